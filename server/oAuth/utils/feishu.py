@@ -7,6 +7,8 @@ from oAuth.models import FeiShuConfig, FeiShuUser
 from oAuth.serializers import UserSerializer
 import requests
 
+from utils.token_cache import get_access_token, invalidate_access_token, is_token_invalid
+
 User = get_user_model()
 
 class FeiShuLoginView(APIView):
@@ -25,27 +27,33 @@ class FeiShuLoginView(APIView):
             if not config:
                 return Response({'message': '飞书登录未配置'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-            # 获取访问令牌
-            token_url = 'https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal'
-            token_resp = requests.post(token_url, json={
-                'app_id': config.app_id,
-                'app_secret': config.app_secret
-            })
-            token_data = token_resp.json()
-            
-            if token_data.get('code') != 0:
-                return Response({'message': '获取飞书令牌失败'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-
-            access_token = token_data.get('tenant_access_token')
-
-            # 获取用户信息
+            # 获取访问令牌（与同步任务共享缓存，未过期时不重复请求）
+            def fetch_token():
+                token_url = 'https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal'
+                token_data = requests.post(token_url, json={
+                    'app_id': config.app_id,
+                    'app_secret': config.app_secret
+                }).json()
+                if token_data.get('code') != 0:
+                    return None
+                return token_data.get('tenant_access_token'), token_data.get('expire', 7200)
+
+            # 获取用户信息，缓存的令牌被平台判定无效时作废，用新令牌重试一次
             user_url = 'https://open.feishu.cn/open-apis/authen/v1/access_token'
-            user_resp = requests.post(
-                user_url,
-                json={'grant_type': 'authorization_code', 'code': code},
-                headers={'Authorization': f'Bearer {access_token}'}
-            )
-            user_data = user_resp.json()
+            for attempt in range(2):
+                access_token = get_access_token('feishu', config.app_id, config.app_secret, fetch_token)
+                if not access_token:
+                    return Response({'message': '获取飞书令牌失败'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+                user_resp = requests.post(
+                    user_url,
+                    json={'grant_type': 'authorization_code', 'code': code},
+                    headers={'Authorization': f'Bearer {access_token}'}
+                )
+                user_data = user_resp.json()
+                if attempt or not is_token_invalid('feishu', user_data.get('code')):
+                    break
+                invalidate_access_token('feishu', config.app_id, config.app_secret, access_token)
 
             if user_data.get('code') != 0:
                 return Response({'message': '获取飞书用户信息失败'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -8,6 +8,8 @@ from oAuth.serializers import UserSerializer
 import requests
 import json
 
+from utils.token_cache import get_access_token, invalidate_access_token, is_token_invalid
+
 User = get_user_model()
 
 class WeComLoginView(APIView):
@@ -25,20 +27,26 @@ class WeComLoginView(APIView):
         if not config:
             return Response({'message': '企业微信登录未配置'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-        # 获取访问令牌
-        token_url = f'https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={config.corp_id}&corpsecret={config.secret}'
-        token_resp = requests.get(token_url)
-        token_data = token_resp.json()
-
-        if token_data.get('errcode') != 0:
-            return Response({'message': '获取企业微信令牌失败'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        # 获取访问令牌（与同步任务共享缓存，未过期时不重复请求）
+        def fetch_token():
+            token_url = f'https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={config.corp_id}&corpsecret={config.secret}'
+            token_data = requests.get(token_url).json()
+            if token_data.get('errcode') != 0:
+                return None
+            return token_data.get('access_token'), token_data.get('expires_in', 7200)
 
-        access_token = token_data.get('access_token')
+        # 获取用户信息，缓存的令牌被平台判定无效时作废，用新令牌重试一次
+        for attempt in range(2):
+            access_token = get_access_token('wecom', config.corp_id, config.secret, fetch_token)
+            if not access_token:
+                return Response({'message': '获取企业微信令牌失败'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-        # 获取用户信息
-        user_url = f'https://qyapi.weixin.qq.com/cgi-bin/user/getuserinfo?access_token={access_token}&code={code}'
-        user_resp = requests.get(user_url)
-        user_info = user_resp.json()
+            user_url = f'https://qyapi.weixin.qq.com/cgi-bin/user/getuserinfo?access_token={access_token}&code={code}'
+            user_resp = requests.get(user_url)
+            user_info = user_resp.json()
+            if attempt or not is_token_invalid('wecom', user_info.get('errcode')):
+                break
+            invalidate_access_token('wecom', config.corp_id, config.secret, access_token)
 
         if user_info.get('errcode') != 0:
             return Response({'message': f'获取企业微信用户信息失败！{str(user_info)}'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
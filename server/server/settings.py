@@ -201,3 +201,37 @@ CORS_ALLOW_ALL_ORIGINS = True
 # 站点配置
 SITE_NAME = 'IM 账号同步助手'
 SITE_DESC = '支持企业微信、飞书、钉钉等 IM 工具同步到 OpenLDAP'
+
+# LDAP连接池配置
+LDAP_POOL_SIZE = int(os.environ.get('LDAP_POOL_SIZE', 5))  # 每个LDAP配置的最大连接数
+LDAP_POOL_IDLE_TIMEOUT = int(os.environ.get('LDAP_POOL_IDLE_TIMEOUT', 300))  # 空闲超过该秒数后重新绑定
+LDAP_POOL_WAIT_TIMEOUT = int(os.environ.get('LDAP_POOL_WAIT_TIMEOUT', 30))  # 连接耗尽时的最长等待秒数
+LDAP_PAGE_SIZE = int(os.environ.get('LDAP_PAGE_SIZE', 500))  # 分页搜索每页条目数
+LDAP_SCHEMA_CACHE_TTL = int(os.environ.get('LDAP_SCHEMA_CACHE_TTL', 3600))  # 对象类探测结果缓存秒数
+LDAP_ASYNC_WINDOW = int(os.environ.get('LDAP_ASYNC_WINDOW', 32))  # 异步写入同时未完成的请求数，小于等于1时使用同步写入
+LDAP_MIRROR_FULL_RELOAD_INTERVAL = int(os.environ.get('LDAP_MIRROR_FULL_RELOAD_INTERVAL', 86400))  # 目录镜像快照增量加载的最长时间，超过后全量加载，0表示不使用快照
+LDAP_RETRY_ATTEMPTS = int(os.environ.get('LDAP_RETRY_ATTEMPTS', 3))  # 暂时性失败（busy、unavailable、网络错误）的最多尝试次数，1表示不重试
+LDAP_RETRY_BASE_DELAY = float(os.environ.get('LDAP_RETRY_BASE_DELAY', 0.2))  # 第一次重试的最长等待秒数，之后每次翻倍，实际等待在其内随机
+LDAP_RETRY_MAX_DELAY = float(os.environ.get('LDAP_RETRY_MAX_DELAY', 5))  # 重试等待的最长秒数
+LDAP_BREAKER_WINDOW = int(os.environ.get('LDAP_BREAKER_WINDOW', 10))  # 熔断器计算失败率的最近请求数
+LDAP_BREAKER_FAILURE_RATE = float(os.environ.get('LDAP_BREAKER_FAILURE_RATE', 0.5))  # 熔断器打开的失败率
+LDAP_BREAKER_RESET_TIMEOUT = int(os.environ.get('LDAP_BREAKER_RESET_TIMEOUT', 30))  # 熔断器打开后放行探测请求前的等待秒数
+
+# 平台API(企业微信、飞书、钉钉)HTTP连接配置
+IM_API_POOL_SIZE = int(os.environ.get('IM_API_POOL_SIZE', 10))  # 每个客户端对每个主机保持的长连接数，应不小于并发请求数
+IM_API_CONNECT_TIMEOUT = float(os.environ.get('IM_API_CONNECT_TIMEOUT', 5))  # 建立连接超时秒数
+IM_API_READ_TIMEOUT = float(os.environ.get('IM_API_READ_TIMEOUT', 30))  # 读取响应超时秒数
+IM_API_MAX_WORKERS = int(os.environ.get('IM_API_MAX_WORKERS', 8))  # 并发拉取部门成员的线程数，1表示逐个部门拉取
+WECOM_API_QPS = float(os.environ.get('WECOM_API_QPS', 20))  # 企业微信接口每秒请求数上限（按企业）
+FEISHU_API_QPS = float(os.environ.get('FEISHU_API_QPS', 10))  # 飞书接口每秒请求数上限（按应用）
+DINGTALK_API_QPS = float(os.environ.get('DINGTALK_API_QPS', 15))  # 钉钉接口每秒请求数上限（按应用）
+IM_TOKEN_REFRESH_MARGIN = int(os.environ.get('IM_TOKEN_REFRESH_MARGIN', 300))  # 访问令牌到期前多少秒开始刷新
+IM_SNAPSHOT_MAX_AGE = int(os.environ.get('IM_SNAPSHOT_MAX_AGE', 300))  # 组织架构快照的共享秒数，同一平台配置同步到多个LDAP时在此时间内只拉取一次，0表示每次同步都拉取
+
+# 缓存配置（平台访问令牌等），默认进程内存缓存；多进程部署时可使用数据库缓存(需执行createcachetable)或文件缓存共享令牌
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'im2ldap'),
+    }
+}
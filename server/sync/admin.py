@@ -11,6 +11,9 @@ class LDAPConfigAdmin(admin.ModelAdmin):
         ('连接信息', {
             'fields': ('server_uri', 'bind_dn', 'bind_password', 'base_dn', 'use_ssl')
         }),
+        ('只读副本', {
+            'fields': ('read_replicas', 'replica_strategy', 'read_your_writes')
+        }),
         ('状态', {
             'fields': ('enabled', 'created_at', 'updated_at')
         }),
@@ -29,6 +32,9 @@ class SyncConfigAdmin(admin.ModelAdmin):
         ('同步设置', {
             'fields': ('sync_interval', 'sync_users', 'sync_departments', 'user_ou', 'department_ou')
         }),
+        ('清理设置', {
+            'fields': ('orphan_action', 'disabled_ou', 'orphan_threshold')
+        }),
         ('时间信息', {
             'fields': ('last_sync_time', 'created_at', 'updated_at')
         }),
@@ -53,7 +59,7 @@ class SyncLogAdmin(admin.ModelAdmin):
     list_display = ('config', 'sync_time', 'success', 'users_synced', 'departments_synced')
     list_filter = ('success', 'sync_time', 'config')
     search_fields = ('config__name',)
-    readonly_fields = ('config', 'sync_time', 'success', 'users_synced', 'departments_synced')
+    readonly_fields = ('config', 'sync_time', 'success', 'users_synced', 'departments_synced', 'stats')
     inlines = [SyncLogDetailInline]
     
     def has_add_permission(self, request):
@@ -0,0 +1,472 @@
+import json
+import logging
+import zlib
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from ldap3.utils.conv import escape_filter_chars
+
+from .platform_identity import (DEPARTMENT_ID_ATTR, USER_ID_ATTR, USER_PLATFORM_ATTR, PlatformId,
+                                parse_entry_identity)
+
+logger = logging.getLogger(__name__)
+
+# 镜像加载的条目范围：组织单位和用户
+MIRROR_FILTER = '(|(objectClass=organizationalUnit)(objectClass=person)(uid=*))'
+
+# 镜像加载的属性：同步写入和比较的全部属性，属性缺失会被当作需要新增的值
+MIRROR_ATTRIBUTES = [
+    'objectClass', 'ou', 'uid', 'userid', 'cn', 'sn', 'displayName', 'mail', 'mobile',
+    'telephoneNumber', 'title', 'departmentNumber', 'description',
+    USER_PLATFORM_ATTR, USER_ID_ATTR, DEPARTMENT_ID_ATTR,
+]
+
+# 增量加载使用的操作属性：entryUUID识别移动/重命名后的条目，modifyTimestamp作为高水位
+ENTRY_UUID_ATTR = 'entryUUID'
+MODIFY_TIMESTAMP_ATTR = 'modifyTimestamp'
+SNAPSHOT_ATTRIBUTES = [ENTRY_UUID_ATTR, MODIFY_TIMESTAMP_ATTR]
+
+# 小写属性名到MIRROR_ATTRIBUTES中属性名的映射，解码原始结果时统一属性名大小写
+_CANONICAL_NAMES = {name.lower(): name for name in MIRROR_ATTRIBUTES}
+_SNAPSHOT_NAMES = {name.lower() for name in SNAPSHOT_ATTRIBUTES}
+
+
+def _key(dn: str) -> str:
+    """DN索引键（LDAP中DN比较不区分大小写）"""
+    return dn.lower()
+
+
+def _parent_key(dn: str) -> str:
+    """上级DN的索引键"""
+    return _key(dn.split(',', 1)[1]) if ',' in dn else ''
+
+
+def _raw_value(raw_attributes: Dict[str, List[bytes]], name: str) -> Optional[str]:
+    """从raw_attributes中取出属性的第一个值（属性名不区分大小写）"""
+    values = raw_attributes.get(name)
+    if values is None:
+        lower = name.lower()
+        values = next((v for n, v in raw_attributes.items() if n.lower() == lower), None)
+    if not values:
+        return None
+    value = values[0]
+    return value.decode('utf-8', 'replace') if isinstance(value, bytes) else str(value)
+
+
+def rebase_dn(dn: str, old_base: str, new_base: str) -> Optional[str]:
+    """
+    子树移动后计算DN的新值
+
+    Args:
+        dn: 原DN
+        old_base: 被移动子树的原根DN
+        new_base: 被移动子树的新根DN
+
+    Returns:
+        str or None: 新DN，dn不在old_base子树中时返回None
+    """
+    dn_key = _key(dn)
+    base_key = _key(old_base)
+    if dn_key == base_key:
+        return new_base
+    if dn_key.endswith(',' + base_key):
+        # 下级条目DN形如"<相对部分>,<原根DN>"，只替换原根DN部分
+        return dn[:len(dn) - len(old_base)] + new_base
+    return None
+
+
+class MirrorEntry:
+    """镜像中的一个LDAP条目"""
+
+    __slots__ = ('dn', 'attrs', 'platform_id', 'uuid')
+
+    def __init__(self, dn: str, attrs: Dict[str, List[Any]], uuid: Optional[str] = None):
+        self.dn = dn
+        self.attrs = attrs
+        self.uuid = uuid
+        self.platform_id = parse_entry_identity(self.get_all)
+
+    @classmethod
+    def from_raw(cls, dn: str, raw_attributes: Dict[str, List[bytes]]) -> 'MirrorEntry':
+        """
+        从搜索结果的raw_attributes创建条目
+
+        属性值按UTF-8解码为字符串，MIRROR_ATTRIBUTES中的属性名统一为其中的写法，
+        之后按属性名查找时不需要再做不区分大小写的遍历。entryUUID保存在uuid中，
+        modifyTimestamp不保存。
+
+        Args:
+            dn: 条目DN
+            raw_attributes: {属性名: [bytes值]}
+
+        Returns:
+            MirrorEntry: 条目
+        """
+        attrs = {}
+        uuid = None
+        for name, values in raw_attributes.items():
+            if not values:
+                continue
+            if name.lower() in _SNAPSHOT_NAMES:
+                if name.lower() == ENTRY_UUID_ATTR.lower():
+                    uuid = _raw_value(raw_attributes, name)
+                continue
+            attrs[_CANONICAL_NAMES.get(name.lower(), name)] = [value.decode('utf-8', 'replace') if isinstance(value, bytes) else value
+                                for value in values]
+        return cls(dn, attrs, uuid)
+
+    def get_all(self, name: str) -> List[Any]:
+        """获取属性的全部值（属性名不区分大小写）"""
+        values = self.attrs.get(name)
+        if values is None:
+            canonical = _CANONICAL_NAMES.get(name.lower())
+            if canonical is not None and canonical in self.attrs:
+                return self.attrs[canonical]
+            lower = name.lower()
+            for attr_name, attr_values in self.attrs.items():
+                if attr_name.lower() == lower:
+                    return attr_values
+            return []
+        return values
+
+    def get(self, name: str, default: Any = None) -> Any:
+        """获取属性的第一个值"""
+        values = self.get_all(name)
+        return values[0] if values else default
+
+    @property
+    def rdn_value(self) -> str:
+        """RDN的值，如ou=研发部中的"研发部\""""
+        return self.dn.split(',', 1)[0].split('=', 1)[1]
+
+
+class DirectoryMirror:
+    """
+    单次同步使用的目录镜像
+
+    同步开始时通过一次分页搜索加载基础DN下的组织单位和用户，之后的查找都在内存字典中完成，
+    连接器在新增、修改、移动、删除成功后就地更新镜像。
+
+    镜像可以通过dump/restore保存为快照，下次同步时用refresh只读取modifyTimestamp不早于
+    高水位的条目，加载成本随变更量而不是目录规模增长。
+    """
+
+    def __init__(self, base_dn: str):
+        """
+        Args:
+            base_dn: 镜像的基础DN
+        """
+        self.base_dn = base_dn
+        self._by_dn: Dict[str, MirrorEntry] = {}
+        self._by_uid: Dict[str, str] = {}
+        self._by_platform_id: Dict[PlatformId, str] = {}
+        self._by_uuid: Dict[str, str] = {}
+        self._children: Dict[str, Set[str]] = {}
+        # 已加载条目中最大的modifyTimestamp，服务器不返回该属性时为None
+        self.high_water_mark: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._by_dn)
+
+    def load(self, connector, attributes: Optional[List[str]] = None, replica: bool = True) -> int:
+        """
+        通过一次分页搜索加载镜像，replica为True且LDAP配置了只读副本时从副本读取
+
+        从副本加载时不设置高水位：副本可能已返回较新的modifyTimestamp、却还没有应用更早的变更，
+        以此为高水位保存的快照在下次全量加载前都读不到这些变更。需要保存快照时应从主服务器加载。
+
+        Args:
+            connector: 已连接的LDAPConnector
+            attributes: 需要加载的属性，默认为MIRROR_ATTRIBUTES
+            replica: 是否允许从只读副本读取
+
+        Returns:
+            int: 加载的条目数
+
+        Raises:
+            LDAPException: 搜索出错
+        """
+        self.clear()
+        self._read(connector, MIRROR_FILTER, attributes, replica=replica)
+        logger.info(f"目录镜像加载完成: {self.base_dn}, 共 {len(self._by_dn)} 个条目")
+        return len(self._by_dn)
+
+    def refresh(self, connector, attributes: Optional[List[str]] = None) -> bool:
+        """
+        在快照的基础上增量刷新镜像
+
+        先只读取entryUUID遍历基础DN下的条目，移除服务器上已不存在的条目，并按entryUUID改写被移动或
+        重命名的条目（包括随上级一起移动、自身modifyTimestamp不变的下级条目）；再读取modifyTimestamp
+        不早于高水位的条目，替换镜像中的旧值。
+
+        增量读取始终发往主服务器：落后的只读副本可能已返回较新的modifyTimestamp、却还没有应用更早的变更，
+        高水位越过这些变更后，之后的增量加载再也读不到它们。
+
+        Args:
+            connector: 已连接的LDAPConnector
+            attributes: 需要加载的属性，默认为MIRROR_ATTRIBUTES
+
+        Returns:
+            bool: 是否完成增量刷新，为False时调用方应使用load全量加载
+
+        Raises:
+            LDAPException: 搜索出错
+        """
+        if not self.high_water_mark:
+            return False
+
+        server_dns: Dict[str, str] = {}
+        for dn, raw_attributes in connector.iter_entries(self.base_dn, MIRROR_FILTER, search_scope='SUBTREE',
+                                                         attributes=[ENTRY_UUID_ATTR], raw=True, replica=False):
+            entry_uuid = _raw_value(raw_attributes, ENTRY_UUID_ATTR)
+            if not entry_uuid:
+                logger.info(f"服务器未返回entryUUID，无法增量加载目录镜像: {dn}")
+                return False
+            server_dns[entry_uuid] = dn
+
+        # 先全部移出索引再重新加入，避免两个条目互换DN时互相覆盖
+        stale = []
+        for entry in list(self._by_dn.values()):
+            new_dn = server_dns.get(entry.uuid) if entry.uuid else None
+            if new_dn != entry.dn:
+                self._unindex(entry)
+                if new_dn is not None:
+                    entry.dn = new_dn
+                    stale.append(entry)
+        for entry in stale:
+            self._index(entry)
+
+        since = self.high_water_mark
+        changed = self._read(connector, f"(&{MIRROR_FILTER}({MODIFY_TIMESTAMP_ATTR}>={escape_filter_chars(since)}))",
+                             attributes, replica=False)
+        missing = server_dns.keys() - self._by_uuid.keys()
+        if missing:
+            logger.info(f"目录镜像快照缺少 {len(missing)} 个条目，改为全量加载")
+            return False
+        logger.info(f"目录镜像增量加载完成: {self.base_dn}, 变更 {changed} 个, 移动 {len(stale)} 个, "
+                     f"共 {len(self._by_dn)} 个条目, 高水位 {since} -> {self.high_water_mark}")
+        return True
+
+    def _read(self, connector, search_filter: str, attributes: Optional[List[str]], replica: bool = True) -> int:
+        """
+        读取条目加入镜像（替换已有的同一条目），返回读取的条目数
+
+        replica为False时从主服务器读取并推进高水位；从副本读取的modifyTimestamp不作为高水位（见load）。
+        """
+        count = 0
+        for dn, raw_attributes in connector.iter_entries(self.base_dn, search_filter, search_scope='SUBTREE',
+                                                         attributes=(attributes or MIRROR_ATTRIBUTES) + SNAPSHOT_ATTRIBUTES,
+                                                         raw=True, replica=replica):
+            entry = MirrorEntry.from_raw(dn, raw_attributes)
+            existing = self._by_dn.get(self._by_uuid.get(entry.uuid, '')) if entry.uuid else None
+            for old in (existing, self.get(dn)):
+                if old is not None:
+                    self._unindex(old)
+            self._index(entry)
+
+            modified = None if replica else _raw_value(raw_attributes, MODIFY_TIMESTAMP_ATTR)
+            if modified and (self.high_water_mark is None or modified > self.high_water_mark):
+                self.high_water_mark = modified
+            count += 1
+        return count
+
+    def dump(self) -> bytes:
+        """
+        将镜像保存为压缩快照
+
+        Returns:
+            bytes: zlib压缩的JSON
+        """
+        data = {
+            'base_dn': self.base_dn,
+            'high_water_mark': self.high_water_mark,
+            'entries': [[entry.dn, entry.attrs, entry.uuid] for entry in self._by_dn.values()],
+        }
+        return zlib.compress(json.dumps(data, ensure_ascii=False, default=str).encode('utf-8'))
+
+    @classmethod
+    def restore(cls, data: bytes) -> 'DirectoryMirror':
+        """
+        从dump生成的快照恢复镜像
+
+        Args:
+            data: zlib压缩的JSON
+
+        Returns:
+            DirectoryMirror: 镜像
+
+        Raises:
+            ValueError: 快照数据无效
+        """
+        try:
+            payload = json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+            mirror = cls(payload['base_dn'])
+            for dn, attrs, entry_uuid in payload['entries']:
+                mirror._index(MirrorEntry(dn, attrs, entry_uuid))
+        except (zlib.error, ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"目录镜像快照无效: {str(e)}")
+        mirror.high_water_mark = payload.get('high_water_mark')
+        return mirror
+
+    def clear(self):
+        """清空镜像"""
+        self._by_dn.clear()
+        self._by_uid.clear()
+        self._by_platform_id.clear()
+        self._by_uuid.clear()
+        self._children.clear()
+        self.high_water_mark = None
+
+    def _index(self, entry: MirrorEntry):
+        key = _key(entry.dn)
+        self._by_dn[key] = entry
+        self._children.setdefault(_parent_key(entry.dn), set()).add(key)
+        uid = entry.get('uid')
+        if uid:
+            self._by_uid[str(uid).lower()] = key
+        if entry.platform_id:
+            self._by_platform_id[entry.platform_id] = key
+        if entry.uuid:
+            self._by_uuid[entry.uuid] = key
+
+    def _unindex(self, entry: MirrorEntry):
+        key = _key(entry.dn)
+        self._by_dn.pop(key, None)
+        siblings = self._children.get(_parent_key(entry.dn))
+        if siblings:
+            siblings.discard(key)
+        uid = entry.get('uid')
+        if uid and self._by_uid.get(str(uid).lower()) == key:
+            del self._by_uid[str(uid).lower()]
+        if entry.platform_id and self._by_platform_id.get(entry.platform_id) == key:
+            del self._by_platform_id[entry.platform_id]
+        if entry.uuid and self._by_uuid.get(entry.uuid) == key:
+            del self._by_uuid[entry.uuid]
+
+    def covers(self, dn: str) -> bool:
+        """DN是否位于镜像的基础DN之下"""
+        dn_key = _key(dn)
+        base_key = _key(self.base_dn)
+        return dn_key != base_key and dn_key.endswith(',' + base_key)
+
+    def get(self, dn: str) -> Optional[MirrorEntry]:
+        """根据DN获取条目"""
+        return self._by_dn.get(_key(dn))
+
+    def exists(self, dn: str) -> bool:
+        """DN是否存在于镜像中"""
+        return _key(dn) in self._by_dn
+
+    def find_by_uid(self, uid: str) -> Optional[MirrorEntry]:
+        """根据uid获取用户条目"""
+        key = self._by_uid.get(str(uid).lower())
+        return self._by_dn.get(key) if key else None
+
+    def find_by_platform_id(self, platform: str, kind: str, external_id: Any) -> Optional[MirrorEntry]:
+        """
+        根据平台标识获取条目
+
+        Args:
+            platform: 平台代码 wecom/feishu/dingtalk
+            kind: 对象类型 user/department
+            external_id: 平台中的用户ID或部门ID
+
+        Returns:
+            MirrorEntry or None: 条目
+        """
+        key = self._by_platform_id.get((platform, kind, str(external_id)))
+        return self._by_dn.get(key) if key else None
+
+    def prefer(self, entry: MirrorEntry):
+        """平台标识相同的条目有多个时，指定同步使用的条目，之后find_by_platform_id返回该条目"""
+        if entry.platform_id and self.get(entry.dn) is entry:
+            self._by_platform_id[entry.platform_id] = _key(entry.dn)
+
+    def iter_platform(self, platform: str, kind: str) -> Iterator[MirrorEntry]:
+        """
+        遍历指定平台和类型的全部条目
+
+        包括平台标识相同的多个条目（如早期移动或重命名留下的重复条目），find_by_platform_id只返回其中一个。
+        """
+        for entry in list(self._by_dn.values()):
+            if entry.platform_id and entry.platform_id[0] == platform and entry.platform_id[1] == kind:
+                yield entry
+
+    def children(self, dn: str) -> List[MirrorEntry]:
+        """获取直接下级条目"""
+        return [self._by_dn[key] for key in self._children.get(_key(dn), ())]
+
+    def subtree(self, dn: str) -> List[MirrorEntry]:
+        """获取条目及其所有下级条目（上级在前）"""
+        result = []
+        pending = deque([_key(dn)])
+        while pending:
+            key = pending.popleft()
+            entry = self._by_dn.get(key)
+            if entry:
+                result.append(entry)
+            pending.extend(self._children.get(key, ()))
+        return result
+
+    def add(self, dn: str, attrs: Dict[str, Any]):
+        """新增条目后更新镜像"""
+        existing = self.get(dn)
+        if existing:
+            self._unindex(existing)
+        normalized = {}
+        for name, values in attrs.items():
+            if values in (None, [], ''):
+                continue
+            normalized[name] = list(values) if isinstance(values, (list, tuple)) else [values]
+        self._index(MirrorEntry(dn, normalized))
+
+    def update(self, dn: str, attrs: Dict[str, Any]):
+        """
+        修改条目后更新镜像：attrs中出现的属性被替换，值为空的属性被删除
+
+        Args:
+            dn: 条目DN
+            attrs: 修改的属性
+        """
+        entry = self.get(dn)
+        if entry is None:
+            return
+        self._unindex(entry)
+        for name, values in attrs.items():
+            if name.lower() == 'objectclass':
+                continue
+            for attr_name in [n for n in entry.attrs if n.lower() == name.lower()]:
+                del entry.attrs[attr_name]
+            if values not in (None, [], ''):
+                entry.attrs[name] = list(values) if isinstance(values, (list, tuple)) else [values]
+        entry.platform_id = parse_entry_identity(entry.get_all)
+        self._index(entry)
+
+    def move(self, old_dn: str, new_dn: str):
+        """
+        移动/重命名条目后更新镜像，所有下级条目的DN一并改写
+
+        Args:
+            old_dn: 原DN
+            new_dn: 新DN
+        """
+        entries = self.subtree(old_dn)
+        if not entries:
+            return
+        for entry in entries:
+            self._unindex(entry)
+        for entry in entries:
+            entry.dn = rebase_dn(entry.dn, old_dn, new_dn)
+        # 被移动条目的RDN属性值随重命名变化
+        root = entries[0]
+        rdn_attr, rdn_value = new_dn.split(',', 1)[0].split('=', 1)
+        for attr_name in [n for n in root.attrs if n.lower() == rdn_attr.lower()]:
+            del root.attrs[attr_name]
+        root.attrs[rdn_attr] = [rdn_value]
+        for entry in entries:
+            self._index(entry)
+
+    def remove(self, dn: str):
+        """删除条目后更新镜像（连同下级条目）"""
+        for entry in reversed(self.subtree(dn)):
+            self._unindex(entry)
@@ -0,0 +1,183 @@
+import logging
+import sys
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class DirectoryDepartment:
+    """平台部门的统一表示，由各平台接口返回的部门数据转换而来"""
+
+    __slots__ = ('platform', 'dept_id', 'name', 'parent_id')
+
+    def __init__(self, platform: str, dept_id: Any, name: str, parent_id: Any):
+        """
+        Args:
+            platform: 平台 wecom/feishu/dingtalk
+            dept_id: 部门ID（企业微信/钉钉为整数，飞书为字符串）
+            name: 部门名称
+            parent_id: 上级部门ID
+        """
+        self.platform = platform
+        self.dept_id = dept_id
+        self.name = name
+        self.parent_id = parent_id
+
+    def __repr__(self):
+        return f"DirectoryDepartment({self.platform}:{self.dept_id} {self.name!r} parent={self.parent_id})"
+
+
+class DirectoryUser:
+    """
+    平台用户的统一表示，由各平台接口返回的用户数据转换而来
+
+    department_ids为用户所属部门ID的元组，第一个为主部门；同一份快照中相同的部门ID共用一个对象。
+    avatar、status、gender、qr_code、position、department_name为企业微信本地用户表保存的字段，
+    其他平台按可用字段填充。
+    """
+
+    __slots__ = ('platform', 'user_id', 'name', 'email', 'mobile', 'department_ids',
+                 'avatar', 'status', 'gender', 'qr_code', 'position', 'department_name')
+
+    def __init__(self, platform: str, user_id: Any, name: str, email: Optional[str] = '',
+                 mobile: Optional[str] = '', department_ids: Tuple[Any, ...] = (), avatar: Optional[str] = '',
+                 status: Any = 1, gender: Any = '0', qr_code: Optional[str] = '', position: Optional[str] = '',
+                 department_name: Optional[str] = ''):
+        self.platform = platform
+        self.user_id = user_id
+        self.name = name
+        self.email = email
+        self.mobile = mobile
+        self.department_ids = department_ids
+        self.avatar = avatar
+        self.status = status
+        self.gender = gender
+        self.qr_code = qr_code
+        self.position = position
+        self.department_name = department_name
+
+    def __repr__(self):
+        return f"DirectoryUser({self.platform}:{self.user_id} {self.name!r} departments={list(self.department_ids)})"
+
+
+class IdInterner:
+    """
+    部门ID驻留表：相同的部门ID返回同一个对象
+
+    部门ID在部门列表和每个用户的所属部门中重复出现，驻留后只保存一份；字符串使用sys.intern，
+    整数等其他类型按值保存在本表中，随快照一起释放。
+    """
+
+    __slots__ = ('_ids',)
+
+    def __init__(self):
+        self._ids: Dict[Any, Any] = {}
+
+    def __call__(self, value: Any) -> Any:
+        if isinstance(value, str):
+            return sys.intern(value)
+        return self._ids.setdefault(value, value)
+
+
+def _wecom_department(raw: Dict[str, Any], intern: IdInterner) -> DirectoryDepartment:
+    return DirectoryDepartment('wecom', intern(raw['id']), raw['name'], intern(raw.get('parentid', 0)))
+
+
+def _feishu_department(raw: Dict[str, Any], intern: IdInterner) -> DirectoryDepartment:
+    return DirectoryDepartment('feishu', intern(raw['department_id']), raw['name'],
+                               intern(raw.get('parent_department_id', '0')))
+
+
+def _dingtalk_department(raw: Dict[str, Any], intern: IdInterner) -> DirectoryDepartment:
+    return DirectoryDepartment('dingtalk', intern(raw['dept_id']), raw['name'], intern(raw.get('parent_id', 1)))
+
+
+def _wecom_user(raw: Dict[str, Any], intern: IdInterner) -> DirectoryUser:
+    return DirectoryUser(
+        'wecom', raw.get('userid'), raw.get('name'),
+        email=raw.get('email', ''),
+        mobile=raw.get('mobile', ''),
+        # department为拉取该成员的部门名称，部门ID列表在department_ids中（见WeComAPI.get_department_users）
+        department_ids=tuple(intern(d) for d in raw.get('department_ids', [])),
+        avatar=raw.get('avatar', ''),
+        status=raw.get('status', 1),
+        gender=raw.get('gender', '0'),
+        qr_code=raw.get('qr_code', ''),
+        position=raw.get('position', ''),
+        department_name=raw.get('department', ''),
+    )
+
+
+def _feishu_user(raw: Dict[str, Any], intern: IdInterner) -> DirectoryUser:
+    return DirectoryUser(
+        'feishu', raw.get('user_id'), raw.get('name'),
+        email=raw.get('email', ''),
+        mobile=raw.get('mobile', ''),
+        department_ids=tuple(intern(d) for d in raw.get('department_ids', [])),
+        avatar=raw.get('avatar_url', ''),
+    )
+
+
+def _dingtalk_user(raw: Dict[str, Any], intern: IdInterner) -> DirectoryUser:
+    return DirectoryUser(
+        'dingtalk', raw.get('userid'), raw.get('name'),
+        email=raw.get('email', ''),
+        mobile=raw.get('mobile', ''),
+        department_ids=tuple(intern(d) for d in raw.get('dept_id_list', [])),
+        avatar=raw.get('avatar', ''),
+        position=raw.get('title', ''),
+    )
+
+
+_DEPARTMENT_NORMALIZERS: Dict[str, Callable[[Dict[str, Any], IdInterner], DirectoryDepartment]] = {
+    'wecom': _wecom_department,
+    'feishu': _feishu_department,
+    'dingtalk': _dingtalk_department,
+}
+
+_USER_NORMALIZERS: Dict[str, Callable[[Dict[str, Any], IdInterner], DirectoryUser]] = {
+    'wecom': _wecom_user,
+    'feishu': _feishu_user,
+    'dingtalk': _dingtalk_user,
+}
+
+
+def normalize_departments(platform: str, departments: Iterable[Dict[str, Any]],
+                          intern: IdInterner) -> List[DirectoryDepartment]:
+    """
+    将平台接口返回的部门数据转换为DirectoryDepartment
+
+    Args:
+        platform: 平台 wecom/feishu/dingtalk
+        departments: 平台返回的部门列表
+        intern: 部门ID驻留表，同一份快照的部门和用户共用
+
+    Returns:
+        List[DirectoryDepartment]: 部门列表
+    """
+    normalize = _DEPARTMENT_NORMALIZERS[platform]
+    return [normalize(dept, intern) for dept in departments]
+
+
+def normalize_users(platform: str, users: Iterable[Dict[str, Any]], intern: IdInterner) -> List[DirectoryUser]:
+    """
+    将平台接口返回的用户数据转换为DirectoryUser，users可以是逐页产出的迭代器，原始数据转换后即可释放；
+    没有用户ID的数据无法与LDAP条目对应，跳过
+
+    Args:
+        platform: 平台 wecom/feishu/dingtalk
+        users: 平台返回的用户
+        intern: 部门ID驻留表，同一份快照的部门和用户共用
+
+    Returns:
+        List[DirectoryUser]: 用户列表
+    """
+    normalize = _USER_NORMALIZERS[platform]
+    records = []
+    for user in users:
+        record = normalize(user, intern)
+        if record.user_id:
+            records.append(record)
+        else:
+            logger.warning(f"{platform}用户数据缺少用户ID，跳过: {record!r}")
+    return records
@@ -0,0 +1,209 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from ldap3 import Connection
+from ldap3.core.exceptions import LDAPException
+
+from .ldap_metrics import LDAPMetrics, bytes_received
+from .ldap_retry import CircuitBreaker, RetryPolicy, is_transient, reopen
+
+logger = logging.getLogger(__name__)
+
+# 异步写入窗口默认大小（同时未完成的请求数），可在settings中通过LDAP_ASYNC_WINDOW覆盖，小于等于1时使用同步写入
+DEFAULT_ASYNC_WINDOW = 32
+
+# 写入完成回调：(是否成功, LDAP结果)
+WriteCallback = Callable[[bool, Optional[Dict[str, Any]]], None]
+
+
+def _related(dn_a: str, dn_b: str) -> bool:
+    """两个DN是否相同或存在上下级关系"""
+    return dn_a == dn_b or dn_a.endswith(',' + dn_b) or dn_b.endswith(',' + dn_a)
+
+
+class _PendingWrite:
+    """已发送、尚未取回结果的写入请求"""
+
+    __slots__ = ('message_id', 'operation', 'dns', 'send', 'on_done', 'sent_at')
+
+    def __init__(self, message_id: int, operation: str, dns: Tuple[str, ...], send: Callable[[], int],
+                 on_done: Optional[WriteCallback], sent_at: float):
+        self.message_id = message_id
+        self.operation = operation
+        self.dns = dns
+        self.send = send
+        self.on_done = on_done
+        self.sent_at = sent_at
+
+
+class AsyncWriteWindow:
+    """
+    基于ldap3 ASYNC策略的流水线写入窗口
+
+    写入请求发送后不等待结果，最多同时保持window个未完成的请求，窗口满时按发送顺序取回结果。
+    发送新请求前，先取回与其DN相同或存在上下级关系的未完成请求，保证先上级后下级、
+    同一条目的多次写入按提交顺序执行。每个请求的结果通过回调交还给提交方。
+    """
+
+    def __init__(self, conn: Connection, window: int = DEFAULT_ASYNC_WINDOW, metrics: Optional[LDAPMetrics] = None,
+                 breaker: Optional[CircuitBreaker] = None, retry_policy: Optional[RetryPolicy] = None):
+        """
+        Args:
+            conn: 已绑定的ASYNC策略连接
+            window: 同时未完成的最大请求数
+            metrics: 操作统计，提供时记录每个请求从发送到取回结果的耗时
+            breaker: 熔断器，提供时发送前检查、取回结果后记录
+            retry_policy: 暂时性失败的重试策略，默认不重试
+        """
+        self.conn = conn
+        self.window = max(1, window)
+        self.metrics = metrics
+        self.breaker = breaker
+        self.retry_policy = retry_policy or RetryPolicy(attempts=1)
+        self._pending: 'OrderedDict[int, _PendingWrite]' = OrderedDict()
+
+        # 统计信息
+        self.submitted = 0
+        self.failed = 0
+        self.retried = 0
+        self.barrier_waits = 0
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, dn: str, object_classes, attributes: Dict[str, Any], on_done: Optional[WriteCallback] = None):
+        """异步新增条目"""
+        self._submit('add', (dn,), lambda: self.conn.add(dn, object_classes, attributes), on_done)
+
+    def modify(self, dn: str, changes: Dict[str, list], on_done: Optional[WriteCallback] = None):
+        """异步修改条目"""
+        self._submit('modify', (dn,), lambda: self.conn.modify(dn, changes), on_done)
+
+    def modify_dn(self, dn: str, relative_dn: str, new_superior: Optional[str] = None,
+                  on_done: Optional[WriteCallback] = None):
+        """异步移动/重命名条目"""
+        new_dn = f"{relative_dn},{new_superior or dn.split(',', 1)[1]}"
+        self._submit('modify_dn', (dn, new_dn),
+                     lambda: self.conn.modify_dn(dn, relative_dn, new_superior=new_superior), on_done)
+
+    def delete(self, dn: str, on_done: Optional[WriteCallback] = None):
+        """异步删除条目"""
+        self._submit('delete', (dn,), lambda: self.conn.delete(dn), on_done)
+
+    def _submit(self, operation: str, dns: Tuple[str, ...], send: Callable[[], int],
+                on_done: Optional[WriteCallback]):
+        dns = tuple(dn.lower() for dn in dns)
+        self._wait_related(dns)
+        while len(self._pending) >= self.window:
+            self._collect(next(iter(self._pending)))
+
+        if self.breaker is not None:
+            self.breaker.before_request()
+        sent_at = time.perf_counter()
+        try:
+            message_id = send()
+        except LDAPException as e:
+            logger.error(f"发送异步{operation}请求失败: {dns[0]}, 错误: {str(e)}")
+            if self.metrics is not None:
+                self.metrics.record(operation, time.perf_counter() - sent_at, None)
+            if self.breaker is not None:
+                self.breaker.record(not is_transient(error=e))
+            self.failed += 1
+            if on_done:
+                on_done(False, {'result': None, 'description': str(e)})
+            return
+
+        self._pending[message_id] = _PendingWrite(message_id, operation, dns, send, on_done, sent_at)
+        self.submitted += 1
+
+    def wait_for(self, *dns: str):
+        """取回与给定DN相同或存在上下级关系的未完成请求，之后可以安全地通过其他连接操作这些DN"""
+        self._wait_related(tuple(dn.lower() for dn in dns))
+
+    def _wait_related(self, dns: Iterable[str]):
+        """取回与给定DN相关的未完成请求"""
+        related = [message_id for message_id, pending in self._pending.items()
+                   if any(_related(dn, other) for dn in dns for other in pending.dns)]
+        if related:
+            self.barrier_waits += 1
+        for message_id in related:
+            # 回调中可能已经取回了后续请求
+            if message_id in self._pending:
+                self._collect(message_id)
+
+    def _collect(self, message_id: int):
+        """
+        取回一个请求的结果并调用回调
+
+        暂时性失败时按重试策略等待后重新发送并立即等待结果，重试期间不发送其他请求，
+        已提交的下级条目写入仍排在它之后。
+        """
+        pending = self._pending.pop(message_id)
+        retry = 0
+        while True:
+            result, transient = self._receive(pending, message_id)
+            if not transient or retry + 1 >= self.retry_policy.attempts:
+                break
+            retry += 1
+            self.retried += 1
+            if self.metrics is not None:
+                self.metrics.retry(pending.operation)
+            delay = self.retry_policy.delay(retry)
+            logger.warning(f"异步{pending.operation}请求暂时失败，{delay:.2f}秒后第{retry}次重试: "
+                           f"{pending.dns[0]}, 原因: {result}")
+            time.sleep(delay)
+            reopen(self.conn)
+            if self.breaker is not None:
+                self.breaker.before_request()
+            pending.sent_at = time.perf_counter()
+            try:
+                message_id = pending.send()
+            except LDAPException as e:
+                result = {'result': None, 'description': str(e)}
+                if self.breaker is not None:
+                    self.breaker.record(not is_transient(error=e))
+                break
+        success = bool(result) and result.get('result') == 0
+
+        if not success:
+            self.failed += 1
+            logger.debug(f"异步{pending.operation}请求失败: {pending.dns[0]}, 原因: {result}")
+        if pending.on_done:
+            pending.on_done(success, result)
+
+    def _receive(self, pending: _PendingWrite, message_id: int) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """取回一次发送的结果并记录统计，返回(LDAP结果, 是否为暂时性失败)"""
+        received = bytes_received(self.conn)
+        error = None
+        try:
+            _, result = self.conn.get_response(message_id)
+        except LDAPException as e:
+            error = e
+            result = {'result': None, 'description': str(e)}
+        result_code = (result or {}).get('result')
+        transient = is_transient(result_code, error)
+        if self.metrics is not None:
+            # 耗时包含请求在窗口中排队等待取回的时间
+            self.metrics.record(pending.operation, time.perf_counter() - pending.sent_at,
+                                result_code, bytes_received(self.conn) - received)
+        if self.breaker is not None:
+            self.breaker.record(not transient)
+        return result, transient
+
+    def flush(self):
+        """取回所有未完成请求的结果（回调中提交的新请求一并处理）"""
+        while self._pending:
+            self._collect(next(iter(self._pending)))
+
+    def stats(self) -> Dict[str, int]:
+        """窗口统计"""
+        return {
+            'window': self.window,
+            'submitted': self.submitted,
+            'failed': self.failed,
+            'retried': self.retried,
+            'barrier_waits': self.barrier_waits,
+            'pending': len(self._pending),
+        }
@@ -1,14 +1,44 @@
 import logging
-from typing import Dict, List, Optional, Any, Union
-from ldap3 import Server, Connection, ALL, SUBTREE, MODIFY_REPLACE
+import time
+from contextlib import contextmanager
+from functools import partial
+from typing import Dict, List, Optional, Any, Union, Iterator, Tuple
+from django.conf import settings
+from ldap3 import (Server, ServerPool, Connection, NONE, ASYNC, SUBTREE, LEVEL, ROUND_ROBIN,
+                   MODIFY_REPLACE, MODIFY_ADD, MODIFY_DELETE)
 from ldap3.core.exceptions import LDAPException, LDAPEntryAlreadyExistsResult, LDAPOperationResult
+from ldap3.utils.conv import escape_filter_chars
+from ldap3.utils.dn import to_dn
+
+from .directory_mirror import MIRROR_ATTRIBUTES, rebase_dn
+from .ldap_async import AsyncWriteWindow, DEFAULT_ASYNC_WINDOW, WriteCallback
+from .ldap_metrics import LDAPMetrics, bytes_received, merge_process_metrics
+from .ldap_pool import LDAPPoolExhausted, get_pool
+from .ldap_retry import LDAPCircuitOpenError, RetryPolicy, TRANSIENT_EXCEPTIONS, get_breaker, is_transient, reopen
+from .ldap_schema import (
+    ObjectClassCapabilities, ObjectClassSet, USER_OBJECT_CLASS_OPTIONS, OU_OBJECT_CLASSES,
+    ensure_server_info, get_capabilities, remember_capabilities, remember_subtree_rename_refused, subtree_rename_refused
+)
+from .platform_identity import identity_filter
 
 logger = logging.getLogger(__name__)
 
+# 服务器拒绝子树重命名时的结果码：notAllowedOnNonLeaf、unwillingToPerform、affectsMultipleDSAs
+SUBTREE_RENAME_REFUSED_CODES = (66, 53, 71)
+
+# 只返回DN、不返回任何属性的投影
+DN_ONLY = ['1.1']
+
+# 分页搜索默认每页条目数，可在settings中通过LDAP_PAGE_SIZE覆盖
+DEFAULT_PAGE_SIZE = 500
+
 class LDAPConnector:
     """LDAP连接器，用于管理LDAP连接和操作"""
     
-    def __init__(self, server_uri: str, bind_dn: str, bind_password: str, base_dn: str, use_ssl: bool = False):
+    def __init__(self, server_uri: str, bind_dn: str, bind_password: str, base_dn: str, use_ssl: bool = False,
+                 pool_key: Optional[str] = None, page_size: int = DEFAULT_PAGE_SIZE,
+                 read_replicas: Optional[List[str]] = None, replica_strategy: str = ROUND_ROBIN,
+                 read_your_writes: bool = True):
         """
         初始化LDAP连接器
         
@@ -18,13 +48,55 @@ class LDAPConnector:
             bind_password: 绑定密码
             base_dn: 基础DN
             use_ssl: 是否使用SSL
+            pool_key: 连接池键，指定后从进程内共享连接池借用连接
+            page_size: 分页搜索每页条目数
+            read_replicas: 只读副本URI列表，配置后快照读取(replica=True)发往副本，写入仍发往server_uri
+            replica_strategy: 副本选择策略 ROUND_ROBIN/FIRST/RANDOM
+            read_your_writes: 本连接器写入后，快照读取改为发往主服务器，避免读到复制完成前的旧数据
         """
         self.server_uri = server_uri
         self.bind_dn = bind_dn
         self.bind_password = bind_password
         self.base_dn = base_dn
         self.use_ssl = use_ssl
+        self.pool_key = pool_key
+        self.pool = None
+        self.page_size = page_size
+        self.mirror = None
+        self.async_window = None
+        self.read_replicas = list(read_replicas or [])
+        self.replica_strategy = replica_strategy
+        self.read_your_writes = read_your_writes
+        self.has_written = False
+        self.metrics = LDAPMetrics()
+        self.breaker = get_breaker(pool_key or server_uri)
+        self.retry_policy = RetryPolicy.from_settings()
         self.conn = None
+        self.read_conn = None
+        
+    @classmethod
+    def from_config(cls, ldap_config) -> 'LDAPConnector':
+        """
+        根据LDAP配置创建使用共享连接池的连接器
+        
+        Args:
+            ldap_config: LDAPConfig实例
+            
+        Returns:
+            LDAPConnector: 连接器
+        """
+        return cls(
+            server_uri=ldap_config.server_uri,
+            bind_dn=ldap_config.bind_dn,
+            bind_password=ldap_config.bind_password,
+            base_dn=ldap_config.base_dn,
+            use_ssl=ldap_config.use_ssl,
+            pool_key=str(ldap_config.id),
+            page_size=getattr(settings, 'LDAP_PAGE_SIZE', DEFAULT_PAGE_SIZE),
+            read_replicas=ldap_config.read_replicas,
+            replica_strategy=ldap_config.replica_strategy,
+            read_your_writes=ldap_config.read_your_writes
+        )
         
     def connect(self) -> bool:
         """
@@ -34,25 +106,268 @@ class LDAPConnector:
             bool: 是否连接成功
         """
         try:
-            server = Server(self.server_uri, get_info=ALL, use_ssl=self.use_ssl)
-            self.conn = Connection(
-                server,
-                user=self.bind_dn,
-                password=self.bind_password,
-                auto_bind=True
-            )
-            logger.info(f"成功连接到LDAP服务器: {self.server_uri}")
+            self.breaker.before_request()
+        except LDAPCircuitOpenError as e:
+            logger.error(f"连接LDAP服务器失败: {str(e)}")
+            return False
+            
+        # 熔断器半开时本次连接即为探测请求，每个分支都要记录结果，否则探测名额一直被占用
+        try:
+            if self.pool_key:
+                self.pool = get_pool(self.pool_key, self.server_uri, self.bind_dn, self.bind_password, self.use_ssl)
+                self.conn = self.pool.acquire()
+                logger.debug(f"从连接池获取LDAP连接: {self.server_uri}")
+            else:
+                # 不在连接时下载根DSE和schema，需要时通过ensure_server_info按配置缓存读取
+                server = Server(self.server_uri, get_info=NONE, use_ssl=self.use_ssl)
+                self.conn = Connection(
+                    server,
+                    user=self.bind_dn,
+                    password=self.bind_password,
+                    auto_bind=True,
+                    collect_usage=True
+                )
+                logger.info(f"成功连接到LDAP服务器: {self.server_uri}")
+            self.breaker.record(True)
             return True
+        except LDAPPoolExhausted as e:
+            # 连接池耗尽与服务器状态无关，不计入失败率，只释放探测名额
+            logger.error(f"连接LDAP服务器失败: {str(e)}")
+            self.breaker.release()
+            return False
         except LDAPException as e:
             logger.error(f"连接LDAP服务器失败: {str(e)}")
+            self.breaker.record(not is_transient(error=e))
+            return False
+        except Exception as e:
+            logger.error(f"连接LDAP服务器失败: {str(e)}")
+            self.breaker.record(False)
             return False
             
     def close(self):
-        """关闭LDAP连接"""
+        """关闭LDAP连接，池化连接归还到连接池"""
+        if self.read_conn:
+            try:
+                self.read_conn.unbind()
+            except Exception:
+                pass
+            self.read_conn = None
         if self.conn:
-            self.conn.unbind()
+            # 本次运行的操作统计计入进程内累计统计
+            merge_process_metrics(self.pool_key or self.server_uri, self.metrics)
+            if self.pool:
+                self.pool.release(self.conn)
+                self.pool = None
+            else:
+                self.conn.unbind()
             self.conn = None
             
+    def _snapshot_conn(self) -> Connection:
+        """
+        快照读取使用的连接
+        
+        配置了只读副本时通过ServerPool按replica_strategy连接副本；未配置副本、副本全部不可用，
+        或开启read_your_writes且本连接器已经写入过时，使用主服务器连接。
+        
+        Returns:
+            Connection: 已绑定的连接
+        """
+        if not self.read_replicas or (self.read_your_writes and self.has_written):
+            return self.conn
+        if self.read_conn is None:
+            try:
+                servers = [Server(uri, get_info=NONE, use_ssl=self.use_ssl) for uri in self.read_replicas]
+                self.read_conn = Connection(
+                    ServerPool(servers, self.replica_strategy, active=1),
+                    user=self.bind_dn,
+                    password=self.bind_password,
+                    auto_bind=True,
+                    collect_usage=True
+                )
+                logger.info(f"已连接LDAP只读副本: {', '.join(self.read_replicas)}")
+            except LDAPException as e:
+                # 本连接器不再尝试副本，后续快照读取都发往主服务器
+                logger.warning(f"连接LDAP只读副本失败，从主服务器读取: {str(e)}")
+                self.read_replicas = []
+                return self.conn
+        return self.read_conn
+        
+    def attach_mirror(self, mirror):
+        """
+        关联目录镜像，之后新增、修改、移动、删除成功时会就地更新镜像，存在性检查优先使用镜像
+        
+        Args:
+            mirror: DirectoryMirror实例，传入None取消关联
+        """
+        self.mirror = mirror
+            
+    @contextmanager
+    def async_writes(self, window: Optional[int] = None):
+        """
+        在上下文内使用异步流水线写入
+        
+        上下文内add_object、modify_object、move_object通过独立的ASYNC连接发送，立即返回True表示已提交，
+        实际结果通过on_done回调返回；退出上下文时等待所有请求完成。无法建立异步连接或窗口不大于1时
+        保持同步写入，on_done在方法返回前调用。
+        
+        Args:
+            window: 同时未完成的最大请求数，默认为settings.LDAP_ASYNC_WINDOW
+            
+        Yields:
+            AsyncWriteWindow or None: 写入窗口，同步写入时为None
+        """
+        if window is None:
+            window = getattr(settings, 'LDAP_ASYNC_WINDOW', DEFAULT_ASYNC_WINDOW)
+        if self.async_window is not None or window <= 1 or not self.conn:
+            yield self.async_window
+            return
+            
+        try:
+            server = Server(self.server_uri, get_info=NONE, use_ssl=self.use_ssl)
+            async_conn = Connection(
+                server,
+                user=self.bind_dn,
+                password=self.bind_password,
+                auto_bind=True,
+                client_strategy=ASYNC,
+                collect_usage=True
+            )
+        except LDAPException as e:
+            logger.warning(f"建立异步LDAP连接失败，使用同步写入: {str(e)}")
+            yield None
+            return
+            
+        self.async_window = AsyncWriteWindow(async_conn, window, metrics=self.metrics,
+                                             breaker=self.breaker, retry_policy=self.retry_policy)
+        try:
+            yield self.async_window
+        finally:
+            try:
+                self.async_window.flush()
+                logger.info(f"异步写入完成: {self.async_window.stats()}")
+            finally:
+                self.async_window = None
+                try:
+                    async_conn.unbind()
+                except Exception:
+                    pass
+            
+    @staticmethod
+    def _notify(on_done: Optional[WriteCallback], success: bool, result: Optional[Dict[str, Any]]):
+        """同步写入完成后调用回调"""
+        if on_done:
+            on_done(success, result)
+            
+    def _request(self, operation: str, conn: Connection, *args, **kwargs):
+        """
+        通过连接发送一次同步LDAP请求，暂时性失败（busy、unavailable、网络错误）按退避策略重试
+        
+        每次尝试的结果计入熔断器，熔断器打开后直接抛出LDAPCircuitOpenError，不再等待网络超时。
+        
+        Args:
+            operation: 操作，即连接的方法名 add/modify/modify_dn/delete/search
+            conn: 连接
+            *args: 请求参数
+            **kwargs: 请求参数
+            
+        Returns:
+            连接方法的返回值
+            
+        Raises:
+            LDAPCircuitOpenError: 熔断器已打开
+            LDAPException: 重试用尽后仍失败的网络错误，或其他请求错误
+        """
+        retry = 0
+        while True:
+            self.breaker.before_request()
+            error = None
+            try:
+                response = self._timed(operation, conn, *args, **kwargs)
+            except TRANSIENT_EXCEPTIONS as e:
+                response, error = False, e
+            transient = is_transient((conn.result or {}).get('result'), error)
+            self.breaker.record(not transient)
+            if not transient or retry + 1 >= self.retry_policy.attempts:
+                if error is not None:
+                    raise error
+                return response
+            
+            retry += 1
+            self.metrics.retry(operation)
+            delay = self.retry_policy.delay(retry)
+            logger.warning(f"LDAP {operation}请求暂时失败，{delay:.2f}秒后第{retry}次重试: {error or conn.result}")
+            time.sleep(delay)
+            reopen(conn)
+            
+    def _timed(self, operation: str, conn: Connection, *args, **kwargs):
+        """
+        通过连接发送一次同步LDAP请求，并在self.metrics中记录耗时、结果码和接收字节数
+        
+        Args:
+            operation: 操作，即连接的方法名 add/modify/modify_dn/delete/search
+            conn: 连接
+            *args: 请求参数
+            **kwargs: 请求参数
+            
+        Returns:
+            连接方法的返回值
+        """
+        received = bytes_received(conn)
+        result_code = None
+        started = time.perf_counter()
+        try:
+            response = getattr(conn, operation)(*args, **kwargs)
+            result_code = (conn.result or {}).get('result')
+            return response
+        except LDAPOperationResult as e:
+            result_code = e.result
+            raise
+        finally:
+            self.metrics.record(operation, time.perf_counter() - started, result_code,
+                                bytes_received(conn) - received)
+            
+    def _timed_pages(self, conn: Connection, responses: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        遍历分页搜索的结果，整个搜索记录为一次paged_search
+        
+        只累计等待服务器返回的时间，不包含调用方处理条目的时间。
+        
+        Args:
+            conn: 执行搜索的连接
+            responses: paged_search返回的生成器
+            
+        Yields:
+            Dict[str, Any]: 搜索结果
+        """
+        self.breaker.before_request()
+        received = bytes_received(conn)
+        elapsed = 0.0
+        result_code = None
+        failed = False
+        transient = False
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    response = next(responses)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield response
+        except LDAPOperationResult as e:
+            result_code, failed, transient = e.result, True, is_transient(error=e)
+            raise
+        except LDAPException as e:
+            failed, transient = True, is_transient(error=e)
+            raise
+        finally:
+            if not failed:
+                result_code = (conn.result or {}).get('result')
+                transient = is_transient(result_code)
+            self.breaker.record(not transient)
+            self.metrics.record('paged_search', elapsed, result_code, bytes_received(conn) - received)
+            
     def search_dn(self, dn: str) -> bool:
         """
         检查指定的DN是否存在
@@ -67,20 +382,17 @@ class LDAPConnector:
             logger.error("未连接到LDAP服务器")
             return False
         
+        if self.mirror is not None and self.mirror.exists(dn):
+            return True
+        
         try:
             # 直接尝试使用DN进行搜索，LDAP服务器会返回该DN是否存在
-            result = self.conn.search(
-                search_base=dn,
-                search_filter='(objectClass=*)',
-                search_scope='BASE',
-                attributes=['1.1']  # 只返回条目存在信息，不返回任何属性
-            )
-            
-            # 如果搜索成功并有条目返回，则DN存在
-            exists = result and len(self.conn.entries) > 0
+            exists = self._first_dn(dn, '(objectClass=*)', search_scope='BASE') is not None
             logger.debug(f"检查DN是否存在: {dn}, 结果: {exists}")
             return exists
             
+        except LDAPCircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"检查DN存在性时出错: {dn}, 错误: {str(e)}")
             return False
@@ -114,7 +426,8 @@ class LDAPConnector:
             return False
             
         try:
-            result = self.conn.add(dn, ['inetOrgPerson', 'organizationalPerson', 'person'], attributes)
+            self.has_written = True
+            result = self._request('add', self.conn, dn, ['inetOrgPerson', 'organizationalPerson', 'person'], attributes)
             if result:
                 logger.info(f"添加用户成功: {dn}")
                 return True
@@ -129,13 +442,14 @@ class LDAPConnector:
             logger.error(f"添加用户失败: {dn}, 错误: {str(e)}")
             return False
             
-    def modify_user(self, dn: str, attributes: Dict[str, Any]) -> bool:
+    def modify_user(self, dn: str, attributes: Dict[str, Any], current_attrs: Optional[Dict[str, List[Any]]] = None) -> bool:
         """
         修改用户
         
         Args:
             dn: 用户DN
             attributes: 用户属性
+            current_attrs: 用户当前属性，提供时只发送有变化的属性
             
         Returns:
             bool: 是否修改成功
@@ -145,12 +459,21 @@ class LDAPConnector:
             return False
             
         try:
-            # 将属性转换为ldap3要求的格式
-            changes = {attr: [(MODIFY_REPLACE, [val])] for attr, val in attributes.items()}
-            result = self.conn.modify(dn, changes)
+            if current_attrs is not None:
+                changes = self._build_delta_changes(current_attrs, attributes)
+                if not changes:
+                    logger.debug(f"用户属性无变化，跳过修改: {dn}")
+                    return True
+            else:
+                # 将属性转换为ldap3要求的格式
+                changes = {attr: [(MODIFY_REPLACE, [val])] for attr, val in attributes.items()}
+            self.has_written = True
+            result = self._request('modify', self.conn, dn, changes)
             
             if result:
                 logger.info(f"修改用户成功: {dn}")
+                if self.mirror is not None:
+                    self.mirror.update(dn, attributes)
                 return True
             else:
                 logger.error(f"修改用户失败: {dn}, 原因: {self.conn.result}")
@@ -159,155 +482,315 @@ class LDAPConnector:
             logger.error(f"修改用户失败: {dn}, 错误: {str(e)}")
             return False
             
-    def add_object(self, dn: str, attributes: Dict[str, Any]) -> bool:
+    def _get_capabilities(self) -> Optional[ObjectClassCapabilities]:
+        """获取服务器支持的对象类组合（按LDAP配置缓存）"""
+        return get_capabilities(self.pool_key or self.server_uri, self.server_uri, self.conn)
+        
+    def _prepare_add(self, dn: str, attributes: Dict[str, Any]) -> Tuple[List[str], Dict[str, Any]]:
         """
-        添加LDAP对象
+        确定新增对象使用的对象类，并按对象类过滤属性
         
         Args:
             dn: 对象DN
             attributes: 对象属性
             
         Returns:
-            bool: 是否添加成功
+            Tuple[List[str], Dict[str, Any]]: (对象类, 属性)，用户对象在schema不可用时对象类为空列表
         """
-        if not self.conn:
-            logger.error("未连接到LDAP服务器")
-            return False
+        # 提取对象类
+        object_classes = attributes.get('objectClass', ['top'])
+        if isinstance(object_classes, str):
+            object_classes = [object_classes]
             
-        try:
-            # 提取对象类
-            object_classes = attributes.get('objectClass', ['top'])
-            if isinstance(object_classes, str):
-                object_classes = [object_classes]
-                
-            # 创建属性副本，移除objectClass以避免重复
-            attrs_copy = dict(attributes)
-            if 'objectClass' in attrs_copy:
-                del attrs_copy['objectClass']
-                
-            # 根据DN和属性判断对象类型
-            if 'uid=' in dn:
-                # 用户对象 - 首先尝试使用最全面的对象类
-                user_object_class_options = [
-                    # 优先尝试最完整的对象类组合
-                    ['top', 'person', 'organizationalPerson', 'inetOrgPerson'],
-                    ['top', 'organizationalPerson', 'inetOrgPerson'],
-                    ['top', 'inetOrgPerson'],
-                    # 如果上面失败，尝试更基本的对象类
-                    ['top', 'person', 'organizationalPerson'],
-                    ['top', 'organizationalPerson'],
-                    ['top', 'person'],
-                    # 最后尝试更专用的对象类
-                    ['top', 'account'],
-                    ['posixAccount'],
-                    ['top', 'simpleSecurityObject']
-                ]
-                
-                # 对于每种对象类组合尝试添加，直到成功
-                for classes in user_object_class_options:
-                    try:
-                        # 复制属性以便可以为每种对象类过滤
-                        current_attrs = dict(attrs_copy)
-                        
-                        # 根据对象类过滤属性
-                        if 'account' in classes and 'inetOrgPerson' not in classes and 'person' not in classes:
-                            # account对象类不支持cn和sn属性
-                            filtered_attrs = {}
-                            for key, value in current_attrs.items():
-                                if key not in ['cn', 'sn']:
-                                    filtered_attrs[key] = value
-                            current_attrs = filtered_attrs
-                        
-                        logger.info(f"尝试使用对象类 {classes} 添加: {dn}")
-                        result = self.conn.add(dn, classes, current_attrs)
-                        
-                        if result:
-                            logger.info(f"使用对象类 {classes} 添加成功: {dn}")
-                            return True
-                        else:
-                            logger.warning(f"使用对象类 {classes} 添加失败: {dn}, 原因: {self.conn.result}")
-                    except Exception as e:
-                        logger.debug(f"使用对象类 {classes} 添加失败: {dn}, 错误: {str(e)}")
-                        continue
-                
-                # 如果所有尝试都失败，记录详细错误
-                logger.error(f"所有尝试添加用户的方法都失败了: {dn}")
-                return False
+        # 创建属性副本，移除objectClass以避免重复
+        attrs_copy = dict(attributes)
+        if 'objectClass' in attrs_copy:
+            del attrs_copy['objectClass']
+        
+        if 'uid=' in dn:
+            capabilities = self._get_capabilities()
+            if capabilities and capabilities.user:
+                return capabilities.user.object_classes, capabilities.user.filter_attrs(attrs_copy)
+            return [], attrs_copy
+        elif 'ou=' in dn and 'ou' in attrs_copy:
+            return list(OU_OBJECT_CLASSES), attrs_copy
+        return object_classes, attrs_copy
+        
+    def _add_user_by_trial(self, dn: str, attrs: Dict[str, Any]) -> bool:
+        """
+        schema不可用时逐个尝试用户对象类组合，并缓存第一个成功的组合
+        
+        Args:
+            dn: 用户DN
+            attrs: 用户属性（不含objectClass）
+            
+        Returns:
+            bool: 是否添加成功
+        """
+        for attempt, classes in enumerate(USER_OBJECT_CLASS_OPTIONS):
+            if attempt:
+                self.metrics.retry('add')
+            try:
+                current_attrs = dict(attrs)
                 
-            elif 'ou=' in dn and 'ou' in attrs_copy:
-                # 组织单位对象
-                object_classes = ['top', 'organizationalUnit']
+                # 根据对象类过滤属性
+                if 'account' in classes and 'inetOrgPerson' not in classes and 'person' not in classes:
+                    # account对象类不支持cn和sn属性
+                    current_attrs = {key: value for key, value in current_attrs.items() if key not in ['cn', 'sn']}
                 
-                # 添加对象
-                logger.info(f"尝试添加组织单位: {dn}, 对象类: {object_classes}")
-                result = self.conn.add(dn, object_classes, attrs_copy)
+                logger.info(f"尝试使用对象类 {classes} 添加: {dn}")
+                result = self._request('add', self.conn, dn, classes, current_attrs)
                 
                 if result:
-                    logger.info(f"添加组织单位成功: {dn}")
+                    logger.info(f"使用对象类 {classes} 添加成功: {dn}")
+                    if self.mirror is not None:
+                        self.mirror.add(dn, dict(current_attrs, objectClass=classes))
+                    # 记住可用的组合，后续用户只需一次添加
+                    allowed = None
+                    if 'account' in classes and 'inetOrgPerson' not in classes and 'person' not in classes:
+                        allowed = frozenset(key.lower() for key in current_attrs)
+                    remember_capabilities(
+                        self.pool_key or self.server_uri, self.server_uri,
+                        ObjectClassCapabilities(ObjectClassSet(classes, allowed), ObjectClassSet(list(OU_OBJECT_CLASSES)))
+                    )
                     return True
+                elif self.conn.result.get('result') == 68:
+                    logger.info(f"对象已存在，尝试修改: {dn}")
+                    return self.modify_object(dn, attrs)
                 else:
-                    logger.error(f"添加组织单位失败: {dn}, 原因: {self.conn.result}")
-                    return False
+                    logger.warning(f"使用对象类 {classes} 添加失败: {dn}, 原因: {self.conn.result}")
+            except LDAPEntryAlreadyExistsResult:
+                raise
+            except LDAPCircuitOpenError:
+                raise
+            except Exception as e:
+                logger.debug(f"使用对象类 {classes} 添加失败: {dn}, 错误: {str(e)}")
+                continue
+        
+        # 如果所有尝试都失败，记录详细错误
+        logger.error(f"所有尝试添加用户的方法都失败了: {dn}")
+        return False
+            
+    def add_object(self, dn: str, attributes: Dict[str, Any], on_done: Optional[WriteCallback] = None) -> bool:
+        """
+        添加LDAP对象
+        
+        用户对象的对象类根据服务器schema一次确定（结果按LDAP配置缓存），每个条目只需一次添加操作。
+        
+        Args:
+            dn: 对象DN
+            attributes: 对象属性
+            on_done: 完成回调(是否成功, LDAP结果)，异步写入时在取回结果后调用
+            
+        Returns:
+            bool: 是否添加成功，异步写入时表示是否已提交
+        """
+        self.has_written = True
+        if self.async_window is not None and self.conn:
+            object_classes, attrs = self._prepare_add(dn, attributes)
+            if object_classes:
+                self.async_window.add(
+                    dn, object_classes, attrs,
+                    on_done=lambda success, result: self._after_async_add(dn, object_classes, attrs, success, result, on_done)
+                )
+                return True
+            # 需要逐个尝试对象类时使用同步连接，先等待相关的异步请求完成
+            self.async_window.wait_for(dn)
+            
+        success = self._add_object(dn, attributes)
+        self._notify(on_done, success, self.conn.result if self.conn else None)
+        return success
+        
+    def _after_async_add(self, dn: str, object_classes: List[str], attrs: Dict[str, Any], success: bool,
+                         result: Optional[Dict[str, Any]], on_done: Optional[WriteCallback]):
+        """异步添加完成后的处理"""
+        if success:
+            logger.info(f"添加对象成功: {dn}")
+            if self.mirror is not None:
+                self.mirror.add(dn, dict(attrs, objectClass=object_classes))
+            self._notify(on_done, True, result)
+        elif result and result.get('result') == 68:
+            logger.info(f"对象已存在，尝试修改: {dn}")
+            self.modify_object(dn, attrs, on_done=on_done)
+        else:
+            logger.error(f"添加对象失败: {dn}, 原因: {result}")
+            self._notify(on_done, False, result)
+            
+    def _add_object(self, dn: str, attributes: Dict[str, Any]) -> bool:
+        """同步添加LDAP对象"""
+        if not self.conn:
+            logger.error("未连接到LDAP服务器")
+            return False
+            
+        attrs = attributes
+        try:
+            object_classes, attrs = self._prepare_add(dn, attributes)
+            
+            if not object_classes:
+                # 无法读取schema，退回逐个尝试
+                return self._add_user_by_trial(dn, attrs)
+            
+            logger.info(f"尝试添加对象: {dn}, 对象类: {object_classes}")
+            result = self._request('add', self.conn, dn, object_classes, attrs)
+            
+            if result:
+                logger.info(f"添加对象成功: {dn}")
+                if self.mirror is not None:
+                    self.mirror.add(dn, dict(attrs, objectClass=object_classes))
+                return True
+            elif self.conn.result.get('result') == 68:
+                # entryAlreadyExists，未开启raise_exceptions时通过结果码判断
+                logger.info(f"对象已存在，尝试修改: {dn}")
+                return self.modify_object(dn, attrs)
             else:
-                # 其他类型的对象，使用提供的对象类
-                logger.info(f"尝试添加其他类型对象: {dn}, 对象类: {object_classes}")
-                result = self.conn.add(dn, object_classes, attrs_copy)
-                
-                if result:
-                    logger.info(f"添加对象成功: {dn}")
-                    return True
-                else:
-                    logger.error(f"添加对象失败: {dn}, 原因: {self.conn.result}")
-                    return False
+                logger.error(f"添加对象失败: {dn}, 原因: {self.conn.result}")
+                return False
                     
         except LDAPEntryAlreadyExistsResult:
             # 如果对象已存在，则尝试修改
             logger.info(f"对象已存在，尝试修改: {dn}")
-            return self.modify_object(dn, attributes)
+            return self.modify_object(dn, attrs)
         except LDAPException as e:
             logger.error(f"添加对象失败: {dn}, 错误: {str(e)}")
             return False
             
-    def modify_object(self, dn: str, attributes: Dict[str, Any]) -> bool:
+    def _attr_key(self, name: str) -> str:
+        """属性名的规范形式（小写，别名按schema归一，如userid与uid）"""
+        schema = ensure_server_info(self.pool_key or self.server_uri, self.server_uri, self.conn)
+        if schema is not None:
+            attr_type = schema.attribute_types.get(name)
+            if attr_type is not None and attr_type.name:
+                return attr_type.name[0].lower()
+        return name.lower()
+        
+    def _build_delta_changes(self, current_attrs: Dict[str, List[Any]], attributes: Dict[str, Any]) -> Dict[str, list]:
+        """
+        计算把条目从当前属性修改为目标属性所需的最小变更
+        
+        只处理attributes中出现的属性：当前没有的属性使用ADD，值不同的使用REPLACE，
+        目标值为空的使用DELETE；未出现在attributes中的属性保持不变。
+        
+        Args:
+            current_attrs: 条目当前属性
+            attributes: 目标属性
+            
+        Returns:
+            Dict[str, list]: ldap3 modify所需的变更，无变化时为空字典
+        """
+        current = {}
+        for name, values in current_attrs.items():
+            values = values if isinstance(values, list) else [values]
+            current.setdefault(self._attr_key(name), set()).update(str(v) for v in values)
+        
+        # 合并别名属性（如uid与userid）的目标值，保留首次出现的属性名
+        desired = {}
+        for name, values in attributes.items():
+            if name.lower() == 'objectclass':
+                continue
+            if values is None or values == '':
+                values = []
+            elif not isinstance(values, list):
+                values = [values]
+            key = self._attr_key(name)
+            if key in desired:
+                merged = desired[key][1]
+                merged.extend(v for v in values if v not in merged)
+            else:
+                desired[key] = (name, list(values))
+        
+        changes = {}
+        for key, (name, values) in desired.items():
+            old_values = current.get(key)
+            if not values:
+                if old_values:
+                    changes[name] = [(MODIFY_DELETE, [])]
+            elif not old_values:
+                changes[name] = [(MODIFY_ADD, values)]
+            elif old_values != set(str(v) for v in values):
+                changes[name] = [(MODIFY_REPLACE, values)]
+        return changes
+        
+    def _modify_changes(self, attributes: Dict[str, Any],
+                        current_attrs: Optional[Dict[str, List[Any]]] = None) -> Dict[str, list]:
+        """
+        构建modify所需的变更
+        
+        Args:
+            attributes: 对象属性
+            current_attrs: 对象当前属性，提供时只包含有变化的属性
+            
+        Returns:
+            Dict[str, list]: ldap3 modify所需的变更
+        """
+        if current_attrs is not None:
+            return self._build_delta_changes(current_attrs, attributes)
+            
+        # 创建属性副本，移除objectClass以避免修改对象类
+        attrs_copy = dict(attributes)
+        if 'objectClass' in attrs_copy:
+            del attrs_copy['objectClass']
+            
+        # 将属性转换为ldap3要求的格式
+        changes = {}
+        for attr, values in attrs_copy.items():
+            if isinstance(values, list):
+                changes[attr] = [(MODIFY_REPLACE, values)]
+            else:
+                changes[attr] = [(MODIFY_REPLACE, [values])]
+        return changes
+        
+    def modify_object(self, dn: str, attributes: Dict[str, Any], current_attrs: Optional[Dict[str, List[Any]]] = None,
+                      on_done: Optional[WriteCallback] = None) -> bool:
         """
         修改LDAP对象
         
         Args:
             dn: 对象DN
             attributes: 对象属性
+            current_attrs: 对象当前属性，提供时只发送有变化的属性，无变化时不访问服务器
+            on_done: 完成回调(是否成功, LDAP结果)，异步写入时在取回结果后调用
             
         Returns:
-            bool: 是否修改成功
+            bool: 是否修改成功，异步写入时表示是否已提交
         """
         if not self.conn:
             logger.error("未连接到LDAP服务器")
+            self._notify(on_done, False, None)
             return False
             
-        try:
-            # 创建属性副本，移除objectClass以避免修改对象类
-            attrs_copy = dict(attributes)
-            if 'objectClass' in attrs_copy:
-                del attrs_copy['objectClass']
-                
-            # 将属性转换为ldap3要求的格式
-            changes = {}
-            for attr, values in attrs_copy.items():
-                if isinstance(values, list):
-                    changes[attr] = [(MODIFY_REPLACE, values)]
-                else:
-                    changes[attr] = [(MODIFY_REPLACE, [values])]
-                    
-            result = self.conn.modify(dn, changes)
+        changes = self._modify_changes(attributes, current_attrs)
+        if not changes:
+            logger.debug(f"对象属性无变化，跳过修改: {dn}")
+            self._notify(on_done, True, None)
+            return True
             
-            if result:
-                logger.info(f"修改对象成功: {dn}")
-                return True
-            else:
-                logger.error(f"修改对象失败: {dn}, 原因: {self.conn.result}")
-                return False
+        self.has_written = True
+        if self.async_window is not None:
+            self.async_window.modify(
+                dn, changes,
+                on_done=lambda success, result: self._after_modify(dn, attributes, success, result, on_done)
+            )
+            return True
+            
+        try:
+            result = self._request('modify', self.conn, dn, changes)
         except LDAPException as e:
             logger.error(f"修改对象失败: {dn}, 错误: {str(e)}")
+            self._notify(on_done, False, {'result': None, 'description': str(e)})
             return False
+        return self._after_modify(dn, attributes, result, self.conn.result, on_done)
+        
+    def _after_modify(self, dn: str, attributes: Dict[str, Any], success: bool,
+                      result: Optional[Dict[str, Any]], on_done: Optional[WriteCallback]) -> bool:
+        """修改完成后的处理"""
+        if success:
+            logger.info(f"修改对象成功: {dn}")
+            if self.mirror is not None:
+                self.mirror.update(dn, attributes)
+        else:
+            logger.error(f"修改对象失败: {dn}, 原因: {result}")
+        self._notify(on_done, success, result)
+        return success
             
     def add_ou(self, dn: str, attributes: Optional[Dict[str, Any]] = None) -> bool:
         """
@@ -328,24 +811,29 @@ class LDAPConnector:
         ou_attrs = attributes or {}
         
         try:
-            # 检查OU是否已存在
-            ou_name = dn.split(',')[0].split('=')[1]
-            self.conn.search(
-                search_base=dn.split(',', 1)[1],
-                search_filter=f"(ou={ou_name})",
-                search_scope=SUBTREE,
-                attributes=['*']
-            )
-            
-            if self.conn.entries:
-                logger.info(f"组织单位已存在: {dn}")
-                return True
+            if self.mirror is not None and self.mirror.covers(dn):
+                # 镜像覆盖该位置时直接在内存中判断
+                if self.mirror.exists(dn):
+                    logger.info(f"组织单位已存在: {dn}")
+                    return True
+            else:
+                # 检查OU是否已存在
+                ou_name = dn.split(',')[0].split('=')[1]
+                if self._first_dn(dn.split(',', 1)[1], f"(ou={ou_name})") is not None:
+                    logger.info(f"组织单位已存在: {dn}")
+                    return True
                 
             # 创建OU
-            result = self.conn.add(dn, ['organizationalUnit'], ou_attrs)
+            self.has_written = True
+            result = self._request('add', self.conn, dn, ['organizationalUnit'], ou_attrs)
             
             if result:
                 logger.info(f"添加组织单位成功: {dn}")
+                if self.mirror is not None:
+                    self.mirror.add(dn, dict(ou_attrs, objectClass=['organizationalUnit']))
+                return True
+            elif self.conn.result.get('result') == 68:
+                logger.info(f"组织单位已存在: {dn}")
                 return True
             else:
                 logger.error(f"添加组织单位失败: {dn}, 原因: {self.conn.result}")
@@ -357,96 +845,273 @@ class LDAPConnector:
             logger.error(f"添加组织单位失败: {dn}, 错误: {str(e)}")
             return False
             
-    def search_user_by_uid(self, uid: str, base_dn: Optional[str] = None) -> Optional[str]:
+    def _first_dn(self, base: str, search_filter: str, search_scope: str = SUBTREE) -> Optional[str]:
         """
-        根据UID在LDAP中查找用户，并返回用户DN
+        只返回DN的搜索：不请求任何属性，最多返回一个条目，也不构建Entry对象
+        
+        Args:
+            base: 搜索基础DN
+            search_filter: LDAP搜索过滤器
+            search_scope: 搜索范围
+            
+        Returns:
+            str or None: 第一个匹配条目的DN，未找到则返回None
+            
+        Raises:
+            LDAPException: 搜索出错
+        """
+        self._request(
+            'search', self.conn,
+            search_base=base,
+            search_filter=search_filter,
+            search_scope=search_scope,
+            attributes=DN_ONLY,
+            size_limit=1
+        )
+        for response in self.conn.response or []:
+            if response.get('type') == 'searchResEntry':
+                return response['dn']
+        return None
+        
+    def _find_first_entry(self, base: str, search_filter: str,
+                          attributes: Optional[List[str]] = None) -> Optional[Tuple[str, Dict[str, List[Any]]]]:
+        """
+        子树搜索并返回第一个匹配条目
+        
+        Args:
+            base: 搜索基础DN
+            search_filter: LDAP搜索过滤器
+            attributes: 需要返回的属性，默认为同步使用的属性(MIRROR_ATTRIBUTES)
+            
+        Returns:
+            Tuple[str, Dict[str, List[Any]]] or None: (DN, {属性名: [属性值]})，未找到则返回None
+            
+        Raises:
+            LDAPException: 搜索出错
+        """
+        self._request(
+            'search', self.conn,
+            search_base=base,
+            search_filter=search_filter,
+            search_scope=SUBTREE,
+            attributes=attributes or MIRROR_ATTRIBUTES,
+            size_limit=1
+        )
+        for response in self.conn.response or []:
+            if response.get('type') != 'searchResEntry':
+                continue
+            attrs = {}
+            for name, values in response.get('attributes', {}).items():
+                if values in (None, [], ''):
+                    continue
+                attrs[name] = values if isinstance(values, list) else [values]
+            return response['dn'], attrs
+        return None
+            
+    def search_user_entry_by_uid(self, uid: str, base_dn: Optional[str] = None) -> Optional[Tuple[str, Dict[str, List[Any]]]]:
+        """
+        根据UID在LDAP中查找用户，并返回用户DN及属性
         
         Args:
             uid: 用户ID
             base_dn: 搜索基础DN，默认为self.base_dn
             
         Returns:
-            str or None: 用户DN，未找到则返回None
+            Tuple[str, Dict[str, List[Any]]] or None: (用户DN, 用户属性)，未找到则返回None
         """
         if not self.conn:
             logger.error("未连接到LDAP服务器")
             return None
             
         base = base_dn or self.base_dn
-        search_filter = f"(uid={uid})"
+        search_filter = f"(uid={escape_filter_chars(uid)})"
         
         try:
             logger.debug(f"根据UID搜索用户: {uid}, 基础DN: {base}")
-            self.conn.search(
-                search_base=base,
-                search_filter=search_filter,
-                search_scope=SUBTREE,
-                attributes=['*']
-            )
+            entry = self._find_first_entry(base, search_filter)
             
-            if self.conn.entries:
-                entry = self.conn.entries[0]
-                user_dn = entry.entry_dn
-                logger.debug(f"找到用户DN: {user_dn}")
-                return user_dn
+            if entry:
+                logger.debug(f"找到用户DN: {entry[0]}")
             else:
                 logger.debug(f"未找到UID为 {uid} 的用户")
-                return None
+            return entry
         except LDAPException as e:
             logger.error(f"搜索用户失败: {str(e)}")
             return None
             
-    def find_department_by_description(self, description_pattern: str, base_dn: Optional[str] = None) -> Optional[str]:
+    def search_user_by_uid(self, uid: str, base_dn: Optional[str] = None) -> Optional[str]:
         """
-        根据描述信息在LDAP中查找部门，并返回部门DN
+        根据UID在LDAP中查找用户，并返回用户DN
+        
+        Args:
+            uid: 用户ID
+            base_dn: 搜索基础DN，默认为self.base_dn
+            
+        Returns:
+            str or None: 用户DN，未找到则返回None
+        """
+        if not self.conn:
+            logger.error("未连接到LDAP服务器")
+            return None
+            
+        try:
+            return self._first_dn(base_dn or self.base_dn, f"(uid={escape_filter_chars(uid)})")
+        except LDAPException as e:
+            logger.error(f"搜索用户失败: {str(e)}")
+            return None
+            
+    def find_department_entry_by_description(self, description_pattern: str,
+                                             base_dn: Optional[str] = None) -> Optional[Tuple[str, Dict[str, List[Any]]]]:
+        """
+        根据描述信息在LDAP中查找部门，并返回部门DN及属性
         
         Args:
             description_pattern: 描述信息模式，如"企业微信部门ID: 123"
             base_dn: 搜索基础DN，默认为self.base_dn
             
         Returns:
-            str or None: 部门DN，未找到则返回None
+            Tuple[str, Dict[str, List[Any]]] or None: (部门DN, 部门属性)，未找到则返回None
         """
         if not self.conn:
             logger.error("未连接到LDAP服务器")
             return None
             
         base = base_dn or self.base_dn
-        # 修复搜索过滤器，使用通配符匹配描述信息
-        search_filter = f"(&(objectClass=organizationalUnit)(description=*{description_pattern}*))"
+        # 等值匹配描述信息，可以使用description的等值索引
+        search_filter = f"(&(objectClass=organizationalUnit)(description={escape_filter_chars(description_pattern)}))"
         
         try:
             logger.debug(f"根据描述信息搜索部门: {description_pattern}, 基础DN: {base}")
-            self.conn.search(
-                search_base=base,
-                search_filter=search_filter,
-                search_scope=SUBTREE,
-                attributes=['*']
-            )
+            entry = self._find_first_entry(base, search_filter)
             
-            if self.conn.entries:
-                entry = self.conn.entries[0]
-                dept_dn = entry.entry_dn
-                logger.debug(f"找到部门DN: {dept_dn}")
-                return dept_dn
+            if entry:
+                logger.debug(f"找到部门DN: {entry[0]}")
             else:
                 logger.debug(f"未找到描述为 {description_pattern} 的部门")
-                return None
+            return entry
+        except LDAPException as e:
+            logger.error(f"搜索部门失败: {str(e)}")
+            return None
+            
+    def find_department_by_description(self, description_pattern: str, base_dn: Optional[str] = None) -> Optional[str]:
+        """
+        根据描述信息在LDAP中查找部门，并返回部门DN
+        
+        Args:
+            description_pattern: 描述信息模式，如"企业微信部门ID: 123"
+            base_dn: 搜索基础DN，默认为self.base_dn
+            
+        Returns:
+            str or None: 部门DN，未找到则返回None
+        """
+        if not self.conn:
+            logger.error("未连接到LDAP服务器")
+            return None
+            
+        search_filter = f"(&(objectClass=organizationalUnit)(description={escape_filter_chars(description_pattern)}))"
+        try:
+            return self._first_dn(base_dn or self.base_dn, search_filter)
         except LDAPException as e:
             logger.error(f"搜索部门失败: {str(e)}")
             return None
             
-    def move_object(self, old_dn: str, new_dn: str) -> bool:
+    def find_entry_by_platform_id(self, platform: str, kind: str, external_id: Any,
+                                  base_dn: Optional[str] = None) -> Optional[Tuple[str, Dict[str, List[Any]]]]:
+        """
+        根据平台标识属性等值查找用户或部门，兼容仍使用描述信息标识的旧条目
+        
+        Args:
+            platform: 平台代码 wecom/feishu/dingtalk
+            kind: 对象类型 user/department
+            external_id: 平台中的用户ID或部门ID
+            base_dn: 搜索基础DN，默认为self.base_dn
+            
+        Returns:
+            Tuple[str, Dict[str, List[Any]]] or None: (DN, 属性)，未找到则返回None
+        """
+        if not self.conn:
+            logger.error("未连接到LDAP服务器")
+            return None
+            
+        base = base_dn or self.base_dn
+        if self.mirror is not None and base.lower() == self.mirror.base_dn.lower():
+            # 镜像覆盖整个搜索范围时直接在内存中查找
+            entry = self.mirror.find_by_platform_id(platform, kind, external_id)
+            return (entry.dn, entry.attrs) if entry is not None else None
+            
+        search_filter = identity_filter(platform, kind, external_id)
+        
+        try:
+            logger.debug(f"根据平台标识搜索: {search_filter}, 基础DN: {base}")
+            return self._find_first_entry(base, search_filter)
+        except LDAPException as e:
+            logger.error(f"根据平台标识搜索失败: {str(e)}")
+            return None
+            
+    @staticmethod
+    def attrs_after_move(attrs: Dict[str, List[Any]], new_dn: str) -> Dict[str, List[Any]]:
+        """
+        计算条目重命名(modify_dn)后的属性：RDN属性值被替换为新RDN的值
+        
+        Args:
+            attrs: 重命名前的属性
+            new_dn: 新DN
+            
+        Returns:
+            Dict[str, List[Any]]: 重命名后的属性副本
+        """
+        rdn_attr, rdn_value = new_dn.split(',', 1)[0].split('=', 1)
+        moved = {name: values for name, values in attrs.items() if name.lower() != rdn_attr.lower()}
+        moved[rdn_attr] = [rdn_value]
+        return moved
+            
+    def move_object(self, old_dn: str, new_dn: str, on_done: Optional[WriteCallback] = None) -> bool:
         """
         移动LDAP对象（重命名DN）
         
         Args:
             old_dn: 原DN
             new_dn: 新DN
+            on_done: 完成回调(是否成功, LDAP结果)，异步写入时在取回结果后调用
             
         Returns:
-            bool: 是否移动成功
+            bool: 是否移动成功，异步写入时表示是否已提交
         """
+        self.has_written = True
+        if self.async_window is not None and self.conn:
+            new_rdn, new_parent = new_dn.split(',', 1)
+            old_parent = old_dn.split(',', 1)[1]
+            self.async_window.modify_dn(
+                old_dn, new_rdn, new_superior=None if new_parent == old_parent else new_parent,
+                on_done=lambda success, result: self._after_async_move(old_dn, new_dn, success, result, on_done)
+            )
+            return True
+            
+        moved = self._move_object(old_dn, new_dn)
+        if moved and self.mirror is not None:
+            # 服务器端的modify_dn会移动整个子树，镜像中的下级DN一并改写
+            self.mirror.move(old_dn, new_dn)
+        self._notify(on_done, moved, self.conn.result if self.conn else None)
+        return moved
+        
+    def _after_async_move(self, old_dn: str, new_dn: str, success: bool,
+                          result: Optional[Dict[str, Any]], on_done: Optional[WriteCallback]):
+        """异步移动完成后的处理，modify_dn被拒绝时改用同步流程（含复制后删除的备选方案）"""
+        if success:
+            logger.info(f"移动对象成功: {old_dn} -> {new_dn}")
+        else:
+            logger.warning(f"异步移动对象失败，改用同步方式: {old_dn} -> {new_dn}, 原因: {result}")
+            self.metrics.retry('modify_dn')
+            if self.async_window is not None:
+                self.async_window.wait_for(old_dn, new_dn)
+            success = self._move_object(old_dn, new_dn)
+            result = self.conn.result
+        if success and self.mirror is not None:
+            self.mirror.move(old_dn, new_dn)
+        self._notify(on_done, success, result)
+            
+    def _move_object(self, old_dn: str, new_dn: str) -> bool:
+        """移动LDAP对象，不更新镜像"""
         if not self.conn:
             logger.error("未连接到LDAP服务器")
             return False
@@ -461,151 +1126,222 @@ class LDAPConnector:
             logger.info(f"移动对象: {old_dn} -> {new_dn}")
             logger.debug(f"旧RDN: {old_rdn}, 新RDN: {new_rdn}, 旧上级: {old_parent}, 新上级: {new_parent}")
             
-            # 检查是否仅仅是重命名
-            if old_parent == new_parent:
-                try:
-                    # 仅重命名，不修改上级
-                    result = self.conn.modify_dn(old_dn, new_rdn)
-                    
-                    if result:
-                        logger.info(f"重命名对象成功: {old_dn} -> {new_dn}")
-                        return True
-                    else:
-                        logger.warning(f"重命名对象失败: {old_dn} -> {new_dn}, 原因: {self.conn.result}")
-                except Exception as e:
-                    logger.warning(f"重命名对象时发生异常: {str(e)}")
+            cache_key = self.pool_key or self.server_uri
+            if subtree_rename_refused(cache_key, self.server_uri) and self._has_children(old_dn):
+                # 已知服务器拒绝子树重命名，不再尝试modify_dn
+                logger.info(f"服务器不支持子树重命名，直接使用复制方式移动: {old_dn} -> {new_dn}")
             else:
-                try:
-                    # 如果需要移动到不同父级，尝试直接使用新DN
-                    result = self.conn.modify_dn(old_dn, new_rdn, new_superior=new_parent)
-                    
-                    if result:
-                        logger.info(f"移动并重命名对象成功: {old_dn} -> {new_dn}")
-                        return True
-                    else:
-                        logger.warning(f"移动并重命名对象失败: {old_dn} -> {new_dn}, 原因: {self.conn.result}")
-                except Exception as e:
-                    logger.warning(f"移动并重命名对象时发生异常: {str(e)}")
-            
-            # 如果直接方法失败，尝试备选方案 - 复制新建然后删除
-            try:
-                # 1. 查询旧对象的所有属性
-                self.conn.search(
-                    search_base=old_dn,
-                    search_filter='(objectClass=*)',
-                    search_scope='BASE',
-                    attributes=['*']
-                )
-                
-                if not self.conn.entries:
-                    logger.error(f"无法获取原对象属性: {old_dn}")
-                    return False
-                
-                old_entry = self.conn.entries[0]
-                object_classes = old_entry['objectClass'].values
-                
-                # 2. 建立属性字典
-                attrs = {}
-                for attr_name in old_entry.entry_attributes:
-                    if attr_name.lower() != 'objectclass':  # objectClass会在add时单独提供
-                        if hasattr(old_entry[attr_name], 'values') and old_entry[attr_name].values:
-                            attrs[attr_name] = old_entry[attr_name].values
-                
-                # 3. 提取新对象的RDN属性名和值
-                new_rdn_attr, new_rdn_value = new_rdn.split('=', 1)
-                # 确保RDN属性在新对象的属性中
-                attrs[new_rdn_attr] = [new_rdn_value]
-                
-                # 4. 检查目标位置是否存在对象（防止覆盖）
-                if self.search_dn(new_dn):
-                    logger.warning(f"目标位置已存在对象，无法复制: {new_dn}")
-                    return False
+                # 检查是否仅仅是重命名
+                if old_parent == new_parent:
+                    try:
+                        # 仅重命名，不修改上级
+                        result = self._request('modify_dn', self.conn, old_dn, new_rdn)
+                        
+                        if result:
+                            logger.info(f"重命名对象成功: {old_dn} -> {new_dn}")
+                            return True
+                        else:
+                            logger.warning(f"重命名对象失败: {old_dn} -> {new_dn}, 原因: {self.conn.result}")
+                    except LDAPCircuitOpenError:
+                        raise
+                    except Exception as e:
+                        logger.warning(f"重命名对象时发生异常: {str(e)}")
+                else:
+                    try:
+                        # 如果需要移动到不同父级，尝试直接使用新DN
+                        result = self._request('modify_dn', self.conn, old_dn, new_rdn, new_superior=new_parent)
+                        
+                        if result:
+                            logger.info(f"移动并重命名对象成功: {old_dn} -> {new_dn}")
+                            return True
+                        else:
+                            logger.warning(f"移动并重命名对象失败: {old_dn} -> {new_dn}, 原因: {self.conn.result}")
+                    except LDAPCircuitOpenError:
+                        raise
+                    except Exception as e:
+                        logger.warning(f"移动并重命名对象时发生异常: {str(e)}")
+                        
+                # 服务器因条目有下级而拒绝时记录下来，之后的子树移动直接复制
+                code = (self.conn.result or {}).get('result')
+                if code == 66 or (code in SUBTREE_RENAME_REFUSED_CODES and self._has_children(old_dn)):
+                    remember_subtree_rename_refused(cache_key, self.server_uri)
+            
+            # 如果直接方法失败，尝试备选方案 - 整个子树复制新建然后删除
+            self.metrics.retry('modify_dn')
+            return self._move_subtree_by_copy(old_dn, new_dn)
+        except LDAPCircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"移动对象过程中发生未预期的错误: {str(e)}")
+            import traceback
+            logger.error(traceback.format_exc())
+            return False
+            
+    def _has_children(self, dn: str) -> bool:
+        """条目是否有下级条目，镜像包含该条目时不访问服务器"""
+        if self.mirror is not None and self.mirror.exists(dn):
+            return bool(self.mirror.children(dn))
+        try:
+            self._request(
+                'search', self.conn,
+                search_base=dn,
+                search_filter='(objectClass=*)',
+                search_scope=LEVEL,
+                attributes=['1.1'],
+                size_limit=1
+            )
+            return any(response.get('type') == 'searchResEntry' for response in self.conn.response or [])
+        except LDAPException:
+            return False
+            
+    def _submit_write(self, operation: str, dn: str, *args, on_done: WriteCallback):
+        """发送一次不经过镜像的原始写入：异步写入时进入窗口，否则同步执行"""
+        if self.async_window is not None:
+            getattr(self.async_window, operation)(dn, *args, on_done=on_done)
+            return
+        try:
+            success = self._request(operation, self.conn, dn, *args)
+            result = self.conn.result
+        except LDAPException as e:
+            success, result = False, {'result': None, 'description': str(e)}
+        on_done(success, result)
+        
+    def _move_subtree_by_copy(self, old_dn: str, new_dn: str) -> bool:
+        """
+        通过复制后删除的方式移动条目及其全部下级
+        
+        一次子树搜索读取所有条目，先上级后下级新增到新位置，全部成功后再先下级后上级删除原条目；
+        任一条目新增失败时删除已新增的条目，原条目保持不变。写入通过异步窗口流水线发送。
+        
+        Args:
+            old_dn: 原DN
+            new_dn: 新DN
+            
+        Returns:
+            bool: 是否移动成功
+        """
+        try:
+            # 1. 检查目标位置是否存在对象（防止覆盖）
+            if self.search_dn(new_dn):
+                logger.warning(f"目标位置已存在对象，无法复制: {new_dn}")
+                return False
                 
-                # 5. 创建新对象
-                add_result = self.conn.add(new_dn, object_classes, attrs)
-                if not add_result:
-                    logger.error(f"创建新对象失败: {new_dn}, 原因: {self.conn.result}")
-                    return False
+            # 2. 一次子树搜索读取原对象及全部下级，按深度排序（上级在前）
+            # 复制条目需要全部用户属性
+            entries = list(self.iter_entries(old_dn, '(objectClass=*)', search_scope=SUBTREE, attributes=['*']))
+            if not entries:
+                logger.error(f"无法获取原对象属性: {old_dn}")
+                return False
+            entries.sort(key=lambda entry: len(to_dn(entry[0])))
+            new_rdn_attr, new_rdn_value = new_dn.split(',', 1)[0].split('=', 1)
+            
+            # 3. 先上级后下级新增到新位置
+            added, failed = [], []
+            
+            def on_added(target_dn, success, result):
+                (added if success else failed).append((target_dn, result))
                 
-                # 6. 获取旧对象下的子对象
-                try:
-                    self.conn.search(
-                        search_base=old_dn,
-                        search_filter='(objectClass=*)',
-                        search_scope='LEVEL',
-                        attributes=['*']
-                    )
-                    
-                    child_entries = self.conn.entries
+            with self.async_writes():
+                for dn, attrs in entries:
+                    target_dn = rebase_dn(dn, old_dn, new_dn)
+                    object_classes = []
+                    new_attrs = {}
+                    for name, values in attrs.items():
+                        if name.lower() == 'objectclass':
+                            object_classes = values
+                        elif target_dn == new_dn and name.lower() == new_rdn_attr.lower():
+                            continue
+                        else:
+                            new_attrs[name] = values
+                    if target_dn == new_dn:
+                        # 确保RDN属性在新对象的属性中
+                        new_attrs[new_rdn_attr] = [new_rdn_value]
+                    self._submit_write('add', target_dn, object_classes, new_attrs, on_done=partial(on_added, target_dn))
+                if self.async_window is not None:
+                    self.async_window.wait_for(new_dn)
                     
-                    # 7. 移动所有子对象到新对象下
-                    for child in child_entries:
-                        child_dn = child.entry_dn
-                        child_rdn = child_dn.split(',')[0]
-                        new_child_dn = f"{child_rdn},{new_dn}"
-                        
-                        # 尝试移动子对象
-                        child_move_result = self.move_object(child_dn, new_child_dn)
-                        if not child_move_result:
-                            logger.warning(f"移动子对象失败: {child_dn} -> {new_child_dn}")
-                            # 继续处理其他子对象，不中断流程
-                except Exception as e:
-                    logger.warning(f"查找或移动子对象时发生异常: {str(e)}")
-                
-                # 8. 删除旧对象
-                try:
-                    delete_result = self.conn.delete(old_dn)
-                    if not delete_result:
-                        logger.warning(f"删除原对象失败: {old_dn}, 原因: {self.conn.result}")
-                        # 不影响总体结果，主要是新对象创建成功
-                except Exception as e:
-                    logger.warning(f"删除原对象时发生异常: {str(e)}")
+            if failed:
+                logger.error(f"复制子树失败: {old_dn} -> {new_dn}, {len(failed)} 个条目新增失败, "
+                             f"首个: {failed[0][0]}, 原因: {failed[0][1]}")
+                # 回滚已新增的条目（先下级后上级）
+                with self.async_writes():
+                    for target_dn, _ in sorted(added, key=lambda item: len(to_dn(item[0])), reverse=True):
+                        self._submit_write('delete', target_dn, on_done=lambda success, result: None)
+                    if self.async_window is not None:
+                        self.async_window.wait_for(new_dn)
+                return False
                 
-                logger.info(f"通过复制的方式成功移动对象: {old_dn} -> {new_dn}")
-                return True
+            # 4. 先下级后上级删除原条目
+            delete_failed = []
+            
+            def on_deleted(dn, success, result):
+                if not success:
+                    delete_failed.append((dn, result))
+                    
+            with self.async_writes():
+                for dn, _ in reversed(entries):
+                    self._submit_write('delete', dn, on_done=partial(on_deleted, dn))
+                if self.async_window is not None:
+                    self.async_window.wait_for(old_dn)
+            if delete_failed:
+                # 不影响总体结果，主要是新对象创建成功
+                logger.warning(f"删除原对象失败 {len(delete_failed)} 个, 首个: {delete_failed[0][0]}, "
+                               f"原因: {delete_failed[0][1]}")
                 
-            except Exception as e:
-                logger.error(f"通过复制方式移动对象时发生异常: {str(e)}")
-                import traceback
-                logger.error(traceback.format_exc())
-                return False
+            logger.info(f"通过复制的方式成功移动对象: {old_dn} -> {new_dn}, 共 {len(entries)} 个条目")
+            return True
             
-            # 所有方法都失败
-            logger.error(f"所有尝试移动对象的方法都失败: {old_dn} -> {new_dn}")
-            return False
+        except LDAPCircuitOpenError:
+            raise
         except Exception as e:
-            logger.error(f"移动对象过程中发生未预期的错误: {str(e)}")
+            logger.error(f"通过复制方式移动对象时发生异常: {str(e)}")
             import traceback
             logger.error(traceback.format_exc())
             return False
             
-    def delete_object(self, dn: str) -> bool:
+    def delete_object(self, dn: str, on_done: Optional[WriteCallback] = None) -> bool:
         """
         删除LDAP对象
         
         Args:
             dn: 对象DN
+            on_done: 完成回调(是否成功, LDAP结果)，异步写入时在取回结果后调用
             
         Returns:
-            bool: 是否删除成功
+            bool: 是否删除成功，异步写入时表示是否已提交
         """
         if not self.conn:
             logger.error("未连接到LDAP服务器")
+            self._notify(on_done, False, None)
             return False
             
-        try:
-            logger.info(f"删除对象: {dn}")
-            result = self.conn.delete(dn)
+        logger.info(f"删除对象: {dn}")
+        self.has_written = True
+        if self.async_window is not None:
+            self.async_window.delete(
+                dn, on_done=lambda success, result: self._after_delete(dn, success, result, on_done)
+            )
+            return True
             
-            if result:
-                logger.info(f"删除对象成功: {dn}")
-                return True
-            else:
-                logger.error(f"删除对象失败: {dn}, 原因: {self.conn.result}")
-                return False
+        try:
+            result = self._request('delete', self.conn, dn)
         except LDAPException as e:
             logger.error(f"删除对象失败: {dn}, 错误: {str(e)}")
+            self._notify(on_done, False, {'result': None, 'description': str(e)})
             return False
+        return self._after_delete(dn, result, self.conn.result, on_done)
+        
+    def _after_delete(self, dn: str, success: bool, result: Optional[Dict[str, Any]],
+                      on_done: Optional[WriteCallback]) -> bool:
+        """删除完成后的处理"""
+        if success:
+            logger.info(f"删除对象成功: {dn}")
+            if self.mirror is not None:
+                self.mirror.remove(dn)
+        else:
+            logger.error(f"删除对象失败: {dn}, 原因: {result}")
+        self._notify(on_done, success, result)
+        return success
             
     def search_user_with_filter(self, search_filter: str, base_dn: Optional[str] = None) -> Optional[str]:
         """
@@ -626,16 +1362,9 @@ class LDAPConnector:
         
         try:
             logger.debug(f"使用过滤器搜索用户: {search_filter}, 基础DN: {base}")
-            self.conn.search(
-                search_base=base,
-                search_filter=search_filter,
-                search_scope=SUBTREE,
-                attributes=['*']
-            )
+            user_dn = self._first_dn(base, search_filter)
             
-            if self.conn.entries:
-                entry = self.conn.entries[0]
-                user_dn = entry.entry_dn
+            if user_dn:
                 logger.debug(f"找到用户DN: {user_dn}")
                 return user_dn
             else:
@@ -645,13 +1374,13 @@ class LDAPConnector:
             logger.error(f"搜索用户失败: {str(e)}")
             return None
             
-    def get_object_attrs(self, dn):
-        """获取LDAP对象的属性"""
+    def get_object_attrs(self, dn, attributes=None):
+        """获取LDAP对象的属性，attributes为需要的属性，默认为全部用户属性"""
         if not self.conn:
             return {}
         
         try:
-            self.conn.search(dn, '(objectClass=*)', search_scope='BASE', attributes=['*'])
+            self._request('search', self.conn, dn, '(objectClass=*)', search_scope='BASE', attributes=attributes or ['*'])
             if self.conn.entries:
                 entry = self.conn.entries[0]
                 attrs = {}
@@ -659,26 +1388,127 @@ class LDAPConnector:
                     attrs[attr] = list(getattr(entry, attr))
                 return attrs
             return {}
+        except LDAPCircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"获取对象属性失败: {dn}, 错误: {str(e)}")
             return {}
 
     def search_entries(self, search_base, search_filter, search_scope='SUBTREE', attributes=None):
-        """搜索LDAP条目并返回原始条目列表"""
+        """搜索LDAP条目并返回原始条目列表，attributes为需要的属性，默认只返回DN"""
         if attributes is None:
-            attributes = ['*']
+            attributes = DN_ONLY
         
         if not self.conn:
             return []
         
         try:
-            self.conn.search(
+            self._request(
+                'search', self.conn,
                 search_base=search_base,
                 search_filter=search_filter,
                 search_scope=search_scope,
                 attributes=attributes
             )
             return self.conn.entries
+        except LDAPCircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"LDAP搜索失败: {str(e)}")
-            return [] 
\ No newline at end of file
+            return [] 
+
+    @staticmethod
+    @contextmanager
+    def _unchecked_names(conn: Connection):
+        """
+        临时关闭连接的check_names，ldap3解码搜索结果时不再按schema格式化每个属性值
+        
+        仅用于读取raw_attributes的搜索，退出后恢复原设置。
+        """
+        check_names = conn.check_names
+        conn.check_names = False
+        try:
+            yield
+        finally:
+            conn.check_names = check_names
+            
+    def iter_entries(self, search_base: str, search_filter: str, search_scope: str = 'SUBTREE',
+                     attributes: Optional[List[str]] = None,
+                     page_size: Optional[int] = None,
+                     raw: bool = False,
+                     replica: bool = False) -> Iterator[Tuple[str, Dict[str, List[Any]]]]:
+        """
+        使用简单分页控制(Simple Paged Results)流式搜索LDAP条目
+        
+        与search_entries不同，不构建ldap3的Entry对象，也不会一次性把所有结果保存在内存中，
+        适合在大目录中遍历用户和部门。
+        
+        Args:
+            search_base: 搜索基础DN
+            search_filter: LDAP搜索过滤器
+            search_scope: 搜索范围
+            attributes: 需要返回的属性，默认为同步使用的属性(MIRROR_ATTRIBUTES)
+            page_size: 每页条目数，默认为self.page_size
+            raw: 为True时返回未解码的属性值(bytes)，并跳过ldap3按schema格式化属性值，
+                 由调用方只解码自己需要的属性
+            replica: 为True时作为快照读取，配置了只读副本时从副本读取
+            
+        Yields:
+            Tuple[str, Dict[str, List[Any]]]: (DN, {属性名: [属性值]})
+            
+        Raises:
+            LDAPException: 搜索过程中出错
+        """
+        if attributes is None:
+            attributes = MIRROR_ATTRIBUTES
+        
+        if not self.conn:
+            logger.error("未连接到LDAP服务器")
+            return
+        
+        conn = self._snapshot_conn() if replica else self.conn
+        if raw:
+            with self._unchecked_names(conn):
+                yield from self._iter_raw_entries(conn, search_base, search_filter, search_scope,
+                                                  attributes, page_size)
+            return
+        
+        try:
+            responses = conn.extend.standard.paged_search(
+                search_base=search_base,
+                search_filter=search_filter,
+                search_scope=search_scope,
+                attributes=attributes,
+                paged_size=page_size or self.page_size,
+                generator=True
+            )
+            for response in self._timed_pages(conn, responses):
+                if response.get('type') != 'searchResEntry':
+                    continue
+                attrs = {}
+                for name, values in response.get('attributes', {}).items():
+                    if values in (None, [], ''):
+                        continue
+                    attrs[name] = values if isinstance(values, list) else [values]
+                yield response['dn'], attrs
+        except LDAPException as e:
+            logger.error(f"LDAP分页搜索失败: {search_filter}, 错误: {str(e)}")
+            raise
+            
+    def _iter_raw_entries(self, conn, search_base, search_filter, search_scope, attributes, page_size):
+        """分页搜索并直接返回raw_attributes"""
+        try:
+            responses = conn.extend.standard.paged_search(
+                search_base=search_base,
+                search_filter=search_filter,
+                search_scope=search_scope,
+                attributes=attributes,
+                paged_size=page_size or self.page_size,
+                generator=True
+            )
+            for response in self._timed_pages(conn, responses):
+                if response.get('type') == 'searchResEntry':
+                    yield response['dn'], response['raw_attributes']
+        except LDAPException as e:
+            logger.error(f"LDAP分页搜索失败: {search_filter}, 错误: {str(e)}")
+            raise
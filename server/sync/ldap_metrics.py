@@ -0,0 +1,156 @@
+import threading
+from bisect import bisect_left
+from typing import Any, Dict, Optional
+
+from ldap3 import Connection
+
+# 延迟直方图的桶上界(毫秒)，最后一个桶收集超过10秒的请求
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def bytes_received(conn: Optional[Connection]) -> int:
+    """连接累计接收的字节数，连接未开启collect_usage时为0"""
+    usage = conn.usage if conn is not None else None
+    return usage.bytes_received if usage else 0
+
+
+class OperationStats:
+    """单类LDAP操作的统计：次数、失败数、结果码分布、接收字节数、重试次数和延迟直方图"""
+
+    __slots__ = ('count', 'failures', 'retries', 'bytes', 'total_seconds', 'max_seconds', 'result_codes', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.retries = 0
+        self.bytes = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.result_codes: Dict[str, int] = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def record(self, seconds: float, result_code: Optional[int], received: int = 0):
+        """
+        记录一次操作
+
+        Args:
+            seconds: 耗时(秒)
+            result_code: LDAP结果码，未取得结果（如网络异常）时为None
+            received: 本次操作接收的字节数
+        """
+        self.count += 1
+        if result_code != 0:
+            self.failures += 1
+        code = 'error' if result_code is None else str(result_code)
+        self.result_codes[code] = self.result_codes.get(code, 0) + 1
+        self.bytes += received
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.buckets[bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+
+    def merge(self, other: 'OperationStats'):
+        """合并另一份统计"""
+        self.count += other.count
+        self.failures += other.failures
+        self.retries += other.retries
+        self.bytes += other.bytes
+        self.total_seconds += other.total_seconds
+        self.max_seconds = max(self.max_seconds, other.max_seconds)
+        for code, count in other.result_codes.items():
+            self.result_codes[code] = self.result_codes.get(code, 0) + count
+        for index, count in enumerate(other.buckets):
+            self.buckets[index] += count
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """按直方图估算分位延迟(毫秒)：所在桶的上界，不超过最大耗时"""
+        if not self.count:
+            return None
+        max_ms = round(self.max_seconds * 1000, 1)
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= target:
+                return min(float(bound), max_ms)
+        return max_ms
+
+    def summary(self) -> Dict[str, Any]:
+        """可序列化为JSON的统计摘要"""
+        histogram = {f"le_{bound}ms": count for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)}
+        histogram['inf'] = self.buckets[-1]
+        return {
+            'count': self.count,
+            'failures': self.failures,
+            'retries': self.retries,
+            'bytes': self.bytes,
+            'total_ms': round(self.total_seconds * 1000, 1),
+            'avg_ms': round(self.total_seconds * 1000 / self.count, 2) if self.count else None,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_seconds * 1000, 1),
+            'result_codes': dict(self.result_codes),
+            'histogram': histogram,
+        }
+
+
+class LDAPMetrics:
+    """
+    按操作类型(add、modify、modify_dn、delete、search、paged_search)汇总的LDAP操作统计
+
+    每个连接器持有一份，记录本次运行的操作；连接器关闭时合并到进程内按LDAP配置累计的统计中。
+    """
+
+    def __init__(self):
+        self.operations: Dict[str, OperationStats] = {}
+
+    def _stats(self, operation: str) -> OperationStats:
+        stats = self.operations.get(operation)
+        if stats is None:
+            stats = self.operations[operation] = OperationStats()
+        return stats
+
+    def record(self, operation: str, seconds: float, result_code: Optional[int], received: int = 0):
+        """记录一次操作，参数见OperationStats.record"""
+        self._stats(operation).record(seconds, result_code, received)
+
+    def retry(self, operation: str):
+        """记录一次重试（同一逻辑操作再次发送请求，或改用备选方案）"""
+        self._stats(operation).retries += 1
+
+    def merge(self, other: 'LDAPMetrics'):
+        """合并另一份统计"""
+        for operation, stats in other.operations.items():
+            self._stats(operation).merge(stats)
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """按操作类型的统计摘要"""
+        return {operation: stats.summary() for operation, stats in sorted(self.operations.items())}
+
+
+_process_metrics: Dict[str, LDAPMetrics] = {}
+_process_lock = threading.Lock()
+
+
+def merge_process_metrics(key: str, metrics: LDAPMetrics):
+    """
+    将一次运行的统计合并到进程内累计统计
+
+    Args:
+        key: LDAP配置ID或服务器URI
+        metrics: 本次运行的统计
+    """
+    if not metrics.operations:
+        return
+    with _process_lock:
+        total = _process_metrics.get(key)
+        if total is None:
+            total = _process_metrics[key] = LDAPMetrics()
+        total.merge(metrics)
+
+
+def all_operation_stats() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """进程启动以来各LDAP配置的操作统计"""
+    with _process_lock:
+        return {key: metrics.summary() for key, metrics in _process_metrics.items()}
+
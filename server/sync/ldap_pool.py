@@ -0,0 +1,262 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from ldap3 import BASE, Server, Connection, NONE
+from ldap3.core.exceptions import LDAPException
+
+logger = logging.getLogger(__name__)
+
+# 连接池默认参数，可在settings中通过LDAP_POOL_*覆盖
+DEFAULT_POOL_SIZE = 5
+DEFAULT_IDLE_TIMEOUT = 300
+DEFAULT_WAIT_TIMEOUT = 30
+
+
+class LDAPPoolExhausted(LDAPException):
+    """等待空闲连接超时"""
+
+
+class _PooledConnection:
+    """连接池中的连接及其使用时间"""
+
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn: Connection):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class LDAPConnectionPool:
+    """单个LDAP配置的连接池，连接在借出时向服务器做健康检查，失效或空闲超时后自动重新绑定"""
+
+    def __init__(self, server_uri: str, bind_dn: str, bind_password: str, use_ssl: bool = False,
+                 max_size: int = DEFAULT_POOL_SIZE, idle_timeout: int = DEFAULT_IDLE_TIMEOUT,
+                 wait_timeout: int = DEFAULT_WAIT_TIMEOUT):
+        """
+        初始化连接池
+
+        Args:
+            server_uri: LDAP服务器URI
+            bind_dn: 绑定DN
+            bind_password: 绑定密码
+            use_ssl: 是否使用SSL
+            max_size: 最大连接数
+            idle_timeout: 空闲超时(秒)，超过后借出前重新绑定
+            wait_timeout: 连接耗尽时等待空闲连接的最长时间(秒)
+        """
+        self.server_uri = server_uri
+        self.bind_dn = bind_dn
+        self.bind_password = bind_password
+        self.use_ssl = use_ssl
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+
+        self._idle: List[_PooledConnection] = []
+        self._in_use: Dict[int, _PooledConnection] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+
+        # 统计信息
+        self._created = 0
+        self._waits = 0
+        self._reconnects = 0
+        self._acquired = 0
+
+    @property
+    def fingerprint(self) -> Tuple[str, str, str, bool]:
+        """连接参数指纹，参数变化时需要重建连接池"""
+        return (self.server_uri, self.bind_dn, self.bind_password, self.use_ssl)
+
+    def _open(self) -> Connection:
+        """建立并绑定一个新连接"""
+        # 根DSE和schema不随每次绑定下载，由ldap_schema.ensure_server_info按配置缓存
+        server = Server(self.server_uri, get_info=NONE, use_ssl=self.use_ssl)
+        conn = Connection(
+            server,
+            user=self.bind_dn,
+            password=self.bind_password,
+            auto_bind=True,
+            collect_usage=True
+        )
+        self._created += 1
+        return conn
+
+    @staticmethod
+    def _discard(conn: Connection):
+        """关闭连接，忽略关闭时的异常"""
+        try:
+            conn.unbind()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _alive(conn: Connection) -> bool:
+        """
+        向服务器发送一次根DSE的基础范围搜索，确认连接仍然可用
+
+        服务器拒绝读取根DSE时同样说明连接正常，只有网络异常（服务器宕机、连接被对端关闭）视为失效。
+        """
+        try:
+            conn.search('', '(objectClass=*)', search_scope=BASE, attributes=['1.1'])
+            return True
+        except LDAPException as e:
+            logger.debug(f"LDAP连接健康检查失败: {str(e)}")
+            return False
+
+    def _check(self, item: _PooledConnection) -> _PooledConnection:
+        """借出前的健康检查：连接断开、空闲超时或服务器无响应时重新建立连接"""
+        conn = item.conn
+        idle = time.monotonic() - item.last_used
+        if (conn.closed or not conn.bound or (self.idle_timeout and idle > self.idle_timeout)
+                or not self._alive(conn)):
+            logger.debug(f"LDAP连接失效或空闲超时({idle:.0f}秒)，重新绑定: {self.server_uri}")
+            self._discard(conn)
+            item = _PooledConnection(self._open())
+            self._reconnects += 1
+        return item
+
+    def acquire(self) -> Connection:
+        """
+        从连接池借出一个已绑定的连接
+
+        Returns:
+            Connection: 已绑定的LDAP连接
+
+        Raises:
+            LDAPPoolExhausted: 等待空闲连接超时
+            LDAPException: 建立连接失败
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            if self._closed:
+                raise LDAPException("连接池已关闭")
+            waited = False
+            while not self._idle and len(self._in_use) >= self.max_size:
+                if not waited:
+                    self._waits += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise LDAPPoolExhausted(f"等待LDAP连接超时: {self.server_uri}")
+                self._cond.wait(remaining)
+
+            item = self._idle.pop() if self._idle else None
+            # 先占位，避免在建立连接期间被其他线程超额借出
+            placeholder = object()
+            self._in_use[id(placeholder)] = None
+
+        try:
+            item = self._check(item) if item else _PooledConnection(self._open())
+        except Exception:
+            with self._cond:
+                del self._in_use[id(placeholder)]
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            del self._in_use[id(placeholder)]
+            self._in_use[id(item.conn)] = item
+            self._acquired += 1
+        return item.conn
+
+    def release(self, conn: Connection, discard: bool = False):
+        """
+        归还连接
+
+        Args:
+            conn: 借出的连接
+            discard: 是否直接丢弃该连接（例如连接已出错）
+        """
+        with self._cond:
+            item = self._in_use.pop(id(conn), None)
+            if item is None:
+                logger.warning("归还了不属于该连接池的LDAP连接")
+                self._discard(conn)
+                return
+            if discard or self._closed or conn.closed:
+                self._discard(conn)
+            else:
+                item.last_used = time.monotonic()
+                self._idle.append(item)
+            self._cond.notify()
+
+    def close(self):
+        """关闭所有空闲连接，借出中的连接在归还时关闭"""
+        with self._cond:
+            self._closed = True
+            for item in self._idle:
+                self._discard(item.conn)
+            self._idle.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池实时统计"""
+        with self._cond:
+            return {
+                'server_uri': self.server_uri,
+                'max_size': self.max_size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'created': self._created,
+                'acquired': self._acquired,
+                'waits': self._waits,
+                'reconnects': self._reconnects,
+            }
+
+
+_pools: Dict[str, LDAPConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key: str, server_uri: str, bind_dn: str, bind_password: str,
+             use_ssl: bool = False) -> LDAPConnectionPool:
+    """
+    获取（必要时创建）进程内共享的连接池
+
+    Args:
+        key: 连接池键，一般为LDAPConfig的ID
+        server_uri: LDAP服务器URI
+        bind_dn: 绑定DN
+        bind_password: 绑定密码
+        use_ssl: 是否使用SSL
+
+    Returns:
+        LDAPConnectionPool: 连接池
+    """
+    fingerprint = (server_uri, bind_dn, bind_password, use_ssl)
+    with _pools_lock:
+        pool = _pools.get(key)
+        # 配置在其他进程中被修改时，这里通过参数指纹发现并重建
+        if pool is not None and pool.fingerprint != fingerprint:
+            pool.close()
+            pool = None
+        if pool is None:
+            pool = LDAPConnectionPool(
+                server_uri, bind_dn, bind_password, use_ssl,
+                max_size=getattr(settings, 'LDAP_POOL_SIZE', DEFAULT_POOL_SIZE),
+                idle_timeout=getattr(settings, 'LDAP_POOL_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT),
+                wait_timeout=getattr(settings, 'LDAP_POOL_WAIT_TIMEOUT', DEFAULT_WAIT_TIMEOUT),
+            )
+            _pools[key] = pool
+        return pool
+
+
+def invalidate_pool(key: str):
+    """关闭并移除指定的连接池，LDAP配置变更或删除时调用"""
+    with _pools_lock:
+        pool = _pools.pop(key, None)
+    if pool:
+        pool.close()
+        logger.info(f"已关闭LDAP连接池: {pool.server_uri}")
+
+
+def all_pool_stats() -> Dict[str, Dict[str, Any]]:
+    """所有连接池的实时统计，键为连接池键"""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {key: pool.stats() for key, pool in pools.items()}
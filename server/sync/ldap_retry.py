@@ -0,0 +1,258 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from ldap3 import Connection
+from ldap3.core.exceptions import (
+    LDAPBusyResult, LDAPCommunicationError, LDAPException, LDAPResponseTimeoutError, LDAPUnavailableResult
+)
+
+logger = logging.getLogger(__name__)
+
+# 可重试的结果码：busy(51)、unavailable(52)，其余结果码（如已存在、无此对象、违反schema）重试也不会成功
+TRANSIENT_RESULT_CODES = frozenset((51, 52))
+
+# 可重试的异常：网络错误、响应超时，以及开启raise_exceptions时的busy/unavailable
+TRANSIENT_EXCEPTIONS = (LDAPCommunicationError, LDAPResponseTimeoutError, LDAPBusyResult, LDAPUnavailableResult)
+
+# 重试和熔断默认参数，可在settings中通过LDAP_RETRY_*、LDAP_BREAKER_*覆盖
+DEFAULT_RETRY_ATTEMPTS = 3
+DEFAULT_RETRY_BASE_DELAY = 0.2
+DEFAULT_RETRY_MAX_DELAY = 5.0
+DEFAULT_BREAKER_WINDOW = 10
+DEFAULT_BREAKER_FAILURE_RATE = 0.5
+DEFAULT_BREAKER_RESET_TIMEOUT = 30
+
+
+class LDAPCircuitOpenError(Exception):
+    """
+    熔断器已打开：LDAP服务器近期失败率过高，不再发送请求
+
+    不继承LDAPException，连接器中按条目处理LDAPException的代码不会吞掉它，同步流程会尽快中止。
+    """
+
+
+def is_transient(result_code: Optional[int] = None, error: Optional[BaseException] = None) -> bool:
+    """
+    失败是否为暂时性的（值得重试，并计入熔断器的失败率）
+
+    Args:
+        result_code: LDAP结果码
+        error: 请求抛出的异常
+
+    Returns:
+        bool: 是否为暂时性失败
+    """
+    if error is not None:
+        return isinstance(error, TRANSIENT_EXCEPTIONS)
+    return result_code in TRANSIENT_RESULT_CODES
+
+
+def reopen(conn: Connection):
+    """网络错误后连接已关闭时重新打开并绑定，失败时留给下一次请求报告"""
+    if not conn.closed:
+        return
+    try:
+        conn.bind()
+    except LDAPException as e:
+        logger.debug(f"重新连接LDAP服务器失败: {str(e)}")
+
+
+class RetryPolicy:
+    """暂时性失败的重试策略：指数退避，等待时间在[0, 上限]内随机（full jitter），避免多个任务同时重试"""
+
+    __slots__ = ('attempts', 'base_delay', 'max_delay')
+
+    def __init__(self, attempts: int = DEFAULT_RETRY_ATTEMPTS, base_delay: float = DEFAULT_RETRY_BASE_DELAY,
+                 max_delay: float = DEFAULT_RETRY_MAX_DELAY):
+        """
+        Args:
+            attempts: 最多尝试次数（含第一次），1表示不重试
+            base_delay: 第一次重试的等待上限(秒)，之后每次翻倍
+            max_delay: 等待上限的最大值(秒)
+        """
+        self.attempts = max(1, attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_settings(cls) -> 'RetryPolicy':
+        """按settings创建重试策略"""
+        return cls(
+            attempts=getattr(settings, 'LDAP_RETRY_ATTEMPTS', DEFAULT_RETRY_ATTEMPTS),
+            base_delay=getattr(settings, 'LDAP_RETRY_BASE_DELAY', DEFAULT_RETRY_BASE_DELAY),
+            max_delay=getattr(settings, 'LDAP_RETRY_MAX_DELAY', DEFAULT_RETRY_MAX_DELAY),
+        )
+
+    def delay(self, retry: int) -> float:
+        """
+        第retry次重试前的等待时间
+
+        Args:
+            retry: 重试序号，从1开始
+
+        Returns:
+            float: 等待秒数
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (retry - 1))))
+
+
+class CircuitBreaker:
+    """
+    单个LDAP服务器的熔断器
+
+    按最近window个请求的结果计算失败率（只有暂时性失败计为失败），请求数达到window的一半且失败率
+    不低于failure_rate时打开，之后的请求直接抛出LDAPCircuitOpenError；reset_timeout秒后放行一个
+    探测请求，成功则关闭，失败则重新计时。同一进程中使用同一LDAP配置的同步任务共享一个熔断器。
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, key: str, window: int = DEFAULT_BREAKER_WINDOW,
+                 failure_rate: float = DEFAULT_BREAKER_FAILURE_RATE,
+                 reset_timeout: float = DEFAULT_BREAKER_RESET_TIMEOUT):
+        """
+        Args:
+            key: 熔断器键，一般为LDAPConfig的ID
+            window: 计算失败率的最近请求数
+            failure_rate: 打开熔断器的失败率
+            reset_timeout: 打开后放行探测请求前的等待秒数
+        """
+        self.key = key
+        self.window = max(2, window)
+        self.failure_rate = failure_rate
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=self.window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self._trips = 0
+        self._rejected = 0
+
+    @property
+    def is_open(self) -> bool:
+        """熔断器是否处于打开状态（含等待探测结果）"""
+        return self.state != self.CLOSED
+
+    def before_request(self):
+        """
+        发送请求前调用
+
+        Raises:
+            LDAPCircuitOpenError: 熔断器打开，且未到探测时间或已有探测请求在进行
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self._rejected += 1
+        raise LDAPCircuitOpenError(f"LDAP服务器近期失败率过高，熔断器已打开: {self.key}")
+
+    def record(self, success: bool):
+        """
+        记录一次请求结果
+
+        Args:
+            success: 请求是否成功（服务器返回了非暂时性的结果码也视为成功）
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                if success:
+                    logger.info(f"LDAP服务器探测请求成功，熔断器关闭: {self.key}")
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self.state = self.OPEN
+                    self._opened_at = time.monotonic()
+                return
+            if self.state == self.OPEN:
+                return
+
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if (len(self._outcomes) >= self.window // 2
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                logger.error(f"LDAP服务器最近 {len(self._outcomes)} 个请求失败 {failures} 个，熔断器打开: {self.key}")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trips += 1
+
+    def release(self):
+        """请求未发往服务器（如连接池耗尽）时调用：不记录结果，放出占用的探测名额"""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        """熔断器实时统计"""
+        with self._lock:
+            return {
+                'state': self.state,
+                'recent_requests': len(self._outcomes),
+                'recent_failures': self._outcomes.count(False),
+                'trips': self._trips,
+                'rejected': self._rejected,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(key: str) -> CircuitBreaker:
+    """
+    获取（必要时创建）进程内共享的熔断器
+
+    Args:
+        key: 熔断器键，一般为LDAPConfig的ID
+
+    Returns:
+        CircuitBreaker: 熔断器
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                key,
+                window=getattr(settings, 'LDAP_BREAKER_WINDOW', DEFAULT_BREAKER_WINDOW),
+                failure_rate=getattr(settings, 'LDAP_BREAKER_FAILURE_RATE', DEFAULT_BREAKER_FAILURE_RATE),
+                reset_timeout=getattr(settings, 'LDAP_BREAKER_RESET_TIMEOUT', DEFAULT_BREAKER_RESET_TIMEOUT),
+            )
+            _breakers[key] = breaker
+        return breaker
+
+
+def reset_breaker(key: str):
+    """
+    丢弃进程内共享的熔断器，下次get_breaker时按当前设置重新创建（关闭状态）
+
+    LDAP配置修改（如修正了服务器地址或凭据）或删除后调用，不必等到reset_timeout后才能重新连接。
+
+    Args:
+        key: 熔断器键，一般为LDAPConfig的ID
+    """
+    with _breakers_lock:
+        breaker = _breakers.pop(key, None)
+    if breaker is not None and breaker.is_open:
+        logger.info(f"LDAP配置已变更，重置熔断器: {key}")
+
+
+def all_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    """所有熔断器的实时统计"""
+    with _breakers_lock:
+        breakers = list(_breakers.items())
+    return {key: breaker.stats() for key, breaker in breakers}
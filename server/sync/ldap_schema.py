@@ -0,0 +1,236 @@
+import logging
+import threading
+import time
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from django.conf import settings
+from ldap3 import ALL
+from ldap3.core.exceptions import LDAPException
+
+logger = logging.getLogger(__name__)
+
+# 服务器信息、schema及能力探测结果默认缓存时间(秒)，可在settings中通过LDAP_SCHEMA_CACHE_TTL覆盖
+DEFAULT_SCHEMA_CACHE_TTL = 3600
+
+# 用户对象类候选组合，按优先级从最完整到最基本排列
+USER_OBJECT_CLASS_OPTIONS = [
+    ['top', 'person', 'organizationalPerson', 'inetOrgPerson'],
+    ['top', 'organizationalPerson', 'inetOrgPerson'],
+    ['top', 'inetOrgPerson'],
+    ['top', 'person', 'organizationalPerson'],
+    ['top', 'organizationalPerson'],
+    ['top', 'person'],
+    ['top', 'account'],
+    ['posixAccount'],
+    ['top', 'simpleSecurityObject'],
+]
+
+OU_OBJECT_CLASSES = ['top', 'organizationalUnit']
+
+
+class ObjectClassSet:
+    """一组对象类及其允许的属性"""
+
+    __slots__ = ('object_classes', 'allowed_attrs')
+
+    def __init__(self, object_classes: List[str], allowed_attrs: Optional[FrozenSet[str]] = None):
+        """
+        Args:
+            object_classes: 对象类列表
+            allowed_attrs: 允许的属性名（小写，含别名），None表示未知，不做过滤
+        """
+        self.object_classes = object_classes
+        self.allowed_attrs = allowed_attrs
+
+    def filter_attrs(self, attributes: Dict[str, object]) -> Dict[str, object]:
+        """过滤掉对象类不允许的属性"""
+        if self.allowed_attrs is None:
+            return dict(attributes)
+        filtered = {}
+        for key, value in attributes.items():
+            if key.lower() in self.allowed_attrs:
+                filtered[key] = value
+            else:
+                logger.debug(f"对象类 {self.object_classes} 不支持属性 {key}，已忽略")
+        return filtered
+
+
+class ObjectClassCapabilities:
+    """服务器支持的最完整的用户/组织单位对象类组合"""
+
+    __slots__ = ('user', 'ou')
+
+    def __init__(self, user: Optional[ObjectClassSet], ou: Optional[ObjectClassSet]):
+        self.user = user
+        self.ou = ou
+
+
+def _allowed_attributes(schema, object_classes: List[str]) -> FrozenSet[str]:
+    """收集对象类（含上级对象类）的MUST/MAY属性及其别名"""
+    allowed = set()
+    pending = list(object_classes)
+    seen = set()
+    while pending:
+        name = pending.pop()
+        if name.lower() in seen:
+            continue
+        seen.add(name.lower())
+        oc = schema.object_classes.get(name)
+        if oc is None:
+            continue
+        for attr_name in list(oc.must_contain or []) + list(oc.may_contain or []):
+            attr_type = schema.attribute_types.get(attr_name)
+            names = attr_type.name if attr_type is not None and attr_type.name else [attr_name]
+            allowed.update(n.lower() for n in names)
+        pending.extend(oc.superior or [])
+    return frozenset(allowed)
+
+
+def probe_capabilities(schema) -> Optional[ObjectClassCapabilities]:
+    """
+    根据服务器schema选择最完整的用户/组织单位对象类组合
+
+    Args:
+        schema: ldap3的SchemaInfo
+
+    Returns:
+        ObjectClassCapabilities or None: schema不可用时返回None
+    """
+    if schema is None or not schema.object_classes:
+        return None
+
+    user = None
+    for classes in USER_OBJECT_CLASS_OPTIONS:
+        if all(schema.object_classes.get(name) is not None for name in classes):
+            user = ObjectClassSet(classes, _allowed_attributes(schema, classes))
+            break
+
+    ou = None
+    if all(schema.object_classes.get(name) is not None for name in OU_OBJECT_CLASSES):
+        ou = ObjectClassSet(OU_OBJECT_CLASSES, _allowed_attributes(schema, OU_OBJECT_CLASSES))
+
+    logger.info(f"LDAP对象类探测结果: 用户={user.object_classes if user else None}, "
+                f"组织单位={ou.object_classes if ou else None}")
+    return ObjectClassCapabilities(user, ou)
+
+
+_cache: Dict[Tuple[str, str], Tuple[float, ObjectClassCapabilities]] = {}
+_cache_lock = threading.Lock()
+
+# 服务器信息(根DSE)和schema缓存：键同_cache，值为(过期时间, DsaInfo, SchemaInfo)；
+# 读取失败或服务器不公开schema时SchemaInfo为None，同样缓存，有效期内不再重复读取
+_info_cache: Dict[Tuple[str, str], Tuple[float, object, object]] = {}
+
+
+def ensure_server_info(key: str, server_uri: str, conn):
+    """
+    获取连接对应服务器的schema，按LDAP配置缓存
+
+    连接使用get_info=NONE建立，绑定时不下载根DSE和schema；只有新增、修改等真正需要schema时才调用本函数。
+    缓存命中时直接挂到连接的Server上，未命中时通过该连接读取一次。
+
+    Args:
+        key: 缓存键，一般为LDAPConfig的ID
+        server_uri: LDAP服务器URI，服务器变化时缓存自动失效
+        conn: 已绑定的ldap3连接
+
+    Returns:
+        SchemaInfo or None: 服务器schema，读取失败或服务器不公开schema时返回None
+    """
+    server = conn.server if conn else None
+    if server is None:
+        return None
+    if server.schema is not None:
+        return server.schema
+
+    cache_key = (key, server_uri)
+    with _cache_lock:
+        cached = _info_cache.get(cache_key)
+    if cached and cached[0] > time.monotonic():
+        _, info, schema = cached
+        if info is not None:
+            server.attach_dsa_info(info)
+        if schema is not None:
+            server.attach_schema_info(schema)
+        return schema
+
+    original_get_info = server.get_info
+    server.get_info = ALL
+    try:
+        server.get_info_from_server(conn)
+    except LDAPException as e:
+        logger.warning(f"读取LDAP服务器schema失败: {server_uri}, 错误: {str(e)}")
+    finally:
+        server.get_info = original_get_info
+
+    schema = server.schema
+    ttl = getattr(settings, 'LDAP_SCHEMA_CACHE_TTL', DEFAULT_SCHEMA_CACHE_TTL)
+    with _cache_lock:
+        _info_cache[cache_key] = (time.monotonic() + ttl, server.info, schema)
+    if schema is None:
+        logger.warning(f"LDAP服务器未返回schema，{ttl} 秒内不再读取: {server_uri}")
+    else:
+        logger.info(f"已读取LDAP服务器schema: {server_uri}")
+    return schema
+
+
+def get_capabilities(key: str, server_uri: str, conn) -> Optional[ObjectClassCapabilities]:
+    """
+    获取缓存的对象类能力，过期或不存在时从连接的schema重新探测
+
+    Args:
+        key: 缓存键，一般为LDAPConfig的ID
+        server_uri: LDAP服务器URI，服务器变化时缓存自动失效
+        conn: 已绑定的ldap3连接
+
+    Returns:
+        ObjectClassCapabilities or None: schema不可用时返回None
+    """
+    cache_key = (key, server_uri)
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(cache_key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    capabilities = probe_capabilities(ensure_server_info(key, server_uri, conn))
+    if capabilities is not None:
+        remember_capabilities(key, server_uri, capabilities)
+    return capabilities
+
+
+def remember_capabilities(key: str, server_uri: str, capabilities: ObjectClassCapabilities):
+    """缓存对象类能力（例如逐个尝试后得到的可用组合）"""
+    ttl = getattr(settings, 'LDAP_SCHEMA_CACHE_TTL', DEFAULT_SCHEMA_CACHE_TTL)
+    with _cache_lock:
+        _cache[(key, server_uri)] = (time.monotonic() + ttl, capabilities)
+
+
+# 拒绝对非叶子条目执行modify_dn的服务器：键同_cache，值为过期时间
+_subtree_rename_refused: Dict[Tuple[str, str], float] = {}
+
+
+def subtree_rename_refused(key: str, server_uri: str) -> bool:
+    """服务器是否已知拒绝子树重命名（移动非叶子条目）"""
+    with _cache_lock:
+        expires = _subtree_rename_refused.get((key, server_uri))
+    return expires is not None and expires > time.monotonic()
+
+
+def remember_subtree_rename_refused(key: str, server_uri: str):
+    """记录服务器拒绝子树重命名，之后移动非叶子条目直接使用复制方式"""
+    ttl = getattr(settings, 'LDAP_SCHEMA_CACHE_TTL', DEFAULT_SCHEMA_CACHE_TTL)
+    with _cache_lock:
+        _subtree_rename_refused[(key, server_uri)] = time.monotonic() + ttl
+    logger.info(f"LDAP服务器不支持子树重命名，后续移动非叶子条目将使用复制方式: {server_uri}")
+
+
+def invalidate_capabilities(key: str):
+    """清除指定键的服务器信息、schema和对象类能力缓存，LDAP配置变更时调用"""
+    with _cache_lock:
+        for cache_key in [k for k in _cache if k[0] == key]:
+            del _cache[cache_key]
+        for cache_key in [k for k in _info_cache if k[0] == key]:
+            del _info_cache[cache_key]
+        for cache_key in [k for k in _subtree_rename_refused if k[0] == key]:
+            del _subtree_rename_refused[cache_key]
@@ -0,0 +1,144 @@
+import logging
+from base64 import b64encode
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from ldap3 import Connection, MOCK_SYNC, OFFLINE_SLAPD_2_4, Server
+from ldap3.core.exceptions import LDAPException
+from ldap3.protocol.rfc2849 import safe_ldif_string
+from ldap3.utils.dn import to_dn
+
+from .ldap_connector import DEFAULT_PAGE_SIZE, LDAPConnector
+
+logger = logging.getLogger(__name__)
+
+# 模拟目录自动维护、不需要导出的属性
+_SKIPPED_ATTRIBUTES = {'entrydn'}
+
+# 基础DN条目按RDN属性使用的对象类
+_BASE_ENTRY_OBJECT_CLASSES = {
+    'dc': ['top', 'dcObject', 'organization'],
+    'o': ['top', 'organization'],
+    'ou': ['top', 'organizationalUnit'],
+}
+
+
+def ldif_line(name: str, value: Any) -> str:
+    """
+    生成一行LDIF，非安全字符串（如中文）按RFC 2849使用base64编码
+
+    Args:
+        name: 属性名
+        value: 属性值
+
+    Returns:
+        str: LDIF行
+    """
+    raw = value if isinstance(value, (bytes, bytearray)) else str(value).encode('utf-8')
+    if safe_ldif_string(raw):
+        return f"{name}: {raw.decode('ascii')}"
+    return f"{name}:: {b64encode(raw).decode('ascii')}"
+
+
+def ldif_record(dn: str, attributes: Dict[str, List[Any]]) -> str:
+    """
+    生成一个LDIF内容记录（不带changetype，可用于slapadd和ldapadd）
+
+    Args:
+        dn: 条目DN
+        attributes: {属性名: [属性值]}，objectClass排在最前
+
+    Returns:
+        str: 以空行结尾的LDIF记录
+    """
+    lines = [ldif_line('dn', dn)]
+    names = sorted(attributes, key=lambda name: name.lower() != 'objectclass')
+    for name in names:
+        if name.lower() in _SKIPPED_ATTRIBUTES:
+            continue
+        lines.extend(ldif_line(name, value) for value in attributes[name])
+    return '\n'.join(lines) + '\n\n'
+
+
+class LDIFExportConnector(LDAPConnector):
+    """
+    首次导入用的LDAP连接器：同步写入一个内存中的模拟目录，完成后按上级在前的顺序导出为LDIF
+
+    同步流程（部门、用户、数据库映射、同步日志）与正常同步完全相同，只是不访问LDAP服务器。
+    同步过程中可能对刚创建的条目再做修改或移动，所以在同步结束后统一从模拟目录导出，
+    而不是逐个操作写出。对象类按OpenLDAP 2.4的标准schema确定。
+    """
+
+    def __init__(self, base_dn: str, page_size: int = DEFAULT_PAGE_SIZE):
+        """
+        Args:
+            base_dn: 基础DN
+            page_size: 分页搜索每页条目数
+        """
+        super().__init__(server_uri='ldif-export', bind_dn='', bind_password='', base_dn=base_dn,
+                         page_size=page_size)
+        self.export_server = Server('ldif-export', get_info=OFFLINE_SLAPD_2_4)
+
+    def connect(self) -> bool:
+        """建立内存中的模拟目录连接，并创建基础DN条目"""
+        try:
+            self.conn = Connection(self.export_server, client_strategy=MOCK_SYNC)
+            if self.base_dn not in self.export_server.dit:
+                rdn_attr, rdn_value = to_dn(self.base_dn)[0].split('=', 1)
+                object_classes = _BASE_ENTRY_OBJECT_CLASSES.get(rdn_attr.lower(), ['top', 'organization'])
+                attributes = {'objectClass': object_classes, rdn_attr: rdn_value}
+                if 'organization' in object_classes:
+                    attributes['o'] = rdn_value
+                self.conn.strategy.add_entry(self.base_dn, attributes)
+            self.conn.bind()
+            return True
+        except LDAPException as e:
+            logger.error(f"创建LDIF导出目录失败: {str(e)}")
+            return False
+
+    @contextmanager
+    def async_writes(self, window: Optional[int] = None):
+        """导出时不使用异步连接，写入都在内存中同步完成"""
+        yield None
+
+    def iter_export_entries(self, include_base: bool = False) -> Iterator[Tuple[str, Dict[str, List[bytes]]]]:
+        """
+        按上级在前的顺序遍历模拟目录中基础DN下的条目
+
+        Args:
+            include_base: 是否包含基础DN条目本身
+
+        Yields:
+            Tuple[str, Dict[str, List[bytes]]]: (DN, {属性名: [属性值]})
+        """
+        base_key = self.base_dn.lower()
+        depths = []
+        for dn in self.export_server.dit:
+            key = dn.lower()
+            if key == base_key:
+                if include_base:
+                    depths.append((0, dn))
+            elif key.endswith(',' + base_key):
+                depths.append((len(to_dn(dn)), dn))
+        # 按DN层级排序，同一层级保持写入顺序
+        depths.sort(key=lambda item: item[0])
+        for _, dn in depths:
+            yield dn, self.export_server.dit[dn]
+
+    def write_ldif(self, stream: TextIO, include_base: bool = False) -> int:
+        """
+        将模拟目录导出为LDIF
+
+        Args:
+            stream: 可写的文本流
+            include_base: 是否包含基础DN条目本身（向空数据库slapadd时需要）
+
+        Returns:
+            int: 导出的条目数
+        """
+        stream.write('version: 1\n\n')
+        count = 0
+        for dn, attributes in self.iter_export_entries(include_base):
+            stream.write(ldif_record(dn, attributes))
+            count += 1
+        return count
@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand, CommandError
+from ldap3.core.exceptions import LDAPException
+
+from sync.ldap_connector import LDAPConnector
+from sync.models import LDAPConfig
+from sync.platform_identity import identity_attrs, parse_description, parse_identity_attrs
+
+# 带描述信息的组织单位和用户
+BACKFILL_FILTER = '(&(description=*)(|(objectClass=organizationalUnit)(uid=*)))'
+
+
+def _attr_getter(attrs):
+    """按属性名（不区分大小写）获取全部属性值"""
+    lower_attrs = {name.lower(): values for name, values in attrs.items()}
+    return lambda name: lower_attrs.get(name.lower(), [])
+
+
+class Command(BaseCommand):
+    help = "将仅通过描述信息标识平台的LDAP条目回填为可等值索引的平台标识属性"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ldap-config', help="LDAP配置ID，默认处理所有启用的LDAP配置")
+        parser.add_argument('--dry-run', action='store_true', help="只统计需要回填的条目，不修改LDAP")
+
+    def handle(self, *args, **options):
+        if options['ldap_config']:
+            configs = LDAPConfig.objects.filter(id=options['ldap_config'])
+            if not configs:
+                raise CommandError(f"LDAP配置不存在: {options['ldap_config']}")
+        else:
+            configs = LDAPConfig.objects.filter(enabled=True)
+
+        for ldap_config in configs:
+            self._backfill(ldap_config, options['dry_run'])
+
+    def _backfill(self, ldap_config, dry_run: bool):
+        connector = LDAPConnector.from_config(ldap_config)
+        if not connector.connect():
+            raise CommandError(f"连接LDAP失败: {ldap_config.server_uri}")
+
+        updated = skipped = failed = 0
+        try:
+            for dn, attrs in connector.iter_entries(ldap_config.base_dn, BACKFILL_FILTER,
+                                                    attributes=['objectClass', 'description', 'employeeType',
+                                                                'employeeNumber', 'businessCategory'],
+                                                    replica=True):
+                get_all = _attr_getter(attrs)
+                if parse_identity_attrs(get_all):
+                    continue
+                platform_id = next(filter(None, (parse_description(str(v)) for v in get_all('description'))), None)
+                if not platform_id:
+                    continue
+
+                # employeeType/employeeNumber由inetOrgPerson定义，其他对象类的用户无法回填
+                object_classes = {str(v).lower() for v in get_all('objectClass')}
+                if platform_id[1] == 'user' and 'inetorgperson' not in object_classes:
+                    skipped += 1
+                    self.stdout.write(f"跳过(对象类不支持平台标识属性): {dn}")
+                    continue
+
+                if dry_run:
+                    updated += 1
+                    self.stdout.write(f"待回填: {dn} -> {identity_attrs(platform_id)}")
+                elif connector.modify_object(dn, identity_attrs(platform_id), current_attrs=attrs):
+                    updated += 1
+                else:
+                    failed += 1
+        except LDAPException as e:
+            raise CommandError(f"搜索LDAP条目失败: {str(e)}")
+        finally:
+            connector.close()
+
+        action = "待回填" if dry_run else "已回填"
+        self.stdout.write(self.style.SUCCESS(
+            f"{ldap_config.server_uri}: {action} {updated} 个条目，跳过 {skipped} 个，失败 {failed} 个"
+        ))
@@ -0,0 +1,102 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from ldap3 import MOCK_SYNC, OFFLINE_SLAPD_2_4, SUBTREE, Connection, Server
+
+from sync.directory_mirror import MIRROR_ATTRIBUTES, MIRROR_FILTER, MirrorEntry
+from sync.ldap_connector import LDAPConnector
+
+BASE_DN = 'dc=example,dc=com'
+USERS_DN = f'ou=users,{BASE_DN}'
+
+
+class Command(BaseCommand):
+    help = "比较加载LDAP条目时ldap3 Entry对象、响应字典和原始属性三种解码方式的耗时与内存（使用内存中的模拟目录）"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='*', type=int, default=[10000, 50000, 100000],
+                            help="模拟目录中的用户数")
+        parser.add_argument('--page-size', type=int, default=1000, help="分页搜索每页条目数")
+        parser.add_argument('--no-memory', action='store_true', help="不统计内存峰值（tracemalloc会拖慢解码）")
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            connector = self._build_directory(size, options['page_size'])
+            self.stdout.write(f"\n用户数: {size}")
+            for name, load in (
+                ('entry', self._load_entries),
+                ('response', self._load_responses),
+                ('raw', self._load_raw),
+            ):
+                seconds, peak, count = self._measure(load, connector, not options['no_memory'])
+                memory = f", 内存峰值 {peak / 1024 / 1024:.1f} MiB" if peak is not None else ''
+                self.stdout.write(f"  {name:<9} {seconds:8.2f} 秒, {count} 个条目{memory}")
+            connector.conn.unbind()
+
+    def _build_directory(self, size, page_size):
+        """创建包含size个用户的模拟目录"""
+        server = Server('benchmark', get_info=OFFLINE_SLAPD_2_4)
+        conn = Connection(server, client_strategy=MOCK_SYNC)
+        conn.strategy.add_entry(BASE_DN, {'objectClass': ['top', 'dcObject', 'organization'],
+                                          'dc': 'example', 'o': 'example'})
+        conn.strategy.add_entry(USERS_DN, {'objectClass': ['top', 'organizationalUnit'], 'ou': 'users'})
+        for index in range(size):
+            userid = f'user{index:06d}'
+            conn.strategy.add_entry(f'uid={userid},{USERS_DN}', {
+                'objectClass': ['top', 'person', 'organizationalPerson', 'inetOrgPerson'],
+                'uid': userid,
+                'cn': f'用户{index}',
+                'sn': f'用户{index}',
+                'displayName': f'用户{index}',
+                'mail': f'{userid}@example.com',
+                'telephoneNumber': f'138{index:08d}',
+                'employeeType': 'wecom',
+                'employeeNumber': userid,
+                'description': f'企业微信用户，用户ID：{userid}',
+            })
+        conn.bind()
+
+        connector = LDAPConnector('benchmark', '', '', BASE_DN, page_size=page_size)
+        connector.conn = conn
+        return connector
+
+    @staticmethod
+    def _measure(load, connector, trace_memory):
+        """执行一次加载，返回(耗时, 内存峰值, 条目数)"""
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        records = load(connector)
+        seconds = time.perf_counter() - started
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return seconds, peak, len(records)
+
+    @staticmethod
+    def _load_entries(connector):
+        """旧方式：通过ldap3的Entry对象逐个读取属性"""
+        connector.conn.search(BASE_DN, MIRROR_FILTER, search_scope=SUBTREE, attributes=['*'])
+        records = {}
+        for entry in connector.conn.entries:
+            attrs = {}
+            for attr_name in entry.entry_attributes:
+                attrs[attr_name] = getattr(entry, attr_name).values
+            records[entry.entry_dn] = attrs
+        return records
+
+    @staticmethod
+    def _load_responses(connector):
+        """分页搜索的响应字典（ldap3按schema格式化属性值）"""
+        return [MirrorEntry(dn, attrs)
+                for dn, attrs in connector.iter_entries(BASE_DN, MIRROR_FILTER, search_scope=SUBTREE,
+                                                        attributes=MIRROR_ATTRIBUTES)]
+
+    @staticmethod
+    def _load_raw(connector):
+        """分页搜索的原始属性值，只解码镜像需要的属性"""
+        return [MirrorEntry.from_raw(dn, raw_attributes)
+                for dn, raw_attributes in connector.iter_entries(BASE_DN, MIRROR_FILTER, search_scope=SUBTREE,
+                                                                 attributes=MIRROR_ATTRIBUTES, raw=True)]
@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from sync.ldap_connector import DEFAULT_PAGE_SIZE
+from sync.ldif_export import LDIFExportConnector
+from sync.models import DirectorySnapshot, SyncConfig
+from sync.sync_service import SyncService
+
+
+class Command(BaseCommand):
+    help = "执行一次完整的同步流程，但不写入LDAP，而是把结果导出为上级在前的LDIF文件，用于首次导入(slapadd/ldapadd -c)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('sync_config', help="同步配置ID")
+        parser.add_argument('output', help="输出的LDIF文件路径")
+        parser.add_argument('--include-base', action='store_true',
+                            help="包含基础DN条目本身，向空数据库slapadd时需要")
+
+    def handle(self, *args, **options):
+        sync_config = SyncConfig.objects.filter(id=options['sync_config']).select_related('ldap_config').first()
+        if not sync_config:
+            raise CommandError(f"同步配置不存在: {options['sync_config']}")
+        ldap_config = sync_config.ldap_config
+
+        connector = LDIFExportConnector(ldap_config.base_dn,
+                                        page_size=getattr(settings, 'LDAP_PAGE_SIZE', DEFAULT_PAGE_SIZE))
+        # 模拟目录不是该LDAP配置的服务器，不保存目录镜像快照、操作统计和上次同步时间
+        log = SyncService(str(sync_config.id), ldap_connector=connector, persist_state=False).sync()
+        if not log.success:
+            raise CommandError(f"同步流程失败，未导出LDIF: {log.error_message}")
+
+        with open(options['output'], 'w', encoding='utf-8') as stream:
+            count = connector.write_ldif(stream, include_base=options['include_base'])
+        # 目录将被重新导入，旧的目录镜像快照不再对应服务器上的条目
+        DirectorySnapshot.objects.filter(ldap_config=ldap_config).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"已导出 {count} 个条目到 {options['output']}（部门 {log.departments_synced} 个，用户 {log.users_synced} 个）"
+        ))
+        self.stdout.write("导入后下一次定时同步会全量加载一次目录镜像，之后按快照增量加载")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from sync.platform_identity import olc_db_index_lines
+
+
+class Command(BaseCommand):
+    help = "输出同步查找所用属性的OpenLDAP olcDbIndex配置"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='{1}mdb',
+                            help="cn=config中的数据库条目，如{1}mdb，用于生成ldapmodify所需的LDIF")
+        parser.add_argument('--extra', nargs='*', default=[], help="额外需要等值索引的属性")
+        parser.add_argument('--ldif', action='store_true', help="输出可直接用于ldapmodify的LDIF")
+
+    def handle(self, *args, **options):
+        lines = olc_db_index_lines(options['extra'])
+        if not options['ldif']:
+            self.stdout.write('\n'.join(lines))
+            return
+
+        ldif = [
+            f"dn: olcDatabase={options['database']},cn=config",
+            "changetype: modify",
+            "add: olcDbIndex",
+        ]
+        ldif.extend(lines)
+        self.stdout.write('\n'.join(ldif))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-16 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0018_remove_syncconfig_sync_frequency_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ldapconfig',
+            name='read_replicas',
+            field=models.JSONField(blank=True, default=list, help_text='目录快照等批量读取发往只读副本，写入仍发往服务器URI', verbose_name='只读副本URI'),
+        ),
+        migrations.AddField(
+            model_name='ldapconfig',
+            name='read_your_writes',
+            field=models.BooleanField(default=True, help_text='同一次同步中写入后的快照读取发往主服务器，避免读到复制延迟前的数据', verbose_name='写入后从主服务器读取'),
+        ),
+        migrations.AddField(
+            model_name='ldapconfig',
+            name='replica_strategy',
+            field=models.CharField(choices=[('ROUND_ROBIN', '轮询'), ('FIRST', '第一个可用'), ('RANDOM', '随机')], default='ROUND_ROBIN', max_length=20, verbose_name='副本选择策略'),
+        ),
+    ]
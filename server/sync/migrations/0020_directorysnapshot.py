@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-16 23:03
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0019_ldapconfig_read_replicas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirectorySnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('server_uri', models.CharField(max_length=255, verbose_name='服务器URI')),
+                ('base_dn', models.CharField(max_length=255, verbose_name='基础DN')),
+                ('data', models.BinaryField(verbose_name='快照数据')),
+                ('high_water_mark', models.CharField(max_length=32, verbose_name='modifyTimestamp高水位')),
+                ('entry_count', models.IntegerField(default=0, verbose_name='条目数')),
+                ('full_loaded_at', models.DateTimeField(verbose_name='上次全量加载时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('ldap_config', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='directory_snapshot', to='sync.ldapconfig', verbose_name='LDAP配置')),
+            ],
+            options={
+                'verbose_name': '目录镜像快照',
+                'verbose_name_plural': '目录镜像快照',
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-16 23:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0020_directorysnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syncconfig',
+            name='disabled_ou',
+            field=models.CharField(default='disabled', max_length=255, verbose_name='停用OU'),
+        ),
+        migrations.AddField(
+            model_name='syncconfig',
+            name='orphan_action',
+            field=models.CharField(choices=[('none', '不处理'), ('disable', '移到停用OU'), ('delete', '删除')], default='none', help_text='平台中已删除的用户和部门在LDAP中的处理方式', max_length=20, verbose_name='平台中已不存在的对象'),
+        ),
+        migrations.AddField(
+            model_name='syncconfig',
+            name='orphan_threshold',
+            field=models.IntegerField(default=10, help_text='待清理对象超过LDAP中该平台对象的比例时不做清理，避免平台数据异常时误删', verbose_name='清理比例上限(%)'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-16 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sync', '0021_syncconfig_orphan_cleanup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synclog',
+            name='stats',
+            field=models.JSONField(blank=True, default=dict, help_text='本次同步的LDAP操作耗时、结果码、接收字节数和重试次数', verbose_name='运行统计'),
+        ),
+    ]
@@ -5,12 +5,24 @@ import uuid
 class LDAPConfig(models.Model):
     """LDAP服务器配置"""
     
+    REPLICA_STRATEGY_CHOICES = (
+        ('ROUND_ROBIN', '轮询'),
+        ('FIRST', '第一个可用'),
+        ('RANDOM', '随机'),
+    )
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     server_uri = models.CharField(max_length=255, verbose_name="服务器URI")
     bind_dn = models.CharField(max_length=255, verbose_name="绑定DN")
     bind_password = models.CharField(max_length=255, verbose_name="绑定密码")
     base_dn = models.CharField(max_length=255, verbose_name="基础DN")
     use_ssl = models.BooleanField(default=False, verbose_name="使用SSL")
+    read_replicas = models.JSONField(default=list, blank=True, verbose_name="只读副本URI",
+                                     help_text="目录快照等批量读取发往只读副本，写入仍发往服务器URI")
+    replica_strategy = models.CharField(max_length=20, choices=REPLICA_STRATEGY_CHOICES, default='ROUND_ROBIN',
+                                        verbose_name="副本选择策略")
+    read_your_writes = models.BooleanField(default=True, verbose_name="写入后从主服务器读取",
+                                           help_text="同一次同步中写入后的快照读取发往主服务器，避免读到复制延迟前的数据")
     enabled = models.BooleanField(default=True, verbose_name="启用")
     sync_interval = models.IntegerField(default=300, verbose_name="同步间隔(秒)")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
@@ -23,6 +35,27 @@ class LDAPConfig(models.Model):
     def __str__(self):
         return self.server_uri
 
+class DirectorySnapshot(models.Model):
+    """目录镜像快照，下次同步时在此基础上增量加载"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    ldap_config = models.OneToOneField(LDAPConfig, on_delete=models.CASCADE, related_name='directory_snapshot',
+                                       verbose_name="LDAP配置")
+    server_uri = models.CharField(max_length=255, verbose_name="服务器URI")
+    base_dn = models.CharField(max_length=255, verbose_name="基础DN")
+    data = models.BinaryField(verbose_name="快照数据")
+    high_water_mark = models.CharField(max_length=32, verbose_name="modifyTimestamp高水位")
+    entry_count = models.IntegerField(default=0, verbose_name="条目数")
+    full_loaded_at = models.DateTimeField(verbose_name="上次全量加载时间")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间")
+    
+    class Meta:
+        verbose_name = "目录镜像快照"
+        verbose_name_plural = "目录镜像快照"
+    
+    def __str__(self):
+        return f"{self.server_uri} {self.base_dn}"
+
 class SyncConfig(models.Model):
     """同步配置"""
     
@@ -32,6 +65,12 @@ class SyncConfig(models.Model):
         ('dingtalk', '钉钉'),
     )
     
+    ORPHAN_ACTION_CHOICES = (
+        ('none', '不处理'),
+        ('disable', '移到停用OU'),
+        ('delete', '删除'),
+    )
+    
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=255, verbose_name="配置名称")
     sync_type = models.CharField(max_length=20, choices=SYNC_TYPE_CHOICES, verbose_name="同步类型")
@@ -40,6 +79,12 @@ class SyncConfig(models.Model):
     sync_departments = models.BooleanField(default=True, verbose_name="同步部门")
     user_ou = models.CharField(max_length=255, default="users", verbose_name="用户OU")
     department_ou = models.CharField(max_length=255, default="departments", verbose_name="部门OU")
+    orphan_action = models.CharField(max_length=20, choices=ORPHAN_ACTION_CHOICES, default='none',
+                                     verbose_name="平台中已不存在的对象",
+                                     help_text="平台中已删除的用户和部门在LDAP中的处理方式")
+    disabled_ou = models.CharField(max_length=255, default="disabled", verbose_name="停用OU")
+    orphan_threshold = models.IntegerField(default=10, verbose_name="清理比例上限(%)",
+                                           help_text="待清理对象超过LDAP中该平台对象的比例时不做清理，避免平台数据异常时误删")
     sync_interval = models.IntegerField(default=300, verbose_name="同步间隔(秒)")
     last_sync_time = models.DateTimeField(null=True, blank=True, verbose_name="上次同步时间")
     enabled = models.BooleanField(default=True, verbose_name="启用")
@@ -64,6 +109,8 @@ class SyncLog(models.Model):
     users_synced = models.IntegerField(default=0, verbose_name="同步用户数")
     departments_synced = models.IntegerField(default=0, verbose_name="同步部门数")
     error_message = models.TextField(blank=True, null=True, verbose_name="错误信息")
+    stats = models.JSONField(default=dict, blank=True, verbose_name="运行统计",
+                             help_text="本次同步的LDAP操作耗时、结果码、接收字节数和重试次数")
     
     class Meta:
         verbose_name = "同步日志"
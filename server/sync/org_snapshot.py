@@ -0,0 +1,175 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+
+from .directory_records import DirectoryDepartment, DirectoryUser, IdInterner, normalize_departments, normalize_users
+
+logger = logging.getLogger(__name__)
+
+
+class OrgSnapshot:
+    """
+    平台组织架构快照：某一时刻从平台拉取的部门列表和用户列表
+
+    部门和用户转换为与平台无关的DirectoryDepartment/DirectoryUser，用户所属部门保存在
+    DirectoryUser.department_ids中，与部门共用驻留的部门ID对象。一次同步的
+    部门阶段和用户阶段使用同一份快照，平台接口只调用一次，两个阶段看到的组织架构一致；共享时间内
+    同一平台配置的其他同步任务也复用这份快照（见get_org_snapshot）。快照中的列表供多个同步任务
+    读取，使用方不应原地修改。
+
+    拉取过程中有请求失败（如某个部门的成员或某一页用户）时incomplete为True：快照只包含部分部门或用户，
+    可以用来创建和更新，但不能据此判断平台中已删除的对象。
+    """
+
+    __slots__ = ('platform', 'departments', 'users', 'fetched_at', 'incomplete')
+
+    def __init__(self, platform: str, departments: List[DirectoryDepartment], users: List[DirectoryUser],
+                 fetched_at: Optional[float] = None, incomplete: bool = False):
+        """
+        Args:
+            platform: 平台 wecom/feishu/dingtalk
+            departments: 部门列表
+            users: 用户列表
+            fetched_at: 拉取时间戳，默认为当前时间
+            incomplete: 拉取过程中是否有请求失败
+        """
+        self.platform = platform
+        self.departments = departments
+        self.users = users
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.incomplete = incomplete
+
+    @classmethod
+    def fetch(cls, platform: str, api) -> 'OrgSnapshot':
+        """
+        从平台拉取部门和用户
+
+        企业微信和钉钉按部门拉取成员，直接使用刚拉取的部门列表，不再重复请求部门接口；
+        飞书按应用的通讯录范围分页拉取用户。用户逐页转换，不同时保存全部原始数据。
+        客户端在请求失败时记录fetch_failures并跳过失败的部分，有失败时快照标记为不完整。
+
+        Args:
+            platform: 平台 wecom/feishu/dingtalk
+            api: 平台API客户端（WeComAPI/FeiShuAPI/DingTalkAPI）
+
+        Returns:
+            OrgSnapshot: 组织架构快照
+        """
+        started = time.monotonic()
+        intern = IdInterner()
+        failures = api.fetch_failures
+        raw_departments = api.get_departments()
+        if not raw_departments:
+            raw_users = ()
+        elif platform == 'feishu':
+            raw_users = api.iter_users()
+        else:
+            raw_users = api.iter_users(departments=raw_departments)
+        users = normalize_users(platform, raw_users, intern)
+        departments = normalize_departments(platform, raw_departments, intern)
+        failures = api.fetch_failures - failures
+        logger.info(f"拉取{platform}组织架构完成: {len(departments)} 个部门, {len(users)} 个用户, "
+                    f"耗时 {time.monotonic() - started:.2f} 秒")
+        if failures:
+            logger.warning(f"拉取{platform}组织架构时有 {failures} 个请求失败，快照不完整")
+        return cls(platform, departments, users, incomplete=failures > 0)
+
+    @property
+    def age(self) -> float:
+        """快照拉取后经过的秒数"""
+        return time.time() - self.fetched_at
+
+
+# 快照的默认共享时间(秒)，可在settings中通过IM_SNAPSHOT_MAX_AGE覆盖，0表示不共享
+DEFAULT_MAX_AGE = 300
+
+
+class _CacheEntry:
+    """一个平台配置的快照缓存项：同一时刻只有一个同步任务拉取，其他任务等待并复用结果"""
+
+    __slots__ = ('snapshot', 'consumers', 'lock', 'hits', 'fetches')
+
+    def __init__(self):
+        self.snapshot: Optional[OrgSnapshot] = None
+        # 已使用当前快照的同步配置ID
+        self.consumers = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.fetches = 0
+
+
+_snapshots: Dict[str, _CacheEntry] = {}
+_snapshots_lock = threading.Lock()
+
+
+def _snapshot_key(platform: str, config) -> str:
+    """缓存键包含配置的更新时间，修改平台配置（如密钥）后不再使用旧快照"""
+    updated_at = getattr(config, 'updated_at', None)
+    return f"{platform}:{config.pk}:{updated_at.timestamp() if updated_at else ''}"
+
+
+def get_org_snapshot(platform: str, config, fetch: Callable[[], OrgSnapshot], consumer: str) -> OrgSnapshot:
+    """
+    获取平台配置的组织架构快照，共享时间内复用已拉取的快照
+
+    同一平台配置同步到多个LDAP服务器时（多个SyncConfig），同时或相近执行的同步任务只向平台拉取一次；
+    正在拉取时其他任务等待拉取结果。同一同步配置再次同步时（如手动立即同步）重新拉取，不会看到自己
+    上次使用的快照。未拉取到部门或不完整的快照（如接口失败）不缓存。
+
+    Args:
+        platform: 平台 wecom/feishu/dingtalk
+        config: 平台配置（WeComConfig/FeiShuConfig/DingTalkConfig）
+        fetch: 从平台拉取快照的函数
+        consumer: 使用快照的同步配置ID
+
+    Returns:
+        OrgSnapshot: 组织架构快照
+    """
+    max_age = getattr(settings, 'IM_SNAPSHOT_MAX_AGE', DEFAULT_MAX_AGE)
+    if max_age <= 0:
+        return fetch()
+
+    key = _snapshot_key(platform, config)
+    with _snapshots_lock:
+        entry = _snapshots.get(key)
+        if entry is None:
+            # 平台配置变更后旧键不再使用，一并清理
+            for stale in [k for k in _snapshots if k.startswith(f"{platform}:{config.pk}:")]:
+                del _snapshots[stale]
+            entry = _snapshots[key] = _CacheEntry()
+
+    with entry.lock:
+        snapshot = entry.snapshot
+        if snapshot is not None and snapshot.age < max_age and consumer not in entry.consumers:
+            entry.consumers.add(consumer)
+            entry.hits += 1
+            logger.info(f"复用 {snapshot.age:.0f} 秒前拉取的{platform}组织架构快照")
+            return snapshot
+        entry.snapshot = None
+        entry.consumers = {consumer}
+        snapshot = fetch()
+        entry.fetches += 1
+        if snapshot.departments and not snapshot.incomplete:
+            entry.snapshot = snapshot
+        return snapshot
+
+
+def all_snapshot_stats() -> Dict[str, Dict[str, Any]]:
+    """各平台配置快照缓存的实时统计"""
+    with _snapshots_lock:
+        entries = list(_snapshots.items())
+    stats = {}
+    for key, entry in entries:
+        snapshot = entry.snapshot
+        platform, config_id = key.split(':')[:2]
+        stats[f"{platform}:{config_id}"] = {
+            'departments': len(snapshot.departments) if snapshot else 0,
+            'users': len(snapshot.users) if snapshot else 0,
+            'age': round(snapshot.age, 1) if snapshot else None,
+            'hits': entry.hits,
+            'fetches': entry.fetches,
+        }
+    return stats
@@ -0,0 +1,177 @@
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ldap3.utils.conv import escape_filter_chars
+
+# 平台代码与描述信息中的平台名称
+PLATFORM_NAMES = {
+    'wecom': '企业微信',
+    'feishu': '飞书',
+    'dingtalk': '钉钉',
+}
+PLATFORM_CODES = {name: code for code, name in PLATFORM_NAMES.items()}
+
+# 平台标识属性：用户使用employeeType(平台代码)+employeeNumber(用户ID)，
+# 组织单位使用businessCategory("平台代码:部门ID")，均可建立等值索引
+USER_PLATFORM_ATTR = 'employeeType'
+USER_ID_ATTR = 'employeeNumber'
+DEPARTMENT_ID_ATTR = 'businessCategory'
+
+# 同步过程中用于查找的属性及建议的索引类型
+INDEXED_ATTRIBUTES = [
+    ('objectClass', 'eq'),
+    ('uid', 'eq'),
+    (USER_PLATFORM_ATTR, 'eq'),
+    (USER_ID_ATTR, 'eq'),
+    (DEPARTMENT_ID_ATTR, 'eq'),
+]
+
+# 旧版本写入描述信息的平台标识，如"企业微信部门ID: 123"、"飞书用户，用户ID：abc"、"钉钉用户ID: abc"
+_DEPT_DESC_RE = re.compile(r'^(企业微信|飞书|钉钉)部门ID: (.+)$')
+_USER_DESC_RES = (
+    re.compile(r'^(企业微信|飞书|钉钉)用户，用户ID：(.+)$'),
+    re.compile(r'^(钉钉)用户ID: (.+)$'),
+)
+
+PlatformId = Tuple[str, str, str]
+
+
+def user_identity_attrs(platform: str, user_id: Any) -> Dict[str, List[str]]:
+    """用户的平台标识属性"""
+    return {
+        USER_PLATFORM_ATTR: [platform],
+        USER_ID_ATTR: [str(user_id)],
+    }
+
+
+def department_identity_attrs(platform: str, dept_id: Any) -> Dict[str, List[str]]:
+    """部门的平台标识属性"""
+    return {DEPARTMENT_ID_ATTR: [f"{platform}:{dept_id}"]}
+
+
+def identity_attrs(platform_id: PlatformId) -> Dict[str, List[str]]:
+    """根据(平台代码, 对象类型, 外部ID)生成平台标识属性"""
+    platform, kind, external_id = platform_id
+    if kind == 'department':
+        return department_identity_attrs(platform, external_id)
+    return user_identity_attrs(platform, external_id)
+
+
+def legacy_descriptions(platform: str, kind: str, external_id: Any) -> List[str]:
+    """旧版本写入的描述信息，用于兼容尚未回填平台标识属性的条目"""
+    name = PLATFORM_NAMES[platform]
+    if kind == 'department':
+        return [f"{name}部门ID: {external_id}"]
+    descriptions = [f"{name}用户，用户ID：{external_id}"]
+    if platform == 'dingtalk':
+        descriptions.append(f"钉钉用户ID: {external_id}")
+    return descriptions
+
+
+def identity_filter(platform: str, kind: str, external_id: Any, include_legacy: bool = True) -> str:
+    """
+    按平台标识查找条目的等值过滤器
+
+    Args:
+        platform: 平台代码 wecom/feishu/dingtalk
+        kind: 对象类型 user/department
+        external_id: 平台中的用户ID或部门ID
+        include_legacy: 是否同时匹配旧版本的描述信息（等值匹配）
+
+    Returns:
+        str: LDAP搜索过滤器
+    """
+    if kind == 'department':
+        clauses = [f"({DEPARTMENT_ID_ATTR}={escape_filter_chars(f'{platform}:{external_id}')})"]
+    else:
+        clauses = [f"(&({USER_PLATFORM_ATTR}={escape_filter_chars(platform)})"
+                   f"({USER_ID_ATTR}={escape_filter_chars(str(external_id))}))"]
+    if include_legacy:
+        clauses.extend(f"(description={escape_filter_chars(desc)})"
+                       for desc in legacy_descriptions(platform, kind, external_id))
+    matched = clauses[0] if len(clauses) == 1 else f"(|{''.join(clauses)})"
+    if kind == 'department':
+        return f"(&(objectClass=organizationalUnit){matched})"
+    return matched
+
+
+def parse_description(description: str) -> Optional[PlatformId]:
+    """
+    从旧版本的描述信息中解析平台标识
+
+    Args:
+        description: 描述信息
+
+    Returns:
+        Tuple[str, str, str] or None: (平台代码, 对象类型user/department, 外部ID)
+    """
+    match = _DEPT_DESC_RE.match(description)
+    if match:
+        return PLATFORM_CODES[match.group(1)], 'department', match.group(2).strip()
+    for pattern in _USER_DESC_RES:
+        match = pattern.match(description)
+        if match:
+            return PLATFORM_CODES[match.group(1)], 'user', match.group(2).strip()
+    return None
+
+
+def parse_identity_attrs(get_all: Callable[[str], List[Any]]) -> Optional[PlatformId]:
+    """
+    从平台标识属性中解析平台标识
+
+    Args:
+        get_all: 按属性名（不区分大小写）获取全部属性值的函数
+
+    Returns:
+        Tuple[str, str, str] or None: (平台代码, 对象类型user/department, 外部ID)
+    """
+    for value in get_all(DEPARTMENT_ID_ATTR):
+        platform, _, external_id = str(value).partition(':')
+        if platform in PLATFORM_NAMES and external_id:
+            return platform, 'department', external_id
+    platforms = [str(v) for v in get_all(USER_PLATFORM_ATTR) if str(v) in PLATFORM_NAMES]
+    user_ids = get_all(USER_ID_ATTR)
+    if platforms and user_ids:
+        return platforms[0], 'user', str(user_ids[0])
+    return None
+
+
+def parse_entry_identity(get_all: Callable[[str], List[Any]]) -> Optional[PlatformId]:
+    """
+    解析条目的平台标识，优先使用平台标识属性，其次使用旧版本的描述信息
+
+    Args:
+        get_all: 按属性名（不区分大小写）获取全部属性值的函数
+
+    Returns:
+        Tuple[str, str, str] or None: (平台代码, 对象类型user/department, 外部ID)
+    """
+    platform_id = parse_identity_attrs(get_all)
+    if platform_id:
+        return platform_id
+    for value in get_all('description'):
+        platform_id = parse_description(str(value))
+        if platform_id:
+            return platform_id
+    return None
+
+
+def olc_db_index_lines(extra: Optional[List[str]] = None) -> List[str]:
+    """
+    生成OpenLDAP(cn=config)的olcDbIndex配置行
+
+    Args:
+        extra: 额外需要等值索引的属性
+
+    Returns:
+        List[str]: 形如"olcDbIndex: employeeNumber eq"的配置行
+    """
+    indexes = list(INDEXED_ATTRIBUTES) + [(name, 'eq') for name in extra or []]
+    lines = []
+    seen = set()
+    for name, index_type in indexes:
+        if name.lower() in seen:
+            continue
+        seen.add(name.lower())
+        lines.append(f"olcDbIndex: {name} {index_type}")
+    return lines
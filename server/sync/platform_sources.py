@@ -0,0 +1,186 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from oAuth.models import DingTalkConfig, FeiShuConfig, WeComConfig, WeComUser
+
+from .directory_records import DirectoryDepartment, DirectoryUser
+from .platform_identity import PLATFORM_NAMES, department_identity_attrs, user_identity_attrs
+
+logger = logging.getLogger(__name__)
+
+
+class PlatformSource(ABC):
+    """
+    平台数据源：同步引擎中与平台相关的部分
+
+    包括平台配置、API客户端、顶级部门的上级部门ID，以及用户和部门在LDAP中的条目格式。
+    拉取、比较、生成变更计划和写入LDAP由同步引擎统一完成。
+    """
+
+    platform = ''
+    config_model = None
+    # 顶级部门的上级部门ID
+    root_parent_id: Any = 0
+    # 是否在本地数据库保存平台用户（见save_local_user）
+    saves_local_users = False
+
+    @property
+    def name(self) -> str:
+        """平台名称（用于日志和同步详情）"""
+        return PLATFORM_NAMES[self.platform]
+
+    def get_config(self):
+        """启用且开启同步的平台配置，不存在时返回None"""
+        return self.config_model.objects.filter(enabled=True, sync_enabled=True).first()
+
+    @abstractmethod
+    def create_api(self, config):
+        """
+        创建平台API客户端
+
+        Args:
+            config: 平台配置
+
+        Returns:
+            WeComAPI/FeiShuAPI/DingTalkAPI: 平台API客户端
+        """
+
+    def user_uid(self, user: DirectoryUser) -> str:
+        """用户条目的uid（RDN属性值）"""
+        return str(user.user_id)
+
+    def user_attrs(self, user: DirectoryUser, uid: str, dept_dns: List[str]) -> Dict[str, List[Any]]:
+        """
+        用户条目的属性
+
+        Args:
+            user: 平台用户
+            uid: 用户条目的uid
+            dept_dns: 用户所属部门的DN，第一个为主部门
+
+        Returns:
+            Dict[str, List[Any]]: 用户属性
+        """
+        attrs = {
+            'objectClass': ['top', 'person'],
+            'uid': [uid],
+            'userid': [uid],  # 增加userid属性，与uid保持一致
+            'cn': [user.name],
+            'sn': [user.name],
+            **user_identity_attrs(self.platform, user.user_id),
+            'description': [f"{self.name}用户，用户ID：{user.user_id}"]
+        }
+        if user.email:
+            attrs['mail'] = [user.email]
+        if user.mobile:
+            attrs['telephoneNumber'] = [user.mobile]
+        return attrs
+
+    def department_attrs(self, dept: DirectoryDepartment) -> Dict[str, List[Any]]:
+        """部门条目的属性"""
+        return {
+            'objectClass': ['top', 'organizationalUnit'],
+            'ou': [dept.name],
+            'description': [f"{self.name}部门ID: {dept.dept_id}"],
+            **department_identity_attrs(self.platform, dept.dept_id)
+        }
+
+    def save_local_user(self, user: DirectoryUser):
+        """LDAP写入成功后保存本地数据库中的平台用户，默认不保存"""
+
+
+class WeComSource(PlatformSource):
+    """企业微信数据源，同步时同时维护本地的企业微信用户表"""
+
+    platform = 'wecom'
+    config_model = WeComConfig
+    root_parent_id = 0
+    saves_local_users = True
+
+    def create_api(self, config):
+        from utils.wecom_api import WeComAPI
+        return WeComAPI(corp_id=config.corp_id, agent_id=config.agent_id, app_secret=config.secret)
+
+    def save_local_user(self, user: DirectoryUser):
+        # 本地用户表由同一企业微信配置的所有同步任务共用，保存失败不影响LDAP同步
+        try:
+            WeComUser.objects.update_or_create(
+                wecom_user_id=user.user_id,
+                defaults={
+                    'name': user.name,
+                    'mobile': user.mobile,
+                    'email': user.email,
+                    'avatar': user.avatar,
+                    'status': user.status,
+                    'gender': user.gender,
+                    'qr_code': user.qr_code,
+                    'position': user.position,
+                    'department': user.department_name,  # 存储部门名称
+                }
+            )
+        except Exception as e:
+            logger.error(f"保存本地企业微信用户失败: {user.user_id}, 原因: {str(e)}")
+
+
+class FeiShuSource(PlatformSource):
+    """飞书数据源"""
+
+    platform = 'feishu'
+    config_model = FeiShuConfig
+    root_parent_id = '0'
+
+    def create_api(self, config):
+        from utils.feishu_api import FeiShuAPI
+        return FeiShuAPI(app_id=config.app_id, app_secret=config.app_secret)
+
+
+class DingTalkSource(PlatformSource):
+    """钉钉数据源：用户uid带dingtalk_前缀，部门DN写入departmentNumber"""
+
+    platform = 'dingtalk'
+    config_model = DingTalkConfig
+    root_parent_id = 1
+
+    def create_api(self, config):
+        from utils.dingtalk_api import DingTalkAPI
+        return DingTalkAPI(client_id=config.client_id, client_secret=config.client_secret, app_id=config.app_id)
+
+    def user_uid(self, user: DirectoryUser) -> str:
+        # 使用钉钉userid作为LDAP的uid
+        return f"dingtalk_{user.user_id}"
+
+    def user_attrs(self, user: DirectoryUser, uid: str, dept_dns: List[str]) -> Dict[str, List[Any]]:
+        attrs = {
+            'objectClass': ['top', 'person'],
+            'cn': [user.name],
+            'sn': [user.name[0] if user.name else "Unknown"],  # 姓氏默认使用名字的第一个字符
+            'uid': [uid],
+            **user_identity_attrs(self.platform, user.user_id),
+            'displayName': [user.name],
+            'description': [f"钉钉用户ID: {user.user_id}"]
+        }
+        if user.email:
+            attrs['mail'] = [user.email]
+        if user.mobile:
+            attrs['telephoneNumber'] = [user.mobile]
+        # 添加部门属性
+        if dept_dns:
+            attrs['departmentNumber'] = dept_dns
+        return attrs
+
+
+_SOURCES = {source.platform: source for source in (WeComSource(), FeiShuSource(), DingTalkSource())}
+
+
+def get_platform_source(platform: str) -> Optional[PlatformSource]:
+    """
+    获取平台数据源
+
+    Args:
+        platform: 平台 wecom/feishu/dingtalk
+
+    Returns:
+        PlatformSource or None: 平台数据源，平台未知时返回None
+    """
+    return _SOURCES.get(platform)
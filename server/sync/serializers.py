@@ -4,11 +4,18 @@ from .models import LDAPConfig, SyncConfig, SyncLog, SyncLogDetail
 class LDAPConfigSerializer(serializers.ModelSerializer):
     class Meta:
         model = LDAPConfig
-        fields = ('id', 'server_uri', 'bind_dn', 'bind_password', 'base_dn', 'use_ssl', 'enabled', 'sync_interval', 'created_at', 'updated_at')
+        fields = ('id', 'server_uri', 'bind_dn', 'bind_password', 'base_dn', 'use_ssl', 'read_replicas',
+                  'replica_strategy', 'read_your_writes', 'enabled', 'sync_interval', 'created_at', 'updated_at')
         extra_kwargs = {
             'bind_password': {'write_only': True}
         }
     
+    def validate_read_replicas(self, value):
+        """只读副本必须是LDAP URI列表"""
+        if not isinstance(value, list) or not all(isinstance(uri, str) and uri.strip() for uri in value):
+            raise serializers.ValidationError("只读副本必须是LDAP URI列表")
+        return [uri.strip() for uri in value]
+    
     def to_representation(self, instance):
         # 不返回密码
         data = super().to_representation(instance)
@@ -33,7 +40,7 @@ class SyncLogSerializer(serializers.ModelSerializer):
     class Meta:
         model = SyncLog
         fields = ['id', 'config', 'sync_time', 'success', 
-                 'users_synced', 'departments_synced', 'details']
+                 'users_synced', 'departments_synced', 'stats', 'details']
     
     def get_details(self, obj):
         # 获取已筛选的详情数据
@@ -47,6 +54,7 @@ class SyncConfigSerializer(serializers.ModelSerializer):
     class Meta:
         model = SyncConfig
         fields = ('id', 'name', 'sync_type', 'ldap_config', 'ldap_config_details', 'sync_users', 
-                 'sync_departments', 'user_ou', 'department_ou', 'sync_interval',
+                 'sync_departments', 'user_ou', 'department_ou', 'orphan_action', 'disabled_ou',
+                 'orphan_threshold', 'sync_interval',
                  'last_sync_time', 'enabled', 'created_at', 'updated_at', 'logs')
         read_only_fields = ('last_sync_time', 'created_at', 'updated_at')
\ No newline at end of file
@@ -1,7 +1,10 @@
 import logging
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from .models import SyncConfig, LDAPConfig
+from .ldap_pool import invalidate_pool
+from .ldap_retry import reset_breaker
+from .ldap_schema import invalidate_capabilities
 
 logger = logging.getLogger(__name__)
 
@@ -9,8 +12,20 @@ logger = logging.getLogger(__name__)
 @receiver(post_save, sender=LDAPConfig)
 def handle_ldap_config_save(sender, instance, **kwargs):
     """当LDAP配置更新时，检查受影响的同步配置"""
+    # 连接参数可能已变化，关闭旧的连接池、重新探测对象类，并重置按旧参数打开的熔断器
+    invalidate_pool(str(instance.id))
+    invalidate_capabilities(str(instance.id))
+    reset_breaker(str(instance.id))
+    
     # 如果LDAP配置被禁用，记录受影响的同步配置
     if not instance.enabled:
         affected_configs = SyncConfig.objects.filter(ldap_config=instance, enabled=True)
         for config in affected_configs:
-            logger.info(f"LDAP配置 {instance.server_uri} 已禁用，同步配置 {config.name} 将受影响")
\ No newline at end of file
+            logger.info(f"LDAP配置 {instance.server_uri} 已禁用，同步配置 {config.name} 将受影响")
+
+@receiver(post_delete, sender=LDAPConfig)
+def handle_ldap_config_delete(sender, instance, **kwargs):
+    """LDAP配置删除时关闭对应的连接池，并移除其熔断器"""
+    invalidate_pool(str(instance.id))
+    invalidate_capabilities(str(instance.id))
+    reset_breaker(str(instance.id))
\ No newline at end of file
@@ -0,0 +1,245 @@
+import logging
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from .directory_mirror import DirectoryMirror, MirrorEntry
+from .directory_records import DirectoryDepartment, DirectoryUser
+from .platform_sources import PlatformSource
+
+logger = logging.getLogger(__name__)
+
+# 顶级部门在同步详情中显示的上级部门名称
+ROOT_DEPARTMENT_NAME = "根部门"
+
+
+class DepartmentChange:
+    """
+    部门变更计划中的一项
+
+    action为create（LDAP中不存在）、update（名称或上级部门变化）或keep（无变化，只补齐属性差异）。
+    目标DN在执行时按上级部门实际写入后的DN确定，上级移动失败时下级随之留在原位置。
+    """
+
+    __slots__ = ('department', 'action', 'entry', 'name_changed', 'parent_changed',
+                 'old_name', 'old_parent_id', 'old_parent_name', 'parent_name')
+
+    def __init__(self, department: DirectoryDepartment, action: str, entry: Optional[MirrorEntry] = None,
+                 name_changed: bool = False, parent_changed: bool = False, old_name: Optional[str] = None,
+                 old_parent_id: Any = None, old_parent_name: Optional[str] = None, parent_name: str = ''):
+        """
+        Args:
+            department: 平台部门
+            action: create/update/keep
+            entry: LDAP中已存在的部门条目（镜像条目，DN随同步中的移动更新）
+            name_changed: 名称是否变化
+            parent_changed: 上级部门是否变化
+            old_name: LDAP中的部门名称
+            old_parent_id: LDAP中的上级部门ID
+            old_parent_name: LDAP中的上级部门名称
+            parent_name: 平台中的上级部门名称
+        """
+        self.department = department
+        self.action = action
+        self.entry = entry
+        self.name_changed = name_changed
+        self.parent_changed = parent_changed
+        self.old_name = old_name
+        self.old_parent_id = old_parent_id
+        self.old_parent_name = old_parent_name
+        self.parent_name = parent_name
+
+
+class UserChange:
+    """
+    用户变更计划中的一项
+
+    action为create（LDAP中不存在）、update（姓名、邮箱、手机或所在部门变化）或keep（无变化，只补齐属性差异）。
+    changed_attrs为记录到同步详情的属性变化，{显示名称: {'old': 原值, 'new': 新值}}。
+    """
+
+    __slots__ = ('user', 'action', 'uid', 'dn', 'attrs', 'entry', 'changed_attrs', 'primary_dept_dn')
+
+    def __init__(self, user: DirectoryUser, action: str, uid: str, dn: str, attrs: Dict[str, List[Any]],
+                 primary_dept_dn: str, entry: Optional[MirrorEntry] = None,
+                 changed_attrs: Optional[Dict[str, Dict[str, Any]]] = None):
+        """
+        Args:
+            user: 平台用户
+            action: create/update/keep
+            uid: 用户条目的uid
+            dn: 用户目标DN
+            attrs: 用户目标属性
+            primary_dept_dn: 主部门DN（没有已同步的部门时为用户OU）
+            entry: LDAP中已存在的用户条目
+            changed_attrs: 记录到同步详情的属性变化
+        """
+        self.user = user
+        self.action = action
+        self.uid = uid
+        self.dn = dn
+        self.attrs = attrs
+        self.primary_dept_dn = primary_dept_dn
+        self.entry = entry
+        self.changed_attrs = changed_attrs or {}
+
+    @property
+    def dn_changed(self) -> bool:
+        """用户是否需要移动到其他部门"""
+        return self.entry is not None and self.entry.dn != self.dn
+
+
+def _parents_first(departments: List[DirectoryDepartment]) -> List[DirectoryDepartment]:
+    """
+    按上级在前的顺序排列部门，同一层级按部门ID排序
+
+    上级部门不在列表中的部门视为顶级部门；上级关系成环的部门排在最后。
+    """
+    ordered = sorted(departments, key=lambda dept: dept.dept_id)
+    ids = {dept.dept_id for dept in ordered}
+    children: Dict[Any, List[DirectoryDepartment]] = {}
+    pending = deque()
+    for dept in ordered:
+        if dept.parent_id in ids and dept.parent_id != dept.dept_id:
+            children.setdefault(dept.parent_id, []).append(dept)
+        else:
+            pending.append(dept)
+
+    result = []
+    while pending:
+        dept = pending.popleft()
+        result.append(dept)
+        pending.extend(children.pop(dept.dept_id, ()))
+    if len(result) < len(ordered):
+        placed = {id(dept) for dept in result}
+        cyclic = [dept for dept in ordered if id(dept) not in placed]
+        logger.warning(f"部门上级关系存在环，挂在部门OU下: {[dept.dept_id for dept in cyclic]}")
+        result.extend(cyclic)
+    return result
+
+
+def _display_id(source: PlatformSource, external_id: str) -> Any:
+    """镜像中的外部ID为字符串，部门ID为整数的平台转换回整数用于同步详情"""
+    if isinstance(source.root_parent_id, int) and external_id.isdigit():
+        return int(external_id)
+    return external_id
+
+
+def plan_departments(source: PlatformSource, departments: List[DirectoryDepartment],
+                     mirror: DirectoryMirror) -> List[DepartmentChange]:
+    """
+    比较平台部门和目录镜像，生成部门变更计划
+
+    计划按上级在前的顺序排列，执行时上级部门先于下级写入。上级部门不在本次平台数据中的部门挂在部门OU下。
+
+    Args:
+        source: 平台数据源
+        departments: 平台部门
+        mirror: 目录镜像
+
+    Returns:
+        List[DepartmentChange]: 部门变更计划
+    """
+    names = {dept.dept_id: dept.name for dept in departments}
+    plan = []
+    for dept in _parents_first(departments):
+        in_tree = dept.parent_id in names and dept.parent_id != dept.dept_id
+        parent_name = names[dept.parent_id] if in_tree else ROOT_DEPARTMENT_NAME
+        entry = mirror.find_by_platform_id(source.platform, 'department', dept.dept_id)
+        if entry is None:
+            plan.append(DepartmentChange(dept, 'create', parent_name=parent_name))
+            continue
+
+        # 上级不是同平台部门（如部门OU）时视为顶级部门
+        old_parent_id = None
+        old_parent_name = ROOT_DEPARTMENT_NAME
+        parent = mirror.get(entry.dn.split(',', 1)[1])
+        if parent and parent.platform_id and parent.platform_id[:2] == (source.platform, 'department'):
+            old_parent_id = parent.platform_id[2]
+            old_parent_name = parent.get('ou', parent.rdn_value)
+
+        old_name = entry.get('ou', entry.rdn_value)
+        name_changed = old_name != dept.name
+        parent_changed = old_parent_id != (str(dept.parent_id) if in_tree else None)
+        plan.append(DepartmentChange(
+            dept, 'update' if name_changed or parent_changed else 'keep', entry,
+            name_changed=name_changed,
+            parent_changed=parent_changed,
+            old_name=old_name,
+            old_parent_id=source.root_parent_id if old_parent_id is None else _display_id(source, old_parent_id),
+            old_parent_name=old_parent_name,
+            parent_name=parent_name,
+        ))
+    return plan
+
+
+def _find_user_entry(source: PlatformSource, mirror: DirectoryMirror, user: DirectoryUser,
+                     uid: str, dn: str) -> Optional[MirrorEntry]:
+    """
+    按平台标识查找用户条目；找不到时使用同uid且不属于任何平台的条目（尚未写入平台标识的旧条目）
+
+    同一用户有多个条目（如早期移动留下的重复条目）时，使用已在目标DN上的条目，其他条目在清理时删除。
+    """
+    entry = mirror.find_by_platform_id(source.platform, 'user', user.user_id)
+    if entry is not None and entry.dn != dn:
+        at_target = mirror.get(dn)
+        if at_target is not None and at_target.platform_id == entry.platform_id:
+            mirror.prefer(at_target)
+            entry = at_target
+    if entry is None:
+        entry = mirror.find_by_uid(uid)
+        if entry is not None and entry.platform_id is not None:
+            return None
+    return entry
+
+
+def plan_users(source: PlatformSource, users: List[DirectoryUser], mirror: DirectoryMirror,
+               dept_dn_map: Dict[Any, str], user_ou_dn: str) -> List[UserChange]:
+    """
+    比较平台用户和目录镜像，生成用户变更计划
+
+    用户挂在第一个已同步的所属部门下，没有已同步的部门时挂在用户OU下。
+
+    Args:
+        source: 平台数据源
+        users: 平台用户
+        mirror: 目录镜像
+        dept_dn_map: 部门同步后的部门ID与DN的映射
+        user_ou_dn: 用户OU的DN
+
+    Returns:
+        List[UserChange]: 用户变更计划
+    """
+    plan = []
+    for user in users:
+        if not user.name:
+            logger.warning(f"用户数据不完整，跳过: {user!r}")
+            continue
+        uid = source.user_uid(user)
+        dept_dns = [dept_dn_map[dept_id] for dept_id in user.department_ids if dept_id in dept_dn_map]
+        primary_dept_dn = dept_dns[0] if dept_dns else user_ou_dn
+        dn = f"uid={uid},{primary_dept_dn}"
+        attrs = source.user_attrs(user, uid, dept_dns)
+
+        entry = _find_user_entry(source, mirror, user, uid, dn)
+        if entry is None:
+            plan.append(UserChange(user, 'create', uid, dn, attrs, primary_dept_dn))
+            continue
+
+        changed_attrs = {}
+        if entry.get('cn', '') != user.name:
+            changed_attrs['姓名'] = {'old': entry.get('cn', ''), 'new': user.name}
+        if user.email and entry.get('mail', '') != user.email:
+            changed_attrs['邮箱'] = {'old': entry.get('mail', ''), 'new': user.email}
+        if user.mobile and entry.get('telephoneNumber', '') != user.mobile:
+            changed_attrs['手机'] = {'old': entry.get('telephoneNumber', ''), 'new': user.mobile}
+        action = 'update' if changed_attrs or entry.dn != dn else 'keep'
+        plan.append(UserChange(user, action, uid, dn, attrs, primary_dept_dn, entry, changed_attrs))
+    return plan
+
+
+def count_actions(plan: List[Any]) -> Dict[str, int]:
+    """统计变更计划中各操作的数量"""
+    counts = {'create': 0, 'update': 0, 'keep': 0}
+    for change in plan:
+        counts[change.action] += 1
+    return counts
@@ -1,27 +1,53 @@
 import logging
+import time
+from contextlib import contextmanager
+from functools import partial
 from typing import Dict, List, Optional, Any
 from ldap3 import Connection, SUBTREE, MODIFY_REPLACE
+from ldap3.utils.dn import to_dn
+from django.conf import settings
 from django.utils import timezone
 
-from .models import LDAPConfig, SyncConfig, SyncLog, SyncLogDetail
+from .models import DirectorySnapshot, LDAPConfig, SyncConfig, SyncLog, SyncLogDetail
 from .ldap_connector import LDAPConnector
-from oAuth.models import WeComUser # <-- 添加导入
+from .ldap_retry import LDAPCircuitOpenError
+from .directory_mirror import DirectoryMirror, rebase_dn
+from .org_snapshot import OrgSnapshot, get_org_snapshot
+from .platform_sources import PlatformSource, get_platform_source
+from .sync_plan import DepartmentChange, UserChange, count_actions, plan_departments, plan_users
 
 logger = logging.getLogger(__name__)
 
 class SyncService:
     """同步服务，用于将企业微信/飞书/钉钉数据同步到LDAP"""
     
-    def __init__(self, sync_config_id: str):
+    def __init__(self, sync_config_id: str, ldap_connector: Optional[LDAPConnector] = None,
+                 persist_state: bool = True):
         """
         初始化同步服务
         
         Args:
             sync_config_id: 同步配置ID
+            ldap_connector: 使用的LDAP连接器，默认按LDAP配置创建（例如LDIF导出时传入LDIFExportConnector）
+            persist_state: 是否保存目录镜像快照、LDAP操作统计和上次同步时间；连接器不是该LDAP配置的服务器时
+                （如LDIF导出）应为False，避免用模拟目录的状态覆盖真实服务器的状态
         """
         self.sync_config = SyncConfig.objects.get(id=sync_config_id)
         self.ldap_config = self.sync_config.ldap_config
-        self.ldap_connector = None
+        self.ldap_connector = ldap_connector
+        self.persist_state = persist_state
+        self.mirror = None
+        self.mirror_full_loaded_at = None
+        # 本次同步从平台获取到的对象ID，{'department'/'user': {外部ID}}，用于识别平台中已不存在的对象
+        self.upstream_ids = {}
+        # 本次同步使用的平台API客户端，{平台: 客户端}，部门和用户同步共用同一个客户端及其HTTP连接
+        self.api_clients = {}
+        # 本次同步使用的组织架构快照，{平台: OrgSnapshot}，部门和用户同步共用同一份快照
+        self.snapshots = {}
+        # 部门同步后的部门ID与DN的映射，{平台: {部门ID: DN}}，供用户同步确定用户所在部门
+        self.dept_dn_maps = {}
+        # 各同步阶段的耗时和变更计划统计，{'departments'/'users': {'fetch_ms', 'plan_ms', 'apply_ms', 'create', ...}}
+        self.stage_stats = {}
         self.log = None
         self.users_synced = 0  # 初始化用户同步数量
         self.departments_synced = 0  # 初始化部门同步数量
@@ -29,18 +55,143 @@ class SyncService:
     def connect_ldap(self) -> bool:
         """连接到LDAP服务器"""
         try:
-            self.ldap_connector = LDAPConnector(
-                server_uri=self.ldap_config.server_uri,
-                bind_dn=self.ldap_config.bind_dn,
-                bind_password=self.ldap_config.bind_password,
-                base_dn=self.ldap_config.base_dn,
-                use_ssl=self.ldap_config.use_ssl
-            )
+            if self.ldap_connector is None:
+                self.ldap_connector = LDAPConnector.from_config(self.ldap_config)
             return self.ldap_connector.connect()
         except Exception as e:
             logger.error(f"连接LDAP失败: {str(e)}")
             return False
             
+    def load_directory_mirror(self) -> bool:
+        """
+        加载本次同步使用的目录镜像，同步过程中的LDAP查找都在镜像中完成
+        
+        存在未过期的目录镜像快照时只增量读取变更的条目，否则全量加载。
+        """
+        try:
+            self.mirror = self._restore_directory_mirror()
+            if self.mirror is None or not self.mirror.refresh(self.ldap_connector):
+                self.mirror = DirectoryMirror(self.ldap_config.base_dn)
+                # 保存快照时从主服务器全量加载，快照的高水位不能来自可能落后的只读副本
+                self.mirror.load(self.ldap_connector, replica=not self._saves_directory_snapshot())
+                self.mirror_full_loaded_at = timezone.now()
+            self.ldap_connector.attach_mirror(self.mirror)
+            return True
+        except Exception as e:
+            logger.error(f"加载目录镜像失败: {str(e)}")
+            return False
+            
+    def _restore_directory_mirror(self) -> Optional[DirectoryMirror]:
+        """从目录镜像快照恢复镜像，快照不存在、已过期或连接参数已变化时返回None"""
+        if not self._saves_directory_snapshot():
+            return None
+        interval = getattr(settings, 'LDAP_MIRROR_FULL_RELOAD_INTERVAL', 86400)
+        snapshot = DirectorySnapshot.objects.filter(ldap_config=self.ldap_config).first()
+        if not snapshot:
+            return None
+        if (snapshot.server_uri, snapshot.base_dn) != (self.ldap_config.server_uri, self.ldap_config.base_dn):
+            logger.info("LDAP连接参数已变化，忽略目录镜像快照")
+            return None
+        if (timezone.now() - snapshot.full_loaded_at).total_seconds() > interval:
+            logger.info(f"目录镜像快照超过 {interval} 秒未全量加载，本次全量加载")
+            return None
+        try:
+            mirror = DirectoryMirror.restore(snapshot.data)
+        except ValueError as e:
+            logger.warning(str(e))
+            return None
+        self.mirror_full_loaded_at = snapshot.full_loaded_at
+        return mirror
+        
+    def _saves_directory_snapshot(self) -> bool:
+        """是否保存目录镜像快照供下次同步增量加载"""
+        return self.persist_state and getattr(settings, 'LDAP_MIRROR_FULL_RELOAD_INTERVAL', 86400) > 0
+        
+    def save_directory_snapshot(self):
+        """保存本次同步结束时的目录镜像，供下次同步增量加载"""
+        if self.mirror is None or not self.mirror.high_water_mark:
+            return
+        if not self._saves_directory_snapshot():
+            return
+        try:
+            DirectorySnapshot.objects.update_or_create(
+                ldap_config=self.ldap_config,
+                defaults={
+                    'server_uri': self.ldap_config.server_uri,
+                    'base_dn': self.ldap_config.base_dn,
+                    'data': self.mirror.dump(),
+                    'high_water_mark': self.mirror.high_water_mark,
+                    'entry_count': len(self.mirror),
+                    'full_loaded_at': self.mirror_full_loaded_at,
+                }
+            )
+        except Exception as e:
+            logger.error(f"保存目录镜像快照失败: {str(e)}")
+            
+    def save_sync_stats(self):
+        """将本次同步的LDAP操作统计保存到同步日志"""
+        if self.log is None or self.ldap_connector is None or not self.persist_state:
+            return
+        ldap_stats = self.ldap_connector.metrics.summary()
+        if ldap_stats:
+            summary = ', '.join(f"{operation} {stats['count']}次/p95 {stats['p95_ms']}ms/失败{stats['failures']}"
+                                for operation, stats in ldap_stats.items())
+            logger.info(f"LDAP操作统计: {summary}")
+        for phase, stats in self.stage_stats.items():
+            logger.info(f"{phase}同步阶段统计: {stats}")
+        try:
+            self.log.stats = dict(self.log.stats or {}, ldap=ldap_stats,
+                                  ldap_breaker=self.ldap_connector.breaker.stats(), stages=self.stage_stats)
+            self.log.save(update_fields=['stats'])
+        except Exception as e:
+            logger.error(f"保存同步统计失败: {str(e)}")
+            
+    def _platform_api(self, source: PlatformSource, config):
+        """
+        获取本次同步使用的平台API客户端，首次调用时创建
+        
+        Args:
+            source: 平台数据源
+            config: 平台配置（WeComConfig/FeiShuConfig/DingTalkConfig）
+            
+        Returns:
+            WeComAPI/FeiShuAPI/DingTalkAPI: 平台API客户端
+        """
+        client = self.api_clients.get(source.platform)
+        if client is None:
+            client = self.api_clients[source.platform] = source.create_api(config)
+        return client
+        
+    def _org_snapshot(self, source: PlatformSource, config) -> OrgSnapshot:
+        """
+        获取本次同步使用的组织架构快照，首次调用时取共享时间内的快照或从平台拉取
+        
+        Args:
+            source: 平台数据源
+            config: 平台配置（WeComConfig/FeiShuConfig/DingTalkConfig）
+            
+        Returns:
+            OrgSnapshot: 组织架构快照
+        """
+        platform = source.platform
+        snapshot = self.snapshots.get(platform)
+        if snapshot is None:
+            snapshot = get_org_snapshot(
+                platform, config, lambda: OrgSnapshot.fetch(platform, self._platform_api(source, config)),
+                consumer=str(self.sync_config.id)
+            )
+            self.snapshots[platform] = snapshot
+        return snapshot
+        
+    def close_platform_apis(self):
+        """关闭本次同步使用的平台API客户端的HTTP连接"""
+        for client in self.api_clients.values():
+            try:
+                client.close()
+            except Exception as e:
+                logger.debug(f"关闭平台API客户端失败: {str(e)}")
+        self.api_clients = {}
+        
     def create_sync_log(self, success=False):
         """创建同步日志"""
         log = SyncLog.objects.create(
@@ -80,6 +231,8 @@ class SyncService:
         # 重置计数器
         self.users_synced = 0
         self.departments_synced = 0
+        self.stage_stats = {}
+        self.dept_dn_maps = {}
         
         try:
             # 连接LDAP
@@ -91,6 +244,15 @@ class SyncService:
                 self.log.save()
                 return self.log
                 
+            # 加载目录镜像
+            if not self.load_directory_mirror():
+                error_msg = "加载LDAP目录镜像失败"
+                logger.error(error_msg)
+                self.log.success = False
+                self.log.error_message = error_msg
+                self.log.save()
+                return self.log
+                
             # 确保基础OU存在
             if not self.ensure_base_ous():
                 error_msg = "创建基础OU失败"
@@ -100,30 +262,21 @@ class SyncService:
                 self.log.save()
                 return self.log
                 
-            # 根据同步类型执行不同的同步操作
-            if self.sync_config.sync_type == 'wecom':
-                # 企业微信同步
-                if self.sync_config.sync_departments:
-                    self.departments_synced = self._sync_wecom_departments()
-                    
-                if self.sync_config.sync_users:
-                    self.users_synced = self._sync_wecom_users()
-                    
-            elif self.sync_config.sync_type == 'feishu':
-                # 飞书同步
+            # 部门和用户同步：拉取 → 与目录镜像比较生成变更计划 → 写入LDAP，平台相关部分由数据源提供
+            source = get_platform_source(self.sync_config.sync_type)
+            if source is not None:
                 if self.sync_config.sync_departments:
-                    self.departments_synced = self._sync_feishu_departments()
+                    self.departments_synced = self._sync_departments(source)
                     
                 if self.sync_config.sync_users:
-                    self.users_synced = self._sync_feishu_users()
-                    
-            elif self.sync_config.sync_type == 'dingtalk':
-                # 钉钉同步
-                if self.sync_config.sync_departments:
-                    self.departments_synced = self._sync_dingtalk_departments()
-                    
-                if self.sync_config.sync_users:
-                    self.users_synced = self._sync_dingtalk_users()
+                    self.users_synced = self._sync_users(source)
+            
+            # LDAP服务器在同步过程中持续失败时中止，不再清理
+            if self.ldap_connector.breaker.is_open:
+                raise LDAPCircuitOpenError(f"LDAP服务器近期失败率过高，熔断器已打开，同步中止: {self.ldap_config.server_uri}")
+            
+            # 清理平台中已不存在的用户和部门
+            self.deprovision_orphans(self.sync_config.sync_type)
             
             # 更新同步记录
             self.log.success = True
@@ -132,8 +285,9 @@ class SyncService:
             self.log.save()
             
             # 更新上次同步时间
-            self.sync_config.last_sync_time = timezone.now()
-            self.sync_config.save()
+            if self.persist_state:
+                self.sync_config.last_sync_time = timezone.now()
+                self.sync_config.save()
             
             return self.log
             
@@ -145,1223 +299,406 @@ class SyncService:
             self.log.save()
             return self.log
         finally:
+            # 保存目录镜像快照，下次同步在此基础上增量加载
+            self.save_directory_snapshot()
+            
+            # 记录本次同步的LDAP操作统计
+            self.save_sync_stats()
+            
             # 关闭LDAP连接
             if self.ldap_connector:
+                self.ldap_connector.attach_mirror(None)
                 self.ldap_connector.close()
+            self.mirror = None
+            self.snapshots = {}
+            self.close_platform_apis()
 
-    def _sync_wecom_departments(self) -> int:
-        """同步企业微信部门"""
-        from oAuth.models import WeComConfig
+    @contextmanager
+    def _stage(self, phase: str, stage: str):
+        """记录同步阶段的耗时(毫秒)到stage_stats[phase]['{stage}_ms']"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = round((time.monotonic() - started) * 1000, 1)
+            self.stage_stats.setdefault(phase, {})[f'{stage}_ms'] = elapsed
+            
+    def _fetch_snapshot(self, source: PlatformSource, config, kind_name: str) -> Optional[OrgSnapshot]:
+        """
+        获取组织架构快照，失败时记录错误到同步日志
         
+        Args:
+            source: 平台数据源
+            config: 平台配置
+            kind_name: 错误信息中的对象类型（部门/用户）
+            
+        Returns:
+            OrgSnapshot or None: 组织架构快照，获取失败时返回None
+        """
         try:
-            # 获取启用的配置
-            config = WeComConfig.objects.filter(enabled=True, sync_enabled=True).first()
-            if not config:
-                logger.warning("未找到有效的企业微信配置或同步未启用")
-                return 0
-                
-            from utils.wecom_api import WeComAPI
+            return self._org_snapshot(source, config)
+        except Exception as e:
+            error_msg = f"获取{source.name}{kind_name}数据失败: {str(e)}"
+            logger.error(error_msg)
+            if self.log:
+                self.log.error_message = error_msg
+                self.log.save()
+            return None
+            
+    def _report_empty(self, source: PlatformSource, kind_name: str):
+        """平台未返回数据时记录到同步日志"""
+        error_msg = f"{source.name}未返回任何{kind_name}数据"
+        logger.warning(error_msg)
+        if self.log:
+            self.log.error_message = error_msg
+            self.log.save()
             
-            # 初始化API
-            wecom_api = WeComAPI(
-                corp_id=config.corp_id,
-                agent_id=config.agent_id,
-                app_secret=config.secret
-            )
+    def _sync_departments(self, source: PlatformSource) -> int:
+        """
+        同步平台部门：拉取 → 与目录镜像比较生成变更计划 → 写入LDAP
+        
+        Args:
+            source: 平台数据源
             
-            # 获取所有部门
-            try:
-                departments = wecom_api.get_departments()
-            except Exception as e:
-                error_msg = f"获取企业微信部门数据失败: {str(e)}"
-                logger.error(error_msg)
-                if self.log:
-                    self.log.error_message = error_msg
-                    self.log.save()
+        Returns:
+            int: 处理的部门数
+        """
+        try:
+            config = source.get_config()
+            if not config:
+                logger.warning(f"未找到有效的{source.name}配置或同步未启用")
                 return 0
                 
+            # 获取所有部门（与用户同步共用本次同步的组织架构快照）
+            with self._stage('departments', 'fetch'):
+                snapshot = self._fetch_snapshot(source, config, '部门')
+            if snapshot is None:
+                return 0
+            departments = snapshot.departments
             if not departments:
-                error_msg = "企业微信未返回任何部门数据"
-                logger.warning(error_msg)
-                if self.log:
-                    self.log.error_message = error_msg
-                    self.log.save()
+                self._report_empty(source, '部门')
                 return 0
                 
-            logger.info(f"从企业微信获取到 {len(departments)} 个部门")
-            
-            # 获取LDAP中的部门OU
-            dept_ou_dn = f"ou={self.sync_config.department_ou},{self.ldap_config.base_dn}"
-            
-            # 部门ID和DN的映射
-            dept_id_to_dn = {}
+            logger.info(f"从{source.name}获取到 {len(departments)} 个部门")
+            self._remember_upstream('department', (dept.dept_id for dept in departments))
             
             # 先确保部门OU存在
+            dept_ou_dn = f"ou={self.sync_config.department_ou},{self.ldap_config.base_dn}"
             if not self.ldap_connector.search_dn(dept_ou_dn):
                 logger.info(f"创建部门基础OU: {dept_ou_dn}")
                 self.ldap_connector.add_ou(dept_ou_dn, {'ou': [self.sync_config.department_ou]})
-            
-            # 按部门ID排序，确保先创建父部门
-            departments.sort(key=lambda x: x['id'])
-            
-            # 建立LDAP部门的映射，用于后续比较
-            ldap_dept_map = self._get_existing_dept_map("企业微信部门ID: ")
-            
-            count = 0
-            for dept in departments:
-                dept_id = dept['id']
-                dept_name = dept['name']
-                parent_id = dept.get('parentid', 0)
-                
-                logger.info(f"处理企业微信部门: ID={dept_id}, 名称={dept_name}, 父ID={parent_id}")
-                
-                # 首先在LDAP中查找该部门ID对应的部门
-                dept_desc = f"企业微信部门ID: {dept_id}"
-                
-                # 检查部门是否已存在（从前面准备的映射中获取）
-                existing_dept_data = ldap_dept_map.get(str(dept_id))
-                
-                if existing_dept_data:
-                    existing_dept_dn = existing_dept_data['dn']
-                    existing_dept_name = existing_dept_data['name']
-                    existing_parent_id = existing_dept_data.get('parent_id', 0)
-                    
-                    logger.info(f"找到现有部门DN: {existing_dept_dn}, 名称: {existing_dept_name}")
-                    
-                    # 确定部门现在应该所在的位置
-                    if parent_id == 0 or parent_id not in dept_id_to_dn:
-                        # 顶级部门或父部门尚未创建，应挂在部门OU下
-                        target_parent_dn = dept_ou_dn
-                    else:
-                        # 非顶级部门，应挂在父部门下
-                        target_parent_dn = dept_id_to_dn[parent_id]
-                    
-                    # 构建新的目标DN
-                    target_dept_dn = f"ou={dept_name},{target_parent_dn}"
-                    
-                    # 检查是否真正需要更新（名称或位置有变化）
-                    name_changed = existing_dept_name != dept_name
-                    parent_changed = (parent_id != existing_parent_id) or (existing_dept_dn != target_dept_dn)
-                    
-                    if name_changed or parent_changed:
-                        logger.info(f"检测到部门变更: 名称变更={name_changed}, 位置变更={parent_changed}")
-                        
-                        # 名称变更，记录日志
-                        if name_changed:
-                            self.add_log_detail(
-                                object_type='department',
-                                action='update',
-                                object_id=str(dept_id),
-                                object_name=dept_name,
-                                old_data={'name': existing_dept_name},
-                                new_data={'name': dept_name},
-                                details=f"更新企业微信部门名称: {existing_dept_name} -> {dept_name}"
-                            )
-                        
-                        # 位置变更，记录日志
-                        if parent_changed:
-                            old_parent_id = existing_parent_id
-                            old_parent_name = "根部门" if old_parent_id == 0 else self._get_dept_name_by_id(old_parent_id, ldap_dept_map)
-                            new_parent_name = "根部门" if parent_id == 0 else self._get_dept_name_by_id(parent_id, dept_id_to_dn)
-                            
-                            self.add_log_detail(
-                                object_type='department',
-                                action='move',
-                                object_id=str(dept_id),
-                                object_name=dept_name,
-                                old_data={'parent_id': old_parent_id, 'parent_name': old_parent_name},
-                                new_data={'parent_id': parent_id, 'parent_name': new_parent_name},
-                                details=f"移动企业微信部门: {dept_name} (从 {old_parent_name} 到 {new_parent_name})"
-                            )
-                        
-                        # 尝试移动/重命名部门
-                        if existing_dept_dn != target_dept_dn:
-                            move_success = self.ldap_connector.move_object(existing_dept_dn, target_dept_dn)
-                            
-                            if move_success:
-                                # 更新部门属性
-                                dept_attrs = {
-                                    'objectClass': ['top', 'organizationalUnit'],
-                                    'ou': [dept_name],
-                                    'description': [dept_desc]
-                                }
-                                
-                                self.ldap_connector.modify_object(target_dept_dn, dept_attrs)
-                                # 记录新DN
-                                dept_id_to_dn[dept_id] = target_dept_dn
-                            else:
-                                # 如果移动失败，使用旧DN，同时尝试更新属性
-                                logger.warning(f"移动部门失败: {existing_dept_dn} -> {target_dept_dn}")
-                                # 尝试更新属性，包括部门名称
-                                dept_attrs = {
-                                    'objectClass': ['top', 'organizationalUnit'],
-                                    'ou': [dept_name],
-                                    'description': [dept_desc]
-                                }
-                                self.ldap_connector.modify_object(existing_dept_dn, dept_attrs)
-                                dept_id_to_dn[dept_id] = existing_dept_dn
-                        else:
-                            # 只需更新名称
-                            dept_attrs = {
-                                'objectClass': ['top', 'organizationalUnit'],
-                                'ou': [dept_name],
-                                'description': [dept_desc]
-                            }
-                            self.ldap_connector.modify_object(existing_dept_dn, dept_attrs)
-                            dept_id_to_dn[dept_id] = existing_dept_dn
-                    else:
-                        # 部门无变化，不记录日志，只更新映射
-                        logger.info(f"部门 {dept_name} 无变化，跳过更新")
-                        dept_id_to_dn[dept_id] = existing_dept_dn
-                else:
-                    # 部门不存在，需要创建
-                    logger.info(f"未找到部门，将创建新部门: ID={dept_id}, 名称={dept_name}")
-                    
-                    # 构建部门DN
-                    if parent_id == 0 or parent_id not in dept_id_to_dn:
-                        # 顶级部门或父部门尚未创建，挂在部门OU下
-                        dept_dn = f"ou={dept_name},{dept_ou_dn}"
-                        parent_name = "根部门"
-                    else:
-                        # 非顶级部门，挂在父部门下
-                        dept_dn = f"ou={dept_name},{dept_id_to_dn[parent_id]}"
-                        parent_name = self._get_dept_name_by_id(parent_id, dept_id_to_dn)
-                    
-                    # 部门属性
-                    dept_attrs = {
-                        'objectClass': ['top', 'organizationalUnit'],
-                        'ou': [dept_name],
-                        'description': [dept_desc]
-                    }
-                    
-                    # 创建部门
-                    add_success = self.ldap_connector.add_object(dept_dn, dept_attrs)
-                    if add_success:
-                        logger.info(f"成功创建部门: {dept_dn}")
-                        # 记录创建部门的详细日志
-                        self.add_log_detail(
-                            object_type='department',
-                            action='create',
-                            object_id=str(dept_id),
-                            object_name=dept_name,
-                            new_data={
-                                'name': dept_name, 
-                                'parent_id': parent_id,
-                                'parent_name': parent_name
-                            },
-                            details=f"创建企业微信部门: {dept_name} (父部门: {parent_name})"
-                        )
-                        # 记录部门ID与DN的映射
-                        dept_id_to_dn[dept_id] = dept_dn
-                    else:
-                        logger.error(f"创建部门失败: {dept_dn}")
-                
-                count += 1
                 
-            # 将部门映射存储为同步服务的属性，以便后续用户同步使用
-            self.wecom_dept_id_to_dn = dept_id_to_dn
-            logger.info(f"同步企业微信部门完成，共处理 {count} 个部门")
-                
-            return count
+            with self._stage('departments', 'plan'):
+                plan = plan_departments(source, departments, self.mirror)
+            self.stage_stats['departments'].update(count_actions(plan))
+            
+            with self._stage('departments', 'apply'):
+                # 部门映射供后续用户同步使用
+                self.dept_dn_maps[source.platform] = self._apply_departments(source, plan, dept_ou_dn)
+            logger.info(f"同步{source.name}部门完成，共处理 {len(plan)} 个部门")
+            return len(plan)
             
         except Exception as e:
-            logger.error(f"同步企业微信部门失败: {str(e)}")
+            logger.error(f"同步{source.name}部门失败: {str(e)}")
             import traceback
             logger.error(traceback.format_exc())
             return 0
-        
-    def _sync_wecom_users(self) -> int:
-        """同步企业微信用户"""
-        from oAuth.models import WeComConfig
-        
-        try:
-            # 获取启用的配置
-            config = WeComConfig.objects.filter(enabled=True, sync_enabled=True).first()
-            if not config:
-                logger.warning("未找到有效的企业微信配置或同步未启用")
-                return 0
-                
-            from utils.wecom_api import WeComAPI
-            
-            # 初始化API
-            wecom_api = WeComAPI(
-                corp_id=config.corp_id,
-                agent_id=config.agent_id,
-                app_secret=config.secret
-            )
-            
-            # 获取所有用户
-            try:
-                users = wecom_api.get_users()
-            except Exception as e:
-                error_msg = f"获取企业微信用户数据失败: {str(e)}"
-                logger.error(error_msg)
-                if self.log:
-                    self.log.error_message = error_msg
-                    self.log.save()
-                return 0
-                
-            if not users:
-                error_msg = "企业微信未返回任何用户数据"
-                logger.warning(error_msg)
-                if self.log:
-                    self.log.error_message = error_msg
-                    self.log.save()
-                return 0
-                
-            logger.info(f"从企业微信获取到 {len(users)} 个用户")
-            
-            # 部门ID和DN的映射应该在同步部门时设置
-            if not hasattr(self, 'wecom_dept_id_to_dn') or not self.wecom_dept_id_to_dn:
-                logger.warning("未找到部门映射，请先同步部门")
-                return 0
-                
-            # 获取LDAP中的用户OU
-            user_ou_dn = f"ou={self.sync_config.user_ou},{self.ldap_config.base_dn}"
-            
-            # 确保用户OU存在
-            if not self.ldap_connector.search_dn(user_ou_dn):
-                logger.info(f"创建用户基础OU: {user_ou_dn}")
-                self.ldap_connector.add_ou(user_ou_dn, {'ou': [self.sync_config.user_ou]})
             
-            # 获取LDAP中的现有用户映射
-            ldap_user_map = self._get_existing_user_map("企业微信用户")
+    def _apply_departments(self, source: PlatformSource, plan: List[DepartmentChange], dept_ou_dn: str) -> Dict[Any, str]:
+        """
+        按部门变更计划写入LDAP（同步写入，下级部门的DN依赖上级部门的写入结果）
+        
+        Args:
+            source: 平台数据源
+            plan: 部门变更计划（上级在前）
+            dept_ou_dn: 部门OU的DN
             
-            count = 0
-            for user in users:
-                userid = user['userid']
-                uid = userid  # 直接使用userid作为uid
-                name = user['name']
-                mobile = user.get('mobile', '')
-                email = user.get('email', '')
-                department_ids = user.get('department', [])
-                alias = user.get('alias', '') # 获取 alias
-                avatar = user.get('avatar', '') # 获取 avatar
-                status = user.get('status', 1) # 获取 status, 默认为 1 (已激活)
-                gender = user.get('gender', '0') # 获取 gender, 默认为 '0' (未知)
-                qr_code = user.get('qr_code', '') # 获取 qr_code
-                position = user.get('position', '') # 获取 position
-                
-                logger.info(f"处理企业微信用户: ID={userid}, 姓名={name}, 部门IDs={department_ids}")
-                
-                # 用户属性
-                user_attrs = {
-                    'objectClass': ['top', 'person'],
-                    'uid': [uid],
-                    'userid': [uid],  # 增加userid属性，与uid保持一致
-                    'cn': [name],
-                    'sn': [name],
-                    'employeeNumber': [userid],
-                    'description': [f"企业微信用户，用户ID：{userid}"]
-                }
-                
-                if email:
-                    user_attrs['mail'] = [email]
-                if mobile:
-                    user_attrs['telephoneNumber'] = [mobile]
-                    
-                # 确定用户所属部门DN
-                dept_dns = []
-                primary_dept_dn = None
-                
-                for dept_id in department_ids:
-                    if dept_id in self.wecom_dept_id_to_dn:
-                        dept_dns.append(self.wecom_dept_id_to_dn[dept_id])
-                        if not primary_dept_dn:  # 将第一个部门作为主部门
-                            primary_dept_dn = self.wecom_dept_id_to_dn[dept_id]
-                            
-                if not primary_dept_dn:
-                    # 如果没有找到有效部门，使用用户OU
-                    primary_dept_dn = user_ou_dn
-                    
-                # 构建用户DN
-                user_dn = f"uid={uid},{primary_dept_dn}"
-                
-                # 检查用户是否已存在
-                existing_user_data = ldap_user_map.get(userid)
-                
-                if existing_user_data:
-                    existing_user_dn = existing_user_data['dn']
-                    existing_attrs = existing_user_data['attrs']
-                    
-                    logger.info(f"找到现有用户DN: {existing_user_dn}")
-                    
-                    # 检查属性是否有变化
-                    attrs_changed = False
-                    changed_attrs = {}
-                    
-                    # 检查基本属性变化
-                    if existing_attrs.get('cn', [''])[0] != name:
-                        attrs_changed = True
-                        changed_attrs['姓名'] = {
-                            'old': existing_attrs.get('cn', [''])[0],
-                            'new': name
-                        }
-                        
-                    if 'mail' in user_attrs and (
-                        'mail' not in existing_attrs or 
-                        existing_attrs.get('mail', [''])[0] != email
-                    ):
-                        attrs_changed = True
-                        changed_attrs['邮箱'] = {
-                            'old': existing_attrs.get('mail', [''])[0] if 'mail' in existing_attrs else '',
-                            'new': email
-                        }
-                        
-                    if 'telephoneNumber' in user_attrs and (
-                        'telephoneNumber' not in existing_attrs or 
-                        existing_attrs.get('telephoneNumber', [''])[0] != mobile
-                    ):
-                        attrs_changed = True
-                        changed_attrs['手机'] = {
-                            'old': existing_attrs.get('telephoneNumber', [''])[0] if 'telephoneNumber' in existing_attrs else '',
-                            'new': mobile
-                        }
-                    
-                    # 检查是否需要移动用户（部门变更）
-                    dn_changed = existing_user_dn != user_dn
-                    
-                    if attrs_changed or dn_changed:
-                        # 记录属性变更日志
-                        if attrs_changed:
-                            self.add_log_detail(
-                                object_type='user',
-                                action='update',
-                                object_id=userid,
-                                object_name=name,
-                                old_data={k: v['old'] for k, v in changed_attrs.items()},
-                                new_data={k: v['new'] for k, v in changed_attrs.items()},
-                                details=f"更新企业微信用户属性: {name}"
-                            )
-                        
-                        # 记录部门变更日志
-                        if dn_changed:
-                            old_dept = existing_user_dn.split(',', 1)[1]
-                            new_dept = user_dn.split(',', 1)[1]
-                            self.add_log_detail(
-                                object_type='user',
-                                action='move',
-                                object_id=userid,
-                                object_name=name,
-                                old_data={'department': old_dept},
-                                new_data={'department': new_dept},
-                                details=f"移动企业微信用户: {name} (到新部门)"
-                            )
-                        
-                        # 进行实际的更新操作
-                        ldap_update_success = False
-                        if dn_changed:
-                            # 尝试移动用户
-                            move_success = self.ldap_connector.move_object(existing_user_dn, user_dn)
-                            
-                            if move_success:
-                                logger.info(f"成功移动用户: {existing_user_dn} -> {user_dn}")
-                                # 更新用户属性
-                                ldap_update_success = self.ldap_connector.modify_object(user_dn, user_attrs)
-                            else:
-                                logger.warning(f"移动用户失败: {existing_user_dn} -> {user_dn}")
-                                # 在原位置更新用户属性
-                                ldap_update_success = self.ldap_connector.modify_object(existing_user_dn, user_attrs)
-                        else:
-                            # 只更新用户属性
-                            ldap_update_success = self.ldap_connector.modify_object(existing_user_dn, user_attrs)
-                            logger.info(f"已更新用户属性: {existing_user_dn}")
-
-                        # 如果LDAP更新成功，则更新本地数据库
-                        if ldap_update_success:
-                            WeComUser.objects.update_or_create(
-                                wecom_user_id=userid,
-                                defaults={
-                                    'name': name,
-                                    # 'alias': alias, # 移除无效字段
-                                    'mobile': mobile,
-                                    'email': email,
-                                    'avatar': avatar,
-                                    'status': status,
-                                    'gender': gender,
-                                    'qr_code': qr_code,
-                                    'position': position,
-                                    'department': department_ids, # 存储部门ID列表
-                                    # 'is_synced': True # 移除无效字段
-                                }
-                            )
-                            logger.info(f"已更新本地数据库用户: {userid}")
-                        else:
-                            logger.error(f"LDAP更新失败，未更新本地数据库用户: {userid}")
-
-                    else:
-                        logger.info(f"用户 {name} 无变化，跳过更新")
-                        # 即使LDAP无变化，也确保本地数据库是最新的
-                        WeComUser.objects.update_or_create(
-                            wecom_user_id=userid,
-                            defaults={
-                                'name': name,
-                                'mobile': mobile,
-                                'email': email,
-                                'avatar': avatar,
-                                'status': status,
-                                'gender': gender,
-                                'qr_code': qr_code,
-                                'position': position,
-                                'department': department_ids
-                            }
-                        )
-                        logger.info(f"已确认本地数据库用户最新: {userid}")
+        Returns:
+            Dict[Any, str]: 部门ID与DN的映射，创建失败的部门不在其中
+        """
+        dept_id_to_dn = {}
+        for change in plan:
+            dept = change.department
+            # 上级部门未同步时挂在部门OU下
+            target_dn = f"ou={dept.name},{dept_id_to_dn.get(dept.parent_id, dept_ou_dn)}"
+            dept_attrs = source.department_attrs(dept)
+            
+            if change.action == 'create':
+                logger.info(f"未找到部门，将创建新部门: ID={dept.dept_id}, 名称={dept.name}")
+                if self.ldap_connector.add_object(target_dn, dept_attrs):
+                    logger.info(f"成功创建部门: {target_dn}")
+                    self.add_log_detail(
+                        object_type='department',
+                        action='create',
+                        object_id=str(dept.dept_id),
+                        object_name=dept.name,
+                        new_data={'name': dept.name, 'parent_id': dept.parent_id, 'parent_name': change.parent_name},
+                        details=f"创建{source.name}部门: {dept.name} (父部门: {change.parent_name})"
+                    )
+                    dept_id_to_dn[dept.dept_id] = target_dn
                 else:
-                    # 创建新用户
-                    logger.info(f"创建新用户: {user_dn}")
-                    add_success = self.ldap_connector.add_object(user_dn, user_attrs)
-                    
-                    if add_success:
-                        # 记录创建用户日志
-                        self.add_log_detail(
-                            object_type='user',
-                            action='create',
-                            object_id=userid,
-                            object_name=name,
-                            new_data={
-                                'name': name,
-                                'department': primary_dept_dn,
-                                'email': email if email else '',
-                                'mobile': mobile if mobile else ''
-                            },
-                            details=f"创建企业微信用户: {name}"
-                        )
-                        logger.info(f"成功创建LDAP用户: {user_dn}")
-                        
-                        # 创建本地数据库用户
-                        WeComUser.objects.create(
-                            wecom_user_id=userid,
-                            name=name,
-                            # alias=alias, # 移除无效字段
-                            mobile=mobile,
-                            email=email,
-                            avatar=avatar,
-                            status=status,
-                            gender=gender,
-                            qr_code=qr_code,
-                            position=position,
-                            department=department_ids,
-                            # is_synced=True # 移除无效字段
-                        )
-                        logger.info(f"成功创建本地数据库用户: {userid}")
-                    else:
-                        logger.error(f"创建LDAP用户失败: {user_dn}")
-                
-                count += 1
-            
-            logger.info(f"同步企业微信用户完成，共处理 {count} 个用户")
-            return count
-            
-        except Exception as e:
-            logger.error(f"同步企业微信用户失败: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
-            return 0
-        
-    def _sync_feishu_departments(self) -> int:
-        """同步飞书部门"""
-        from oAuth.models import FeiShuConfig
+                    logger.error(f"创建部门失败: {target_dn}")
+                continue
+                
+            if change.action == 'update':
+                self._log_department_update(source, change)
+                
+            entry = change.entry
+            existing_dn = entry.dn
+            current_attrs = entry.attrs
+            if existing_dn != target_dn:
+                if self.ldap_connector.move_object(existing_dn, target_dn):
+                    # 已处理的下级部门随子树一起移动
+                    self._rebase_dept_dns(dept_id_to_dn, existing_dn, target_dn)
+                    current_attrs = LDAPConnector.attrs_after_move(current_attrs, target_dn)
+                else:
+                    # 移动失败时使用旧DN，在原位置更新属性
+                    logger.warning(f"移动部门失败: {existing_dn} -> {target_dn}")
+                    target_dn = existing_dn
+            # 只写入与现有属性不同的部分，无变化时不发送请求
+            self.ldap_connector.modify_object(target_dn, dept_attrs, current_attrs=current_attrs)
+            dept_id_to_dn[dept.dept_id] = target_dn
+        return dept_id_to_dn
         
-        try:
-            # 获取启用的配置
-            config = FeiShuConfig.objects.filter(enabled=True, sync_enabled=True).first()
-            if not config:
-                logger.warning("未找到有效的飞书配置或同步未启用")
-                return 0
-                
-            from utils.feishu_api import FeiShuAPI
-            
-            # 初始化API
-            feishu_api = FeiShuAPI(
-                app_id=config.app_id,
-                app_secret=config.app_secret
+    def _log_department_update(self, source: PlatformSource, change: DepartmentChange):
+        """记录部门名称和上级部门的变更详情"""
+        dept = change.department
+        if change.name_changed:
+            self.add_log_detail(
+                object_type='department',
+                action='update',
+                object_id=str(dept.dept_id),
+                object_name=dept.name,
+                old_data={'name': change.old_name},
+                new_data={'name': dept.name},
+                details=f"更新{source.name}部门名称: {change.old_name} -> {dept.name}"
+            )
+        if change.parent_changed:
+            self.add_log_detail(
+                object_type='department',
+                action='move',
+                object_id=str(dept.dept_id),
+                object_name=dept.name,
+                old_data={'parent_id': change.old_parent_id, 'parent_name': change.old_parent_name},
+                new_data={'parent_id': dept.parent_id, 'parent_name': change.parent_name},
+                details=f"移动{source.name}部门: {dept.name} (从 {change.old_parent_name} 到 {change.parent_name})"
             )
             
-            # 获取所有部门
-            try:
-                departments = feishu_api.get_departments()
-            except Exception as e:
-                error_msg = f"获取飞书部门数据失败: {str(e)}"
-                logger.error(error_msg)
-                if self.log:
-                    self.log.error_message = error_msg
-                    self.log.save()
-                return 0
-                
-            if not departments:
-                error_msg = "飞书未返回任何部门数据"
-                logger.warning(error_msg)
-                if self.log:
-                    self.log.error_message = error_msg
-                    self.log.save()
-                return 0
-                
-            logger.info(f"从飞书获取到 {len(departments)} 个部门")
-            
-            # 获取LDAP中的部门OU
-            dept_ou_dn = f"ou={self.sync_config.department_ou},{self.ldap_config.base_dn}"
-            
-            # 部门ID和DN的映射
-            dept_id_to_dn = {}
-            
-            # 按部门ID排序，确保先创建父部门
-            departments.sort(key=lambda x: x['department_id'])
-            
-            count = 0
-            for dept in departments:
-                dept_id = dept['department_id']
-                dept_name = dept['name']
-                parent_id = dept.get('parent_department_id', '0')
-                
-                # 首先在LDAP中查找该部门ID对应的部门
-                existing_dept_dn = self.ldap_connector.find_department_by_description(f"飞书部门ID: {dept_id}", self.ldap_config.base_dn)
-                
-                if existing_dept_dn:
-                    # 部门已存在，检查名称是否需要更新
-                    existing_dept_name = existing_dept_dn.split(',')[0].split('=')[1]
-                    
-                    # 确定部门现在应该所在的位置
-                    if parent_id == '0' or parent_id not in dept_id_to_dn:
-                        # 顶级部门或父部门尚未创建，应挂在部门OU下
-                        target_parent_dn = dept_ou_dn
-                    else:
-                        # 非顶级部门，应挂在父部门下
-                        target_parent_dn = dept_id_to_dn[parent_id]
-                    
-                    # 构建新的目标DN
-                    target_dept_dn = f"ou={dept_name},{target_parent_dn}"
-                    
-                    # 检查是否需要移动或重命名
-                    if existing_dept_dn != target_dept_dn:
-                        logger.info(f"检测到部门变更: {existing_dept_dn} -> {target_dept_dn}")
-                        
-                        # 尝试移动/重命名部门
-                        move_success = self.ldap_connector.move_object(existing_dept_dn, target_dept_dn)
-                        
-                        if move_success:
-                            # 更新部门属性
-                            dept_attrs = {
-                                'objectClass': ['top', 'organizationalUnit'],
-                                'ou': [dept_name],
-                                'description': [f"飞书部门ID: {dept_id}"]
-                            }
-                            
-                            self.ldap_connector.modify_object(target_dept_dn, dept_attrs)
-                            # 记录新DN
-                            dept_id_to_dn[dept_id] = target_dept_dn
-                        else:
-                            # 如果移动失败，使用旧DN
-                            logger.warning(f"移动部门失败: {existing_dept_dn} -> {target_dept_dn}")
-                            dept_id_to_dn[dept_id] = existing_dept_dn
-                    else:
-                        # 部门位置和名称未变，只需更新属性
-                        dept_attrs = {
-                            'objectClass': ['top', 'organizationalUnit'],
-                            'ou': [dept_name],
-                            'description': [f"飞书部门ID: {dept_id}"]
-                        }
-                        
-                        self.ldap_connector.modify_object(existing_dept_dn, dept_attrs)
-                        # 记录DN
-                        dept_id_to_dn[dept_id] = existing_dept_dn
-                else:
-                    # 部门不存在，需要创建
-                    # 构建部门DN
-                    if parent_id == '0' or parent_id not in dept_id_to_dn:
-                        # 顶级部门或父部门尚未创建，挂在部门OU下
-                        dept_dn = f"ou={dept_name},{dept_ou_dn}"
-                    else:
-                        # 非顶级部门，挂在父部门下
-                        dept_dn = f"ou={dept_name},{dept_id_to_dn[parent_id]}"
-                    
-                    # 部门属性
-                    dept_attrs = {
-                        'objectClass': ['top', 'organizationalUnit'],
-                        'ou': [dept_name],
-                        'description': [f"飞书部门ID: {dept_id}"]
-                    }
-                    
-                    # 创建部门
-                    self.ldap_connector.add_object(dept_dn, dept_attrs)
-                    # 记录部门ID与DN的映射
-                    dept_id_to_dn[dept_id] = dept_dn
-                
-                count += 1
-                
-            # 将部门映射存储为同步服务的属性，以便后续用户同步使用
-            self.feishu_dept_id_to_dn = dept_id_to_dn
-                
-            return count
-            
-        except Exception as e:
-            logger.error(f"同步飞书部门失败: {str(e)}")
-            return 0
-        
-    def _sync_feishu_users(self) -> int:
-        """同步飞书用户"""
-        from oAuth.models import FeiShuConfig
+    def _sync_users(self, source: PlatformSource) -> int:
+        """
+        同步平台用户：拉取 → 与目录镜像比较生成变更计划 → 写入LDAP（异步流水线）
         
+        Args:
+            source: 平台数据源
+            
+        Returns:
+            int: 处理的用户数
+        """
         try:
-            # 获取启用的配置
-            config = FeiShuConfig.objects.filter(enabled=True, sync_enabled=True).first()
+            config = source.get_config()
             if not config:
-                logger.warning("未找到有效的飞书配置或同步未启用")
+                logger.warning(f"未找到有效的{source.name}配置或同步未启用")
                 return 0
                 
-            from utils.feishu_api import FeiShuAPI
-            
-            # 初始化API
-            feishu_api = FeiShuAPI(
-                app_id=config.app_id,
-                app_secret=config.app_secret
-            )
-            
-            # 获取所有用户
-            try:
-                users = feishu_api.get_users()
-            except Exception as e:
-                error_msg = f"获取飞书用户数据失败: {str(e)}"
-                logger.error(error_msg)
-                if self.log:
-                    self.log.error_message = error_msg
-                    self.log.save()
+            # 获取所有用户（与部门同步共用本次同步的组织架构快照）
+            with self._stage('users', 'fetch'):
+                snapshot = self._fetch_snapshot(source, config, '用户')
+            if snapshot is None:
                 return 0
-                
+            users = snapshot.users
             if not users:
-                error_msg = "飞书未返回任何用户数据"
-                logger.warning(error_msg)
-                if self.log:
-                    self.log.error_message = error_msg
-                    self.log.save()
+                self._report_empty(source, '用户')
                 return 0
                 
-            logger.info(f"从飞书获取到 {len(users)} 个用户")
+            logger.info(f"从{source.name}获取到 {len(users)} 个用户")
+            self._remember_upstream('user', (user.user_id for user in users))
             
             # 部门ID和DN的映射应该在同步部门时设置
-            if not hasattr(self, 'feishu_dept_id_to_dn') or not self.feishu_dept_id_to_dn:
+            dept_dn_map = self.dept_dn_maps.get(source.platform)
+            if not dept_dn_map:
                 logger.warning("未找到部门映射，请先同步部门")
                 return 0
                 
-            # 获取LDAP中的用户OU
-            user_ou_dn = f"ou={self.sync_config.user_ou},{self.ldap_config.base_dn}"
-            
             # 确保用户OU存在
+            user_ou_dn = f"ou={self.sync_config.user_ou},{self.ldap_config.base_dn}"
             if not self.ldap_connector.search_dn(user_ou_dn):
                 logger.info(f"创建用户基础OU: {user_ou_dn}")
                 self.ldap_connector.add_ou(user_ou_dn, {'ou': [self.sync_config.user_ou]})
-            
-            # 获取LDAP中的现有用户映射
-            ldap_user_map = self._get_existing_user_map("飞书用户")
-            
-            count = 0
-            for user in users:
-                userid = user['user_id']
-                uid = userid  # 直接使用userid作为uid
-                name = user['name']
-                mobile = user.get('mobile', '')
-                email = user.get('email', '')
-                department_ids = user.get('department_ids', [])
-                
-                logger.info(f"处理飞书用户: ID={userid}, 姓名={name}, 部门IDs={department_ids}")
-                
-                # 用户属性
-                user_attrs = {
-                    'objectClass': ['top', 'person'],
-                    'uid': [uid],
-                    'userid': [uid],
-                    'cn': [name],
-                    'sn': [name],
-                    'employeeNumber': [userid],
-                    'description': [f"飞书用户，用户ID：{userid}"]
-                }
                 
-                if email:
-                    user_attrs['mail'] = [email]
-                if mobile:
-                    user_attrs['telephoneNumber'] = [mobile]
-                    
-                # 确定用户所属部门DN
-                dept_dns = []
-                primary_dept_dn = None
-                
-                for dept_id in department_ids:
-                    if dept_id in self.feishu_dept_id_to_dn:
-                        dept_dns.append(self.feishu_dept_id_to_dn[dept_id])
-                        if not primary_dept_dn:  # 将第一个部门作为主部门
-                            primary_dept_dn = self.feishu_dept_id_to_dn[dept_id]
-                            
-                if not primary_dept_dn:
-                    # 如果没有找到有效部门，使用用户OU
-                    primary_dept_dn = user_ou_dn
-                    
-                # 构建用户DN
-                user_dn = f"uid={uid},{primary_dept_dn}"
-                
-                # 检查用户是否已存在
-                existing_user_data = ldap_user_map.get(userid)
-                
-                if existing_user_data:
-                    existing_user_dn = existing_user_data['dn']
-                    existing_attrs = existing_user_data['attrs']
-                    
-                    logger.info(f"找到现有用户DN: {existing_user_dn}")
-                    
-                    # 检查属性是否有变化
-                    attrs_changed = False
-                    changed_attrs = {}
-                    
-                    # 检查基本属性变化
-                    if existing_attrs.get('cn', [''])[0] != name:
-                        attrs_changed = True
-                        changed_attrs['姓名'] = {
-                            'old': existing_attrs.get('cn', [''])[0],
-                            'new': name
-                        }
-                        
-                    if 'mail' in user_attrs and (
-                        'mail' not in existing_attrs or 
-                        existing_attrs.get('mail', [''])[0] != email
-                    ):
-                        attrs_changed = True
-                        changed_attrs['邮箱'] = {
-                            'old': existing_attrs.get('mail', [''])[0] if 'mail' in existing_attrs else '',
-                            'new': email
-                        }
-                        
-                    if 'telephoneNumber' in user_attrs and (
-                        'telephoneNumber' not in existing_attrs or 
-                        existing_attrs.get('telephoneNumber', [''])[0] != mobile
-                    ):
-                        attrs_changed = True
-                        changed_attrs['手机'] = {
-                            'old': existing_attrs.get('telephoneNumber', [''])[0] if 'telephoneNumber' in existing_attrs else '',
-                            'new': mobile
-                        }
-                    
-                    # 检查是否需要移动用户（部门变更）
-                    dn_changed = existing_user_dn != user_dn
-                    
-                    if attrs_changed or dn_changed:
-                        # 记录属性变更日志
-                        if attrs_changed:
-                            self.add_log_detail(
-                                object_type='user',
-                                action='update',
-                                object_id=userid,
-                                object_name=name,
-                                old_data={k: v['old'] for k, v in changed_attrs.items()},
-                                new_data={k: v['new'] for k, v in changed_attrs.items()},
-                                details=f"更新飞书用户属性: {name}"
-                            )
-                        
-                        # 记录部门变更日志
-                        if dn_changed:
-                            old_dept = existing_user_dn.split(',', 1)[1]
-                            new_dept = user_dn.split(',', 1)[1]
-                            self.add_log_detail(
-                                object_type='user',
-                                action='move',
-                                object_id=userid,
-                                object_name=name,
-                                old_data={'department': old_dept},
-                                new_data={'department': new_dept},
-                                details=f"移动飞书用户: {name} (到新部门)"
-                            )
-                        
-                        # 进行实际的更新操作
-                        if dn_changed:
-                            # 尝试移动用户
-                            move_success = self.ldap_connector.move_object(existing_user_dn, user_dn)
-                            
-                            if move_success:
-                                logger.info(f"成功移动用户: {existing_user_dn} -> {user_dn}")
-                                # 更新用户属性
-                                self.ldap_connector.modify_object(user_dn, user_attrs)
-                            else:
-                                logger.warning(f"移动用户失败: {existing_user_dn} -> {user_dn}")
-                                # 在原位置更新用户属性
-                                self.ldap_connector.modify_object(existing_user_dn, user_attrs)
-                        else:
-                            # 只更新用户属性
-                            self.ldap_connector.modify_object(existing_user_dn, user_attrs)
-                            logger.info(f"已更新用户属性: {existing_user_dn}")
-                    else:
-                        logger.info(f"用户 {name} 无变化，跳过更新")
-                else:
-                    # 创建新用户
-                    logger.info(f"创建新用户: {user_dn}")
-                    add_success = self.ldap_connector.add_object(user_dn, user_attrs)
-                    
-                    if add_success:
-                        # 记录创建用户日志
-                        self.add_log_detail(
-                            object_type='user',
-                            action='create',
-                            object_id=userid,
-                            object_name=name,
-                            new_data={
-                                'name': name,
-                                'department': primary_dept_dn,
-                                'email': email if email else '',
-                                'mobile': mobile if mobile else ''
-                            },
-                            details=f"创建飞书用户: {name}"
-                        )
-                        logger.info(f"成功创建用户: {user_dn}")
-                    else:
-                        logger.error(f"创建用户失败: {user_dn}")
-                
-                count += 1
+            with self._stage('users', 'plan'):
+                plan = plan_users(source, users, self.mirror, dept_dn_map, user_ou_dn)
+            self.stage_stats['users'].update(count_actions(plan))
             
-            logger.info(f"同步飞书用户完成，共处理 {count} 个用户")
+            # 用户写入使用异步流水线，退出时等待全部写入完成
+            with self._stage('users', 'apply'), self.ldap_connector.async_writes():
+                count = self._apply_users(source, plan)
+            logger.info(f"同步{source.name}用户完成，共处理 {count} 个用户")
             return count
             
         except Exception as e:
-            logger.error(f"同步飞书用户失败: {str(e)}")
+            logger.error(f"同步{source.name}用户失败: {str(e)}")
             import traceback
             logger.error(traceback.format_exc())
             return 0
-        
-    def _sync_dingtalk_departments(self) -> int:
-        """同步钉钉部门"""
-        from oAuth.models import DingTalkConfig
-        
-        try:
-            # 获取启用的配置
-            config = DingTalkConfig.objects.filter(enabled=True, sync_enabled=True).first()
-            if not config:
-                logger.warning("未找到有效的钉钉配置或同步未启用")
-                return 0
-                
-            from utils.dingtalk_api import DingTalkAPI
             
-            # 初始化API
-            dingtalk_api = DingTalkAPI(
-                client_id=config.client_id,
-                client_secret=config.client_secret,
-                app_id=config.app_id
-            )
+    def _apply_users(self, source: PlatformSource, plan: List[UserChange]) -> int:
+        """
+        按用户变更计划写入LDAP，写入成功后记录同步详情并保存本地数据库用户
+        
+        Args:
+            source: 平台数据源
+            plan: 用户变更计划
             
-            # 获取所有部门
+        Returns:
+            int: 处理的用户数
+        """
+        count = 0
+        for change in plan:
+            user = change.user
             try:
-                departments = dingtalk_api.get_departments()
-            except Exception as e:
-                error_msg = f"获取钉钉部门数据失败: {str(e)}"
-                logger.error(error_msg)
-                if self.log:
-                    self.log.error_message = error_msg
-                    self.log.save()
-                return 0
-                
-            if not departments:
-                error_msg = "钉钉未返回任何部门数据"
-                logger.warning(error_msg)
-                if self.log:
-                    self.log.error_message = error_msg
-                    self.log.save()
-                return 0
-                
-            logger.info(f"从钉钉获取到 {len(departments)} 个部门")
-            
-            # 获取LDAP中的部门OU
-            dept_ou_dn = f"ou={self.sync_config.department_ou},{self.ldap_config.base_dn}"
-            
-            # 部门ID和DN的映射
-            dept_id_to_dn = {}
-            
-            # 按部门ID排序，确保先创建父部门
-            departments.sort(key=lambda x: x['dept_id'])
-            
-            count = 0
-            for dept in departments:
-                dept_id = dept['dept_id']
-                dept_name = dept['name']
-                parent_id = dept.get('parent_id', 1)
-                
-                # 首先在LDAP中查找该部门ID对应的部门
-                existing_dept_dn = self.ldap_connector.find_department_by_description(f"钉钉部门ID: {dept_id}", self.ldap_config.base_dn)
-                
-                if existing_dept_dn:
-                    # 部门已存在，检查名称是否需要更新
-                    existing_dept_name = existing_dept_dn.split(',')[0].split('=')[1]
-                    
-                    # 确定部门现在应该所在的位置
-                    if parent_id == 1 or parent_id not in dept_id_to_dn:
-                        # 顶级部门或父部门尚未创建，应挂在部门OU下
-                        target_parent_dn = dept_ou_dn
-                    else:
-                        # 非顶级部门，应挂在父部门下
-                        target_parent_dn = dept_id_to_dn[parent_id]
-                    
-                    # 构建新的目标DN
-                    target_dept_dn = f"ou={dept_name},{target_parent_dn}"
-                    
-                    # 检查是否需要移动或重命名
-                    if existing_dept_dn != target_dept_dn:
-                        logger.info(f"检测到部门变更: {existing_dept_dn} -> {target_dept_dn}")
-                        
-                        # 尝试移动/重命名部门
-                        move_success = self.ldap_connector.move_object(existing_dept_dn, target_dept_dn)
-                        
-                        if move_success:
-                            # 更新部门属性
-                            dept_attrs = {
-                                'objectClass': ['top', 'organizationalUnit'],
-                                'ou': [dept_name],
-                                'description': [f"钉钉部门ID: {dept_id}"]
-                            }
-                            
-                            self.ldap_connector.modify_object(target_dept_dn, dept_attrs)
-                            # 记录新DN
-                            dept_id_to_dn[dept_id] = target_dept_dn
-                        else:
-                            # 如果移动失败，使用旧DN
-                            logger.warning(f"移动部门失败: {existing_dept_dn} -> {target_dept_dn}")
-                            dept_id_to_dn[dept_id] = existing_dept_dn
-                    else:
-                        # 部门位置和名称未变，只需更新属性
-                        dept_attrs = {
-                            'objectClass': ['top', 'organizationalUnit'],
-                            'ou': [dept_name],
-                            'description': [f"钉钉部门ID: {dept_id}"]
-                        }
-                        
-                        self.ldap_connector.modify_object(existing_dept_dn, dept_attrs)
-                        # 记录DN
-                        dept_id_to_dn[dept_id] = existing_dept_dn
+                save_local_user = partial(source.save_local_user, user) if source.saves_local_users else None
+                if change.action == 'create':
+                    logger.info(f"创建新用户: {change.dn}")
+                    self.ldap_connector.add_object(
+                        change.dn, change.attrs,
+                        on_done=partial(
+                            self._on_user_created, source.name, user.user_id, user.name, change.dn,
+                            {
+                                'name': user.name,
+                                'department': change.primary_dept_dn,
+                                'email': user.email or '',
+                                'mobile': user.mobile or ''
+                            },
+                            save_local_user
+                        )
+                    )
                 else:
-                    # 部门不存在，需要创建
-                    # 构建部门DN
-                    if parent_id == 1 or parent_id not in dept_id_to_dn:
-                        # 顶级部门或父部门尚未创建，挂在部门OU下
-                        dept_dn = f"ou={dept_name},{dept_ou_dn}"
-                    else:
-                        # 非顶级部门，挂在父部门下
-                        dept_dn = f"ou={dept_name},{dept_id_to_dn[parent_id]}"
-                    
-                    # 部门属性
-                    dept_attrs = {
-                        'objectClass': ['top', 'organizationalUnit'],
-                        'ou': [dept_name],
-                        'description': [f"钉钉部门ID: {dept_id}"]
-                    }
-                    
-                    # 创建部门
-                    self.ldap_connector.add_object(dept_dn, dept_attrs)
-                    # 记录部门ID与DN的映射
-                    dept_id_to_dn[dept_id] = dept_dn
-                
+                    if change.action == 'update':
+                        self._log_user_update(source, change)
+                    # 移动（如需要）并更新用户属性，无变化时不发送请求
+                    self._update_ldap_user(
+                        change.entry.dn, change.entry.attrs, change.dn, change.attrs,
+                        on_done=partial(self._on_user_updated, source.name, user.user_id, user.name, save_local_user)
+                    )
                 count += 1
-                
-            # 将部门映射存储为同步服务的属性，以便后续用户同步使用
-            self.dingtalk_dept_id_to_dn = dept_id_to_dn
-                
-            return count
-            
-        except Exception as e:
-            logger.error(f"同步钉钉部门失败: {str(e)}")
-            return 0
-        
-    def _sync_dingtalk_users(self) -> int:
-        """同步钉钉用户"""
-        from oAuth.models import DingTalkConfig
+            except Exception as e:
+                logger.error(f"处理用户 {user.user_id} 失败: {str(e)}")
+        return count
         
-        try:
-            # 获取启用的配置
-            config = DingTalkConfig.objects.filter(enabled=True, sync_enabled=True).first()
-            if not config:
-                logger.warning("未找到有效的钉钉配置或同步未启用")
-                return 0
-                
-            from utils.dingtalk_api import DingTalkAPI
-            
-            # 初始化API
-            dingtalk_api = DingTalkAPI(
-                client_id=config.client_id,
-                client_secret=config.client_secret,
-                app_id=config.app_id
+    def _log_user_update(self, source: PlatformSource, change: UserChange):
+        """记录用户属性和所在部门的变更详情"""
+        user = change.user
+        if change.changed_attrs:
+            self.add_log_detail(
+                object_type='user',
+                action='update',
+                object_id=user.user_id,
+                object_name=user.name,
+                old_data={k: v['old'] for k, v in change.changed_attrs.items()},
+                new_data={k: v['new'] for k, v in change.changed_attrs.items()},
+                details=f"更新{source.name}用户属性: {user.name}"
             )
+        if change.dn_changed:
+            self.add_log_detail(
+                object_type='user',
+                action='move',
+                object_id=user.user_id,
+                object_name=user.name,
+                old_data={'department': change.entry.dn.split(',', 1)[1]},
+                new_data={'department': change.dn.split(',', 1)[1]},
+                details=f"移动{source.name}用户: {user.name} (到新部门)"
+            )
+
+    def _update_ldap_user(self, existing_dn: str, existing_attrs: dict, user_dn: str, user_attrs: dict,
+                          on_done=None):
+        """
+        更新已存在的LDAP用户：部门变更时先移动，移动失败则在原位置更新属性
+        
+        Args:
+            existing_dn: 用户当前DN
+            existing_attrs: 用户当前属性
+            user_dn: 用户目标DN
+            user_attrs: 用户目标属性
+            on_done: 完成回调(是否成功, LDAP结果)，异步写入时在取回结果后调用
+        """
+        connector = self.ldap_connector
+        if existing_dn == user_dn:
+            connector.modify_object(existing_dn, user_attrs, current_attrs=existing_attrs, on_done=on_done)
+            return
             
-            # 获取所有用户
-            try:
-                users = dingtalk_api.get_users()
-            except Exception as e:
-                error_msg = f"获取钉钉用户数据失败: {str(e)}"
-                logger.error(error_msg)
-                if self.log:
-                    self.log.error_message = error_msg
-                    self.log.save()
-                return 0
-                
-            if not users:
-                error_msg = "钉钉未返回任何用户数据"
-                logger.warning(error_msg)
-                if self.log:
-                    self.log.error_message = error_msg
-                    self.log.save()
-                return 0
-                
-            logger.info(f"从钉钉获取到 {len(users)} 个用户")
-            
-            # 部门ID和DN的映射应该在同步部门时设置
-            if not hasattr(self, 'dingtalk_dept_id_to_dn') or not self.dingtalk_dept_id_to_dn:
-                logger.warning("未找到部门映射，请先同步部门")
-                return 0
-                
-            # 获取LDAP中的用户OU
-            user_ou_dn = f"ou={self.sync_config.user_ou},{self.ldap_config.base_dn}"
-            
-            # 确保用户OU存在
-            if not self.ldap_connector.search_dn(user_ou_dn):
-                logger.info(f"创建用户基础OU: {user_ou_dn}")
-                self.ldap_connector.add_ou(user_ou_dn, {'ou': [self.sync_config.user_ou]})
-                
-            count = 0
-            for user in users:
-                userid = user['userid']
-                uid = userid  # 直接使用userid作为uid
-                name = user['name']
-                mobile = user.get('mobile', '')
-                email = user.get('email', '')
-                department_ids = user.get('dept_id_list', [])
-                
-                logger.info(f"处理钉钉用户: ID={userid}, 姓名={name}, 部门IDs={department_ids}")
-                
-                # 用户属性
-                user_attrs = {
-                    'objectClass': ['top', 'person'],
-                    'uid': [uid],
-                    'userid': [uid],  # 增加userid属性，与uid保持一致
-                    'cn': [name],
-                    'sn': [name],
-                    'employeeNumber': [userid],
-                    'description': [f"钉钉用户，用户ID：{userid}"]
-                }
-                
-                if email:
-                    user_attrs['mail'] = [email]
-                if mobile:
-                    user_attrs['telephoneNumber'] = [mobile]
-                    
-                # 确定用户所属部门DN
-                dept_dns = []
-                primary_dept_dn = None
-                
-                for dept_id in department_ids:
-                    if dept_id in self.dingtalk_dept_id_to_dn:
-                        dept_dns.append(self.dingtalk_dept_id_to_dn[dept_id])
-                        if not primary_dept_dn:  # 将第一个部门作为主部门
-                            primary_dept_dn = self.dingtalk_dept_id_to_dn[dept_id]
-                            
-                if not primary_dept_dn:
-                    # 如果没有找到有效部门，使用用户OU
-                    primary_dept_dn = user_ou_dn
-                    
-                # 构建用户DN
-                user_dn = f"uid={uid},{primary_dept_dn}"
-                
-                # 检查用户是否已存在（通过uid查找）
-                try:
-                    userid = user.get('userid')
-                    name = user.get('name')
-                    email = user.get('email', '')
-                    mobile = user.get('mobile', '')
-                    department_ids = user.get('dept_id_list', [])
-                    
-                    logger.info(f"处理钉钉用户: ID={userid}, 姓名={name}, 部门IDs={department_ids}")
-                    
-                    if not userid or not name:
-                        logger.warning(f"用户数据不完整，跳过: {user}")
-                        continue
-                        
-                    # 使用钉钉userid作为LDAP的uid
-                    uid = f"dingtalk_{userid}"
-                    
-                    # 检查用户是否已存在（通过uid查找）
-                    existing_user_dn = self.ldap_connector.search_user_by_uid(uid, self.ldap_config.base_dn)
-                    
-                    # 确定用户所属部门DN
-                    dept_dns = []
-                    primary_dept_dn = None
-                    
-                    for dept_id in department_ids:
-                        if dept_id in self.dingtalk_dept_id_to_dn:
-                            dept_dns.append(self.dingtalk_dept_id_to_dn[dept_id])
-                            if not primary_dept_dn:  # 将第一个部门作为主部门
-                                primary_dept_dn = self.dingtalk_dept_id_to_dn[dept_id]
-                                
-                    if not primary_dept_dn:
-                        # 如果没有找到有效部门，使用用户OU
-                        primary_dept_dn = user_ou_dn
-                        
-                    # 构建用户DN
-                    user_dn = f"uid={uid},{primary_dept_dn}"
-                    
-                    # 用户属性
-                    cn = name
-                    sn = name[0] if name else "Unknown"  # 姓氏默认使用名字的第一个字符
-                    
-                    user_attrs = {
-                        'objectClass': ['top', 'person'],
-                        'cn': [cn],
-                        'sn': [sn],
-                        'uid': [uid],
-                        'employeeNumber': [userid],
-                        'displayName': [name],
-                        'description': [f"钉钉用户ID: {userid}"]
-                    }
-                    
-                    if email:
-                        user_attrs['mail'] = [email]
-                    if mobile:
-                        user_attrs['telephoneNumber'] = [mobile]
-                        
-                    # 添加部门属性
-                    if dept_dns:
-                        user_attrs['departmentNumber'] = dept_dns
-                        
-                    if existing_user_dn:
-                        logger.info(f"找到现有用户DN: {existing_user_dn}")
-                        
-                        # 检查是否需要移动用户
-                        if existing_user_dn != user_dn:
-                            logger.info(f"检测到用户部门变更: {existing_user_dn} -> {user_dn}")
-                            
-                            # 尝试移动用户
-                            move_success = self.ldap_connector.move_object(existing_user_dn, user_dn)
-                            
-                            if move_success:
-                                logger.info(f"成功移动用户: {existing_user_dn} -> {user_dn}")
-                                # 更新用户属性
-                                self.ldap_connector.modify_object(user_dn, user_attrs)
-                            else:
-                                logger.warning(f"移动用户失败: {existing_user_dn} -> {user_dn}")
-                                # 在原位置更新用户属性
-                                self.ldap_connector.modify_object(existing_user_dn, user_attrs)
-                        else:
-                            # 更新用户属性
-                            self.ldap_connector.modify_object(existing_user_dn, user_attrs)
-                            logger.info(f"已更新用户属性: {existing_user_dn}")
-                    else:
-                        # 创建新用户
-                        logger.info(f"创建新用户: {user_dn}")
-                        self.ldap_connector.add_object(user_dn, user_attrs)
-                        
-                    count += 1
-                except Exception as e:
-                    logger.error(f"处理用户 {user.get('userid')} 失败: {str(e)}")
-                    continue
-                    
-            logger.info(f"同步钉钉用户完成，共处理 {count} 个用户")
-            return count
+        def moved(success, result):
+            if success:
+                logger.info(f"成功移动用户: {existing_dn} -> {user_dn}")
+                connector.modify_object(
+                    user_dn, user_attrs,
+                    current_attrs=LDAPConnector.attrs_after_move(existing_attrs, user_dn),
+                    on_done=on_done
+                )
+            else:
+                logger.warning(f"移动用户失败: {existing_dn} -> {user_dn}")
+                # 在原位置更新用户属性
+                connector.modify_object(existing_dn, user_attrs, current_attrs=existing_attrs, on_done=on_done)
+                
+        connector.move_object(existing_dn, user_dn, on_done=moved)
+        
+    @staticmethod
+    def _rebase_dept_dns(dept_id_to_dn: dict, old_dn: str, new_dn: str):
+        """
+        部门子树移动后改写已处理下级部门的DN（服务器端modify_dn已移动整个子树）
+        
+        Args:
+            dept_id_to_dn: 部门ID与DN的映射
+            old_dn: 部门原DN
+            new_dn: 部门新DN
+        """
+        for dept_id, dn in dept_id_to_dn.items():
+            rebased = rebase_dn(dn, old_dn, new_dn)
+            if rebased is not None:
+                dept_id_to_dn[dept_id] = rebased
+                
+    def _on_user_created(self, platform_name, userid, name, user_dn, new_data, after_success, success, result):
+        """LDAP用户创建完成：成功时记录创建日志并执行后续操作，失败时记录失败详情"""
+        if not success:
+            self._on_user_failed('create', platform_name, userid, name, success, result)
+            return
+        self.add_log_detail(
+            object_type='user',
+            action='create',
+            object_id=userid,
+            object_name=name,
+            new_data=new_data,
+            details=f"创建{platform_name}用户: {name}"
+        )
+        logger.info(f"成功创建LDAP用户: {user_dn}")
+        if after_success:
+            after_success()
+            logger.info(f"成功创建本地数据库用户: {userid}")
+            
+    def _on_user_updated(self, platform_name, userid, name, after_success, success, result):
+        """LDAP用户更新完成：成功时执行后续操作，失败时记录失败详情"""
+        if not success:
+            self._on_user_failed('update', platform_name, userid, name, success, result)
+            return
+        if after_success:
+            after_success()
+            logger.info(f"已更新本地数据库用户: {userid}")
             
-        except Exception as e:
-            logger.error(f"同步钉钉用户失败: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
-            return 0 
-
+    def _on_user_failed(self, action, platform_name, userid, name, success, result):
+        """LDAP用户写入失败时记录到同步日志详情"""
+        if success:
+            return
+        reason = (result or {}).get('description') or '未知错误'
+        action_name = '创建' if action == 'create' else '更新'
+        logger.error(f"{action_name}{platform_name}用户失败: {userid}, 原因: {result}")
+        self.add_log_detail(
+            object_type='user',
+            action=action,
+            object_id=userid,
+            object_name=name,
+            new_data={'error': reason},
+            details=f"{action_name}{platform_name}用户失败: {name}, 原因: {reason}"
+        )
+        
     def add_log_detail(self, object_type, action, object_id, object_name, old_data=None, new_data=None, details=""):
         """添加同步日志详情"""
         if not self.log:
@@ -1378,149 +715,152 @@ class SyncService:
             details=details
         ) 
 
-    def _get_existing_dept_map(self, desc_prefix: str) -> dict:
-        """获取LDAP中已存在的部门映射
+    def _remember_upstream(self, kind: str, external_ids):
+        """记录本次同步从平台获取到的对象ID"""
+        self.upstream_ids[kind] = {str(external_id) for external_id in external_ids if external_id is not None}
         
-        返回格式: {
-            "部门ID": {
-                "dn": "部门DN",
-                "name": "部门名称",
-                "parent_id": 父部门ID,
-                ...其他属性
-            }
-        }
+    def _upstream_complete(self, platform: str) -> bool:
         """
-        dept_map = {}
+        本次同步的组织架构快照是否完整，不完整时记录到同步日志详情
         
-        try:
-            # 获取基础DN下所有部门
-            search_filter = f"(&(objectClass=organizationalUnit)(description={desc_prefix}*))"
-            entries = self.ldap_connector.search_entries(self.ldap_config.base_dn, search_filter, search_scope='SUBTREE')
+        部分部门成员或分页请求失败时，缺少的用户和部门会被误判为平台中已删除，因此不做清理。
+        
+        Args:
+            platform: 平台代码 wecom/feishu/dingtalk
             
-            for entry in entries:
-                dn = entry.entry_dn
-                attrs = {}
-                
-                # 提取部门ID
-                desc = getattr(entry, 'description', [])
-                if not desc:
-                    continue
-                    
-                desc_value = desc.value
-                if isinstance(desc_value, list) and desc_value:
-                    desc_value = desc_value[0]
-                    
-                if not desc_value.startswith(desc_prefix):
-                    continue
-                    
-                dept_id = desc_value[len(desc_prefix):].strip()
-                
-                # 提取部门名称
-                name = getattr(entry, 'ou', []).value
-                if isinstance(name, list) and name:
-                    name = name[0]
-                    
-                # 确定父部门ID
-                parent_id = 0  # 默认为顶级部门
-                parent_dn = ",".join(dn.split(",")[1:])  # 获取父DN
-                
-                # 从其他映射中找出父部门ID
-                for pid, pdata in dept_map.items():
-                    if pdata['dn'] == parent_dn:
-                        parent_id = int(pid)
-                        break
-                
-                # 存储部门信息
-                dept_map[dept_id] = {
-                    'dn': dn,
-                    'name': name,
-                    'parent_id': parent_id,
-                    # 可以添加其他需要的属性
-                }
-                
-            return dept_map
-        except Exception as e:
-            logger.error(f"获取已存在部门映射失败: {str(e)}")
-            return {}
-
-    def _get_dept_name_by_id(self, dept_id, dept_map):
-        """根据部门ID获取部门名称"""
-        if isinstance(dept_map, dict):
-            # 如果是ID到数据的映射
-            if str(dept_id) in dept_map:
-                dept_data = dept_map[str(dept_id)]
-                if isinstance(dept_data, dict) and 'name' in dept_data:
-                    return dept_data['name']
+        Returns:
+            bool: 快照完整（或本次未使用快照）时返回True
+        """
+        snapshot = self.snapshots.get(platform)
+        if snapshot is None or not snapshot.incomplete:
+            return True
+        error_msg = "从平台拉取的组织架构不完整（部分部门或用户请求失败），本次不清理平台中已不存在的用户和部门"
+        logger.warning(error_msg)
+        for kind in self.upstream_ids:
+            self.add_log_detail(
+                object_type=kind,
+                action='delete',
+                object_id='',
+                object_name='',
+                new_data={'skipped': True},
+                details=error_msg
+            )
+        if self.log:
+            self.log.error_message = error_msg
+            self.log.save()
+        return False
+        
+    def _find_orphans(self, platform: str, disabled_ou_dn: str) -> Optional[list]:
+        """
+        找出LDAP中属于该平台、但本次同步时平台中已不存在的用户和部门
+        
+        只比较本次成功获取到的对象类型，已在停用OU中的条目不参与比较。平台中仍存在的对象在LDAP中有多个条目时，
+        同步使用的条目（find_by_platform_id返回的条目）之外的重复条目也视为待清理。
+        
+        Args:
+            platform: 平台代码 wecom/feishu/dingtalk
+            disabled_ou_dn: 停用OU的DN
             
-            # 如果是ID到DN的映射
-            if dept_id in dept_map:
-                dn = dept_map[dept_id]
-                if isinstance(dn, str):
-                    # 从DN中提取名称
-                    return dn.split(',')[0].split('=')[1]
+        Returns:
+            list or None: 待清理的镜像条目，超过清理比例上限时返回None
+        """
+        disabled_suffix = ',' + disabled_ou_dn.lower()
+        threshold = self.sync_config.orphan_threshold
+        orphans = []
+        for kind in ('user', 'department'):
+            upstream = self.upstream_ids.get(kind)
+            if not upstream:
+                continue
+            entries = [entry for entry in self.mirror.iter_platform(platform, kind)
+                       if not entry.dn.lower().endswith(disabled_suffix)]
+            kind_orphans = [entry for entry in entries
+                            if entry.platform_id[2] not in upstream
+                            or self.mirror.find_by_platform_id(*entry.platform_id) is not entry]
+            if kind_orphans and len(kind_orphans) * 100 > len(entries) * threshold:
+                kind_name = '用户' if kind == 'user' else '部门'
+                error_msg = (f"待清理{kind_name} {len(kind_orphans)} 个，超过LDAP中该平台{kind_name}"
+                             f"({len(entries)} 个)的 {threshold}%，本次不做清理")
+                logger.error(error_msg)
+                if self.log:
+                    self.log.error_message = error_msg
+                    self.log.save()
+                return None
+            orphans.extend(kind_orphans)
+        return orphans
         
-        return f"未知部门({dept_id})" 
-
-    def _get_existing_user_map(self, desc_prefix: str) -> dict:
-        """获取LDAP中已存在的用户映射
+    def deprovision_orphans(self, platform: str) -> int:
+        """
+        按同步配置删除或停用平台中已不存在的用户和部门
         
-        返回格式: {
-            "用户ID": {
-                "dn": "用户DN",
-                "attrs": {
-                    "属性名": ["属性值"],
-                    ...
-                }
-            }
-        }
+        从最深的条目开始处理，下级条目先于上级完成；部门只有在其下所有条目都待清理时才删除。
+        组织架构快照不完整（部分请求失败）时不做清理。
+        停用时用户移到停用OU，部门删除。每个被清理的对象记录一条delete详情。
+        
+        Args:
+            platform: 平台代码 wecom/feishu/dingtalk
+            
+        Returns:
+            int: 提交清理的对象数
         """
-        user_map = {}
+        action = self.sync_config.orphan_action
+        if action == 'none' or self.mirror is None:
+            return 0
+            
+        if not self._upstream_complete(platform):
+            return 0
+            
+        disabled_ou_dn = f"ou={self.sync_config.disabled_ou},{self.ldap_config.base_dn}"
+        orphans = self._find_orphans(platform, disabled_ou_dn)
+        if not orphans:
+            return 0
+        logger.info(f"发现 {len(orphans)} 个平台中已不存在的对象，处理方式: {action}")
         
-        try:
-            # 获取基础DN下所有包含指定描述前缀的用户
-            search_filter = f"(&(objectClass=person)(description=*{desc_prefix}*))"
-            entries = self.ldap_connector.search_entries(self.ldap_config.base_dn, search_filter, search_scope='SUBTREE')
+        if action == 'disable' and not self.ldap_connector.add_ou(disabled_ou_dn, {'ou': [self.sync_config.disabled_ou]}):
+            logger.error(f"创建停用OU失败: {disabled_ou_dn}")
+            return 0
             
-            for entry in entries:
-                dn = entry.entry_dn
-                attrs = {}
-                
-                # 提取用户属性
-                for attr_name in entry.entry_attributes:
-                    attr_values = getattr(entry, attr_name).values
-                    if attr_values:
-                        attrs[attr_name] = attr_values
-                
-                # 提取用户ID
-                userid = attrs.get('userid', [None])[0]
-                if not userid:
-                    employeeNumber = attrs.get('employeeNumber', [None])[0]
-                    if employeeNumber:
-                        userid = employeeNumber
-                    else:
-                        # 尝试从uid提取
-                        uid = attrs.get('uid', [None])[0]
-                        if uid:
-                            # 如果uid格式为 "platform_id"，则提取id部分
-                            if '_' in uid:
-                                userid = uid.split('_', 1)[1]
-                            else:
-                                userid = uid
-                
-                # 如果仍然没有找到userid，则跳过
-                if not userid:
-                    logger.warning(f"无法从用户 {dn} 提取userid")
-                    continue
-                    
-                # 存储用户信息
-                user_map[userid] = {
-                    'dn': dn,
-                    'attrs': attrs
-                }
-                
-            return user_map
-        except Exception as e:
-            logger.error(f"获取已存在用户映射失败: {str(e)}")
-            import traceback
-            logger.error(traceback.format_exc())
-            return {}
\ No newline at end of file
+        orphan_keys = {entry.dn.lower() for entry in orphans}
+        # 按DN层级从深到浅处理，异步窗口保证下级的写入先于上级完成
+        orphans.sort(key=lambda entry: len(to_dn(entry.dn)), reverse=True)
+        
+        count = 0
+        with self.ldap_connector.async_writes():
+            for entry in orphans:
+                platform_id = entry.platform_id
+                kind = platform_id[1]
+                name = entry.get('cn') or entry.get('ou') or entry.rdn_value
+                on_done = partial(self._on_orphan_removed, platform, entry.dn, platform_id, name, action)
+                
+                if kind == 'department':
+                    if any(child.dn.lower() not in orphan_keys for child in self.mirror.subtree(entry.dn)):
+                        logger.warning(f"部门下仍有需要保留的条目，跳过清理: {entry.dn}")
+                        continue
+                    self.ldap_connector.delete_object(entry.dn, on_done=partial(on_done, None))
+                elif action == 'disable':
+                    target_dn = f"{entry.dn.split(',', 1)[0]},{disabled_ou_dn}"
+                    self.ldap_connector.move_object(entry.dn, target_dn, on_done=partial(on_done, target_dn))
+                else:
+                    self.ldap_connector.delete_object(entry.dn, on_done=partial(on_done, None))
+                count += 1
+        return count
+        
+    def _on_orphan_removed(self, platform: str, dn: str, platform_id, name: str, action: str,
+                           target_dn: Optional[str], success: bool, result: Optional[dict]):
+        """清理完成回调：记录delete详情"""
+        kind_name = '用户' if platform_id[1] == 'user' else '部门'
+        if not success:
+            logger.error(f"清理{kind_name}失败: {dn}, 原因: {result}")
+            return
+        if target_dn:
+            details = f"{kind_name} {name} 在平台中已不存在，已停用并移到 {target_dn}"
+        else:
+            details = f"{kind_name} {name} 在平台中已不存在，已从LDAP删除"
+        self.add_log_detail(
+            object_type=platform_id[1],
+            action='delete',
+            object_id=platform_id[2],
+            object_name=name,
+            old_data={'dn': dn},
+            new_data={'dn': target_dn} if target_dn else None,
+            details=details
+        )
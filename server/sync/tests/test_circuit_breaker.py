@@ -0,0 +1,100 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from ldap3.core.exceptions import LDAPSocketOpenError
+
+from sync.ldap_connector import LDAPConnector
+from sync.ldap_pool import LDAPPoolExhausted
+from sync.ldap_retry import CircuitBreaker, all_breaker_stats, get_breaker
+from sync.models import LDAPConfig
+
+
+class CircuitBreakerConnectTests(SimpleTestCase):
+    """通过LDAPConnector.connect()驱动的熔断器状态变化"""
+
+    def setUp(self):
+        self.breaker = CircuitBreaker('test', window=4, failure_rate=0.5, reset_timeout=60)
+        self.pool = mock.Mock()
+        self.pool.acquire.return_value = mock.Mock()
+        patcher = mock.patch('sync.ldap_connector.get_pool', return_value=self.pool)
+        self.get_pool = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def connector(self, pool_key='test-pool'):
+        connector = LDAPConnector('ldap://ldap.example.com', 'cn=admin,dc=example,dc=com', 'secret',
+                                  'dc=example,dc=com', pool_key=pool_key)
+        connector.breaker = self.breaker
+        return connector
+
+    def trip(self):
+        """打开熔断器并让其到达探测时间"""
+        self.breaker.record(False)
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.breaker._opened_at -= self.breaker.reset_timeout
+
+    def test_transient_connect_failures_open_breaker(self):
+        with mock.patch('sync.ldap_connector.Connection', side_effect=LDAPSocketOpenError('refused')):
+            connector = self.connector(pool_key=None)
+            self.assertFalse(connector.connect())
+            self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+            self.assertFalse(connector.connect())
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_open_breaker_rejects_without_acquiring(self):
+        self.breaker.record(False)
+        self.breaker.record(False)
+        self.assertFalse(self.connector().connect())
+        self.get_pool.assert_not_called()
+        self.assertEqual(self.breaker.stats()['rejected'], 1)
+
+    def test_pooled_probe_success_closes_breaker(self):
+        self.trip()
+        self.assertTrue(self.connector().connect())
+        self.pool.acquire.assert_called_once()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_pooled_probe_failure_reopens_breaker(self):
+        self.trip()
+        self.pool.acquire.side_effect = LDAPSocketOpenError('refused')
+        self.assertFalse(self.connector().connect())
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        # 重新计时，未到探测时间前直接拒绝
+        self.assertFalse(self.connector().connect())
+        self.assertEqual(self.pool.acquire.call_count, 1)
+
+    def test_pool_exhausted_releases_probe(self):
+        self.trip()
+        self.pool.acquire.side_effect = LDAPPoolExhausted('timeout')
+        self.assertFalse(self.connector().connect())
+        # 连接池耗尽不计入结果，探测名额释放后下一次连接仍可探测
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.pool.acquire.side_effect = None
+        self.assertTrue(self.connector().connect())
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+
+class BreakerResetTests(TestCase):
+    """LDAP配置修改或删除后重置其熔断器"""
+
+    def setUp(self):
+        self.ldap_config = LDAPConfig.objects.create(server_uri='ldap://ldap.example.com',
+                                                     bind_dn='cn=admin,dc=example,dc=com', bind_password='wrong',
+                                                     base_dn='dc=example,dc=com')
+        self.key = str(self.ldap_config.id)
+        breaker = get_breaker(self.key)
+        for _ in range(breaker.window):
+            breaker.record(False)
+        self.assertTrue(breaker.is_open)
+
+    def test_save_resets_breaker(self):
+        self.ldap_config.bind_password = 'secret'
+        self.ldap_config.save()
+        self.assertNotIn(self.key, all_breaker_stats())
+        breaker = get_breaker(self.key)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.before_request()
+
+    def test_delete_removes_breaker(self):
+        self.ldap_config.delete()
+        self.assertNotIn(self.key, all_breaker_stats())
@@ -0,0 +1,151 @@
+import re
+
+from django.test import SimpleTestCase
+
+from sync.directory_mirror import DirectoryMirror, rebase_dn
+from sync.platform_identity import user_identity_attrs
+
+BASE_DN = 'dc=example,dc=com'
+
+
+class FakeDirectory:
+    """按LDAPConnector.iter_entries的接口返回条目的目录，记录每次搜索是否允许读取副本"""
+
+    def __init__(self):
+        self.entries = {}
+        self.searches = []
+
+    def put(self, dn, uuid, timestamp, **attrs):
+        raw = {name: [str(value).encode('utf-8') for value in values] for name, values in attrs.items()}
+        raw['entryUUID'] = [uuid.encode()]
+        raw['modifyTimestamp'] = [timestamp.encode()]
+        self.entries[dn] = raw
+
+    def iter_entries(self, base_dn, search_filter, search_scope='SUBTREE', attributes=None, raw=False,
+                     replica=False):
+        self.searches.append(replica)
+        since = re.search(r'modifyTimestamp>=([0-9Z]+)', search_filter)
+        for dn, raw_attributes in list(self.entries.items()):
+            if since and raw_attributes['modifyTimestamp'][0].decode() < since.group(1):
+                continue
+            yield dn, raw_attributes
+
+
+class DirectoryMirrorSnapshotTests(SimpleTestCase):
+    """目录镜像的高水位：load → dump → restore → refresh"""
+
+    def setUp(self):
+        self.directory = FakeDirectory()
+        self.directory.put(f'ou=users,{BASE_DN}', 'u-ou', '20260101000000Z',
+                           objectClass=['organizationalUnit'], ou=['users'])
+        self.directory.put(f'uid=zhangsan,ou=users,{BASE_DN}', 'u-1', '20260102000000Z',
+                           objectClass=['person'], uid=['zhangsan'], cn=['张三'],
+                           **user_identity_attrs('wecom', 'zhangsan'))
+
+    def test_load_from_provider_sets_high_water_mark(self):
+        mirror = DirectoryMirror(BASE_DN)
+        self.assertEqual(mirror.load(self.directory, replica=False), 2)
+        self.assertEqual(mirror.high_water_mark, '20260102000000Z')
+        self.assertEqual(self.directory.searches, [False])
+
+    def test_load_from_replica_has_no_high_water_mark(self):
+        mirror = DirectoryMirror(BASE_DN)
+        mirror.load(self.directory)
+        self.assertIsNone(mirror.high_water_mark)
+        # 没有高水位的镜像不能增量刷新
+        self.assertFalse(mirror.refresh(self.directory))
+
+    def test_refresh_restored_snapshot(self):
+        mirror = DirectoryMirror(BASE_DN)
+        mirror.load(self.directory, replica=False)
+        restored = DirectoryMirror.restore(mirror.dump())
+        self.assertEqual(restored.high_water_mark, '20260102000000Z')
+        self.assertEqual(restored.find_by_platform_id('wecom', 'user', 'zhangsan').get('cn'), '张三')
+
+        self.directory.put(f'uid=zhangsan,ou=users,{BASE_DN}', 'u-1', '20260103000000Z',
+                           objectClass=['person'], uid=['zhangsan'], cn=['张三丰'],
+                           **user_identity_attrs('wecom', 'zhangsan'))
+        self.directory.put(f'uid=lisi,ou=users,{BASE_DN}', 'u-2', '20260103000000Z',
+                           objectClass=['person'], uid=['lisi'], cn=['李四'])
+        self.directory.searches.clear()
+
+        self.assertTrue(restored.refresh(self.directory))
+        self.assertEqual(restored.high_water_mark, '20260103000000Z')
+        self.assertEqual(restored.find_by_platform_id('wecom', 'user', 'zhangsan').get('cn'), '张三丰')
+        self.assertEqual(restored.find_by_uid('lisi').get('cn'), '李四')
+        self.assertEqual(len(restored), 3)
+        # 增量刷新只从主服务器读取
+        self.assertEqual(self.directory.searches, [False, False])
+
+    def test_refresh_drops_deleted_entries(self):
+        mirror = DirectoryMirror(BASE_DN)
+        mirror.load(self.directory, replica=False)
+        restored = DirectoryMirror.restore(mirror.dump())
+        del self.directory.entries[f'uid=zhangsan,ou=users,{BASE_DN}']
+
+        self.assertTrue(restored.refresh(self.directory))
+        self.assertIsNone(restored.find_by_uid('zhangsan'))
+        self.assertEqual(len(restored), 1)
+
+
+class DirectoryMirrorDuplicateTests(SimpleTestCase):
+    """平台标识相同的多个条目"""
+
+    def setUp(self):
+        self.mirror = DirectoryMirror(BASE_DN)
+        self.old_dn = f'uid=zhangsan,ou=users,{BASE_DN}'
+        self.new_dn = f'uid=zhangsan,ou=RD,{BASE_DN}'
+        for dn in (self.old_dn, self.new_dn):
+            self.mirror.add(dn, {'objectClass': ['person'], 'uid': ['zhangsan'],
+                                 **user_identity_attrs('wecom', 'zhangsan')})
+
+    def test_iter_platform_includes_duplicates(self):
+        dns = sorted(entry.dn for entry in self.mirror.iter_platform('wecom', 'user'))
+        self.assertEqual(dns, sorted([self.old_dn, self.new_dn]))
+
+    def test_prefer(self):
+        self.mirror.prefer(self.mirror.get(self.old_dn))
+        self.assertEqual(self.mirror.find_by_platform_id('wecom', 'user', 'zhangsan').dn, self.old_dn)
+        self.mirror.prefer(self.mirror.get(self.new_dn))
+        self.assertEqual(self.mirror.find_by_platform_id('wecom', 'user', 'zhangsan').dn, self.new_dn)
+
+
+class DirectoryMirrorMoveTests(SimpleTestCase):
+    """部门子树移动和重命名后一并改写下级条目"""
+
+    def setUp(self):
+        self.mirror = DirectoryMirror(BASE_DN)
+        self.mirror.add(f'ou=RD,{BASE_DN}', {'objectClass': ['organizationalUnit'], 'ou': ['RD']})
+        self.mirror.add(f'ou=QA,ou=RD,{BASE_DN}', {'objectClass': ['organizationalUnit'], 'ou': ['QA']})
+        self.mirror.add(f'uid=zhangsan,ou=QA,ou=RD,{BASE_DN}', {'objectClass': ['person'], 'uid': ['zhangsan'],
+                                                                 **user_identity_attrs('wecom', 'zhangsan')})
+
+    def test_rebase_dn(self):
+        self.assertEqual(rebase_dn(f'uid=a,ou=RD,{BASE_DN}', f'ou=RD,{BASE_DN}', f'ou=研发,{BASE_DN}'),
+                         f'uid=a,ou=研发,{BASE_DN}')
+        self.assertEqual(rebase_dn(f'ou=RD,{BASE_DN}', f'ou=rd,{BASE_DN}', f'ou=研发,{BASE_DN}'), f'ou=研发,{BASE_DN}')
+        self.assertIsNone(rebase_dn(f'uid=a,ou=QA,{BASE_DN}', f'ou=RD,{BASE_DN}', f'ou=研发,{BASE_DN}'))
+        # 只匹配完整的RDN，ou=XRD不在ou=RD的子树中
+        self.assertIsNone(rebase_dn(f'uid=a,ou=XRD,{BASE_DN}', f'ou=RD,{BASE_DN}', f'ou=研发,{BASE_DN}'))
+
+    def test_rename_rebases_subtree(self):
+        self.mirror.move(f'ou=RD,{BASE_DN}', f'ou=研发,{BASE_DN}')
+        self.assertFalse(self.mirror.exists(f'ou=RD,{BASE_DN}'))
+        self.assertEqual(self.mirror.get(f'ou=研发,{BASE_DN}').get('ou'), '研发')
+        self.assertEqual(self.mirror.find_by_uid('zhangsan').dn, f'uid=zhangsan,ou=QA,ou=研发,{BASE_DN}')
+        self.assertEqual(self.mirror.find_by_platform_id('wecom', 'user', 'zhangsan').dn,
+                         f'uid=zhangsan,ou=QA,ou=研发,{BASE_DN}')
+        self.assertEqual([entry.dn for entry in self.mirror.children(f'ou=研发,{BASE_DN}')],
+                         [f'ou=QA,ou=研发,{BASE_DN}'])
+
+    def test_move_under_new_parent(self):
+        self.mirror.add(f'ou=Tech,{BASE_DN}', {'objectClass': ['organizationalUnit'], 'ou': ['Tech']})
+        self.mirror.move(f'ou=QA,ou=RD,{BASE_DN}', f'ou=QA,ou=Tech,{BASE_DN}')
+        self.assertEqual(self.mirror.children(f'ou=RD,{BASE_DN}'), [])
+        self.assertEqual([entry.dn for entry in self.mirror.subtree(f'ou=Tech,{BASE_DN}')],
+                         [f'ou=Tech,{BASE_DN}', f'ou=QA,ou=Tech,{BASE_DN}', f'uid=zhangsan,ou=QA,ou=Tech,{BASE_DN}'])
+
+    def test_remove_subtree(self):
+        self.mirror.remove(f'ou=RD,{BASE_DN}')
+        self.assertEqual(len(self.mirror), 0)
+        self.assertIsNone(self.mirror.find_by_uid('zhangsan'))
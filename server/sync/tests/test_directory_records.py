@@ -0,0 +1,83 @@
+from django.test import SimpleTestCase
+
+from sync.directory_records import IdInterner, normalize_departments, normalize_users
+
+
+class NormalizeDepartmentsTests(SimpleTestCase):
+    """各平台部门数据转换"""
+
+    def test_wecom(self):
+        depts = normalize_departments('wecom', [
+            {'id': 1, 'name': '总部'},
+            {'id': 2, 'name': '研发部', 'parentid': 1},
+        ], IdInterner())
+        self.assertEqual([(d.dept_id, d.name, d.parent_id) for d in depts], [(1, '总部', 0), (2, '研发部', 1)])
+        self.assertTrue(all(d.platform == 'wecom' for d in depts))
+
+    def test_feishu(self):
+        depts = normalize_departments('feishu', [
+            {'department_id': 'od-1', 'name': '研发部'},
+            {'department_id': 'od-2', 'name': '测试组', 'parent_department_id': 'od-1'},
+        ], IdInterner())
+        self.assertEqual([(d.dept_id, d.parent_id) for d in depts], [('od-1', '0'), ('od-2', 'od-1')])
+
+    def test_dingtalk(self):
+        depts = normalize_departments('dingtalk', [
+            {'dept_id': 10, 'name': '研发部'},
+            {'dept_id': 11, 'name': '测试组', 'parent_id': 10},
+        ], IdInterner())
+        self.assertEqual([(d.dept_id, d.parent_id) for d in depts], [(10, 1), (11, 10)])
+
+
+class NormalizeUsersTests(SimpleTestCase):
+    """各平台用户数据转换"""
+
+    def test_wecom_keeps_department_ids_and_name_apart(self):
+        # WeComAPI.get_department_users把department替换为部门名称，部门ID列表在department_ids中
+        users = normalize_users('wecom', [{
+            'userid': 'zhangsan', 'name': '张三', 'email': 'zs@example.com', 'mobile': '13800000000',
+            'department': '研发部', 'department_ids': [2, 3], 'position': '工程师', 'gender': '1',
+        }], IdInterner())
+        user = users[0]
+        self.assertEqual(user.user_id, 'zhangsan')
+        self.assertEqual(user.department_ids, (2, 3))
+        self.assertEqual(user.department_name, '研发部')
+        self.assertEqual((user.email, user.mobile, user.position, user.gender),
+                         ('zs@example.com', '13800000000', '工程师', '1'))
+
+    def test_wecom_without_department_ids(self):
+        users = normalize_users('wecom', [{'userid': 'lisi', 'name': '李四', 'department': '研发部'}], IdInterner())
+        self.assertEqual(users[0].department_ids, ())
+
+    def test_feishu(self):
+        users = normalize_users('feishu', [{
+            'user_id': 'ou-1', 'name': '王五', 'department_ids': ['od-1'], 'avatar_url': 'https://a/1.png',
+        }], IdInterner())
+        self.assertEqual(users[0].user_id, 'ou-1')
+        self.assertEqual(users[0].department_ids, ('od-1',))
+        self.assertEqual(users[0].avatar, 'https://a/1.png')
+
+    def test_dingtalk(self):
+        users = normalize_users('dingtalk', [{
+            'userid': 'd1', 'name': '赵六', 'dept_id_list': [10, 11], 'title': '经理', 'department': '10,11',
+        }], IdInterner())
+        self.assertEqual(users[0].department_ids, (10, 11))
+        self.assertEqual(users[0].position, '经理')
+
+    def test_skips_users_without_id(self):
+        users = normalize_users('wecom', [
+            {'name': '无ID'},
+            {'userid': 'zhangsan', 'name': '张三', 'department_ids': [2]},
+        ], IdInterner())
+        self.assertEqual([user.user_id for user in users], ['zhangsan'])
+
+    def test_department_ids_are_interned(self):
+        # 分别解析出的整数是不同的对象，驻留后共用部门列表中的那一个
+        intern = IdInterner()
+        depts = normalize_departments('wecom', [{'id': int('1000'), 'name': '研发部'}], intern)
+        users = normalize_users('wecom', [
+            {'userid': 'a', 'name': 'A', 'department_ids': [int('1000')]},
+            {'userid': 'b', 'name': 'B', 'department_ids': [int('1000')]},
+        ], intern)
+        self.assertIs(users[0].department_ids[0], depts[0].dept_id)
+        self.assertIs(users[1].department_ids[0], depts[0].dept_id)
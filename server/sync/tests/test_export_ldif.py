@@ -0,0 +1,65 @@
+import base64
+import io
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from sync.models import DirectorySnapshot, SyncLog
+from sync.tests.test_sync_service import BASE_DN, WeComPlatformMixin
+
+
+@override_settings(IM_SNAPSHOT_MAX_AGE=0)
+class ExportLDIFTests(WeComPlatformMixin, TestCase):
+    """export_ldif命令：完整同步流程写入模拟目录后导出LDIF，不改变真实LDAP配置的状态"""
+
+    def setUp(self):
+        super().setUp()
+        # 下级部门排在上级之前返回
+        self.departments = [
+            {'id': 3, 'name': 'QA', 'parentid': 2},
+            {'id': 2, 'name': 'RD', 'parentid': 1},
+            {'id': 1, 'name': '总部', 'parentid': 0},
+        ]
+        self.users[3] = [{'userid': 'zhaoliu', 'name': '赵六'}]
+        handle, self.output = tempfile.mkstemp(suffix='.ldif')
+        os.close(handle)
+        self.addCleanup(os.remove, self.output)
+
+    def export(self, *args):
+        call_command('export_ldif', str(self.sync_config.id), self.output, *args, stdout=io.StringIO())
+        dns = []
+        with open(self.output, encoding='utf-8') as stream:
+            for line in stream:
+                if line.startswith('dn:: '):
+                    dns.append(base64.b64decode(line[5:]).decode('utf-8'))
+                elif line.startswith('dn: '):
+                    dns.append(line[4:].rstrip('\n'))
+        return dns
+
+    def test_parents_before_children(self):
+        dns = self.export('--include-base')
+        self.assertEqual(dns[0], BASE_DN)
+        self.assertIn(f'uid=zhaoliu,ou=QA,ou=RD,ou=总部,ou=departments,{BASE_DN}', dns)
+        self.assertEqual(len(dns), 1 + 2 + 3 + 5)
+        seen = set()
+        for dn in dns:
+            parent = dn.split(',', 1)[1] if dn != BASE_DN else None
+            if parent and parent != BASE_DN.split(',', 1)[1]:
+                self.assertIn(parent.lower(), seen, f"{dn} 在上级之前导出")
+            seen.add(dn.lower())
+
+    def test_does_not_persist_sync_state(self):
+        DirectorySnapshot.objects.create(ldap_config=self.ldap_config, server_uri=self.ldap_config.server_uri,
+                                         base_dn=BASE_DN, data=b'', high_water_mark='20260101000000Z',
+                                         entry_count=0, full_loaded_at=timezone.now())
+        with override_settings(LDAP_MIRROR_FULL_RELOAD_INTERVAL=86400):
+            self.export()
+
+        self.sync_config.refresh_from_db()
+        self.assertIsNone(self.sync_config.last_sync_time)
+        self.assertEqual(SyncLog.objects.get(config=self.sync_config).stats, {})
+        # 目录将被重新导入，旧快照在导出成功后删除，不会保存模拟目录的快照
+        self.assertFalse(DirectorySnapshot.objects.exists())
@@ -0,0 +1,42 @@
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase, override_settings
+
+from utils.http_session import create_session
+
+
+@override_settings(IM_API_POOL_SIZE=10, IM_API_MAX_WORKERS=16, IM_API_CONNECT_TIMEOUT=3, IM_API_READ_TIMEOUT=20)
+class APISessionTests(SimpleTestCase):
+    """平台API客户端的长连接会话"""
+
+    def setUp(self):
+        patcher = mock.patch.object(requests.Session, 'request', return_value='response')
+        self.send = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pool_sized_for_concurrent_fetch(self):
+        session = create_session()
+        adapter = session.get_adapter('https://qyapi.weixin.qq.com')
+        self.assertIs(session.get_adapter('http://example.com'), adapter)
+        self.assertEqual(adapter._pool_maxsize, 16)
+        self.assertEqual(create_session(pool_size=0).get_adapter('https://x')._pool_maxsize, 1)
+
+    def test_keep_alive_and_gzip_headers(self):
+        session = create_session()
+        self.assertEqual(session.headers['Connection'], 'keep-alive')
+        self.assertIn('gzip', session.headers['Accept-Encoding'])
+
+    def test_default_timeout(self):
+        session = create_session()
+        session.get('https://qyapi.weixin.qq.com/cgi-bin/department/list')
+        self.assertEqual(self.send.call_args.kwargs['timeout'], (3, 20))
+        session.get('https://qyapi.weixin.qq.com/cgi-bin/department/list', timeout=1)
+        self.assertEqual(self.send.call_args.kwargs['timeout'], 1)
+
+    def test_requests_pass_rate_limiter(self):
+        limiter = mock.Mock()
+        session = create_session(rate_limiter=limiter)
+        self.assertEqual(session.get('https://open.feishu.cn/open-apis/contact/v3/users'), 'response')
+        session.post('https://oapi.dingtalk.com/topapi/v2/user/list')
+        self.assertEqual(limiter.acquire.call_count, 2)
@@ -0,0 +1,126 @@
+from django.test import SimpleTestCase
+
+from sync.ldap_async import AsyncWriteWindow
+from sync.ldap_retry import RetryPolicy
+
+BASE_DN = 'dc=example,dc=com'
+
+
+class FakeAsyncConnection:
+    """模拟ASYNC策略的连接：发送时返回消息ID，取回结果时按results中的顺序返回结果码（默认成功）"""
+
+    def __init__(self, results=None):
+        self.events = []
+        self.results = results or {}
+        self.usage = None
+        self.closed = False
+        self._next_id = 0
+        self._dns = {}
+
+    def _send(self, operation, dn):
+        self._next_id += 1
+        self._dns[self._next_id] = dn
+        self.events.append(('send', operation, dn))
+        return self._next_id
+
+    def add(self, dn, object_classes, attributes):
+        return self._send('add', dn)
+
+    def modify(self, dn, changes):
+        return self._send('modify', dn)
+
+    def modify_dn(self, dn, relative_dn, new_superior=None):
+        return self._send('modify_dn', dn)
+
+    def delete(self, dn):
+        return self._send('delete', dn)
+
+    def get_response(self, message_id):
+        dn = self._dns.pop(message_id)
+        self.events.append(('collect', dn))
+        codes = self.results.get(dn)
+        code = codes.pop(0) if codes else 0
+        return [], {'result': code, 'description': 'busy' if code == 51 else 'success'}
+
+
+class AsyncWriteWindowTests(SimpleTestCase):
+    """异步写入窗口的发送和取回顺序"""
+
+    def setUp(self):
+        self.conn = FakeAsyncConnection()
+        self.done = []
+
+    def callback(self, dn):
+        return lambda success, result: self.done.append((dn, success))
+
+    def test_child_waits_for_parent(self):
+        window = AsyncWriteWindow(self.conn, window=10)
+        parent = f'ou=RD,{BASE_DN}'
+        other = f'ou=QA,{BASE_DN}'
+        child = f'uid=zhangsan,ou=RD,{BASE_DN}'
+        window.add(parent, ['organizationalUnit'], {})
+        window.add(other, ['organizationalUnit'], {})
+        window.add(child, ['person'], {})
+        window.flush()
+        self.assertEqual(self.conn.events, [
+            ('send', 'add', parent),
+            ('send', 'add', other),
+            ('collect', parent),
+            ('send', 'add', child),
+            ('collect', other),
+            ('collect', child),
+        ])
+        self.assertEqual(window.stats()['barrier_waits'], 1)
+
+    def test_same_entry_writes_keep_order(self):
+        window = AsyncWriteWindow(self.conn, window=10)
+        dn = f'uid=zhangsan,{BASE_DN}'
+        window.add(dn, ['person'], {}, on_done=self.callback('add'))
+        window.modify(dn, {}, on_done=self.callback('modify'))
+        window.flush()
+        self.assertEqual(self.conn.events.index(('collect', dn)), 1)
+        self.assertEqual(self.done, [('add', True), ('modify', True)])
+
+    def test_move_waits_for_target_subtree(self):
+        window = AsyncWriteWindow(self.conn, window=10)
+        target = f'ou=QA,{BASE_DN}'
+        window.add(target, ['organizationalUnit'], {})
+        window.modify_dn(f'uid=zhangsan,ou=RD,{BASE_DN}', 'uid=zhangsan', new_superior=target)
+        self.assertEqual(self.conn.events[1], ('collect', target))
+
+    def test_window_limits_pending_requests(self):
+        window = AsyncWriteWindow(self.conn, window=2)
+        dns = [f'uid=user{i},{BASE_DN}' for i in range(3)]
+        for dn in dns:
+            window.add(dn, ['person'], {})
+            self.assertLessEqual(len(window), 2)
+        self.assertEqual(self.conn.events[2], ('collect', dns[0]))
+        window.flush()
+        self.assertEqual(len(window), 0)
+        self.assertEqual(window.stats()['submitted'], 3)
+
+    def test_wait_for(self):
+        window = AsyncWriteWindow(self.conn, window=10)
+        window.add(f'uid=zhangsan,ou=RD,{BASE_DN}', ['person'], {})
+        window.add(f'uid=lisi,ou=QA,{BASE_DN}', ['person'], {})
+        window.wait_for(f'ou=RD,{BASE_DN}')
+        self.assertEqual(len(window), 1)
+
+    def test_retries_transient_result(self):
+        dn = f'uid=zhangsan,{BASE_DN}'
+        self.conn.results[dn] = [51, 0]
+        window = AsyncWriteWindow(self.conn, window=10, retry_policy=RetryPolicy(attempts=3, base_delay=0))
+        window.add(dn, ['person'], {}, on_done=self.callback(dn))
+        window.flush()
+        self.assertEqual(self.done, [(dn, True)])
+        self.assertEqual(window.stats()['retried'], 1)
+        self.assertEqual([event[0] for event in self.conn.events], ['send', 'collect', 'send', 'collect'])
+
+    def test_reports_failure_after_retries(self):
+        dn = f'uid=zhangsan,{BASE_DN}'
+        self.conn.results[dn] = [51, 51]
+        window = AsyncWriteWindow(self.conn, window=10, retry_policy=RetryPolicy(attempts=2, base_delay=0))
+        window.add(dn, ['person'], {}, on_done=self.callback(dn))
+        window.flush()
+        self.assertEqual(self.done, [(dn, False)])
+        self.assertEqual(window.stats()['failed'], 1)
@@ -0,0 +1,62 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from ldap3 import MODIFY_ADD, MODIFY_DELETE, MODIFY_REPLACE
+
+from sync.ldap_connector import LDAPConnector
+from sync.ldap_retry import RetryPolicy
+
+DN = 'uid=zhangsan,ou=研发部,dc=example,dc=com'
+CURRENT = {
+    'objectClass': ['top', 'inetOrgPerson'],
+    'cn': ['张三'],
+    'mail': ['zhangsan@example.com'],
+    'telephoneNumber': ['13800000000'],
+}
+
+
+class DeltaModifyTests(SimpleTestCase):
+    """提供当前属性时只发送有变化的属性"""
+
+    def setUp(self):
+        self.connector = LDAPConnector('ldap://ldap.example.com', 'cn=admin,dc=example,dc=com', 'secret',
+                                       'dc=example,dc=com')
+        self.connector.retry_policy = RetryPolicy(attempts=1)
+        # 连接没有Server，属性名不按schema归一，只做大小写归一
+        self.connector.conn = mock.Mock(usage=None, closed=False, server=None, result={'result': 0})
+        self.connector.conn.modify.return_value = True
+
+    def test_changes_per_attribute(self):
+        changes = self.connector._build_delta_changes(CURRENT, {
+            'objectClass': ['top', 'person'],
+            'CN': '张三',
+            'mail': 'zhangsan@corp.example.com',
+            'title': '工程师',
+            'telephoneNumber': '',
+        })
+        self.assertEqual(changes, {
+            'mail': [(MODIFY_REPLACE, ['zhangsan@corp.example.com'])],
+            'title': [(MODIFY_ADD, ['工程师'])],
+            'telephoneNumber': [(MODIFY_DELETE, [])],
+        })
+
+    def test_value_order_is_ignored(self):
+        current = {'member': ['uid=a', 'uid=b']}
+        self.assertEqual(self.connector._build_delta_changes(current, {'member': ['uid=b', 'uid=a']}), {})
+
+    def test_unchanged_object_skips_server(self):
+        self.assertTrue(self.connector.modify_object(DN, {'cn': '张三', 'mail': 'zhangsan@example.com'}, CURRENT))
+        self.assertTrue(self.connector.modify_user(DN, {'cn': '张三'}, CURRENT))
+        self.connector.conn.modify.assert_not_called()
+        self.assertFalse(self.connector.has_written)
+
+    def test_only_changed_attributes_sent(self):
+        self.assertTrue(self.connector.modify_object(DN, {'cn': '张三', 'mail': 'new@example.com'}, CURRENT))
+        self.connector.conn.modify.assert_called_once_with(DN, {'mail': [(MODIFY_REPLACE, ['new@example.com'])]})
+
+    def test_without_current_attributes_replaces_all(self):
+        self.connector.modify_object(DN, {'objectClass': ['top'], 'cn': '张三', 'mail': ['a@example.com']})
+        self.connector.conn.modify.assert_called_once_with(DN, {
+            'cn': [(MODIFY_REPLACE, ['张三'])],
+            'mail': [(MODIFY_REPLACE, ['a@example.com'])],
+        })
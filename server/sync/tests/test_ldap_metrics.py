@@ -0,0 +1,72 @@
+from django.test import SimpleTestCase
+
+from sync import ldap_metrics
+from sync.ldap_metrics import LDAPMetrics, OperationStats, merge_process_metrics
+
+
+class OperationStatsTests(SimpleTestCase):
+    """单类操作的统计"""
+
+    def test_record_counts_outcomes(self):
+        stats = OperationStats()
+        stats.record(0.003, 0, received=100)
+        stats.record(0.020, 68)
+        stats.record(2.0, None)
+        summary = stats.summary()
+        self.assertEqual(summary['count'], 3)
+        self.assertEqual(summary['failures'], 2)
+        self.assertEqual(summary['bytes'], 100)
+        self.assertEqual(summary['result_codes'], {'0': 1, '68': 1, 'error': 1})
+        self.assertEqual(summary['histogram']['le_5ms'], 1)
+        self.assertEqual(summary['histogram']['le_25ms'], 1)
+        self.assertEqual(summary['histogram']['le_2500ms'], 1)
+        self.assertEqual(summary['max_ms'], 2000.0)
+
+    def test_percentiles_use_bucket_bounds(self):
+        stats = OperationStats()
+        for _ in range(99):
+            stats.record(0.0008, 0)
+        stats.record(0.3, 0)
+        self.assertEqual(stats.percentile(0.5), 1.0)
+        self.assertEqual(stats.percentile(0.99), 1.0)
+        self.assertEqual(stats.percentile(1.0), 300.0)
+
+    def test_slow_operation_lands_in_overflow_bucket(self):
+        stats = OperationStats()
+        stats.record(12.0, 0)
+        self.assertEqual(stats.summary()['histogram']['inf'], 1)
+        self.assertEqual(stats.percentile(0.5), 12000.0)
+
+    def test_empty_summary(self):
+        summary = OperationStats().summary()
+        self.assertIsNone(summary['avg_ms'])
+        self.assertIsNone(summary['p50_ms'])
+
+
+class LDAPMetricsTests(SimpleTestCase):
+    """按操作类型汇总并合并到进程统计"""
+
+    def setUp(self):
+        ldap_metrics._process_metrics.clear()
+        self.addCleanup(ldap_metrics._process_metrics.clear)
+
+    def test_merge_into_process_totals(self):
+        first = LDAPMetrics()
+        first.record('add', 0.01, 0)
+        first.retry('add')
+        second = LDAPMetrics()
+        second.record('add', 0.02, 0)
+        second.record('search', 0.005, 0, received=50)
+        merge_process_metrics('1', first)
+        merge_process_metrics('1', second)
+        merge_process_metrics('1', LDAPMetrics())
+
+        totals = ldap_metrics.all_operation_stats()['1']
+        self.assertEqual(list(totals), ['add', 'search'])
+        self.assertEqual(totals['add']['count'], 2)
+        self.assertEqual(totals['add']['retries'], 1)
+        self.assertEqual(totals['search']['bytes'], 50)
+
+    def test_empty_run_is_not_recorded(self):
+        merge_process_metrics('1', LDAPMetrics())
+        self.assertEqual(ldap_metrics.all_operation_stats(), {})
@@ -0,0 +1,128 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from ldap3.core.exceptions import LDAPSocketOpenError
+
+from sync import ldap_pool
+from sync.ldap_pool import LDAPConnectionPool, LDAPPoolExhausted, get_pool, invalidate_pool
+
+
+class FakeConnection:
+    """记录健康检查和关闭的连接"""
+
+    def __init__(self):
+        self.closed = False
+        self.bound = True
+        self.searches = 0
+        self.fail_search = False
+
+    def search(self, *args, **kwargs):
+        self.searches += 1
+        if self.fail_search:
+            raise LDAPSocketOpenError('连接已断开')
+        return True
+
+    def unbind(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """连接复用、健康检查和容量限制"""
+
+    def setUp(self):
+        patcher = mock.patch.object(LDAPConnectionPool, '_open', autospec=True, side_effect=self.open)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.opened = []
+
+    def open(self, pool):
+        pool._created += 1
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+    def pool(self, **kwargs):
+        return LDAPConnectionPool('ldap://ldap.example.com', 'cn=admin', 'secret', **kwargs)
+
+    def test_released_connection_is_reused(self):
+        pool = self.pool()
+        conn = pool.acquire()
+        pool.release(conn)
+        self.assertIs(pool.acquire(), conn)
+        self.assertEqual(conn.searches, 1)
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['acquired'], 2)
+
+    def test_dead_connection_is_replaced(self):
+        pool = self.pool()
+        conn = pool.acquire()
+        pool.release(conn)
+        conn.fail_search = True
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()['reconnects'], 1)
+
+    def test_idle_timeout_rebinds_without_probe(self):
+        pool = self.pool(idle_timeout=10)
+        conn = pool.acquire()
+        pool.release(conn)
+        pool._idle[0].last_used -= 11
+        self.assertIsNot(pool.acquire(), conn)
+        self.assertEqual(conn.searches, 0)
+
+    def test_discarded_connection_is_not_pooled(self):
+        pool = self.pool()
+        conn = pool.acquire()
+        pool.release(conn, discard=True)
+        self.assertTrue(conn.closed)
+        self.assertIsNot(pool.acquire(), conn)
+
+    def test_exhausted_pool_times_out(self):
+        pool = self.pool(max_size=1, wait_timeout=0.05)
+        pool.acquire()
+        with self.assertRaises(LDAPPoolExhausted):
+            pool.acquire()
+        self.assertEqual(pool.stats()['waits'], 1)
+
+    def test_failed_open_frees_slot(self):
+        pool = self.pool(max_size=1, wait_timeout=0.05)
+        with mock.patch.object(LDAPConnectionPool, '_open', side_effect=LDAPSocketOpenError('拒绝连接')):
+            with self.assertRaises(LDAPSocketOpenError):
+                pool.acquire()
+        self.assertEqual(pool.stats()['in_use'], 0)
+        pool.acquire()
+
+    def test_close_discards_idle_and_returned(self):
+        pool = self.pool()
+        idle, busy = pool.acquire(), pool.acquire()
+        pool.release(idle)
+        pool.close()
+        self.assertTrue(idle.closed)
+        pool.release(busy)
+        self.assertTrue(busy.closed)
+
+
+class SharedPoolTests(SimpleTestCase):
+    """进程内按LDAP配置共享连接池"""
+
+    def setUp(self):
+        ldap_pool._pools.clear()
+        self.addCleanup(ldap_pool._pools.clear)
+
+    def test_same_key_shares_pool(self):
+        pool = get_pool('1', 'ldap://a', 'cn=admin', 'secret')
+        self.assertIs(get_pool('1', 'ldap://a', 'cn=admin', 'secret'), pool)
+        self.assertIsNot(get_pool('2', 'ldap://a', 'cn=admin', 'secret'), pool)
+
+    def test_changed_credentials_rebuild_pool(self):
+        pool = get_pool('1', 'ldap://a', 'cn=admin', 'secret')
+        rebuilt = get_pool('1', 'ldap://a', 'cn=admin', 'changed')
+        self.assertIsNot(rebuilt, pool)
+        self.assertTrue(pool._closed)
+
+    def test_invalidate_closes_pool(self):
+        pool = get_pool('1', 'ldap://a', 'cn=admin', 'secret')
+        invalidate_pool('1')
+        self.assertTrue(pool._closed)
+        self.assertEqual(ldap_pool.all_pool_stats(), {})
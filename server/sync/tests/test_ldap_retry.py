@@ -0,0 +1,74 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from ldap3.core.exceptions import LDAPSocketOpenError
+
+from sync.ldap_connector import LDAPConnector
+from sync.ldap_retry import CircuitBreaker, LDAPCircuitOpenError, RetryPolicy, is_transient
+
+
+class RetryPolicyTests(SimpleTestCase):
+    """重试等待时间：指数增长的上限内随机，不超过max_delay"""
+
+    def test_delay_upper_bound_doubles_until_max(self):
+        policy = RetryPolicy(attempts=6, base_delay=0.2, max_delay=1.0)
+        with mock.patch('sync.ldap_retry.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([policy.delay(retry) for retry in range(1, 6)], [0.2, 0.4, 0.8, 1.0, 1.0])
+
+    def test_delay_within_bounds(self):
+        policy = RetryPolicy(attempts=5, base_delay=0.2, max_delay=1.0)
+        for retry in range(1, 5):
+            upper = min(1.0, 0.2 * 2 ** (retry - 1))
+            for _ in range(50):
+                self.assertTrue(0 <= policy.delay(retry) <= upper)
+
+    def test_at_least_one_attempt(self):
+        self.assertEqual(RetryPolicy(attempts=0).attempts, 1)
+
+    def test_is_transient(self):
+        self.assertTrue(is_transient(51))
+        self.assertTrue(is_transient(52))
+        self.assertFalse(is_transient(68))
+        self.assertTrue(is_transient(error=LDAPSocketOpenError('refused')))
+
+
+class ConnectorRetryTests(SimpleTestCase):
+    """LDAPConnector._request按重试策略重试暂时性失败，每次结果计入熔断器"""
+
+    def setUp(self):
+        self.connector = LDAPConnector('ldap://ldap.example.com', 'cn=admin,dc=example,dc=com', 'secret',
+                                       'dc=example,dc=com')
+        self.connector.breaker = CircuitBreaker('test', window=10, failure_rate=0.5, reset_timeout=60)
+        self.connector.retry_policy = RetryPolicy(attempts=3, base_delay=0)
+        self.conn = mock.Mock(usage=None, closed=False)
+
+    def respond(self, *codes):
+        def delete(dn):
+            self.conn.result = {'result': next(results)}
+            return self.conn.result['result'] == 0
+        results = iter(codes)
+        self.conn.delete.side_effect = delete
+
+    def test_retries_busy_until_success(self):
+        self.respond(51, 51, 0)
+        self.assertTrue(self.connector._request('delete', self.conn, 'uid=a,dc=example,dc=com'))
+        self.assertEqual(self.conn.delete.call_count, 3)
+        self.assertEqual(self.connector.breaker.stats()['recent_failures'], 2)
+
+    def test_gives_up_after_attempts(self):
+        self.respond(52, 52, 52, 0)
+        self.assertFalse(self.connector._request('delete', self.conn, 'uid=a,dc=example,dc=com'))
+        self.assertEqual(self.conn.delete.call_count, 3)
+
+    def test_non_transient_result_is_not_retried(self):
+        self.respond(32)
+        self.assertFalse(self.connector._request('delete', self.conn, 'uid=a,dc=example,dc=com'))
+        self.assertEqual(self.conn.delete.call_count, 1)
+        self.assertEqual(self.connector.breaker.stats()['recent_failures'], 0)
+
+    def test_open_breaker_stops_retrying(self):
+        self.connector.breaker = CircuitBreaker('test', window=2, failure_rate=0.5, reset_timeout=60)
+        self.respond(51, 51, 0)
+        with self.assertRaises(LDAPCircuitOpenError):
+            self.connector._request('delete', self.conn, 'uid=a,dc=example,dc=com')
+        self.assertEqual(self.conn.delete.call_count, 1)
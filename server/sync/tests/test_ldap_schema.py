@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase
+from ldap3 import OFFLINE_SLAPD_2_4, Server
+
+from sync import ldap_schema
+from sync.ldap_schema import get_capabilities, invalidate_capabilities, probe_capabilities
+
+
+def slapd_schema():
+    return Server('ldap://offline', get_info=OFFLINE_SLAPD_2_4).schema
+
+
+class ProbeCapabilitiesTests(SimpleTestCase):
+    """根据schema选择对象类组合"""
+
+    def test_prefers_most_complete_user_classes(self):
+        capabilities = probe_capabilities(slapd_schema())
+        self.assertEqual(capabilities.user.object_classes, ldap_schema.USER_OBJECT_CLASS_OPTIONS[0])
+        self.assertEqual(capabilities.ou.object_classes, ldap_schema.OU_OBJECT_CLASSES)
+
+    def test_filter_attrs_keeps_inherited_and_aliases(self):
+        user = probe_capabilities(slapd_schema()).user
+        attributes = {'cn': '张三', 'surname': '张', 'mail': 'a@example.com', 'unknownAttr': 'x'}
+        self.assertEqual(user.filter_attrs(attributes), {'cn': '张三', 'surname': '张', 'mail': 'a@example.com'})
+
+    def test_falls_back_when_classes_missing(self):
+        schema = slapd_schema()
+        object_classes = {name: oc for name, oc in schema.object_classes.items()
+                          if name.lower() not in ('inetorgperson', 'organizationalperson', 'person')}
+        fake = SimpleNamespace(object_classes=object_classes, attribute_types=schema.attribute_types)
+        self.assertEqual(probe_capabilities(fake).user.object_classes, ['top', 'account'])
+
+    def test_no_schema(self):
+        self.assertIsNone(probe_capabilities(None))
+
+
+class FakeServer:
+    """只记录读取次数的服务器，读取时设置schema"""
+
+    reads = 0
+
+    def __init__(self, schema):
+        self.remote_schema = schema
+        self.schema = None
+        self.info = None
+        self.get_info = None
+
+    def get_info_from_server(self, conn):
+        FakeServer.reads += 1
+        self.info = 'dsa'
+        self.schema = self.remote_schema
+
+    def attach_dsa_info(self, info):
+        self.info = info
+
+    def attach_schema_info(self, schema):
+        self.schema = schema
+
+
+class SchemaCacheTests(SimpleTestCase):
+    """按LDAP配置缓存服务器信息、schema和能力"""
+
+    def setUp(self):
+        FakeServer.reads = 0
+        self.schema = slapd_schema()
+        for cache in (ldap_schema._cache, ldap_schema._info_cache, ldap_schema._subtree_rename_refused):
+            cache.clear()
+            self.addCleanup(cache.clear)
+
+    def connection(self):
+        return SimpleNamespace(server=FakeServer(self.schema))
+
+    def test_schema_read_once_per_config(self):
+        first = self.connection()
+        self.assertIs(ldap_schema.ensure_server_info('1', 'ldap://a', first), self.schema)
+        second = self.connection()
+        self.assertIs(ldap_schema.ensure_server_info('1', 'ldap://a', second), self.schema)
+        self.assertIs(second.server.schema, self.schema)
+        self.assertEqual(second.server.info, 'dsa')
+        self.assertEqual(FakeServer.reads, 1)
+
+        ldap_schema.ensure_server_info('1', 'ldap://b', self.connection())
+        self.assertEqual(FakeServer.reads, 2)
+
+    def test_missing_schema_is_cached(self):
+        self.schema = None
+        self.assertIsNone(ldap_schema.ensure_server_info('1', 'ldap://a', self.connection()))
+        self.assertIsNone(ldap_schema.ensure_server_info('1', 'ldap://a', self.connection()))
+        self.assertEqual(FakeServer.reads, 1)
+
+    def test_capabilities_cached_until_invalidated(self):
+        with mock.patch.object(ldap_schema, 'probe_capabilities', wraps=probe_capabilities) as probe:
+            first = get_capabilities('1', 'ldap://a', self.connection())
+            self.assertIs(get_capabilities('1', 'ldap://a', self.connection()), first)
+            self.assertEqual(probe.call_count, 1)
+
+            invalidate_capabilities('1')
+            self.assertIsNot(get_capabilities('1', 'ldap://a', self.connection()), first)
+            self.assertEqual(probe.call_count, 2)
+        self.assertEqual(FakeServer.reads, 2)
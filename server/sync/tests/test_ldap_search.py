@@ -0,0 +1,112 @@
+from unittest import mock
+
+from django.test import SimpleTestCase
+from ldap3 import MOCK_SYNC, Connection, Server
+from ldap3.core.exceptions import LDAPSocketOpenError
+
+from sync.directory_mirror import MIRROR_ATTRIBUTES
+from sync.ldap_connector import DN_ONLY, LDAPConnector
+
+BASE_DN = 'dc=example,dc=com'
+ADMIN_DN = f'cn=admin,{BASE_DN}'
+
+
+def mock_directory(users):
+    """包含users个用户的模拟目录，返回已绑定的连接"""
+    conn = Connection(Server('mock'), user=ADMIN_DN, password='secret', client_strategy=MOCK_SYNC)
+    conn.strategy.add_entry(ADMIN_DN, {'userPassword': 'secret'})
+    for i in range(users):
+        conn.strategy.add_entry(f'uid=u{i},{BASE_DN}', {
+            'objectClass': ['inetOrgPerson'], 'uid': f'u{i}', 'cn': f'用户{i}', 'sn': '用户',
+        })
+    conn.bind()
+    return conn
+
+
+class PagedSearchTests(SimpleTestCase):
+    """iter_entries分页流式搜索"""
+
+    def setUp(self):
+        self.connector = LDAPConnector('ldap://ldap.example.com', ADMIN_DN, 'secret', BASE_DN, page_size=2)
+        self.connector.conn = mock_directory(7)
+
+    def test_yields_all_pages(self):
+        with mock.patch.object(self.connector.conn.extend.standard, 'paged_search',
+                               wraps=self.connector.conn.extend.standard.paged_search) as paged_search:
+            entries = dict(self.connector.iter_entries(BASE_DN, '(uid=*)', attributes=['uid', 'cn']))
+        self.assertEqual(len(entries), 7)
+        self.assertEqual(entries[f'uid=u3,{BASE_DN}'], {'uid': ['u3'], 'cn': ['用户3']})
+        self.assertEqual(paged_search.call_args.kwargs['paged_size'], 2)
+        self.assertTrue(paged_search.call_args.kwargs['generator'])
+
+    def test_search_recorded_once(self):
+        list(self.connector.iter_entries(BASE_DN, '(uid=*)', attributes=['uid']))
+        stats = self.connector.metrics.summary()['paged_search']
+        self.assertEqual(stats['count'], 1)
+        self.assertEqual(stats['failures'], 0)
+
+    def test_not_connected(self):
+        self.connector.conn = None
+        self.assertEqual(list(self.connector.iter_entries(BASE_DN, '(uid=*)')), [])
+
+    def test_raw_values_skip_decoding(self):
+        entries = self.connector.iter_entries(BASE_DN, '(uid=u1)', attributes=['cn'], raw=True)
+        self.assertEqual(next(entries), (f'uid=u1,{BASE_DN}', {'cn': ['用户1'.encode('utf-8')]}))
+        self.assertFalse(self.connector.conn.check_names)
+        self.assertEqual(list(entries), [])
+        # 搜索结束后恢复连接的check_names
+        self.assertTrue(self.connector.conn.check_names)
+
+
+class ProjectionTests(SimpleTestCase):
+    """搜索只请求调用方需要的属性"""
+
+    def setUp(self):
+        self.connector = LDAPConnector('ldap://ldap.example.com', ADMIN_DN, 'secret', BASE_DN)
+        self.connector.conn = mock_directory(1)
+
+    def test_search_entries_defaults_to_dn_only(self):
+        with mock.patch.object(self.connector.conn, 'search', wraps=self.connector.conn.search) as search:
+            entries = self.connector.search_entries(BASE_DN, '(uid=u0)')
+        self.assertEqual(search.call_args.kwargs['attributes'], DN_ONLY)
+        self.assertEqual([entry.entry_dn for entry in entries], [f'uid=u0,{BASE_DN}'])
+
+    def test_iter_entries_defaults_to_mirror_attributes(self):
+        with mock.patch.object(self.connector.conn.extend.standard, 'paged_search',
+                               wraps=self.connector.conn.extend.standard.paged_search) as paged_search:
+            list(self.connector.iter_entries(BASE_DN, '(uid=u0)'))
+        self.assertEqual(paged_search.call_args.kwargs['attributes'], MIRROR_ATTRIBUTES)
+
+class ReplicaReadTests(SimpleTestCase):
+    """快照读取发往只读副本，写入后按read_your_writes改读主服务器"""
+
+    def setUp(self):
+        self.connector = LDAPConnector('ldap://provider.example.com', ADMIN_DN, 'secret', BASE_DN,
+                                       read_replicas=['ldap://replica.example.com'])
+        self.connector.conn = mock_directory(2)
+        # 副本尚未复制第二个用户
+        self.connector.read_conn = mock_directory(1)
+
+    def users(self, replica):
+        return sorted(dn for dn, _ in self.connector.iter_entries(BASE_DN, '(uid=*)', attributes=['uid'],
+                                                                    replica=replica))
+
+    def test_snapshot_reads_use_replica(self):
+        self.assertEqual(self.users(replica=True), [f'uid=u0,{BASE_DN}'])
+        self.assertEqual(len(self.users(replica=False)), 2)
+
+    def test_reads_after_write_use_provider(self):
+        self.connector.has_written = True
+        self.assertEqual(len(self.users(replica=True)), 2)
+
+    def test_stale_reads_allowed_without_read_your_writes(self):
+        self.connector.read_your_writes = False
+        self.connector.has_written = True
+        self.assertEqual(len(self.users(replica=True)), 1)
+
+    def test_unreachable_replica_falls_back_to_provider(self):
+        self.connector.read_conn = None
+        with mock.patch('sync.ldap_connector.Connection', side_effect=LDAPSocketOpenError('拒绝连接')), \
+                self.assertLogs('sync.ldap_connector', 'WARNING'):
+            self.assertEqual(len(self.users(replica=True)), 2)
+        self.assertEqual(self.connector.read_replicas, [])
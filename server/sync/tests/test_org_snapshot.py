@@ -0,0 +1,129 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase, override_settings
+
+from sync import org_snapshot
+from sync.org_snapshot import OrgSnapshot, get_org_snapshot
+
+
+class FakeAPI:
+    """记录调用的平台客户端，iter_users按部门产出成员"""
+
+    def __init__(self, departments, users, failures=0):
+        self.departments = departments
+        self.users = users
+        self.failures = failures
+        self.fetch_failures = 0
+        self.department_calls = 0
+        self.iter_users_args = []
+
+    def get_departments(self):
+        self.department_calls += 1
+        return self.departments
+
+    def iter_users(self, departments=None):
+        self.iter_users_args.append(departments)
+        self.fetch_failures += self.failures
+        yield from self.users
+
+
+WECOM_DEPARTMENTS = [
+    {'id': 1, 'name': '总部', 'parentid': 0},
+    {'id': 2, 'name': '研发部', 'parentid': 1},
+]
+WECOM_USERS = [
+    {'userid': 'zhangsan', 'name': '张三', 'department_ids': [2]},
+    {'name': '无ID成员', 'department_ids': [1]},
+]
+
+
+class OrgSnapshotFetchTests(SimpleTestCase):
+    """一次拉取得到部门和用户"""
+
+    def test_members_use_fetched_departments(self):
+        api = FakeAPI(WECOM_DEPARTMENTS, WECOM_USERS)
+        snapshot = OrgSnapshot.fetch('wecom', api)
+        self.assertEqual(api.department_calls, 1)
+        self.assertEqual(api.iter_users_args, [WECOM_DEPARTMENTS])
+        self.assertEqual([d.dept_id for d in snapshot.departments], [1, 2])
+        self.assertEqual([u.user_id for u in snapshot.users], ['zhangsan'])
+        self.assertFalse(snapshot.incomplete)
+
+    def test_user_department_ids_share_interned_ids(self):
+        # 部门和用户数据中的ID是内容相同的不同字符串对象
+        api = FakeAPI([{'department_id': ''.join(['od', '-1']), 'name': '总部'}],
+                      [{'user_id': 'u1', 'name': '李四', 'department_ids': [''.join(['od-', '1'])]}])
+        snapshot = OrgSnapshot.fetch('feishu', api)
+        self.assertIs(snapshot.users[0].department_ids[0], snapshot.departments[0].dept_id)
+
+    def test_feishu_fetches_users_by_scope(self):
+        api = FakeAPI([{'department_id': 'od-1', 'name': '总部'}],
+                      [{'user_id': 'u1', 'name': '李四', 'department_ids': ['od-1']}])
+        snapshot = OrgSnapshot.fetch('feishu', api)
+        self.assertEqual(api.iter_users_args, [None])
+        self.assertEqual(snapshot.users[0].department_ids, ('od-1',))
+
+    def test_no_departments_skips_users(self):
+        api = FakeAPI([], WECOM_USERS)
+        snapshot = OrgSnapshot.fetch('wecom', api)
+        self.assertEqual(api.iter_users_args, [])
+        self.assertEqual(snapshot.users, [])
+
+    def test_failed_requests_mark_incomplete(self):
+        snapshot = OrgSnapshot.fetch('wecom', FakeAPI(WECOM_DEPARTMENTS, WECOM_USERS, failures=1))
+        self.assertTrue(snapshot.incomplete)
+
+
+@override_settings(IM_SNAPSHOT_MAX_AGE=300)
+class SharedSnapshotTests(SimpleTestCase):
+    """多个同步配置共享同一平台配置的快照"""
+
+    def setUp(self):
+        org_snapshot._snapshots.clear()
+        self.addCleanup(org_snapshot._snapshots.clear)
+        self.config = SimpleNamespace(pk=1, updated_at=datetime(2026, 1, 1, tzinfo=timezone.utc))
+        self.fetches = 0
+
+    def fetch(self, incomplete=False, departments=True):
+        self.fetches += 1
+        return OrgSnapshot('wecom', [object()] if departments else [], [], incomplete=incomplete)
+
+    def test_other_consumers_reuse_snapshot(self):
+        first = get_org_snapshot('wecom', self.config, self.fetch, 'sync-a')
+        second = get_org_snapshot('wecom', self.config, self.fetch, 'sync-b')
+        self.assertIs(first, second)
+        self.assertEqual(self.fetches, 1)
+        self.assertEqual(org_snapshot.all_snapshot_stats()['wecom:1']['hits'], 1)
+
+    def test_same_consumer_fetches_again(self):
+        first = get_org_snapshot('wecom', self.config, self.fetch, 'sync-a')
+        second = get_org_snapshot('wecom', self.config, self.fetch, 'sync-a')
+        self.assertIsNot(first, second)
+        self.assertEqual(self.fetches, 2)
+
+    def test_expired_snapshot_is_not_reused(self):
+        get_org_snapshot('wecom', self.config, self.fetch, 'sync-a')
+        org_snapshot._snapshots[org_snapshot._snapshot_key('wecom', self.config)].snapshot.fetched_at -= 301
+        get_org_snapshot('wecom', self.config, self.fetch, 'sync-b')
+        self.assertEqual(self.fetches, 2)
+
+    def test_incomplete_or_empty_snapshot_is_not_shared(self):
+        get_org_snapshot('wecom', self.config, lambda: self.fetch(incomplete=True), 'sync-a')
+        get_org_snapshot('wecom', self.config, lambda: self.fetch(departments=False), 'sync-b')
+        get_org_snapshot('wecom', self.config, self.fetch, 'sync-c')
+        self.assertEqual(self.fetches, 3)
+
+    def test_config_change_drops_old_snapshot(self):
+        get_org_snapshot('wecom', self.config, self.fetch, 'sync-a')
+        self.config.updated_at = datetime(2026, 1, 2, tzinfo=timezone.utc)
+        get_org_snapshot('wecom', self.config, self.fetch, 'sync-b')
+        self.assertEqual(self.fetches, 2)
+        self.assertEqual(len(org_snapshot._snapshots), 1)
+
+    @override_settings(IM_SNAPSHOT_MAX_AGE=0)
+    def test_sharing_disabled(self):
+        get_org_snapshot('wecom', self.config, self.fetch, 'sync-a')
+        get_org_snapshot('wecom', self.config, self.fetch, 'sync-b')
+        self.assertEqual(self.fetches, 2)
+        self.assertEqual(org_snapshot._snapshots, {})
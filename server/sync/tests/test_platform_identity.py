@@ -0,0 +1,50 @@
+from django.test import SimpleTestCase
+
+from sync.platform_identity import (department_identity_attrs, identity_filter, olc_db_index_lines,
+                                    parse_description, parse_entry_identity, user_identity_attrs)
+
+
+def getter(attrs):
+    """按属性名（不区分大小写）获取属性值"""
+    lowered = {name.lower(): values for name, values in attrs.items()}
+    return lambda name: lowered.get(name.lower(), [])
+
+
+class PlatformIdentityTests(SimpleTestCase):
+    """平台标识属性和旧版本描述信息"""
+
+    def test_user_filter_uses_equality_attributes(self):
+        self.assertEqual(identity_filter('wecom', 'user', 'zhangsan', include_legacy=False),
+                         '(&(employeeType=wecom)(employeeNumber=zhangsan))')
+
+    def test_department_filter_with_legacy_description(self):
+        self.assertEqual(identity_filter('wecom', 'department', 2),
+                         '(&(objectClass=organizationalUnit)'
+                         '(|(businessCategory=wecom:2)(description=企业微信部门ID: 2)))')
+
+    def test_filter_escapes_values(self):
+        self.assertIn(r'(employeeNumber=a\2a\29)', identity_filter('feishu', 'user', 'a*)', include_legacy=False))
+
+    def test_parse_identity_attrs(self):
+        self.assertEqual(parse_entry_identity(getter(user_identity_attrs('feishu', 'ou-1'))), ('feishu', 'user', 'ou-1'))
+        self.assertEqual(parse_entry_identity(getter(department_identity_attrs('dingtalk', 10))),
+                         ('dingtalk', 'department', '10'))
+
+    def test_identity_attrs_take_precedence_over_description(self):
+        attrs = dict(user_identity_attrs('wecom', 'new'), description=['企业微信用户，用户ID：old'])
+        self.assertEqual(parse_entry_identity(getter(attrs)), ('wecom', 'user', 'new'))
+
+    def test_parse_legacy_descriptions(self):
+        self.assertEqual(parse_description('企业微信部门ID: 2'), ('wecom', 'department', '2'))
+        self.assertEqual(parse_description('飞书用户，用户ID：ou-1'), ('feishu', 'user', 'ou-1'))
+        self.assertEqual(parse_description('钉钉用户ID: d1'), ('dingtalk', 'user', 'd1'))
+        self.assertIsNone(parse_description('手工创建的用户'))
+
+    def test_unknown_platform_is_ignored(self):
+        self.assertIsNone(parse_entry_identity(getter({'employeeType': ['staff'], 'employeeNumber': ['1']})))
+        self.assertIsNone(parse_entry_identity(getter({'businessCategory': ['retail']})))
+
+    def test_index_lines(self):
+        lines = olc_db_index_lines(['mail'])
+        self.assertIn('olcDbIndex: employeeNumber eq', lines)
+        self.assertIn('olcDbIndex: mail eq', lines)
@@ -0,0 +1,98 @@
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from utils.rate_limit import TokenBucket, get_rate_limiter, iter_concurrently
+
+
+class TokenBucketTests(SimpleTestCase):
+    """令牌桶限流"""
+
+    def setUp(self):
+        # 速率使用2的幂，模拟时钟的累加没有舍入误差
+        self.now = 100.0
+        self.sleeps = []
+        patcher = mock.patch('utils.rate_limit.time')
+        clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        clock.monotonic.side_effect = lambda: self.now
+        clock.sleep.side_effect = self.sleep
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def test_waits_for_next_token(self):
+        bucket = TokenBucket(4, capacity=1)
+        bucket.acquire()
+        self.assertEqual(self.sleeps, [])
+        bucket.acquire()
+        self.assertEqual(self.sleeps, [0.25])
+
+    def test_rate_over_time(self):
+        bucket = TokenBucket(16, capacity=1)
+        for _ in range(33):
+            bucket.acquire()
+        # 第一个令牌立即可用，之后每秒16个
+        self.assertEqual(self.now - 100.0, 2.0)
+
+    def test_idle_time_refills_up_to_capacity(self):
+        bucket = TokenBucket(8, capacity=3)
+        for _ in range(3):
+            bucket.acquire()
+        self.now += 60
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(self.sleeps, [])
+        bucket.acquire()
+        self.assertEqual(len(self.sleeps), 1)
+
+    @override_settings(FEISHU_API_QPS=5)
+    def test_shared_per_app(self):
+        bucket = get_rate_limiter('feishu', 'rate-limit-test-app')
+        self.assertIs(get_rate_limiter('feishu', 'rate-limit-test-app'), bucket)
+        self.assertIsNot(get_rate_limiter('feishu', 'rate-limit-other-app'), bucket)
+        self.assertEqual(bucket.rate, 5)
+
+
+class IterConcurrentlyTests(SimpleTestCase):
+    """有界线程池并发拉取：按输入顺序产出，使用方提前停止时取消未开始的任务"""
+
+    def setUp(self):
+        self.started = []
+        self.lock = threading.Lock()
+
+    def fetch(self, item):
+        with self.lock:
+            self.started.append(item)
+        # 前面的任务较慢，检查结果仍按输入顺序产出
+        time.sleep(0.01 if item % 2 == 0 else 0)
+        return item * 10
+
+    def test_yields_in_input_order(self):
+        self.assertEqual(list(iter_concurrently(range(10), self.fetch, max_workers=4)),
+                         [item * 10 for item in range(10)])
+
+    def test_bounds_submitted_tasks(self):
+        results = iter_concurrently(range(100), self.fetch, max_workers=2)
+        self.assertEqual(next(results), 0)
+        # 产出第一个结果前最多提交线程数两倍的任务
+        self.assertLessEqual(len(self.started), 4)
+        results.close()
+
+    def test_early_stop_cancels_pending_tasks(self):
+        results = iter_concurrently(range(100), self.fetch, max_workers=2)
+        next(results)
+        results.close()
+        started = len(self.started)
+        self.assertLessEqual(started, 4)
+        time.sleep(0.05)
+        self.assertEqual(len(self.started), started)
+
+    def test_single_worker_is_lazy(self):
+        results = iter_concurrently(range(10), self.fetch, max_workers=1)
+        self.assertEqual(next(results), 0)
+        self.assertEqual(self.started, [0])
+        results.close()
@@ -0,0 +1,146 @@
+from django.test import SimpleTestCase
+
+from sync.directory_mirror import DirectoryMirror
+from sync.directory_records import DirectoryDepartment, DirectoryUser
+from sync.platform_sources import PlatformSource, get_platform_source
+from sync.sync_plan import ROOT_DEPARTMENT_NAME, count_actions, plan_departments, plan_users
+
+BASE_DN = 'dc=example,dc=com'
+DEPT_OU = f'ou=departments,{BASE_DN}'
+USER_OU = f'ou=users,{BASE_DN}'
+
+
+def dept(dept_id, name, parent_id=0):
+    return DirectoryDepartment('wecom', dept_id, name, parent_id)
+
+
+def user(user_id, name, department_ids=(), **kwargs):
+    return DirectoryUser('wecom', user_id, name, department_ids=tuple(department_ids), **kwargs)
+
+
+class PlanDepartmentsTests(SimpleTestCase):
+    """部门变更计划"""
+
+    def setUp(self):
+        self.source = get_platform_source('wecom')
+        self.mirror = DirectoryMirror(BASE_DN)
+
+    def add_entry(self, dn, department):
+        self.mirror.add(dn, self.source.department_attrs(department))
+
+    def test_new_departments_parents_first(self):
+        plan = plan_departments(self.source, [dept(3, 'QA', 2), dept(2, 'RD', 1), dept(1, '总部')], self.mirror)
+        self.assertEqual([(change.department.dept_id, change.action) for change in plan],
+                         [(1, 'create'), (2, 'create'), (3, 'create')])
+        self.assertEqual([change.parent_name for change in plan], [ROOT_DEPARTMENT_NAME, '总部', 'RD'])
+
+    def test_parent_outside_snapshot_is_top_level(self):
+        plan = plan_departments(self.source, [dept(2, 'RD', 99)], self.mirror)
+        self.assertEqual(plan[0].parent_name, ROOT_DEPARTMENT_NAME)
+
+    def test_cycle_is_placed_last(self):
+        plan = plan_departments(self.source, [dept(5, 'A', 6), dept(6, 'B', 5), dept(1, '总部')], self.mirror)
+        self.assertEqual([change.department.dept_id for change in plan], [1, 5, 6])
+
+    def test_unchanged_department_is_kept(self):
+        self.add_entry(f'ou=总部,{DEPT_OU}', dept(1, '总部'))
+        self.add_entry(f'ou=RD,ou=总部,{DEPT_OU}', dept(2, 'RD', 1))
+        plan = plan_departments(self.source, [dept(1, '总部'), dept(2, 'RD', 1)], self.mirror)
+        self.assertEqual([change.action for change in plan], ['keep', 'keep'])
+        self.assertEqual(plan[1].entry.dn, f'ou=RD,ou=总部,{DEPT_OU}')
+
+    def test_rename(self):
+        self.add_entry(f'ou=RD,{DEPT_OU}', dept(2, 'RD'))
+        change = plan_departments(self.source, [dept(2, '研发部')], self.mirror)[0]
+        self.assertEqual((change.action, change.name_changed, change.parent_changed), ('update', True, False))
+        self.assertEqual(change.old_name, 'RD')
+
+    def test_move_to_new_parent(self):
+        self.add_entry(f'ou=总部,{DEPT_OU}', dept(1, '总部'))
+        self.add_entry(f'ou=RD,{DEPT_OU}', dept(2, 'RD'))
+        change = plan_departments(self.source, [dept(1, '总部'), dept(2, 'RD', 1)], self.mirror)[1]
+        self.assertEqual((change.action, change.name_changed, change.parent_changed), ('update', False, True))
+        self.assertEqual((change.old_parent_id, change.old_parent_name, change.parent_name),
+                         (0, ROOT_DEPARTMENT_NAME, '总部'))
+
+
+class PlanUsersTests(SimpleTestCase):
+    """用户变更计划"""
+
+    def setUp(self):
+        self.source = get_platform_source('wecom')
+        self.mirror = DirectoryMirror(BASE_DN)
+        self.dept_dn_map = {2: f'ou=RD,{DEPT_OU}', 3: f'ou=QA,{DEPT_OU}'}
+
+    def plan(self, *users, source=None):
+        return plan_users(source or self.source, list(users), self.mirror, self.dept_dn_map, USER_OU)
+
+    def add_user(self, dn, record, uid=None):
+        uid = uid or record.user_id
+        self.mirror.add(dn, self.source.user_attrs(record, uid, []))
+
+    def test_create_under_first_synced_department(self):
+        change = self.plan(user('zhangsan', '张三', [99, 3, 2]))[0]
+        self.assertEqual(change.action, 'create')
+        self.assertEqual(change.dn, f'uid=zhangsan,ou=QA,{DEPT_OU}')
+
+    def test_create_under_user_ou_without_department(self):
+        change = self.plan(user('zhangsan', '张三', [99]))[0]
+        self.assertEqual(change.dn, f'uid=zhangsan,{USER_OU}')
+
+    def test_skips_user_without_name(self):
+        self.assertEqual(self.plan(user('zhangsan', '')), [])
+
+    def test_keep_and_update(self):
+        self.add_user(f'uid=zhangsan,ou=RD,{DEPT_OU}', user('zhangsan', '张三', email='zs@example.com'))
+        self.add_user(f'uid=lisi,ou=RD,{DEPT_OU}', user('lisi', '李四'))
+        keep, update = self.plan(user('zhangsan', '张三', [2], email='zs@example.com'),
+                                 user('lisi', '李四四', [2], email='ls@example.com'))
+        self.assertEqual(keep.action, 'keep')
+        self.assertEqual(update.action, 'update')
+        self.assertEqual(update.changed_attrs, {'姓名': {'old': '李四', 'new': '李四四'},
+                                                '邮箱': {'old': '', 'new': 'ls@example.com'}})
+        self.assertFalse(update.dn_changed)
+
+    def test_move_to_new_department(self):
+        self.add_user(f'uid=zhangsan,ou=RD,{DEPT_OU}', user('zhangsan', '张三'))
+        change = self.plan(user('zhangsan', '张三', [3]))[0]
+        self.assertEqual(change.action, 'update')
+        self.assertTrue(change.dn_changed)
+        self.assertEqual(change.changed_attrs, {})
+
+    def test_adopts_legacy_entry_with_same_uid(self):
+        self.mirror.add(f'uid=zhangsan,{USER_OU}', {'objectClass': ['person'], 'uid': ['zhangsan'], 'cn': ['张三']})
+        change = self.plan(user('zhangsan', '张三'))[0]
+        self.assertEqual(change.action, 'keep')
+        self.assertEqual(change.entry.dn, f'uid=zhangsan,{USER_OU}')
+
+    def test_does_not_adopt_other_platform_entry(self):
+        feishu = get_platform_source('feishu')
+        self.mirror.add(f'uid=zhangsan,{USER_OU}',
+                        feishu.user_attrs(DirectoryUser('feishu', 'zhangsan', '张三'), 'zhangsan', []))
+        self.assertEqual(self.plan(user('zhangsan', '张三'))[0].action, 'create')
+
+    def test_dingtalk_uid_prefix(self):
+        dingtalk = get_platform_source('dingtalk')
+        change = self.plan(DirectoryUser('dingtalk', 'd1', '赵六', department_ids=(2,)), source=dingtalk)[0]
+        self.assertEqual(change.uid, 'dingtalk_d1')
+        self.assertEqual(change.attrs['departmentNumber'], [f'ou=RD,{DEPT_OU}'])
+
+    def test_count_actions(self):
+        self.add_user(f'uid=zhangsan,ou=RD,{DEPT_OU}', user('zhangsan', '张三'))
+        plan = self.plan(user('zhangsan', '张三', [2]), user('lisi', '李四', [2]))
+        self.assertEqual(count_actions(plan), {'create': 1, 'update': 0, 'keep': 1})
+
+
+class PlatformSourceTests(SimpleTestCase):
+    """平台数据源"""
+
+    def test_create_api_is_required(self):
+        with self.assertRaises(TypeError):
+            PlatformSource()
+
+    def test_sources(self):
+        self.assertEqual([get_platform_source(code).root_parent_id for code in ('wecom', 'feishu', 'dingtalk')],
+                         [0, '0', 1])
+        self.assertIsNone(get_platform_source('gitee'))
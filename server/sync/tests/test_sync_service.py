@@ -0,0 +1,121 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from ldap3 import MOCK_SYNC, Connection
+
+from oAuth.models import WeComConfig, WeComUser
+from sync.ldif_export import LDIFExportConnector
+from sync.models import LDAPConfig, SyncConfig, SyncLogDetail
+from sync.platform_identity import user_identity_attrs
+from sync.sync_service import SyncService
+from utils.wecom_api import WeComAPI
+
+BASE_DN = 'dc=example,dc=com'
+
+
+class WeComPlatformMixin:
+    """企业微信同步配置，平台接口返回departments和users中的组织架构"""
+
+    def setUp(self):
+        self.ldap_config = ldap_config = LDAPConfig.objects.create(server_uri='ldap://ldap.example.com', bind_dn='cn=admin,' + BASE_DN,
+                                                bind_password='secret', base_dn=BASE_DN)
+        WeComConfig.objects.create(corp_id='corp', agent_id='1000001', secret='secret')
+        self.sync_config = SyncConfig.objects.create(name='企业微信', sync_type='wecom', ldap_config=ldap_config,
+                                                     orphan_action='delete', orphan_threshold=50)
+        # 同一个连接器的模拟目录在多次同步之间保留
+        self.connector = LDIFExportConnector(BASE_DN)
+        self.departments = [
+            {'id': 1, 'name': '总部', 'parentid': 0},
+            {'id': 2, 'name': 'RD', 'parentid': 1},
+        ]
+        self.users = {
+            1: [{'userid': 'boss', 'name': '老板'}],
+            2: [{'userid': 'zhangsan', 'name': '张三'}, {'userid': 'lisi', 'name': '李四'},
+                {'userid': 'wangwu', 'name': '王五'}],
+        }
+        self.failed_departments = set()
+
+        for name, kwargs in (
+            ('_get_access_token', {'return_value': 'token'}),
+            ('get_departments', {'autospec': True, 'side_effect': lambda api: list(self.departments)}),
+            ('get_department_users', {'autospec': True, 'side_effect': self.department_users}),
+        ):
+            patcher = mock.patch.object(WeComAPI, name, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def department_users(self, api, department_id, department_name):
+        """按WeComAPI.get_department_users的格式返回部门成员，失败的部门记录一次失败请求"""
+        if department_id in self.failed_departments:
+            api._fetch_failed()
+            return []
+        return [dict(user, department=department_name, department_ids=[department_id])
+                for user in self.users.get(department_id, [])]
+
+
+@override_settings(IM_SNAPSHOT_MAX_AGE=0, LDAP_MIRROR_FULL_RELOAD_INTERVAL=0)
+class WeComSyncTests(WeComPlatformMixin, TestCase):
+    """企业微信同步到模拟目录（MOCK_SYNC），包括清理平台中已不存在的用户和部门"""
+
+    def sync(self):
+        return SyncService(self.sync_config.id, ldap_connector=self.connector).sync()
+
+    def user_dns(self):
+        return sorted(dn for dn in self.connector.export_server.dit if dn.startswith('uid='))
+
+    def test_creates_departments_and_users(self):
+        log = self.sync()
+        self.assertTrue(log.success, log.error_message)
+        self.assertEqual((log.departments_synced, log.users_synced), (2, 4))
+        self.assertIn(f'uid=zhangsan,ou=RD,ou=总部,ou=departments,{BASE_DN}', self.user_dns())
+        self.assertEqual(WeComUser.objects.get(wecom_user_id='zhangsan').department, 'RD')
+
+    def test_deletes_users_removed_from_platform(self):
+        self.assertTrue(self.sync().success)
+        self.users[2] = [user for user in self.users[2] if user['userid'] != 'wangwu']
+
+        log = self.sync()
+        self.assertTrue(log.success, log.error_message)
+        self.assertEqual(len(self.user_dns()), 3)
+        self.assertFalse(any(dn.startswith('uid=wangwu,') for dn in self.user_dns()))
+        detail = SyncLogDetail.objects.get(sync_log=log, action='delete')
+        self.assertEqual((detail.object_type, detail.object_id), ('user', 'wangwu'))
+
+    def test_deletes_duplicate_entries_of_existing_users(self):
+        self.assertTrue(self.sync().success)
+        # 早期移动留下的重复条目，与同步使用的条目有相同的平台标识
+        dit = self.connector.export_server.dit
+        user_dn = f'uid=zhangsan,ou=RD,ou=总部,ou=departments,{BASE_DN}'
+        duplicate_dn = f'uid=zhangsan,ou=users,{BASE_DN}'
+        self.assertTrue(Connection(self.connector.export_server, client_strategy=MOCK_SYNC).strategy.add_entry(
+            duplicate_dn, {'objectClass': ['top', 'person'], 'uid': 'zhangsan', 'cn': '张三', 'sn': '张三',
+                           **user_identity_attrs('wecom', 'zhangsan')}))
+
+        log = self.sync()
+        self.assertTrue(log.success, log.error_message)
+        self.assertNotIn(duplicate_dn, dit)
+        self.assertIn(user_dn, dit)
+        detail = SyncLogDetail.objects.get(sync_log=log, action='delete')
+        self.assertEqual((detail.object_id, detail.old_data), ('zhangsan', {'dn': duplicate_dn}))
+
+    def test_threshold_blocks_large_deletions(self):
+        self.assertTrue(self.sync().success)
+        self.users[2] = []
+
+        log = self.sync()
+        self.assertEqual(len(self.user_dns()), 4)
+        self.assertIn('本次不做清理', log.error_message)
+        self.assertFalse(SyncLogDetail.objects.filter(sync_log=log, action='delete').exists())
+
+    def test_incomplete_snapshot_skips_deprovisioning(self):
+        self.assertTrue(self.sync().success)
+        # RD部门成员请求失败，其成员不能视为已从平台删除
+        self.users[2] = [user for user in self.users[2] if user['userid'] != 'wangwu']
+        self.failed_departments.add(2)
+
+        log = self.sync()
+        self.assertEqual(len(self.user_dns()), 4)
+        self.assertIn('组织架构不完整', log.error_message)
+        details = SyncLogDetail.objects.filter(sync_log=log, action='delete')
+        self.assertTrue(details.exists())
+        self.assertTrue(all(detail.new_data == {'skipped': True} for detail in details))
@@ -0,0 +1,109 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from utils.token_cache import get_access_token, invalidate_access_token, is_token_invalid
+from utils.wecom_api import WeComAPI
+
+
+@override_settings(IM_TOKEN_REFRESH_MARGIN=300)
+class AccessTokenCacheTests(SimpleTestCase):
+    """平台访问令牌缓存：过期、提前刷新和作废"""
+
+    def setUp(self):
+        cache.clear()
+        self.now = 1_000_000.0
+        patcher = mock.patch('utils.token_cache.time')
+        patcher.start().time.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+        self.fetch = mock.Mock(side_effect=[('token-1', 7200), ('token-2', 7200), ('token-3', 7200)])
+
+    def get(self):
+        return get_access_token('wecom', 'corp', 'secret', self.fetch)
+
+    def test_reuses_cached_token(self):
+        self.assertEqual(self.get(), 'token-1')
+        self.now += 3600
+        self.assertEqual(self.get(), 'token-1')
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_refreshes_within_margin(self):
+        self.get()
+        self.now += 7200 - 301
+        self.assertEqual(self.get(), 'token-1')
+        self.now += 2
+        self.assertEqual(self.get(), 'token-2')
+
+    def test_refreshes_expired_token(self):
+        self.get()
+        self.now += 7201
+        self.assertEqual(self.get(), 'token-2')
+
+    def test_keeps_unexpired_token_when_refresh_fails(self):
+        self.fetch.side_effect = [('token-1', 7200), None]
+        self.get()
+        self.now += 7000
+        self.assertEqual(self.get(), 'token-1')
+
+    def test_secret_change_uses_new_token(self):
+        self.get()
+        self.assertEqual(get_access_token('wecom', 'corp', 'new-secret', self.fetch), 'token-2')
+
+    def test_invalidate(self):
+        self.get()
+        invalidate_access_token('wecom', 'corp', 'secret', 'token-1')
+        self.assertEqual(self.get(), 'token-2')
+
+    def test_invalidate_keeps_newer_token(self):
+        self.get()
+        invalidate_access_token('wecom', 'corp', 'secret', 'token-1')
+        self.get()
+        # 其他调用方之后才报告旧令牌无效，不能删掉已刷新的令牌
+        invalidate_access_token('wecom', 'corp', 'secret', 'token-1')
+        self.assertEqual(self.get(), 'token-2')
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_is_token_invalid(self):
+        self.assertTrue(is_token_invalid('wecom', 42001))
+        self.assertTrue(is_token_invalid('feishu', 99991663))
+        self.assertFalse(is_token_invalid('wecom', 0))
+        self.assertFalse(is_token_invalid('wecom', 60011))
+
+
+class RejectedTokenRetryTests(SimpleTestCase):
+    """平台客户端收到令牌无效的错误码时作废令牌并重试一次"""
+
+    def setUp(self):
+        cache.clear()
+        self.session = mock.Mock()
+        self.api = WeComAPI('corp', 'secret', session=self.session)
+        patcher = mock.patch.object(WeComAPI, '_fetch_access_token',
+                                    side_effect=[('token-1', 7200), ('token-2', 7200), ('token-3', 7200)])
+        self.fetch = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def respond(self, *results):
+        self.session.get.side_effect = [mock.Mock(**{'json.return_value': result}) for result in results]
+
+    def tokens_sent(self):
+        return [call.kwargs['params']['access_token'] for call in self.session.get.call_args_list]
+
+    def test_retries_with_new_token(self):
+        self.respond({'errcode': 42001, 'errmsg': 'access_token expired'},
+                     {'errcode': 0, 'department': [{'id': 1, 'name': '总部'}]})
+        self.assertEqual(self.api.get_departments(), [{'id': 1, 'name': '总部'}])
+        self.assertEqual(self.tokens_sent(), ['token-1', 'token-2'])
+        self.assertEqual(self.api.fetch_failures, 0)
+
+    def test_retries_only_once(self):
+        self.respond({'errcode': 40014}, {'errcode': 40014})
+        self.assertEqual(self.api.get_departments(), [])
+        self.assertEqual(self.tokens_sent(), ['token-1', 'token-2'])
+        self.assertEqual(self.api.fetch_failures, 1)
+
+    def test_other_errors_are_not_retried(self):
+        self.respond({'errcode': 60011, 'errmsg': 'no privilege'})
+        self.assertEqual(self.api.get_departments(), [])
+        self.assertEqual(self.tokens_sent(), ['token-1'])
+        self.assertEqual(self.fetch.call_count, 1)
@@ -17,6 +17,10 @@ from .sync_service import SyncService
 from .sync_scheduler import scheduler
 from oAuth.models import WeComUser, FeiShuUser, DingTalkUser, WeComConfig, FeiShuConfig, DingTalkConfig
 from .ldap_connector import LDAPConnector
+from .ldap_pool import all_pool_stats
+from .ldap_metrics import all_operation_stats
+from .ldap_retry import all_breaker_stats
+from .org_snapshot import all_snapshot_stats
 
 class LDAPConfigViewSet(viewsets.ModelViewSet):
     queryset = LDAPConfig.objects.all().order_by('-updated_at')
@@ -29,13 +33,7 @@ class LDAPConfigViewSet(viewsets.ModelViewSet):
         
         ldap_config = self.get_object()
         try:
-            connector = LDAPConnector(
-                server_uri=ldap_config.server_uri,
-                bind_dn=ldap_config.bind_dn,
-                bind_password=ldap_config.bind_password,
-                base_dn=ldap_config.base_dn,
-                use_ssl=ldap_config.use_ssl
-            )
+            connector = LDAPConnector.from_config(ldap_config)
             success = connector.connect()
             if success:
                 connector.close()
@@ -44,6 +42,21 @@ class LDAPConfigViewSet(viewsets.ModelViewSet):
                 return Response({'message': '连接失败'}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'message': f'连接错误: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['get'])
+    def pool_stats(self, request):
+        """获取LDAP连接池实时统计（使用中、空闲、等待次数、重连次数）"""
+        return Response(all_pool_stats())
+    
+    @action(detail=False, methods=['get'])
+    def operation_stats(self, request):
+        """获取本进程启动以来各LDAP配置的操作统计（次数、结果码、耗时直方图、接收字节数、重试次数）"""
+        return Response(all_operation_stats())
+    
+    @action(detail=False, methods=['get'])
+    def breaker_stats(self, request):
+        """获取各LDAP配置熔断器的实时状态（状态、最近失败数、打开次数、拒绝的请求数）"""
+        return Response(all_breaker_stats())
 
 class SyncConfigViewSet(viewsets.ModelViewSet):
     queryset = SyncConfig.objects.all().order_by('-updated_at')
@@ -61,6 +74,11 @@ class SyncConfigViewSet(viewsets.ModelViewSet):
         # 刷新调度
         scheduler.refresh_schedule()
     
+    @action(detail=False, methods=['get'])
+    def snapshot_stats(self, request):
+        """获取各平台配置组织架构快照的共享情况（部门数、用户数、快照时长、复用次数、拉取次数）"""
+        return Response(all_snapshot_stats())
+    
     @action(detail=True, methods=['post'])
     def sync_now(self, request, pk=None):
         """立即执行同步任务"""
@@ -365,34 +383,27 @@ def get_user_stats(request):
     ldap_config = LDAPConfig.objects.filter(enabled=True).first()
     
     if ldap_config:
+        ldap_connector = None
         try:
             # 连接LDAP
-            ldap_connector = LDAPConnector(
-                server_uri=ldap_config.server_uri,
-                bind_dn=ldap_config.bind_dn,
-                bind_password=ldap_config.bind_password,
-                base_dn=ldap_config.base_dn,
-                use_ssl=ldap_config.use_ssl
-            )
+            ldap_connector = LDAPConnector.from_config(ldap_config)
             ldap_connector.connect()
             # 使用更广泛的搜索过滤器，匹配任意用户相关的对象类
             # search_filter = '(|(objectClass=person)(objectClass=inetOrgPerson)(objectClass=organizationalPerson))'
             
             # 或者尝试使用uid属性来识别用户
             search_filter = '(uid=*)'
-            attributes = ['uid', 'cn']
             
-            entries = ldap_connector.search_entries(
+            # 分页流式计数，只需要DN，不保存条目
+            entries = ldap_connector.iter_entries(
                 search_base=ldap_config.base_dn,
                 search_filter=search_filter,
                 search_scope='SUBTREE',
-                attributes=attributes
+                attributes=['1.1'],
+                replica=True
             )
             
-            ldap_users = len(entries) if entries else 0
-
-            # 关闭连接
-            ldap_connector.close()
+            ldap_users = sum(1 for _ in entries)
             
             print(f"LDAP用户搜索完成，找到 {ldap_users} 个用户")
         except Exception as e:
@@ -400,6 +411,10 @@ def get_user_stats(request):
             # 添加更详细的异常信息打印
             import traceback
             traceback.print_exc()
+        finally:
+            # 关闭连接（连接池模式下归还连接），出错时同样归还，避免占满连接池
+            if ldap_connector:
+                ldap_connector.close()
     
     return Response({
         "wecom_users": wecom_users,
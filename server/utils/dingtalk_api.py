@@ -1,19 +1,24 @@
 import requests
 import logging
+import threading
 import json
-import time
 import hmac
 import hashlib
 import base64
 import urllib.parse
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from .http_session import create_session
+from .rate_limit import get_rate_limiter, iter_concurrently
+from .token_cache import get_access_token, invalidate_access_token, is_token_invalid
 
 logger = logging.getLogger(__name__)
 
 class DingTalkAPI:
     """钉钉API封装类"""
     
-    def __init__(self, client_id: str, client_secret: str, app_id: str = None):
+    def __init__(self, client_id: str, client_secret: str, app_id: str = None,
+                 session: Optional[requests.Session] = None):
         """
         初始化钉钉API
         
@@ -21,24 +26,68 @@ class DingTalkAPI:
             client_id: 应用ID
             client_secret: 应用密钥
             app_id: 钉钉应用ID，选填
+            session: HTTP会话，默认新建一个按应用限流的长连接会话，同一客户端的所有请求复用其连接
         """
         self.client_id = client_id
         self.client_secret = client_secret
         self.app_id = app_id
-        self.access_token = None
-        self.token_expire_time = 0
+        # 拉取部门和成员时失败的请求数，大于0表示拉取到的数据不完整（见sync.org_snapshot.OrgSnapshot.fetch）
+        self.fetch_failures = 0
+        self._failures_lock = threading.Lock()
+        self.session = session or create_session(rate_limiter=get_rate_limiter('dingtalk', client_id))
+        
+    def close(self):
+        """关闭HTTP会话及其连接"""
+        self.session.close()
+        
+    def _fetch_failed(self):
+        """记录一次失败的拉取请求，并发拉取部门成员时在工作线程中调用"""
+        with self._failures_lock:
+            self.fetch_failures += 1
         
     def _get_access_token(self) -> Optional[str]:
         """
-        获取访问令牌
+        获取访问令牌，同一应用的令牌在进程间共享，到期前自动刷新
         
         Returns:
             str: 访问令牌
         """
-        # 如果令牌未过期，直接返回
-        if self.access_token and time.time() < self.token_expire_time:
-            return self.access_token
+        return get_access_token('dingtalk', self.client_id, self.client_secret, self._fetch_access_token)
+        
+    def _request(self, url: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        发送带访问令牌的POST请求并返回结果，令牌被平台判定无效时作废缓存的令牌，用新令牌重试一次
+        
+        Args:
+            url: 接口地址（不含access_token）
+            data: 请求体
             
+        Returns:
+            Dict[str, Any]: 接口返回的结果，未能获取令牌时为空字典
+        """
+        headers = {
+            "Content-Type": "application/json"
+        }
+        result = {}
+        for attempt in range(2):
+            token = self._get_access_token()
+            if not token:
+                break
+            response = self.session.post(url, headers=headers, params={"access_token": token}, data=json.dumps(data))
+            response.raise_for_status()
+            result = response.json()
+            if attempt or not is_token_invalid('dingtalk', result.get('errcode')):
+                break
+            invalidate_access_token('dingtalk', self.client_id, self.client_secret, token)
+        return result
+        
+    def _fetch_access_token(self) -> Optional[Tuple[str, int]]:
+        """
+        向钉钉请求新的访问令牌
+        
+        Returns:
+            Tuple[str, int]: (访问令牌, 有效秒数)
+        """
         url = "https://oapi.dingtalk.com/gettoken"
         params = {
             "appkey": self.client_id,
@@ -46,15 +95,12 @@ class DingTalkAPI:
         }
         
         try:
-            response = requests.get(url, params=params)
+            response = self.session.get(url, params=params)
             response.raise_for_status()
             
             result = response.json()
             if result.get("errcode") == 0:
-                self.access_token = result.get("access_token")
-                # 设置过期时间，提前5分钟过期
-                self.token_expire_time = time.time() + result.get("expires_in", 7200) - 300
-                return self.access_token
+                return result.get("access_token"), result.get("expires_in", 7200)
             else:
                 logger.error(f"获取钉钉访问令牌失败: {result}")
                 return None
@@ -84,34 +130,27 @@ class DingTalkAPI:
         Returns:
             List[Dict[str, Any]]: 部门列表
         """
-        token = self._get_access_token()
-        if not token:
+        if not self._get_access_token():
             logger.error("未能获取有效的访问令牌")
+            self._fetch_failed()
             return []
             
         url = "https://oapi.dingtalk.com/topapi/v2/department/list"
-        headers = {
-            "Content-Type": "application/json"
-        }
         data = {
             "language": "zh_CN"
         }
-        params = {
-            "access_token": token
-        }
         
         try:
-            response = requests.post(url, headers=headers, params=params, data=json.dumps(data))
-            response.raise_for_status()
-            
-            result = response.json()
+            result = self._request(url, data)
             if result.get("errcode") == 0:
                 return result.get("result", [])
             else:
                 logger.error(f"获取钉钉部门列表失败: {result}")
+                self._fetch_failed()
                 return []
         except Exception as e:
             logger.error(f"获取钉钉部门列表出错: {str(e)}")
+            self._fetch_failed()
             return []
             
     def get_department_users(self, dept_id: int) -> List[Dict[str, Any]]:
@@ -124,24 +163,28 @@ class DingTalkAPI:
         Returns:
             List[Dict[str, Any]]: 用户列表
         """
-        token = self._get_access_token()
-        if not token:
+        return list(self.iter_department_users(dept_id))
+        
+    def iter_department_users(self, dept_id: int) -> Iterator[Dict[str, Any]]:
+        """
+        按页产出部门用户，每页请求完成后即可处理，不等待全部分页
+        
+        Args:
+            dept_id: 部门ID
+            
+        Yields:
+            Dict[str, Any]: 用户
+        """
+        if not self._get_access_token():
             logger.error("未能获取有效的访问令牌")
-            return []
+            self._fetch_failed()
+            return
             
         url = "https://oapi.dingtalk.com/topapi/v2/user/list"
-        headers = {
-            "Content-Type": "application/json"
-        }
         data = {
             "dept_id": dept_id,
             "language": "zh_CN"
         }
-        params = {
-            "access_token": token
-        }
-        
-        users = []
         
         try:
             # 分页获取所有用户
@@ -152,53 +195,58 @@ class DingTalkAPI:
                 data["cursor"] = cursor
                 data["size"] = 100
                 
-                response = requests.post(url, headers=headers, params=params, data=json.dumps(data))
-                response.raise_for_status()
-                
-                result = response.json()
+                result = self._request(url, data)
                 if result.get("errcode") == 0:
                     result_data = result.get("result", {})
                     items = result_data.get("list", [])
-                    users.extend(items)
+                    yield from items
                     
                     # 检查是否有更多数据
                     has_more = result_data.get("has_more", False)
                     cursor = cursor + 100
                 else:
                     logger.error(f"获取钉钉部门用户失败: {result}")
+                    self._fetch_failed()
                     break
-                    
-            return users
         except Exception as e:
             logger.error(f"获取钉钉部门用户出错: {str(e)}")
-            return []
+            self._fetch_failed()
             
-    def get_users(self) -> List[Dict[str, Any]]:
+    def iter_users(self, departments: Optional[List[Dict[str, Any]]] = None) -> Iterator[Dict[str, Any]]:
         """
-        获取所有用户
+        逐个部门产出所有用户，前面部门的用户可以在后面部门拉取完成前开始处理
         
-        Returns:
-            List[Dict[str, Any]]: 用户列表
+        Args:
+            departments: 已获取的部门列表，为None时重新获取
+            
+        Yields:
+            Dict[str, Any]: 处理后的用户数据（按用户ID去重）
         """
-        departments = self.get_departments()
+        if departments is None:
+            departments = self.get_departments()
         if not departments:
-            return []
+            return
+        # 先取得令牌，避免并发请求各自去获取
+        if not self._get_access_token():
+            logger.error("未能获取有效的访问令牌")
+            self._fetch_failed()
+            return
             
-        all_users = []
         # 用户ID去重
         user_ids = set()
         
-        for dept in departments:
-            dept_id = dept.get("dept_id")
-            users = self.get_department_users(dept_id)
-            
+        # 并发拉取各部门成员（部门内按游标顺序分页），按部门顺序产出，保证输出顺序稳定
+        department_users = iter_concurrently(
+            departments, lambda dept: self.get_department_users(dept.get("dept_id"))
+        )
+        for users in department_users:
             for user in users:
                 user_id = user.get("userid")
                 if user_id and user_id not in user_ids:
                     user_ids.add(user_id)
                     
                     # 处理用户数据
-                    user_data = {
+                    yield {
                         'userid': user.get('userid'),
                         'unionid': user.get('unionid'),
                         'name': user.get('name'),
@@ -207,11 +255,21 @@ class DingTalkAPI:
                         'avatar': user.get('avatar'),
                         'title': user.get('title'),
                         'department': ','.join([str(d) for d in user.get('dept_id_list', [])]),
+                        'dept_id_list': user.get('dept_id_list', []),
                         'job_number': user.get('job_number')
                     }
-                    all_users.append(user_data)
         
-        return all_users
+    def get_users(self, departments: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        获取所有用户
+        
+        Args:
+            departments: 已获取的部门列表，为None时重新获取
+            
+        Returns:
+            List[Dict[str, Any]]: 用户列表
+        """
+        return list(self.iter_users(departments))
     
     def get_user_detail(self, user_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -223,28 +281,18 @@ class DingTalkAPI:
         Returns:
             Dict[str, Any] or None: 用户详情
         """
-        token = self._get_access_token()
-        if not token:
+        if not self._get_access_token():
             logger.error("未能获取有效的访问令牌")
             return None
             
         url = "https://oapi.dingtalk.com/topapi/v2/user/get"
-        headers = {
-            "Content-Type": "application/json"
-        }
         data = {
             "userid": user_id,
             "language": "zh_CN"
         }
-        params = {
-            "access_token": token
-        }
         
         try:
-            response = requests.post(url, headers=headers, params=params, data=json.dumps(data))
-            response.raise_for_status()
-            
-            result = response.json()
+            result = self._request(url, data)
             if result.get("errcode") == 0:
                 return result.get("result", {})
             else:
@@ -1,38 +1,87 @@
 import requests
 import logging
+import threading
 import json
-import time
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from .http_session import create_session
+from .rate_limit import get_rate_limiter
+from .token_cache import get_access_token, invalidate_access_token, is_token_invalid
 
 logger = logging.getLogger(__name__)
 
 class FeiShuAPI:
     """飞书API封装类"""
     
-    def __init__(self, app_id: str, app_secret: str):
+    def __init__(self, app_id: str, app_secret: str, session: Optional[requests.Session] = None):
         """
         初始化飞书API
         
         Args:
             app_id: 应用ID
             app_secret: 应用密钥
+            session: HTTP会话，默认新建一个按应用限流的长连接会话，同一客户端的所有请求复用其连接
         """
         self.app_id = app_id
         self.app_secret = app_secret
-        self.access_token = None
-        self.token_expire_time = 0
+        # 拉取部门和成员时失败的请求数，大于0表示拉取到的数据不完整（见sync.org_snapshot.OrgSnapshot.fetch）
+        self.fetch_failures = 0
+        self._failures_lock = threading.Lock()
+        self.session = session or create_session(rate_limiter=get_rate_limiter('feishu', app_id))
+        
+    def close(self):
+        """关闭HTTP会话及其连接"""
+        self.session.close()
+        
+    def _fetch_failed(self):
+        """记录一次失败的拉取请求，并发拉取部门成员时在工作线程中调用"""
+        with self._failures_lock:
+            self.fetch_failures += 1
         
     def _get_access_token(self) -> Optional[str]:
         """
-        获取访问令牌
+        获取访问令牌，同一应用的令牌在进程间共享，到期前自动刷新
         
         Returns:
             str: 访问令牌
         """
-        # 如果令牌未过期，直接返回
-        if self.access_token and time.time() < self.token_expire_time:
-            return self.access_token
+        return get_access_token('feishu', self.app_id, self.app_secret, self._fetch_access_token)
+        
+    def _request(self, url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        发送带访问令牌的GET请求并返回结果，令牌被平台判定无效时作废缓存的令牌，用新令牌重试一次
+        
+        Args:
+            url: 接口地址
+            params: 查询参数
             
+        Returns:
+            Dict[str, Any]: 接口返回的结果，未能获取令牌时为空字典
+        """
+        result = {}
+        for attempt in range(2):
+            token = self._get_access_token()
+            if not token:
+                break
+            headers = {
+                "Authorization": f"Bearer {token}",
+                "Content-Type": "application/json"
+            }
+            response = self.session.get(url, headers=headers, params=params)
+            response.raise_for_status()
+            result = response.json()
+            if attempt or not is_token_invalid('feishu', result.get('code')):
+                break
+            invalidate_access_token('feishu', self.app_id, self.app_secret, token)
+        return result
+        
+    def _fetch_access_token(self) -> Optional[Tuple[str, int]]:
+        """
+        向飞书请求新的应用访问令牌
+        
+        Returns:
+            Tuple[str, int]: (访问令牌, 有效秒数)
+        """
         url = "https://open.feishu.cn/open-apis/auth/v3/tenant_access_token/internal"
         headers = {
             "Content-Type": "application/json"
@@ -43,15 +92,12 @@ class FeiShuAPI:
         }
         
         try:
-            response = requests.post(url, headers=headers, data=json.dumps(data))
+            response = self.session.post(url, headers=headers, data=json.dumps(data))
             response.raise_for_status()
             
             result = response.json()
             if result.get("code") == 0:
-                self.access_token = result.get("tenant_access_token")
-                # 设置过期时间，提前5分钟过期
-                self.token_expire_time = time.time() + result.get("expire", 7200) - 300
-                return self.access_token
+                return result.get("tenant_access_token"), result.get("expire", 7200)
             else:
                 logger.error(f"获取飞书访问令牌失败: {result}")
                 return None
@@ -66,16 +112,12 @@ class FeiShuAPI:
         Returns:
             List[Dict[str, Any]]: 部门列表
         """
-        token = self._get_access_token()
-        if not token:
+        if not self._get_access_token():
             logger.error("未能获取有效的访问令牌")
+            self._fetch_failed()
             return []
             
         url = "https://open.feishu.cn/open-apis/contact/v3/departments/children"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
         params = {
             "department_id": "0",  # 根部门
             "fetch_child": True
@@ -90,10 +132,7 @@ class FeiShuAPI:
                 if page_token:
                     params["page_token"] = page_token
                     
-                response = requests.get(url, headers=headers, params=params)
-                response.raise_for_status()
-                
-                result = response.json()
+                result = self._request(url, params)
                 if result.get("code") == 0:
                     items = result.get("data", {}).get("items", [])
                     departments.extend(items)
@@ -104,11 +143,13 @@ class FeiShuAPI:
                         break
                 else:
                     logger.error(f"获取飞书部门列表失败: {result}")
+                    self._fetch_failed()
                     break
                     
             return departments
         except Exception as e:
             logger.error(f"获取飞书部门列表出错: {str(e)}")
+            self._fetch_failed()
             return []
             
     def get_department_users(self, department_id: str) -> List[Dict[str, Any]]:
@@ -121,21 +162,28 @@ class FeiShuAPI:
         Returns:
             List[Dict[str, Any]]: 用户列表
         """
-        token = self._get_access_token()
-        if not token:
+        return list(self.iter_department_users(department_id))
+        
+    def iter_department_users(self, department_id: str) -> Iterator[Dict[str, Any]]:
+        """
+        按页产出部门成员，每页请求完成后即可处理，不等待全部分页
+        
+        Args:
+            department_id: 部门ID
+            
+        Yields:
+            Dict[str, Any]: 用户
+        """
+        if not self._get_access_token():
             logger.error("未能获取有效的访问令牌")
-            return []
+            self._fetch_failed()
+            return
             
         url = "https://open.feishu.cn/open-apis/contact/v3/users"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
         params = {
             "department_id": department_id
         }
         
-        users = []
         page_token = None
         
         try:
@@ -144,13 +192,10 @@ class FeiShuAPI:
                 if page_token:
                     params["page_token"] = page_token
                     
-                response = requests.get(url, headers=headers, params=params)
-                response.raise_for_status()
-                
-                result = response.json()
+                result = self._request(url, params)
                 if result.get("code") == 0:
                     items = result.get("data", {}).get("items", [])
-                    users.extend(items)
+                    yield from items
                     
                     # 检查是否有下一页
                     page_token = result.get("data", {}).get("page_token")
@@ -158,12 +203,11 @@ class FeiShuAPI:
                         break
                 else:
                     logger.error(f"获取飞书部门成员失败: {result}")
+                    self._fetch_failed()
                     break
-                    
-            return users
         except Exception as e:
             logger.error(f"获取飞书部门成员出错: {str(e)}")
-            return []
+            self._fetch_failed()
             
     def get_users(self) -> List[Dict[str, Any]]:
         """
@@ -172,18 +216,22 @@ class FeiShuAPI:
         Returns:
             List[Dict[str, Any]]: 用户列表
         """
-        token = self._get_access_token()
-        if not token:
+        return list(self.iter_users())
+        
+    def iter_users(self) -> Iterator[Dict[str, Any]]:
+        """
+        按页产出所有用户，每页请求完成后即可处理，内存占用与分页大小相关而与用户总数无关
+        
+        Yields:
+            Dict[str, Any]: 处理后的用户数据
+        """
+        if not self._get_access_token():
             logger.error("未能获取有效的访问令牌")
-            return []
+            self._fetch_failed()
+            return
             
         url = "https://open.feishu.cn/open-apis/contact/v3/users"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
         
-        users = []
         page_token = None
         
         try:
@@ -193,24 +241,22 @@ class FeiShuAPI:
                 if page_token:
                     params["page_token"] = page_token
                     
-                response = requests.get(url, headers=headers, params=params)
-                response.raise_for_status()
-                
-                result = response.json()
+                result = self._request(url, params)
                 if result.get("code") == 0:
                     items = result.get("data", {}).get("items", [])
                     
                     # 处理用户数据格式
                     for user in items:
-                        user_data = {
+                        yield {
+                            'user_id': user.get('user_id'),
                             'open_id': user.get('open_id'),
                             'union_id': user.get('union_id'),
                             'name': user.get('name'),
                             'email': user.get('email'),
                             'mobile': user.get('mobile'),
+                            'department_ids': user.get('department_ids', []),
                             'avatar_url': user.get('avatar', {}).get('url')
                         }
-                        users.append(user_data)
                     
                     # 检查是否有下一页
                     page_token = result.get("data", {}).get("page_token")
@@ -218,12 +264,11 @@ class FeiShuAPI:
                         break
                 else:
                     logger.error(f"获取飞书用户列表失败: {result}")
+                    self._fetch_failed()
                     break
-                    
-            return users
         except Exception as e:
             logger.error(f"获取飞书用户列表出错: {str(e)}")
-            return []
+            self._fetch_failed()
     
     def get_user_detail(self, user_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -235,22 +280,14 @@ class FeiShuAPI:
         Returns:
             Dict[str, Any] or None: 用户详情
         """
-        token = self._get_access_token()
-        if not token:
+        if not self._get_access_token():
             logger.error("未能获取有效的访问令牌")
             return None
             
         url = f"https://open.feishu.cn/open-apis/contact/v3/users/{user_id}"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
         
         try:
-            response = requests.get(url, headers=headers)
-            response.raise_for_status()
-            
-            result = response.json()
+            result = self._request(url)
             if result.get("code") == 0:
                 return result.get("data", {}).get("user", {})
             else:
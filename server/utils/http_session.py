@@ -0,0 +1,65 @@
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from typing import Optional, Tuple
+
+from .rate_limit import DEFAULT_MAX_WORKERS, TokenBucket
+
+# HTTP连接池默认参数，可在settings中通过IM_API_*覆盖
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+
+# 每个会话缓存连接池的主机数（各平台的接口分布在一到两个域名上）
+POOL_HOSTS = 4
+
+
+class APISession(requests.Session):
+    """未指定timeout的请求使用默认超时、发送前经过限流器的requests会话"""
+
+    def __init__(self, timeout: Tuple[float, float], rate_limiter: Optional[TokenBucket] = None):
+        """
+        Args:
+            timeout: 默认的(连接超时, 读取超时)秒数
+            rate_limiter: 限流器，为None时不限流
+        """
+        super().__init__()
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        return super().request(method, url, **kwargs)
+
+
+def create_session(pool_size: Optional[int] = None, rate_limiter: Optional[TokenBucket] = None) -> APISession:
+    """
+    创建平台API客户端使用的HTTP会话
+
+    会话保持长连接并复用TLS连接，每个主机最多保持pool_size个连接，应不小于并发请求数；
+    响应使用gzip压缩传输。
+
+    Args:
+        pool_size: 每个主机的连接数，默认为settings.IM_API_POOL_SIZE，且不小于并发拉取的线程数
+        rate_limiter: 限流器，所有请求发送前先取令牌
+
+    Returns:
+        APISession: HTTP会话
+    """
+    if pool_size is None:
+        pool_size = max(getattr(settings, 'IM_API_POOL_SIZE', DEFAULT_POOL_SIZE),
+                        getattr(settings, 'IM_API_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+    session = APISession((
+        getattr(settings, 'IM_API_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+        getattr(settings, 'IM_API_READ_TIMEOUT', DEFAULT_READ_TIMEOUT),
+    ), rate_limiter)
+    adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=max(1, pool_size))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive',
+    })
+    return session
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+from django.conf import settings
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+# 各平台接口的默认每秒请求数，低于平台文档中单个应用的频率限制，可在settings中通过*_API_QPS覆盖
+DEFAULT_QPS = {
+    'wecom': 20,
+    'feishu': 10,
+    'dingtalk': 15,
+}
+
+# 并发拉取部门成员的默认线程数，可在settings中通过IM_API_MAX_WORKERS覆盖
+DEFAULT_MAX_WORKERS = 8
+
+
+class TokenBucket:
+    """令牌桶限流器：每秒补充rate个令牌，最多积攒capacity个，取不到令牌时阻塞等待（线程安全）"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: 每秒请求数
+            capacity: 允许的突发请求数，默认为rate
+        """
+        self.rate = max(rate, 0.001)
+        self.capacity = max(capacity or rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取一个令牌，必要时等待"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_rate_limiter(platform: str, app_key: str) -> TokenBucket:
+    """
+    获取（必要时创建）进程内共享的限流器，同一应用的所有客户端共用一个令牌桶
+
+    Args:
+        platform: 平台 wecom/feishu/dingtalk
+        app_key: 应用标识（企业ID、应用ID等），平台按应用计算频率限制
+
+    Returns:
+        TokenBucket: 限流器
+    """
+    key = f"{platform}:{app_key}"
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            qps = getattr(settings, f'{platform.upper()}_API_QPS', DEFAULT_QPS.get(platform, 10))
+            # 不积攒突发令牌，任意1秒内的请求数不超过qps+1
+            bucket = _buckets[key] = TokenBucket(qps, capacity=1)
+        return bucket
+
+
+def iter_concurrently(items: Iterable[T], fetch: Callable[[T], R], max_workers: Optional[int] = None) -> Iterator[R]:
+    """
+    用有界线程池并发调用fetch，按items的顺序逐个产出结果
+
+    同时提交的任务数不超过线程数的两倍，使用方处理较慢时不会积压全部结果，内存占用与items总数无关。
+
+    Args:
+        items: 待拉取的对象（如部门）
+        fetch: 拉取单个对象的函数，需自行处理异常
+        max_workers: 最大线程数，默认为settings.IM_API_MAX_WORKERS
+
+    Yields:
+        R: 与items顺序一致的结果
+    """
+    if max_workers is None:
+        max_workers = getattr(settings, 'IM_API_MAX_WORKERS', DEFAULT_MAX_WORKERS)
+    if max_workers <= 1:
+        for item in items:
+            yield fetch(item)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='im-fetch') as executor:
+        pending = deque()
+        try:
+            for item in items:
+                pending.append(executor.submit(fetch, item))
+                if len(pending) >= max_workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # 使用方提前停止迭代时不再执行未开始的任务
+            for future in pending:
+                future.cancel()
+
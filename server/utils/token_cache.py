@@ -0,0 +1,155 @@
+import hashlib
+import logging
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# 令牌到期前多少秒开始刷新，可在settings中通过IM_TOKEN_REFRESH_MARGIN覆盖
+DEFAULT_REFRESH_MARGIN = 300
+
+# 刷新锁的有效期(秒)，持有锁的进程异常退出时锁自动失效
+LOCK_TIMEOUT = 30
+
+# 等待其他进程刷新时的轮询间隔(秒)
+POLL_INTERVAL = 0.1
+
+# 平台判定访问令牌无效（已过期、被吊销或格式错误）时返回的错误码，收到后作废缓存的令牌并重新获取
+INVALID_TOKEN_CODES = {
+    'wecom': {40001, 40014, 42001},
+    'feishu': {99991661, 99991663, 99991664, 99991668},
+    'dingtalk': {40001, 40014, 42001},
+}
+
+# 获取令牌的函数：返回(令牌, 有效秒数)，失败时返回None
+TokenFetcher = Callable[[], Optional[Tuple[str, int]]]
+
+# 进程内按缓存键的刷新锁，同一进程的并发线程不必经过缓存后端的锁
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def _cache_key(platform: str, app_key: str, secret: str) -> str:
+    """缓存键包含密钥的摘要：不在缓存中暴露密钥，密钥变更后自动使用新令牌"""
+    digest = hashlib.sha256(f"{app_key}:{secret}".encode('utf-8')).hexdigest()[:32]
+    return f"im_token:{platform}:{digest}"
+
+
+def _local_lock(key: str) -> threading.Lock:
+    with _local_locks_guard:
+        lock = _local_locks.get(key)
+        if lock is None:
+            lock = _local_locks[key] = threading.Lock()
+        return lock
+
+
+def get_access_token(platform: str, app_key: str, secret: str, fetch: TokenFetcher) -> Optional[str]:
+    """
+    从共享缓存获取平台应用的访问令牌，不存在或即将过期时刷新
+
+    令牌按平台返回的有效期保存在Django缓存中（默认缓存后端为进程内存，配置为数据库或文件缓存后
+    多个进程共享）。到期前refresh_margin秒内由一个调用方刷新，其他调用方继续使用尚未过期的令牌；
+    令牌已过期时其他调用方等待刷新结果，不会同时请求令牌接口。
+
+    Args:
+        platform: 平台 wecom/feishu/dingtalk
+        app_key: 应用标识（企业ID、应用ID等）
+        secret: 应用密钥
+        fetch: 向平台请求新令牌的函数
+
+    Returns:
+        str or None: 访问令牌，获取失败时返回None
+    """
+    key = _cache_key(platform, app_key, secret)
+    margin = getattr(settings, 'IM_TOKEN_REFRESH_MARGIN', DEFAULT_REFRESH_MARGIN)
+    entry = cache.get(key)
+    now = time.time()
+    if entry and now < entry['expires_at'] - margin:
+        return entry['token']
+
+    lock = _local_lock(key)
+    if not lock.acquire(blocking=False):
+        # 本进程的其他线程正在刷新：旧令牌仍有效时直接使用，否则等待
+        if entry and now < entry['expires_at']:
+            return entry['token']
+        lock.acquire()
+    deadline = time.time() + LOCK_TIMEOUT
+    try:
+        while True:
+            entry = cache.get(key)
+            now = time.time()
+            if entry and now < entry['expires_at'] - margin:
+                return entry['token']
+
+            # cache.add是原子操作，只有一个进程能取得刷新锁
+            if cache.add(f"{key}:lock", 1, timeout=LOCK_TIMEOUT):
+                try:
+                    token = _refresh(key, platform, fetch)
+                finally:
+                    cache.delete(f"{key}:lock")
+                if token:
+                    return token
+                # 刷新失败时，旧令牌未过期仍可使用
+                return entry['token'] if entry and now < entry['expires_at'] else None
+
+            # 其他进程正在刷新：旧令牌仍有效时直接使用，否则等待
+            if entry and now < entry['expires_at']:
+                return entry['token']
+            if now >= deadline:
+                logger.error(f"等待其他进程刷新{platform}访问令牌超时")
+                return None
+            time.sleep(POLL_INTERVAL)
+    finally:
+        lock.release()
+
+
+def _refresh(key: str, platform: str, fetch: TokenFetcher) -> Optional[str]:
+    """请求新令牌并写入缓存"""
+    fetched = fetch()
+    if not fetched:
+        return None
+    token, expires_in = fetched
+    expires_in = int(expires_in or 7200)
+    cache.set(key, {'token': token, 'expires_at': time.time() + expires_in}, timeout=expires_in)
+    logger.debug(f"已刷新{platform}访问令牌，有效期 {expires_in} 秒")
+    return token
+
+
+
+def is_token_invalid(platform: str, code) -> bool:
+    """
+    平台返回的错误码是否表示访问令牌无效
+
+    Args:
+        platform: 平台 wecom/feishu/dingtalk
+        code: 接口返回的errcode/code
+
+    Returns:
+        bool: 令牌无效时返回True
+    """
+    return code in INVALID_TOKEN_CODES.get(platform, ())
+
+
+def invalidate_access_token(platform: str, app_key: str, secret: str, token: Optional[str] = None):
+    """
+    作废缓存的访问令牌，下次get_access_token时重新获取
+
+    平台可能在到期前判定令牌无效（如令牌被其他调用方重置），此时不能继续使用缓存到expires_at。
+    指定token时只在缓存中仍是该令牌时删除，避免删掉其他调用方刚刷新的新令牌。
+
+    Args:
+        platform: 平台 wecom/feishu/dingtalk
+        app_key: 应用标识（企业ID、应用ID等）
+        secret: 应用密钥
+        token: 被平台拒绝的令牌
+    """
+    key = _cache_key(platform, app_key, secret)
+    with _local_lock(key):
+        entry = cache.get(key)
+        if entry and (token is None or entry['token'] == token):
+            cache.delete(key)
+            logger.info(f"{platform}访问令牌已被平台判定无效，已作废缓存")
@@ -1,14 +1,20 @@
 import requests
 import logging
+import threading
 import json
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+
+from .http_session import create_session
+from .rate_limit import get_rate_limiter, iter_concurrently
+from .token_cache import get_access_token, invalidate_access_token, is_token_invalid
 
 logger = logging.getLogger(__name__)
 
 class WeComAPI:
     """企业微信API封装类"""
     
-    def __init__(self, corp_id: str, app_secret: str, agent_id: str = None):
+    def __init__(self, corp_id: str, app_secret: str, agent_id: str = None,
+                 session: Optional[requests.Session] = None):
         """
         初始化企业微信API
         
@@ -16,32 +22,74 @@ class WeComAPI:
             corp_id: 企业ID
             app_secret: 应用密钥
             agent_id: 应用ID
+            session: HTTP会话，默认新建一个按企业限流的长连接会话，同一客户端的所有请求复用其连接
         """
         self.corp_id = corp_id
         self.app_secret = app_secret
         self.agent_id = agent_id
-        self.access_token = None
+        # 拉取部门和成员时失败的请求数，大于0表示拉取到的数据不完整（见sync.org_snapshot.OrgSnapshot.fetch）
+        self.fetch_failures = 0
+        self._failures_lock = threading.Lock()
+        self.session = session or create_session(rate_limiter=get_rate_limiter('wecom', corp_id))
+        
+    def close(self):
+        """关闭HTTP会话及其连接"""
+        self.session.close()
+        
+    def _fetch_failed(self):
+        """记录一次失败的拉取请求，并发拉取部门成员时在工作线程中调用"""
+        with self._failures_lock:
+            self.fetch_failures += 1
         
     def _get_access_token(self) -> Optional[str]:
         """
-        获取访问令牌
+        获取访问令牌，同一企业应用的令牌在进程间共享，到期前自动刷新
         
         Returns:
             str: 访问令牌
         """
-        if self.access_token:
-            return self.access_token
+        return get_access_token('wecom', self.corp_id, self.app_secret, self._fetch_access_token)
+        
+    def _request(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        发送带访问令牌的GET请求并返回结果，令牌被平台判定无效时作废缓存的令牌，用新令牌重试一次
+        
+        Args:
+            url: 接口地址（不含access_token）
+            params: 查询参数
             
+        Returns:
+            Dict[str, Any]: 接口返回的结果，未能获取令牌时为空字典
+        """
+        result = {}
+        for attempt in range(2):
+            token = self._get_access_token()
+            if not token:
+                break
+            response = self.session.get(url, params={'access_token': token, **params})
+            response.raise_for_status()
+            result = response.json()
+            if attempt or not is_token_invalid('wecom', result.get('errcode')):
+                break
+            invalidate_access_token('wecom', self.corp_id, self.app_secret, token)
+        return result
+        
+    def _fetch_access_token(self) -> Optional[Tuple[str, int]]:
+        """
+        向企业微信请求新的访问令牌
+        
+        Returns:
+            Tuple[str, int]: (访问令牌, 有效秒数)
+        """
         url = f"https://qyapi.weixin.qq.com/cgi-bin/gettoken?corpid={self.corp_id}&corpsecret={self.app_secret}"
         
         try:
-            response = requests.get(url)
+            response = self.session.get(url)
             response.raise_for_status()
             
             result = response.json()
             if result.get("errcode") == 0:
-                self.access_token = result.get("access_token")
-                return self.access_token
+                return result.get("access_token"), result.get("expires_in", 7200)
             else:
                 logger.error(f"获取企业微信访问令牌失败: {result}")
                 return None
@@ -56,25 +104,24 @@ class WeComAPI:
         Returns:
             List[Dict[str, Any]]: 部门列表
         """
-        token = self._get_access_token()
-        if not token:
+        if not self._get_access_token():
             logger.error("未能获取有效的访问令牌")
+            self._fetch_failed()
             return []
             
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/department/list?access_token={token}"
+        url = "https://qyapi.weixin.qq.com/cgi-bin/department/list"
         
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            result = response.json()
+            result = self._request(url, {})
             if result.get("errcode") == 0:
                 return result.get("department", [])
             else:
                 logger.error(f"获取企业微信部门列表失败: {result}")
+                self._fetch_failed()
                 return []
         except Exception as e:
             logger.error(f"获取企业微信部门列表出错: {str(e)}")
+            self._fetch_failed()
             return []
             
     def get_department_users(self, department_id: int, department_name: str) -> List[Dict[str, Any]]:
@@ -87,58 +134,77 @@ class WeComAPI:
         Returns:
             List[Dict[str, Any]]: 用户列表
         """
-        token = self._get_access_token()
-        if not token:
+        if not self._get_access_token():
             logger.error("未能获取有效的访问令牌")
+            self._fetch_failed()
             return []
             
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/user/list?access_token={token}&department_id={department_id}&fetch_child=0"
+        url = "https://qyapi.weixin.qq.com/cgi-bin/user/list"
         
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            result = response.json()
+            result = self._request(url, {'department_id': department_id, 'fetch_child': 0})
             user_list = []
             if result.get("errcode") == 0:
                 for user in result.get("userlist", []):
+                    # department为成员所属部门ID列表，保留到department_ids后替换为当前部门名称
+                    user["department_ids"] = user.get("department", [])
                     user["department"] = department_name
                     user_list.append(user)
                 return user_list
             else:
                 logger.error(f"获取企业微信部门成员失败: {result}")
+                self._fetch_failed()
                 return []
         except Exception as e:
             logger.error(f"获取企业微信部门成员出错: {str(e)}")
+            self._fetch_failed()
             return []
             
-    def get_users(self) -> List[Dict[str, Any]]:
+    def iter_users(self, departments: Optional[List[Dict[str, Any]]] = None) -> Iterator[Dict[str, Any]]:
         """
-        获取所有用户
+        逐个部门产出所有用户，前面部门的用户可以在后面部门拉取完成前开始处理
         
-        Returns:
-            List[Dict[str, Any]]: 用户列表
+        Args:
+            departments: 已获取的部门列表，为None时重新获取
+            
+        Yields:
+            Dict[str, Any]: 用户（按用户ID去重）
         """
-        departments = self.get_departments()
+        if departments is None:
+            departments = self.get_departments()
         if not departments:
-            return []
+            return
+        # 先取得令牌，避免并发请求各自去获取
+        if not self._get_access_token():
+            logger.error("未能获取有效的访问令牌")
+            self._fetch_failed()
+            return
             
-        all_users = []
         # 用户ID去重
         user_ids = set()
         
-        for dept in departments:
-            dept_id = dept["id"]
-            department_name = dept["name"]
-            users = self.get_department_users(dept_id, department_name)
-            
+        # 并发拉取各部门成员，按部门顺序产出，保证输出顺序稳定
+        department_users = iter_concurrently(
+            departments, lambda dept: self.get_department_users(dept["id"], dept["name"])
+        )
+        for users in department_users:
             for user in users:
                 user_id = user.get("userid")
                 if user_id and user_id not in user_ids:
                     user_ids.add(user_id)
-                    all_users.append(user)
+                    yield user
+        
+    def get_users(self, departments: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        获取所有用户
         
-        return all_users
+        Args:
+            departments: 已获取的部门列表，为None时重新获取
+            
+        Returns:
+            List[Dict[str, Any]]: 用户列表
+        """
+        return list(self.iter_users(departments))
     
     def get_user_detail(self, user_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -150,18 +216,14 @@ class WeComAPI:
         Returns:
             Dict[str, Any] or None: 用户详情
         """
-        token = self._get_access_token()
-        if not token:
+        if not self._get_access_token():
             logger.error("未能获取有效的访问令牌")
             return None
             
-        url = f"https://qyapi.weixin.qq.com/cgi-bin/user/get?access_token={token}&userid={user_id}"
+        url = "https://qyapi.weixin.qq.com/cgi-bin/user/get"
         
         try:
-            response = requests.get(url)
-            response.raise_for_status()
-            
-            result = response.json()
+            result = self._request(url, {'userid': user_id})
             if result.get("errcode") == 0:
                 return result
             else:
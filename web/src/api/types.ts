@@ -79,6 +79,9 @@ export interface LDAPConfig {
   bind_password?: string
   base_dn: string
   use_ssl: boolean
+  read_replicas: string[]
+  replica_strategy: 'ROUND_ROBIN' | 'FIRST' | 'RANDOM'
+  read_your_writes: boolean
   enabled: boolean
   created_at: string
   updated_at: string
@@ -92,6 +95,7 @@ export interface SyncLog {
   message: string
   users_synced: number
   departments_synced: number
+  stats?: Record<string, any>
 }
 
 export interface SyncConfig {
@@ -105,6 +109,9 @@ export interface SyncConfig {
   user_ou: string
   department_ou: string
   sync_frequency: 'realtime' | 'hourly' | 'daily' | 'weekly' | 'manual'
+  orphan_action: 'none' | 'disable' | 'delete'
+  disabled_ou: string
+  orphan_threshold: number
   last_sync_time: string | null
   enabled: boolean
   created_at: string